@@ -4,13 +4,18 @@ import json
 import os
 import re
 import shutil
+import tempfile
 import sys
 import uuid
 import time
+import weakref
 import secrets
 import base64
+import hashlib
+import math
+import heapq
 import mimetypes
-from collections import defaultdict
+from collections import defaultdict, deque
 from contextlib import asynccontextmanager, AsyncExitStack
 from pathlib import Path
 from typing import Optional, Dict, List
@@ -18,7 +23,7 @@ from datetime import datetime, timezone, timedelta
 
 import uvicorn
 from camoufox.async_api import AsyncCamoufox
-from fastapi import FastAPI, HTTPException, Depends, status, Form, Request, Response
+from fastapi import FastAPI, HTTPException, Depends, status, Form, Request, Response, WebSocket, WebSocketDisconnect
 from starlette.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
 
@@ -333,7 +338,7 @@ def extract_recaptcha_params_from_text(text: str) -> tuple[Optional[str], Option
 
 
 def get_recaptcha_settings(config: Optional[dict] = None) -> tuple[str, str]:
-    cfg = config or get_config()
+    cfg = config or get_config_view()
     sitekey = str((cfg or {}).get("recaptcha_sitekey") or "").strip()
     action = str((cfg or {}).get("recaptcha_action") or "").strip()
     if not sitekey:
@@ -627,52 +632,147 @@ def find_chrome_executable() -> Optional[str]:
     return None
 
 
-async def get_recaptcha_v3_token_with_chrome(config: dict) -> Optional[str]:
+async def _add_missing_chrome_profile_cookies(context, cookies: list[dict]) -> None:
+    if not cookies:
+        return
     try:
-        from playwright.async_api import async_playwright  # type: ignore
-    except Exception:
-        return None
+        existing_names: set[str] = set()
+        try:
+            existing = await context.cookies("https://lmarena.ai")
+            for c in existing or []:
+                name = c.get("name")
+                if name:
+                    existing_names.add(str(name))
+        except Exception:
+            existing_names = set()
 
-    chrome_path = find_chrome_executable()
-    if not chrome_path:
-        return None
+        cookies_to_add: list[dict] = []
+        for c in cookies:
+            name = str(c.get("name") or "")
+            if not name:
+                continue
+            # Always ensure the auth cookie matches the selected upstream token.
+            if name == "arena-auth-prod-v1":
+                cookies_to_add.append(c)
+                continue
 
-    profile_dir = Path(CONFIG_FILE).with_name("chrome_grecaptcha")
+            # Do NOT overwrite/inject Cloudflare or reCAPTCHA cookies in the persistent profile.
+            # The profile manages these itself; injecting stale ones from config causes 403s.
+            if name in ("cf_clearance", "__cf_bm", "_GRECAPTCHA"):
+                continue
 
-    cf_clearance = str(config.get("cf_clearance") or "").strip()
-    cf_bm = str(config.get("cf_bm") or "").strip()
-    cfuvid = str(config.get("cfuvid") or "").strip()
-    provisional_user_id = str(config.get("provisional_user_id") or "").strip()
-    user_agent = normalize_user_agent_value(config.get("user_agent"))
-    recaptcha_sitekey, recaptcha_action = get_recaptcha_settings(config)
+            # Avoid overwriting existing Cloudflare/session cookies in the persistent profile.
+            if name in existing_names:
+                continue
+            cookies_to_add.append(c)
 
-    cookies = []
-    if cf_clearance:
-        cookies.append({"name": "cf_clearance", "value": cf_clearance, "domain": ".lmarena.ai", "path": "/"})
-    if cf_bm:
-        cookies.append({"name": "__cf_bm", "value": cf_bm, "domain": ".lmarena.ai", "path": "/"})
-    if cfuvid:
-        cookies.append({"name": "_cfuvid", "value": cfuvid, "domain": ".lmarena.ai", "path": "/"})
-    if provisional_user_id:
-        cookies.append(
-            {"name": "provisional_user_id", "value": provisional_user_id, "domain": ".lmarena.ai", "path": "/"}
-        )
+        if cookies_to_add:
+            await context.add_cookies(cookies_to_add)
+    except Exception:
+        pass
 
-    # Add split cookies if present in config
-    cookie_store = config.get("browser_cookies")
-    if isinstance(cookie_store, dict):
-        v1_0 = str(cookie_store.get("arena-auth-prod-v1.0") or "").strip()
-        v1_1 = str(cookie_store.get("arena-auth-prod-v1.1") or "").strip()
-        if v1_0:
-            cookies.append({"name": "arena-auth-prod-v1.0", "value": v1_0, "domain": "lmarena.ai", "path": "/"})
-        if v1_1:
-            cookies.append({"name": "arena-auth-prod-v1.1", "value": v1_1, "domain": "lmarena.ai", "path": "/"})
 
-    async with async_playwright() as p:
+# --- Warm Chrome page pool ---
+# Launching a persistent Chrome context, navigating to LMArena and clearing Cloudflare costs several seconds, so
+# Chrome fetches lease an already-navigated page instead. Each slot owns its own profile directory (slot 0 keeps
+# the historical `chrome_grecaptcha` profile) because Chrome locks a user-data-dir to a single process.
+def _chrome_pool_profile_dir(index: int) -> Path:
+    return Path(CONFIG_FILE).with_name("chrome_grecaptcha" if index == 0 else f"chrome_grecaptcha_{index}")
+
+
+class ChromePageSlot:
+    __slots__ = (
+        "index",
+        "profile_dir",
+        "context",
+        "page",
+        "jobs",
+        "broken",
+        "user_agent",
+        "lines_queue",
+        "fetch_id",
+        "headless",
+        "launched_at",
+    )
+
+    def __init__(self, index: int, profile_dir: Path):
+        self.index = index
+        self.profile_dir = profile_dir
+        self.context = None
+        self.page = None
+        self.jobs = 0
+        self.broken = False
+        self.user_agent: Optional[str] = None
+        # Channel of the current lease; the page-level `reportChunk` binding forwards into it.
+        self.lines_queue: Optional["StreamLineChannel"] = None
+        # Id of the in-page fetch currently allowed to report lines; chunks tagged with any other id come from an
+        # earlier attempt or lease whose fetch is still running, and are dropped.
+        self.fetch_id: Optional[str] = None
+        # Mode the current context was launched in; a lease asking for the other mode relaunches the slot.
+        self.headless = False
+        self.launched_at = 0.0
+
+    def is_healthy(self, max_jobs: int) -> bool:
+        if self.context is None or self.page is None or self.broken:
+            return False
+        if self.jobs >= max_jobs:
+            return False
+        try:
+            closed = self.page.is_closed()
+        except Exception:
+            return False
+        # Only trust a real boolean (mocked pages may return arbitrary objects).
+        return closed is not True
+
+
+class ChromePagePool:
+    """Fixed-size pool of warm Chrome pages with lease/return semantics."""
+
+    def __init__(self, size: int, max_jobs: int, chrome_path: str):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.chrome_path = chrome_path
+        self.loop = asyncio.get_running_loop()
+        self.slots = [ChromePageSlot(i, _chrome_pool_profile_dir(i)) for i in range(size)]
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for slot in self.slots:
+            self._idle.put_nowait(slot)
+        self._playwright_cm = None
+        self._playwright = None
+        self._closed = False
+        self.launches = 0
+        self.recycles = 0
+        self.leases = 0
+
+    async def _ensure_playwright(self):
+        if self._playwright is None:
+            from playwright.async_api import async_playwright  # type: ignore
+
+            self._playwright_cm = async_playwright()
+            self._playwright = await self._playwright_cm.__aenter__()
+        return self._playwright
+
+    async def _close_slot(self, slot: ChromePageSlot) -> None:
+        context = slot.context
+        slot.context = None
+        slot.page = None
+        slot.jobs = 0
+        slot.broken = False
+        slot.user_agent = None
+        slot.lines_queue = None
+        slot.fetch_id = None
+        if context is not None:
+            try:
+                await context.close()
+            except Exception:
+                pass
+
+    async def _launch_slot(self, slot: ChromePageSlot, cookies: list[dict], headless: bool, user_agent: str) -> None:
+        p = await self._ensure_playwright()
         context = await p.chromium.launch_persistent_context(
-            user_data_dir=str(profile_dir),
-            executable_path=chrome_path,
-            headless=False,  # Headful for better reCAPTCHA score/warmup
+            user_data_dir=str(slot.profile_dir),
+            executable_path=self.chrome_path,
+            headless=bool(headless),
             user_agent=user_agent or None,
             args=[
                 "--disable-blink-features=AutomationControlled",
@@ -680,117 +780,355 @@ async def get_recaptcha_v3_token_with_chrome(config: dict) -> Optional[str]:
                 "--no-default-browser-check",
             ],
         )
-        try:
-            # Small stealth tweak: reduces bot-detection surface for reCAPTCHA v3 scoring.
-            try:
-                await context.add_init_script(
-                    "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
-                )
-            except Exception:
-                pass
-
-            if cookies:
-                try:
-                    existing_names: set[str] = set()
-                    try:
-                        existing = await context.cookies("https://lmarena.ai")
-                        for c in existing or []:
-                            name = c.get("name")
-                            if name:
-                                existing_names.add(str(name))
-                    except Exception:
-                        existing_names = set()
+        slot.context = context
+        slot.headless = bool(headless)
+        self.launches += 1
+        slot.launched_at = time.time()
 
-                    cookies_to_add: list[dict] = []
-                    for c in cookies:
-                        name = str(c.get("name") or "")
-                        if not name:
-                            continue
-                        # Always ensure the auth cookie matches the selected upstream token.
-                        if name == "arena-auth-prod-v1":
-                            cookies_to_add.append(c)
-                            continue
+        # Small stealth tweak: reduces bot-detection surface for reCAPTCHA v3 scoring.
+        try:
+            await context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
+        except Exception:
+            pass
 
-                        # Do NOT overwrite/inject Cloudflare or reCAPTCHA cookies in the persistent profile.
-                        # The profile manages these itself; injecting stale ones from config causes 403s.
-                        if name in ("cf_clearance", "__cf_bm", "_GRECAPTCHA"):
-                            continue
+        # Cookies must be in place before the first navigation so the landing page sees the selected session.
+        await _add_missing_chrome_profile_cookies(context, cookies)
 
-                        # Avoid overwriting existing Cloudflare/session cookies in the persistent profile.
-                        if name in existing_names:
-                            continue
-                        cookies_to_add.append(c)
+        page = await context.new_page()
 
-                    if cookies_to_add:
-                        await context.add_cookies(cookies_to_add)
-                except Exception:
-                    pass
+        # A binding can only be exposed once per page, so it dispatches to whichever lease currently owns the slot.
+        async def _report_chunk(source, fetch_id: str, line: str):
+            queue = slot.lines_queue
+            if queue is None or fetch_id != slot.fetch_id:
+                return
+            if line and line.strip():
+                await queue.put(line)
 
-            page = await context.new_page()
-            await page.goto("https://lmarena.ai/?mode=direct", wait_until="domcontentloaded", timeout=120000)
+        await page.expose_binding("reportChunk", _report_chunk)
+        await page.goto("https://lmarena.ai/?mode=direct", wait_until="domcontentloaded", timeout=120000)
 
-            # Best-effort: if we land on a Cloudflare challenge page, try clicking Turnstile.
+        # Best-effort: if we land on a Cloudflare challenge page, try clicking Turnstile before minting tokens.
+        try:
+            for i in range(10): # Up to 30 seconds
+                title = await page.title()
+                if "Just a moment" not in title:
+                    break
+                debug_print(f"  ⏳ Waiting for Cloudflare challenge in Chrome... (attempt {i+1}/10)")
+                await click_turnstile(page)
+                await asyncio.sleep(3)
             try:
-                for _ in range(5):
-                    title = await page.title()
-                    if "Just a moment" not in title:
-                        break
-                    await click_turnstile(page)
-                    await asyncio.sleep(2)
+                await page.wait_for_load_state("domcontentloaded", timeout=15000)
             except Exception:
                 pass
+        except Exception:
+            pass
+
+        # Light warm-up (often improves reCAPTCHA v3 score vs firing immediately).
+        try:
+            await page.mouse.move(100, 100)
+            await asyncio.sleep(0.5)
+            await page.mouse.wheel(0, 200)
+            await asyncio.sleep(1)
+            await page.mouse.move(200, 300)
+            await asyncio.sleep(0.5)
+            await page.mouse.wheel(0, 300)
+            await asyncio.sleep(2) # Reduced "Human" pause for faster response
+        except Exception:
+            pass
+
+        slot.page = page
+        debug_print(f"🌐 Chrome page pool: slot {slot.index} warmed ({slot.profile_dir.name})")
+
+    async def acquire(
+        self,
+        cookies: Optional[list[dict]] = None,
+        headless: bool = False,
+        user_agent: str = "",
+        timeout: float = 60.0,
+    ) -> ChromePageSlot:
+        """
+        Lease a warm slot, (re)launching it if it was never started, crashed, served `max_jobs` fetches, or was
+        launched in the other `headless` mode.
+        """
+        if self._closed:
+            raise RuntimeError("Chrome page pool is closed")
+        deadline = time.monotonic() + timeout
+        while True:
+            slot: ChromePageSlot = await asyncio.wait_for(
+                self._idle.get(), timeout=max(0.0, deadline - time.monotonic())
+            )
+            if slot.index < self.size:
+                break
+            # Slot beyond the configured size after a shrink: retire it.
+            await self._retire_slot(slot)
+        try:
+            if not slot.is_healthy(self.max_jobs) or slot.headless != bool(headless):
+                if slot.context is not None:
+                    self.recycles += 1
+                    debug_print(f"♻️  Chrome page pool: recycling slot {slot.index} after {slot.jobs} jobs")
+                await self._close_slot(slot)
+                await self._launch_slot(slot, cookies or [], headless, user_agent)
+            else:
+                await _add_missing_chrome_profile_cookies(slot.context, cookies or [])
+        except BaseException:
+            await self._close_slot(slot)
+            self._idle.put_nowait(slot)
+            raise
+        self.leases += 1
+        return slot
+
+    def release(self, slot: ChromePageSlot, broken: bool = False) -> None:
+        """Return a leased slot; broken slots are relaunched on their next lease."""
+        slot.jobs += 1
+        slot.lines_queue = None
+        slot.fetch_id = None
+        if broken:
+            slot.broken = True
+        if self._closed or slot.index >= self.size:
+            self.loop.create_task(self._retire_slot(slot))
+            return
+        self._idle.put_nowait(slot)
+
+    async def _retire_slot(self, slot: ChromePageSlot) -> None:
+        await self._close_slot(slot)
+        # Drop the slot only after its context is closed so a regrown slot never races it for the profile lock.
+        if slot in self.slots:
+            self.slots.remove(slot)
 
-            # Light warm-up (often improves reCAPTCHA v3 score vs firing immediately).
+    def resize(self, size: int, max_jobs: int) -> None:
+        self.max_jobs = max_jobs
+        if size == self.size:
+            return
+        self.size = size
+        present = {slot.index for slot in self.slots}
+        for i in range(size):
+            if i not in present:
+                slot = ChromePageSlot(i, _chrome_pool_profile_dir(i))
+                self.slots.append(slot)
+                self._idle.put_nowait(slot)
+
+    async def close(self) -> None:
+        self._closed = True
+        for slot in self.slots:
+            await self._close_slot(slot)
+        cm = self._playwright_cm
+        self._playwright_cm = None
+        self._playwright = None
+        if cm is not None:
             try:
-                await page.mouse.move(100, 100)
-                await page.mouse.wheel(0, 200)
-                await asyncio.sleep(1)
-                await page.mouse.move(200, 300)
-                await page.mouse.wheel(0, 300)
-                await asyncio.sleep(3) # Increased "Human" pause
+                await cm.__aexit__(None, None, None)
             except Exception:
                 pass
 
-            # Persist updated cookies/UA from this real browser context (often refreshes arena-auth-prod-v1).
-            try:
-                fresh_cookies = await context.cookies("https://lmarena.ai")
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "max_jobs": self.max_jobs,
+            "warm": sum(1 for s in self.slots if s.context is not None and not s.broken),
+            "idle": self._idle.qsize(),
+            "leases": self.leases,
+            "launches": self.launches,
+            "recycles": self.recycles,
+        }
+
+
+_CHROME_PAGE_POOL: Optional[ChromePagePool] = None
+
+
+def _get_chrome_page_pool_settings(config: Optional[dict] = None) -> tuple[int, int, float]:
+    cfg = config or get_config_view()
+    try:
+        size = int(cfg.get("chrome_fetch_pool_size", 1))
+    except Exception:
+        size = 1
+    try:
+        max_jobs = int(cfg.get("chrome_fetch_pool_max_jobs", 50))
+    except Exception:
+        max_jobs = 50
+    try:
+        acquire_timeout = float(cfg.get("chrome_fetch_pool_acquire_timeout_seconds", 60))
+    except Exception:
+        acquire_timeout = 60.0
+    return max(1, min(size, 8)), max(1, min(max_jobs, 10000)), max(1.0, min(acquire_timeout, 600.0))
+
+
+async def get_chrome_page_pool() -> Optional[ChromePagePool]:
+    """Return the shared Chrome page pool for the running loop, or None when Playwright/Chrome is unavailable."""
+    global _CHROME_PAGE_POOL
+    try:
+        import playwright.async_api  # type: ignore  # noqa: F401
+    except Exception:
+        return None
+
+    chrome_path = find_chrome_executable()
+    if not chrome_path:
+        return None
+
+    size, max_jobs, _ = _get_chrome_page_pool_settings()
+    loop = asyncio.get_running_loop()
+    pool = _CHROME_PAGE_POOL
+    if pool is not None and not pool._closed and pool.loop is loop:
+        pool.resize(size, max_jobs)
+        return pool
+    # (A pool bound to a different, possibly closed, event loop is simply dropped.)
+
+    pool = ChromePagePool(size, max_jobs, chrome_path)
+    _CHROME_PAGE_POOL = pool
+    return pool
+
+
+async def close_chrome_page_pool() -> None:
+    global _CHROME_PAGE_POOL
+    pool = _CHROME_PAGE_POOL
+    _CHROME_PAGE_POOL = None
+    if pool is not None:
+        try:
+            await pool.close()
+        except Exception:
+            pass
+
+
+async def prewarm_chrome_page_pool() -> None:
+    """Launch and navigate every pool slot up front so the first strict-model requests don't pay for it."""
+    pool = await get_chrome_page_pool()
+    if pool is None:
+        return
+    config = get_config_view()
+    cookies = _build_chrome_profile_cookies(config)
+    user_agent = normalize_user_agent_value(config.get("user_agent"))
+    _, _, acquire_timeout = _get_chrome_page_pool_settings(config)
+    slots: list[ChromePageSlot] = []
+    try:
+        for _ in range(pool.size):
+            slots.append(await pool.acquire(cookies=cookies, user_agent=user_agent, timeout=acquire_timeout))
+    except Exception as e:
+        debug_print(f"⚠️  Chrome page pool prewarm failed: {e}")
+    finally:
+        for slot in slots:
+            pool.release(slot)
+
+
+def get_chrome_page_pool_stats() -> dict:
+    pool = _CHROME_PAGE_POOL
+    if pool is None:
+        size, max_jobs, _ = _get_chrome_page_pool_settings()
+        return {"size": size, "max_jobs": max_jobs, "warm": 0, "idle": 0, "leases": 0, "launches": 0, "recycles": 0}
+    return pool.stats()
+
+
+def _build_chrome_profile_cookies(config: dict, auth_token: str = "") -> list[dict]:
+    cookie_store = config.get("browser_cookies")
+    cookie_map: dict[str, str] = {}
+    if isinstance(cookie_store, dict):
+        for name, value in cookie_store.items():
+            if not name or not value:
+                continue
+            cookie_map[str(name)] = str(value)
+
+    # Prefer the Chrome persistent profile's own Cloudflare/BM cookies when present.
+    # We only inject missing cookies to avoid overwriting a valid cf_clearance/__cf_bm with stale values
+    # coming from a different browser fingerprint.
+    cf_clearance = str(config.get("cf_clearance") or cookie_map.get("cf_clearance") or "").strip()
+    cf_bm = str(config.get("cf_bm") or cookie_map.get("__cf_bm") or "").strip()
+    cfuvid = str(config.get("cfuvid") or cookie_map.get("_cfuvid") or "").strip()
+    provisional_user_id = str(config.get("provisional_user_id") or cookie_map.get("provisional_user_id") or "").strip()
+    grecaptcha_cookie = str(cookie_map.get("_GRECAPTCHA") or "").strip()
+
+    desired_cookies: list[dict] = []
+    if cf_clearance:
+        desired_cookies.append({"name": "cf_clearance", "value": cf_clearance, "domain": ".lmarena.ai", "path": "/"})
+    if cf_bm:
+        desired_cookies.append({"name": "__cf_bm", "value": cf_bm, "domain": ".lmarena.ai", "path": "/"})
+    if cfuvid:
+        desired_cookies.append({"name": "_cfuvid", "value": cfuvid, "domain": ".lmarena.ai", "path": "/"})
+    if provisional_user_id:
+        desired_cookies.append(
+            {"name": "provisional_user_id", "value": provisional_user_id, "domain": ".lmarena.ai", "path": "/"}
+        )
+    if grecaptcha_cookie:
+        desired_cookies.append({"name": "_GRECAPTCHA", "value": grecaptcha_cookie, "domain": ".lmarena.ai", "path": "/"})
+    if auth_token:
+        # arena-auth-prod-v1 is commonly stored as a host-only cookie on `lmarena.ai` (no leading dot).
+        desired_cookies.append({"name": "arena-auth-prod-v1", "value": auth_token, "domain": "lmarena.ai", "path": "/"})
+
+    # Inject split cookies if present
+    if isinstance(cookie_store, dict):
+        v1_0 = str(cookie_store.get("arena-auth-prod-v1.0") or "").strip()
+        v1_1 = str(cookie_store.get("arena-auth-prod-v1.1") or "").strip()
+        if v1_0:
+            desired_cookies.append({"name": "arena-auth-prod-v1.0", "value": v1_0, "domain": "lmarena.ai", "path": "/"})
+        if v1_1:
+            desired_cookies.append({"name": "arena-auth-prod-v1.1", "value": v1_1, "domain": "lmarena.ai", "path": "/"})
+    return desired_cookies
+
+
+async def get_recaptcha_v3_token_with_chrome(config: dict) -> Optional[str]:
+    pool = await get_chrome_page_pool()
+    if pool is None:
+        return None
+
+    user_agent = normalize_user_agent_value(config.get("user_agent"))
+    recaptcha_sitekey, recaptcha_action = get_recaptcha_settings(config)
+    _, _, acquire_timeout = _get_chrome_page_pool_settings()
+
+    try:
+        # Headful for better reCAPTCHA score/warmup.
+        slot = await pool.acquire(
+            cookies=_build_chrome_profile_cookies(config),
+            headless=False,
+            user_agent=user_agent,
+            timeout=acquire_timeout,
+        )
+    except Exception as e:
+        debug_print(f"⚠️ Chrome reCAPTCHA retrieval failed: {e}")
+        return None
+
+    broken = False
+    try:
+        context, page = slot.context, slot.page
+
+        # Persist updated cookies/UA from this real browser context (often refreshes arena-auth-prod-v1).
+        try:
+            fresh_cookies = await context.cookies("https://lmarena.ai")
+            if slot.user_agent is None:
                 try:
-                    ua_now = await page.evaluate("() => navigator.userAgent")
+                    slot.user_agent = await page.evaluate("() => navigator.userAgent")
                 except Exception:
-                    ua_now = user_agent
-                if _upsert_browser_session_into_config(config, fresh_cookies, user_agent=ua_now):
-                    save_config(config)
-            except Exception:
-                pass
+                    slot.user_agent = user_agent
+            if _upsert_browser_session_into_config(config, fresh_cookies, user_agent=slot.user_agent):
+                save_config(config)
+        except Exception:
+            pass
 
-            await page.wait_for_function(
-                "window.grecaptcha && ("
-                "(window.grecaptcha.enterprise && typeof window.grecaptcha.enterprise.execute === 'function') || "
-                "typeof window.grecaptcha.execute === 'function'"
-                ")",
-                timeout=60000,
-            )
+        await page.wait_for_function(
+            "window.grecaptcha && ("
+            "(window.grecaptcha.enterprise && typeof window.grecaptcha.enterprise.execute === 'function') || "
+            "typeof window.grecaptcha.execute === 'function'"
+            ")",
+            timeout=60000,
+        )
 
-            token = await page.evaluate(
-                """({sitekey, action}) => new Promise((resolve, reject) => {
-                  const g = (window.grecaptcha?.enterprise && typeof window.grecaptcha.enterprise.execute === 'function')
-                    ? window.grecaptcha.enterprise
-                    : window.grecaptcha;
-                  if (!g || typeof g.execute !== 'function') return reject('NO_GRECAPTCHA');
-                  try {
-                    g.execute(sitekey, { action }).then(resolve).catch((err) => reject(String(err)));
-                  } catch (e) { reject(String(e)); }
-                })""",
-                {"sitekey": recaptcha_sitekey, "action": recaptcha_action},
-            )
-            if isinstance(token, str) and token:
-                return token
-            return None
-        except Exception as e:
-            debug_print(f"⚠️ Chrome reCAPTCHA retrieval failed: {e}")
-            return None
-        finally:
-            await context.close()
+        token = await page.evaluate(
+            """({sitekey, action}) => new Promise((resolve, reject) => {
+              const g = (window.grecaptcha?.enterprise && typeof window.grecaptcha.enterprise.execute === 'function')
+                ? window.grecaptcha.enterprise
+                : window.grecaptcha;
+              if (!g || typeof g.execute !== 'function') return reject('NO_GRECAPTCHA');
+              try {
+                g.execute(sitekey, { action }).then(resolve).catch((err) => reject(String(err)));
+              } catch (e) { reject(String(e)); }
+            })""",
+            {"sitekey": recaptcha_sitekey, "action": recaptcha_action},
+        )
+        if isinstance(token, str) and token:
+            return token
+        return None
+    except Exception as e:
+        debug_print(f"⚠️ Chrome reCAPTCHA retrieval failed: {e}")
+        broken = is_execution_context_destroyed_error(e) or "closed" in str(e).lower()
+        return None
+    finally:
+        pool.release(slot, broken=broken)
 
 
 def is_execution_context_destroyed_error(exc: BaseException) -> bool:
@@ -819,24 +1157,464 @@ async def safe_page_evaluate(page, script: str, retries: int = 3):
     raise RuntimeError("Page.evaluate failed")
 
 
-class BrowserFetchStreamResponse:
-    def __init__(
-        self,
-        status_code: int,
-        headers: Optional[dict],
-        text: str = "",
-        method: str = "POST",
-        url: str = "",
-        lines_queue: Optional[asyncio.Queue] = None,
-        done_event: Optional[asyncio.Event] = None,
-    ):
-        self.status_code = int(status_code or 0)
-        self.headers = headers or {}
+# --- Stream line channel ---
+# Upstream lines from browser/userscript transports (and the keep-alive reader in `generate_stream`) flow through
+# a single-consumer channel: one await yields the next line, EOF, or a keep-alive tick, without a Task per line or
+# a polling timeout to notice completion.
+#
+# Transport channels are bounded by a line/byte budget so a slow or vanished client cannot make upstream output
+# pile up in memory. On overflow the channel either pauses the producer (backpressure into the page binding,
+# proxy push or socket read), aborts the job, or spills further lines to a temp file.
+STREAM_CHANNEL_EOF = object()
+STREAM_QUEUE_POLICIES = ("pause", "abort", "spill")
+
+_STREAM_CHANNELS: "weakref.WeakSet[StreamLineChannel]" = weakref.WeakSet()
+_STREAM_CHANNEL_STATS = {"overflows": 0, "pause_timeouts": 0, "paused": 0, "spilled_lines": 0, "dropped_lines": 0}
+
+
+class StreamChannelOverflow(RuntimeError):
+    """Raised to the consumer when a bounded channel aborted because its budget was exceeded."""
+
+
+def _get_stream_queue_settings(config: Optional[dict] = None) -> tuple[int, int, str, float, int]:
+    cfg = config or get_config_view()
+    try:
+        max_lines = int(cfg.get("stream_queue_max_lines", 10000))
+    except Exception:
+        max_lines = 10000
+    try:
+        max_bytes = int(cfg.get("stream_queue_max_bytes", 4 * 1024 * 1024))
+    except Exception:
+        max_bytes = 4 * 1024 * 1024
+    policy = str(cfg.get("stream_queue_overflow_policy") or "pause").strip().lower()
+    if policy not in STREAM_QUEUE_POLICIES:
+        policy = "pause"
+    try:
+        pause_timeout = float(cfg.get("stream_queue_pause_timeout_seconds", 30))
+    except Exception:
+        pause_timeout = 30.0
+    try:
+        spill_max_bytes = int(cfg.get("stream_queue_spill_max_bytes", 64 * 1024 * 1024))
+    except Exception:
+        spill_max_bytes = 64 * 1024 * 1024
+    return (
+        max(1, min(max_lines, 1_000_000)),
+        max(1024, min(max_bytes, 1024 * 1024 * 1024)),
+        policy,
+        max(0.0, min(pause_timeout, 600.0)),
+        max(0, spill_max_bytes),
+    )
+
+
+def _resolve_channel_waiter(waiter: asyncio.Future, has_data: bool) -> None:
+    if not waiter.done():
+        waiter.set_result(has_data)
+
+
+class StreamLineChannel:
+    """
+    Single-consumer line channel, optionally bounded.
+
+    `get(timeout)` returns the next line, `STREAM_CHANNEL_EOF` once closed and drained (re-raising the close error,
+    if any), or None when `timeout` elapses / `wake()` is called with nothing buffered. `put(None)` closes the
+    channel, so producers written against an `asyncio.Queue` with a None sentinel work unchanged.
+
+    With `max_lines`/`max_bytes` set (bytes counted as characters), a full channel applies `policy`:
+    "pause" blocks `put()` until the consumer catches up (aborting after `pause_timeout`), "abort" closes the
+    channel with `StreamChannelOverflow`, and "spill" appends lines to a temp file (up to `spill_max_bytes`).
+    `put()` returns False when the line was not accepted.
+    """
+
+    __slots__ = (
+        "label",
+        "max_lines",
+        "max_bytes",
+        "policy",
+        "pause_timeout",
+        "spill_max_bytes",
+        "buffered_bytes",
+        "peak_bytes",
+        "total_lines",
+        "dropped_lines",
+        "spilled_lines",
+        "spill_bytes",
+        "_items",
+        "_waiter",
+        "_putters",
+        "_closed",
+        "_error",
+        "_spill",
+        "_spill_read_at",
+        "_spill_write_at",
+        "_spill_pending",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        max_lines: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        policy: str = "pause",
+        pause_timeout: Optional[float] = None,
+        spill_max_bytes: int = 0,
+        label: str = "",
+    ):
+        self.label = str(label or "")
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.policy = policy if policy in STREAM_QUEUE_POLICIES else "pause"
+        self.pause_timeout = pause_timeout
+        self.spill_max_bytes = int(spill_max_bytes or 0)
+        self.buffered_bytes = 0
+        self.peak_bytes = 0
+        self.total_lines = 0
+        self.dropped_lines = 0
+        self.spilled_lines = 0
+        self.spill_bytes = 0
+        self._items: deque = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._putters: deque = deque()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._spill = None
+        self._spill_read_at = 0
+        self._spill_write_at = 0
+        self._spill_pending = 0
+        if max_lines is not None or max_bytes is not None:
+            _STREAM_CHANNELS.add(self)
+
+    @classmethod
+    def bounded(cls, label: str = "", config: Optional[dict] = None, policy: Optional[str] = None) -> "StreamLineChannel":
+        """Channel using the configured `stream_queue_*` budget and overflow policy."""
+        max_lines, max_bytes, default_policy, pause_timeout, spill_max_bytes = _get_stream_queue_settings(config)
+        return cls(max_lines, max_bytes, policy or default_policy, pause_timeout, spill_max_bytes, label)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def empty(self) -> bool:
+        return not self._items and not self._spill_pending
+
+    def qsize(self) -> int:
+        return len(self._items) + self._spill_pending
+
+    def _notify(self, has_data: bool) -> None:
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(has_data)
+
+    def _has_room(self, size: int) -> bool:
+        if not self._items:
+            return True
+        if self.max_lines is not None and len(self._items) >= self.max_lines:
+            return False
+        if self.max_bytes is not None and self.buffered_bytes + size > self.max_bytes:
+            return False
+        return True
+
+    def _append(self, item) -> None:
+        size = len(item) if isinstance(item, str) else 0
+        self._items.append(item)
+        self.buffered_bytes += size
+        self.total_lines += 1
+        if self.buffered_bytes > self.peak_bytes:
+            self.peak_bytes = self.buffered_bytes
+        self._notify(True)
+
+    def _overflow(self, reason: str) -> bool:
+        self.dropped_lines += 1
+        _STREAM_CHANNEL_STATS["dropped_lines"] += 1
+        if not self._closed:
+            _STREAM_CHANNEL_STATS["overflows"] += 1
+            debug_print(f"⚠️ Stream channel {self.label or '?'} overflow ({reason}); aborting job output")
+            # An aborted channel frees its buffer right away; the consumer only sees the error.
+            self._items.clear()
+            self.buffered_bytes = 0
+            self._close_spill()
+            self.close(StreamChannelOverflow(f"Upstream stream buffer overflow ({reason})"))
+        return False
+
+    def _spill_line(self, item) -> bool:
+        data = (json.dumps(item) + "\n").encode("utf-8")
+        if self.spill_max_bytes and self._spill_write_at + len(data) > self.spill_max_bytes:
+            return self._overflow("spill limit")
+        try:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(prefix="lmarena-stream-")
+            self._spill.seek(self._spill_write_at)
+            self._spill.write(data)
+            self._spill_write_at += len(data)
+        except Exception as e:
+            return self._overflow(f"spill failed: {e}")
+        self._spill_pending += 1
+        self.spilled_lines += 1
+        self.spill_bytes = self._spill_write_at - self._spill_read_at
+        self.total_lines += 1
+        _STREAM_CHANNEL_STATS["spilled_lines"] += 1
+        self._notify(True)
+        return True
+
+    def _unspill(self):
+        self._spill.seek(self._spill_read_at)
+        raw = self._spill.readline()
+        self._spill_read_at += len(raw)
+        self._spill_pending -= 1
+        if not self._spill_pending:
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_read_at = self._spill_write_at = 0
+        self.spill_bytes = self._spill_write_at - self._spill_read_at
+        return json.loads(raw.decode("utf-8"))
+
+    def _offer(self, item) -> Optional[bool]:
+        """Accept `item` if possible; None means the caller must wait for room (pause policy)."""
+        if self._closed:
+            self.dropped_lines += 1
+            _STREAM_CHANNEL_STATS["dropped_lines"] += 1
+            return False
+        size = len(item) if isinstance(item, str) else 0
+        if self._spill_pending:
+            # Keep ordering: once lines spill, later lines follow them through the file.
+            return self._spill_line(item)
+        if self._has_room(size):
+            self._append(item)
+            return True
+        if self.policy == "spill":
+            return self._spill_line(item)
+        if self.policy == "abort":
+            return self._overflow("budget exceeded")
+        return None
+
+    def put_nowait(self, item) -> None:
+        if item is None:
+            self.close()
+            return
+        if self._offer(item) is None:
+            raise asyncio.QueueFull
+
+    async def put(self, item) -> bool:
+        if item is None:
+            self.close()
+            return True
+        accepted = self._offer(item)
+        if accepted is not None:
+            return accepted
+        _STREAM_CHANNEL_STATS["paused"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = None if self.pause_timeout is None else loop.time() + self.pause_timeout
+        while True:
+            putter = loop.create_future()
+            self._putters.append(putter)
+            try:
+                if deadline is None:
+                    await putter
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError
+                    await asyncio.wait_for(putter, timeout=remaining)
+            except asyncio.TimeoutError:
+                _STREAM_CHANNEL_STATS["pause_timeouts"] += 1
+                return self._overflow("consumer stalled")
+            finally:
+                if putter in self._putters:
+                    self._putters.remove(putter)
+            accepted = self._offer(item)
+            if accepted is not None:
+                return accepted
+
+    def _release_putter(self) -> None:
+        while self._putters:
+            putter = self._putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
+                return
+
+    def unget(self, item) -> None:
+        """Push a line back to the front (e.g. after peeking for a status/meta line)."""
+        self._items.appendleft(item)
+        self.buffered_bytes += len(item) if isinstance(item, str) else 0
+        self._notify(True)
+
+    def get_nowait(self):
+        if self._items:
+            item = self._items.popleft()
+            self.buffered_bytes -= len(item) if isinstance(item, str) else 0
+            self._release_putter()
+            return item
+        if self._spill_pending:
+            return self._unspill()
+        raise asyncio.QueueEmpty
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        if error is not None and self._error is None and not self._closed:
+            self._error = error
+        self._closed = True
+        while self._putters:
+            putter = self._putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
+        self._notify(True)
+
+    def _close_spill(self) -> None:
+        spill = self._spill
+        self._spill = None
+        self._spill_pending = 0
+        self._spill_read_at = self._spill_write_at = 0
+        self.spill_bytes = 0
+        if spill is not None:
+            try:
+                spill.close()
+            except Exception:
+                pass
+
+    def abandon(self) -> None:
+        """Consumer is gone: drop everything buffered and make further `put()` calls return False."""
+        self._items.clear()
+        self.buffered_bytes = 0
+        self._close_spill()
+        self.close()
+
+    def wake(self) -> None:
+        """Make a blocked `get()` return a tick (None) now."""
+        self._notify(False)
+
+    async def get(self, timeout: Optional[float] = None):
+        while True:
+            if self._items or self._spill_pending:
+                return self.get_nowait()
+            if self._closed:
+                self._close_spill()
+                if self._error is not None:
+                    raise self._error
+                return STREAM_CHANNEL_EOF
+            if timeout is not None and timeout <= 0:
+                return None
+            if self._waiter is not None:
+                raise RuntimeError("StreamLineChannel supports a single consumer")
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            handle = loop.call_later(timeout, _resolve_channel_waiter, waiter, False) if timeout is not None else None
+            self._waiter = waiter
+            try:
+                has_data = await waiter
+            finally:
+                self._waiter = None
+                if handle is not None:
+                    handle.cancel()
+            if not has_data and not self._items and not self._spill_pending and not self._closed:
+                return None
+
+    async def __aiter__(self):
+        while True:
+            item = await self.get()
+            if item is STREAM_CHANNEL_EOF:
+                return
+            if item is not None:
+                yield item
+
+    def stats_snapshot(self) -> dict:
+        return {
+            "label": self.label,
+            "policy": self.policy,
+            "lines": len(self._items),
+            "bytes": self.buffered_bytes,
+            "peak_bytes": self.peak_bytes,
+            "spilled_pending": self._spill_pending,
+            "spill_bytes": self.spill_bytes,
+            "dropped": self.dropped_lines,
+            "paused_producers": len(self._putters),
+            "closed": self._closed,
+        }
+
+
+def get_stream_channel_stats() -> dict:
+    channels = [channel for channel in list(_STREAM_CHANNELS) if not channel.closed or not channel.empty()]
+    jobs = sorted((channel.stats_snapshot() for channel in channels), key=lambda s: -(s["bytes"] + s["spill_bytes"]))
+    stats = dict(_STREAM_CHANNEL_STATS)
+    stats.update(
+        {
+            "open": len(channels),
+            "buffered_bytes": sum(job["bytes"] for job in jobs),
+            "spill_bytes": sum(job["spill_bytes"] for job in jobs),
+            "jobs": jobs[:20],
+        }
+    )
+    return stats
+
+
+async def aiter_lines_with_keepalive(lines, timeout_fn, heartbeat=None):
+    """
+    Yield lines from the async iterable `lines`, or None whenever no line arrived within `timeout_fn()` seconds
+    (None: no deadline) or the `heartbeat` reports the stream idle.
+
+    A single pump task feeds a `StreamLineChannel`, so waiting costs one future per idle period rather than a Task
+    per line. Errors raised by `lines` propagate to the caller after already-received lines are delivered.
+    """
+    # Pausing the pump stops reading from upstream until the client catches up (no timeout: the pump dies with us).
+    max_lines, max_bytes, _, _, _ = _get_stream_queue_settings()
+    channel = StreamLineChannel(max_lines, max_bytes, "pause", label="upstream-reader")
+    if heartbeat is not None:
+        heartbeat.start()
+        heartbeat.set_waker(channel.wake)
+
+    async def _pump() -> None:
+        try:
+            async for line in lines:
+                await channel.put(line if line is not None else "")
+        except Exception as e:
+            channel.close(e)
+        finally:
+            channel.close()
+
+    pump = asyncio.create_task(_pump())
+    try:
+        while True:
+            item = await channel.get(timeout=timeout_fn())
+            if item is STREAM_CHANNEL_EOF:
+                break
+            yield item
+    finally:
+        if heartbeat is not None:
+            heartbeat.set_waker(None)
+        if not pump.done():
+            pump.cancel()
+        channel.abandon()
+
+
+class BrowserFetchStreamResponse:
+    def __init__(
+        self,
+        status_code: int,
+        headers: Optional[dict],
+        text: str = "",
+        method: str = "POST",
+        url: str = "",
+        lines_queue: Optional[StreamLineChannel] = None,
+        done_event: Optional[asyncio.Event] = None,
+        on_abandon=None,
+    ):
+        self.status_code = int(status_code or 0)
+        self.headers = headers or {}
         self._text = text or ""
         self._method = str(method or "POST")
         self._url = str(url or "")
         self._lines_queue = lines_queue
         self._done_event = done_event
+        # Called once if the consumer stops before the producer finished (e.g. to abort the in-page fetch).
+        self._on_abandon = on_abandon
+
+    def _abandon(self) -> None:
+        channel = self._lines_queue
+        if channel is not None:
+            channel.abandon()
+        callback, self._on_abandon = self._on_abandon, None
+        if callback is not None:
+            try:
+                callback()
+            except Exception:
+                pass
 
     async def __aenter__(self):
         return self
@@ -845,7 +1623,8 @@ class BrowserFetchStreamResponse:
         return False
 
     async def aclose(self) -> None:
-        return None
+        if self._lines_queue is not None and not self._lines_queue.closed:
+            self._abandon()
 
     @property
     def text(self) -> str:
@@ -860,18 +1639,16 @@ class BrowserFetchStreamResponse:
 
     async def aiter_lines(self):
         if self._lines_queue is not None:
-            # Streaming mode
-            while True:
-                if self._done_event and self._done_event.is_set() and self._lines_queue.empty():
-                    break
-                try:
-                    # Brief timeout to check done_event occasionally
-                    line = await asyncio.wait_for(self._lines_queue.get(), timeout=1.0)
-                    if line is None: # Sentinel for EOF
-                        break
+            # Streaming mode: the producer closes the channel when the in-page fetch finishes.
+            channel = self._lines_queue
+            finished = False
+            try:
+                async for line in channel:
                     yield line
-                except asyncio.TimeoutError:
-                    continue
+                finished = True
+            finally:
+                if not finished:
+                    self._abandon()
         else:
             # Buffered mode
             for line in self._text.splitlines():
@@ -921,7 +1698,7 @@ def _get_userscript_proxy_queue() -> asyncio.Queue:
 
 
 def _userscript_proxy_is_active(config: Optional[dict] = None) -> bool:
-    cfg = config or get_config()
+    cfg = config or get_config_view()
     poll_timeout = 25
     try:
         poll_timeout = int(cfg.get("userscript_proxy_poll_timeout_seconds", 25))
@@ -943,15 +1720,22 @@ def _userscript_proxy_is_active(config: Optional[dict] = None) -> bool:
     return delta <= float(active_window)
 
 
-def _userscript_proxy_check_secret(request: Request) -> None:
-    cfg = get_config()
+def _userscript_proxy_secret_ok(presented: Optional[str], config: Optional[dict] = None) -> bool:
+    """True when no `userscript_proxy_secret` is configured or `presented` matches it (constant-time)."""
+    cfg = config or get_config_view()
     secret = str(cfg.get("userscript_proxy_secret") or "").strip()
-    if secret and request.headers.get("X-LMBridge-Secret") != secret:
+    if not secret:
+        return True
+    return secrets.compare_digest(str(presented or "").encode("utf-8"), secret.encode("utf-8"))
+
+
+def _userscript_proxy_check_secret(request: Request) -> None:
+    if not _userscript_proxy_secret_ok(request.headers.get("X-LMBridge-Secret")):
         raise HTTPException(status_code=401, detail="Invalid userscript proxy secret")
 
 
 def _cleanup_userscript_proxy_jobs(config: Optional[dict] = None) -> None:
-    cfg = config or get_config()
+    cfg = config or get_config_view()
     ttl_seconds = 90
     try:
         ttl_seconds = int(cfg.get("userscript_proxy_job_ttl_seconds", 90))
@@ -1064,44 +1848,36 @@ class UserscriptProxyStreamResponse:
             return
         q = job.get("lines_queue")
         done_event = job.get("done_event")
-        if not isinstance(q, asyncio.Queue) or not isinstance(done_event, asyncio.Event):
+        if not isinstance(q, StreamLineChannel) or not isinstance(done_event, asyncio.Event):
             return
 
         deadline = time.time() + float(max(5, self._timeout_seconds))
-        while True:
-            if done_event.is_set() and q.empty():
-                break
-            remaining = deadline - time.time()
-            if remaining <= 0:
-                job["error"] = job.get("error") or "userscript proxy timeout"
-                job["done"] = True
-                done_event.set()
-                break
-            timeout = max(0.25, min(2.0, remaining))
-            try:
-                item = await asyncio.wait_for(q.get(), timeout=timeout)
-            except asyncio.TimeoutError:
-                continue
-            if item is None:
-                break
-            yield str(item)
-
-    async def aread(self) -> bytes:
-        job = _USERSCRIPT_PROXY_JOBS.get(self.job_id)
-        if not isinstance(job, dict):
-            return b""
-        q = job.get("lines_queue")
-        if not isinstance(q, asyncio.Queue):
-            return b""
-        items: list[str] = []
+        finished = False
         try:
             while True:
-                item = q.get_nowait()
-                if item is None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    job["error"] = job.get("error") or "userscript proxy timeout"
+                    job["done"] = True
+                    done_event.set()
+                    q.close()
                     break
-                items.append(str(item))
-        except Exception:
-            pass
+                # Proxy pushes close the channel with `done`; the timeout only bounds an abandoned job.
+                item = await q.get(timeout=remaining)
+                if item is STREAM_CHANNEL_EOF:
+                    break
+                if item is None:
+                    continue
+                yield str(item)
+            finished = True
+        finally:
+            if not finished:
+                # Client went away mid-stream: release the buffer and stop accepting pushes for this job.
+                q.abandon()
+
+    async def aread(self) -> bytes:
+        # Buffer the rest of the body (typically a short error payload); the channel closes once the proxy is done.
+        items = [line async for line in self.aiter_lines()]
         return ("\n".join(items)).encode("utf-8")
 
     def raise_for_status(self) -> None:
@@ -1117,6 +1893,28 @@ class UserscriptProxyStreamResponse:
             raise httpx.HTTPStatusError(f"HTTP {status}", request=request, response=response)
 
 
+async def wait_for_userscript_proxy_job_update(job: dict, timeout: float) -> None:
+    """
+    Wait until the proxy reports a (new) status for `job` or finishes it, or `timeout` seconds pass.
+
+    The job's `status_event` is cleared first so a status that was already reported doesn't count as an update.
+    """
+    status_event = job.get("status_event")
+    done_event = job.get("done_event")
+    events = [event for event in (status_event, done_event) if isinstance(event, asyncio.Event)]
+    if isinstance(status_event, asyncio.Event) and not job.get("done"):
+        status_event.clear()
+    waiters = [asyncio.ensure_future(event.wait()) for event in events]
+    try:
+        if waiters:
+            await asyncio.wait(waiters, timeout=max(0.0, float(timeout)), return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await asyncio.sleep(max(0.0, float(timeout)))
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
 async def fetch_lmarena_stream_via_userscript_proxy(
     http_method: str,
     url: str,
@@ -1128,7 +1926,7 @@ async def fetch_lmarena_stream_via_userscript_proxy(
     _cleanup_userscript_proxy_jobs(config)
 
     job_id = str(uuid.uuid4())
-    lines_queue: asyncio.Queue = asyncio.Queue()
+    lines_queue = StreamLineChannel.bounded(label=f"userscript:{job_id[:8]}", config=config)
     done_event: asyncio.Event = asyncio.Event()
     status_event: asyncio.Event = asyncio.Event()
     picked_up_event: asyncio.Event = asyncio.Event()
@@ -1177,61 +1975,13 @@ async def fetch_lmarena_stream_via_chrome(
     Fallback transport: perform the stream request via in-browser fetch (Chrome/Edge via Playwright).
     This tends to align cookies/UA/TLS with what LMArena expects and can reduce reCAPTCHA flakiness.
     """
-    try:
-        from playwright.async_api import async_playwright  # type: ignore
-    except Exception:
-        return None
-
-    chrome_path = find_chrome_executable()
-    if not chrome_path:
+    pool = await get_chrome_page_pool()
+    if pool is None:
         return None
 
     config = get_config()
     recaptcha_sitekey, recaptcha_action = get_recaptcha_settings(config)
-
-    cookie_store = config.get("browser_cookies")
-    cookie_map: dict[str, str] = {}
-    if isinstance(cookie_store, dict):
-        for name, value in cookie_store.items():
-            if not name or not value:
-                continue
-            cookie_map[str(name)] = str(value)
-
-    # Prefer the Chrome persistent profile's own Cloudflare/BM cookies when present.
-    # We only inject missing cookies to avoid overwriting a valid cf_clearance/__cf_bm with stale values
-    # coming from a different browser fingerprint.
-    cf_clearance = str(config.get("cf_clearance") or cookie_map.get("cf_clearance") or "").strip()
-    cf_bm = str(config.get("cf_bm") or cookie_map.get("__cf_bm") or "").strip()
-    cfuvid = str(config.get("cfuvid") or cookie_map.get("_cfuvid") or "").strip()
-    provisional_user_id = str(config.get("provisional_user_id") or cookie_map.get("provisional_user_id") or "").strip()
-    grecaptcha_cookie = str(cookie_map.get("_GRECAPTCHA") or "").strip()
-
-    desired_cookies: list[dict] = []
-    if cf_clearance:
-        desired_cookies.append({"name": "cf_clearance", "value": cf_clearance, "domain": ".lmarena.ai", "path": "/"})
-    if cf_bm:
-        desired_cookies.append({"name": "__cf_bm", "value": cf_bm, "domain": ".lmarena.ai", "path": "/"})
-    if cfuvid:
-        desired_cookies.append({"name": "_cfuvid", "value": cfuvid, "domain": ".lmarena.ai", "path": "/"})
-    if provisional_user_id:
-        desired_cookies.append(
-            {"name": "provisional_user_id", "value": provisional_user_id, "domain": ".lmarena.ai", "path": "/"}
-        )
-    if grecaptcha_cookie:
-        desired_cookies.append({"name": "_GRECAPTCHA", "value": grecaptcha_cookie, "domain": ".lmarena.ai", "path": "/"})
-    if auth_token:
-        # arena-auth-prod-v1 is commonly stored as a host-only cookie on `lmarena.ai` (no leading dot).
-        desired_cookies.append({"name": "arena-auth-prod-v1", "value": auth_token, "domain": "lmarena.ai", "path": "/"})
-
-    # Inject split cookies if present
-    if isinstance(cookie_store, dict):
-        v1_0 = str(cookie_store.get("arena-auth-prod-v1.0") or "").strip()
-        v1_1 = str(cookie_store.get("arena-auth-prod-v1.1") or "").strip()
-        if v1_0:
-            desired_cookies.append({"name": "arena-auth-prod-v1.0", "value": v1_0, "domain": "lmarena.ai", "path": "/"})
-        if v1_1:
-            desired_cookies.append({"name": "arena-auth-prod-v1.1", "value": v1_1, "domain": "lmarena.ai", "path": "/"})
-
+    desired_cookies = _build_chrome_profile_cookies(config, auth_token)
     user_agent = normalize_user_agent_value(config.get("user_agent"))
 
     fetch_url = url
@@ -1253,98 +2003,500 @@ async def fetch_lmarena_stream_via_chrome(
 
     max_recaptcha_attempts = max(1, min(int(max_recaptcha_attempts), 10))
 
-    profile_dir = Path(CONFIG_FILE).with_name("chrome_grecaptcha")
-    async with async_playwright() as p:
-        context = await p.chromium.launch_persistent_context(
-            user_data_dir=str(profile_dir),
-            executable_path=chrome_path,
-            headless=bool(headless),
-            user_agent=user_agent or None,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-first-run",
-                "--no-default-browser-check",
-            ],
+    _, _, acquire_timeout = _get_chrome_page_pool_settings()
+    try:
+        slot = await pool.acquire(
+            cookies=desired_cookies,
+            headless=headless,
+            user_agent=user_agent,
+            timeout=acquire_timeout,
         )
+    except Exception as e:
+        debug_print(f"??? Chrome fetch transport failed: {e}")
+        return None
+
+    # The lease is returned in `finally`, unless a streaming response takes ownership of it.
+    release_on_exit = True
+    broken = False
+    fetch_task: Optional[asyncio.Task] = None
+    fetch_id = ""
+    context, page = slot.context, slot.page
+    try:
+        # Persist updated cookies/UA from this browser context (helps keep auth + cf cookies fresh).
         try:
-            # Small stealth tweak: reduces bot-detection surface for reCAPTCHA v3 scoring.
+            fresh_cookies = await context.cookies("https://lmarena.ai")
+            _capture_ephemeral_arena_auth_token_from_cookies(fresh_cookies)
+            if slot.user_agent is None:
+                try:
+                    slot.user_agent = await page.evaluate("() => navigator.userAgent")
+                except Exception:
+                    slot.user_agent = user_agent
+            if _upsert_browser_session_into_config(config, fresh_cookies, user_agent=slot.user_agent):
+                save_config(config)
+        except Exception:
+            pass
+
+        async def _mint_recaptcha_v3_token() -> Optional[str]:
+            await page.wait_for_function(
+                "window.grecaptcha && ("
+                "(window.grecaptcha.enterprise && typeof window.grecaptcha.enterprise.execute === 'function') || "
+                "typeof window.grecaptcha.execute === 'function'"
+                ")",
+                timeout=60000,
+            )
+            token = await page.evaluate(
+                """({sitekey, action}) => new Promise((resolve, reject) => {
+                  const g = (window.grecaptcha?.enterprise && typeof window.grecaptcha.enterprise.execute === 'function')
+                    ? window.grecaptcha.enterprise
+                    : window.grecaptcha;
+                  if (!g || typeof g.execute !== 'function') return reject('NO_GRECAPTCHA');
+                  try {
+                    g.execute(sitekey, { action }).then(resolve).catch((err) => reject(String(err)));
+                  } catch (e) { reject(String(e)); }
+                })""",
+                {"sitekey": recaptcha_sitekey, "action": recaptcha_action},
+            )
+            if isinstance(token, str) and token:
+                return token
+            return None
+
+        async def _mint_recaptcha_v2_token() -> Optional[str]:
+            """
+            Best-effort: try to obtain a reCAPTCHA Enterprise v2 token (checkbox/invisible).
+            LMArena falls back to v2 when v3 scoring is rejected.
+            """
             try:
-                await context.add_init_script(
-                    "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
+                await page.wait_for_function(
+                    "window.grecaptcha && window.grecaptcha.enterprise && typeof window.grecaptcha.enterprise.render === 'function'",
+                    timeout=60000,
                 )
             except Exception:
-                pass
+                return None
 
-            if desired_cookies:
-                try:
-                    existing_names: set[str] = set()
-                    try:
-                        existing = await context.cookies("https://lmarena.ai")
-                        for c in existing or []:
-                            name = c.get("name")
-                            if name:
-                                existing_names.add(str(name))
-                    except Exception:
-                        existing_names = set()
+            token = await page.evaluate(
+                """({sitekey, timeoutMs}) => new Promise((resolve, reject) => {
+                  const g = window.grecaptcha?.enterprise;
+                  if (!g || typeof g.render !== 'function') return reject('NO_GRECAPTCHA_V2');
+                  let settled = false;
+                  const done = (fn, arg) => {
+                    if (settled) return;
+                    settled = true;
+                    fn(arg);
+                  };
+                  try {
+                    const el = document.createElement('div');
+                    el.style.cssText = 'position:fixed;left:-9999px;top:-9999px;width:1px;height:1px;';
+                    document.body.appendChild(el);
+                    const timer = setTimeout(() => done(reject, 'V2_TIMEOUT'), timeoutMs || 60000);
+                    const wid = g.render(el, {
+                      sitekey,
+                      size: 'invisible',
+                      callback: (tok) => { clearTimeout(timer); done(resolve, tok); },
+                      'error-callback': () => { clearTimeout(timer); done(reject, 'V2_ERROR'); },
+                    });
+                    try {
+                      if (typeof g.execute === 'function') g.execute(wid);
+                    } catch (e) {}
+                  } catch (e) {
+                    done(reject, String(e));
+                  }
+                })""",
+                {"sitekey": RECAPTCHA_V2_SITEKEY, "timeoutMs": 60000},
+            )
+            if isinstance(token, str) and token:
+                return token
+            return None
 
-                    cookies_to_add: list[dict] = []
-                    for c in desired_cookies:
-                        name = str(c.get("name") or "")
-                        if not name:
-                            continue
-                        # Always ensure the auth cookie matches the selected upstream token.
-                        if name == "arena-auth-prod-v1":
-                            cookies_to_add.append(c)
-                            continue
+        lines_queue = StreamLineChannel.bounded(label=f"chrome:{slot.index}")
+        done_event: asyncio.Event = asyncio.Event()
+        # The page's `reportChunk` binding (exposed once per pooled page) forwards lines for this lease here.
+        slot.lines_queue = lines_queue
+
+        fetch_script = """async ({url, method, body, extraHeaders, timeoutMs, fetchId}) => {
+          const controller = new AbortController();
+          const timer = setTimeout(() => controller.abort('timeout'), timeoutMs);
+          const active = (window.__lmbridgeFetches = window.__lmbridgeFetches || {});
+          active[fetchId] = controller;
+          try {
+            const res = await fetch(url, {
+              method,
+              headers: { 
+                'content-type': 'text/plain;charset=UTF-8',
+                ...extraHeaders
+              },
+              body,
+              credentials: 'include',
+              signal: controller.signal,
+            });
+            const headers = {};
+            try {
+              if (res.headers && typeof res.headers.forEach === 'function') {
+                res.headers.forEach((value, key) => { headers[key] = value; });
+              }
+            } catch (e) {}
 
-                        # Do NOT overwrite/inject Cloudflare or reCAPTCHA cookies in the persistent profile.
-                        # The profile manages these itself; injecting stale ones from config causes 403s.
-                        if name in ("cf_clearance", "__cf_bm", "_GRECAPTCHA"):
-                            continue
+            // Send initial status and headers
+            if (window.reportChunk) {
+                await window.reportChunk(fetchId, JSON.stringify({ __type: 'meta', status: res.status, headers }));
+            }
 
-                        # Avoid overwriting existing Cloudflare/session cookies in the persistent profile.
-                        if name in existing_names:
-                            continue
-                        cookies_to_add.append(c)
+            if (res.body) {
+              const reader = res.body.getReader();
+              const decoder = new TextDecoder();
+              let buffer = '';
+              while (true) {
+                const { value, done } = await reader.read();
+                if (value) buffer += decoder.decode(value, { stream: true });
+                if (done) buffer += decoder.decode();
+                
+                const parts = buffer.split(/\\r?\\n/);
+                buffer = parts.pop() || '';
+                for (const line of parts) {
+                    if (line.trim() && window.reportChunk) {
+                        await window.reportChunk(fetchId, line);
+                    }
+                }
+                if (done) break;
+              }
+              if (buffer.trim() && window.reportChunk) {
+                  await window.reportChunk(fetchId, buffer);
+              }
+            } else {
+              const text = await res.text();
+              if (window.reportChunk) await window.reportChunk(fetchId, text);
+            }
+            return { __streaming: true };
+          } catch (e) {
+            return { status: 502, headers: {}, text: 'FETCH_ERROR:' + String(e) };
+          } finally {
+            clearTimeout(timer);
+            delete active[fetchId];
+          }
+        }"""
+
+        async def _abort_fetch(task: Optional[asyncio.Task], aborted_id: str) -> None:
+            """Stop an in-page fetch that is no longer wanted (superseded attempt or departed client)."""
+            if task is None or task.done():
+                return
+            try:
+                await page.evaluate(
+                    "(id) => { const c = (window.__lmbridgeFetches || {})[id]; if (c) c.abort('cancelled'); }",
+                    aborted_id,
+                )
+            except Exception:
+                # Could not reach the page: stop waiting on it; late chunks are dropped by the fetch id check.
+                task.cancel()
+
+        result: dict = {"status": 0, "headers": {}, "text": ""}
+        for attempt in range(max_recaptcha_attempts):
+            # A previous attempt's fetch may still be streaming its (error) body; stop it before starting over.
+            await _abort_fetch(fetch_task, fetch_id)
+
+            # Clear queue for each attempt
+            while not lines_queue.empty():
+                lines_queue.get_nowait()
+            done_event.clear()
+
+            current_recaptcha_token = ""
+            # Mint a new token if not already present or if it's empty
+            has_v2 = isinstance(payload, dict) and bool(payload.get("recaptchaV2Token"))
+            has_v3 = isinstance(payload, dict) and bool(payload.get("recaptchaV3Token"))
+            
+            if isinstance(payload, dict) and not has_v2 and (attempt > 0 or not has_v3):
+                current_recaptcha_token = await _mint_recaptcha_v3_token()
+                if current_recaptcha_token:
+                    payload["recaptchaV3Token"] = current_recaptcha_token
+
+            extra_headers = {}
+            token_for_headers = current_recaptcha_token
+            if not token_for_headers and isinstance(payload, dict):
+                token_for_headers = str(payload.get("recaptchaV3Token") or "").strip()
+            if token_for_headers:
+                extra_headers["X-Recaptcha-Token"] = token_for_headers
+                extra_headers["X-Recaptcha-Action"] = recaptcha_action
+
+            body = json.dumps(payload) if payload is not None else ""
+            
+            # Start fetch task; only this attempt's fetch may feed `lines_queue` from now on.
+            fetch_id = uuid.uuid4().hex
+            slot.fetch_id = fetch_id
+            fetch_task = asyncio.create_task(page.evaluate(
+                fetch_script,
+                {
+                    "fetchId": fetch_id,
+                    "url": fetch_url,
+                    "method": http_method,
+                    "body": body,
+                    "extraHeaders": extra_headers,
+                    "timeoutMs": int(timeout_seconds * 1000),
+                },
+            ))
+
+            # Wait for initial meta (status/headers) OR task completion (which wakes the channel).
+            meta = None
+            fetch_task.add_done_callback(lambda _task: lines_queue.wake())
+            while not fetch_task.done():
+                # Peek at queue for meta
+                item = await lines_queue.get()
+                if item is STREAM_CHANNEL_EOF:
+                    break
+                if item is None:
+                    continue
+                if isinstance(item, str) and item.startswith('{"__type":"meta"'):
+                    meta = json.loads(item)
+                    break
+                # Not meta: LMArena may send data immediately, so it's likely already content.
+                # Put it back in front and assume status 200.
+                lines_queue.unget(item)
+                meta = {"status": 200, "headers": {}}
+                break
+            
+            if fetch_task.done() and meta is None:
+                try:
+                    res = fetch_task.result()
+                    if isinstance(res, dict) and not res.get("__streaming"):
+                        result = res
+                    else:
+                        result = {"status": 502, "text": "FETCH_DONE_WITHOUT_META"}
+                except Exception as e:
+                    result = {"status": 502, "text": f"FETCH_EXCEPTION: {e}"}
+            elif meta:
+                result = meta
+            
+            status_code = int(result.get("status") or 0)
+
+            # If upstream rate limits us, wait and retry inside the same browser session to avoid hammering.
+            if status_code == HTTPStatus.TOO_MANY_REQUESTS and attempt < max_recaptcha_attempts - 1:
+                retry_after = None
+                if isinstance(result, dict) and isinstance(result.get("headers"), dict):
+                    headers_map = result.get("headers") or {}
+                    retry_after = headers_map.get("retry-after") or headers_map.get("Retry-After")
+                sleep_seconds = get_rate_limit_sleep_seconds(
+                    str(retry_after) if retry_after is not None else None,
+                    attempt,
+                )
+                await asyncio.sleep(sleep_seconds)
+                continue
+
+            if not _is_recaptcha_validation_failed(status_code, result.get("text")):
+                # Success or non-recaptcha error. 
+                # If success, start a task to wait for fetch_task to finish and set done_event.
+                if status_code < 400:
+                    # If the in-page script returned a buffered body (e.g. in unit tests/mocks where
+                    # `reportChunk` isn't exercised), fall back to a plain buffered response.
+                    body_text = ""
+                    try:
+                        candidate_body = result.get("text") if isinstance(result, dict) else None
+                    except Exception:
+                        candidate_body = None
+                    if isinstance(candidate_body, str) and candidate_body:
+                        return BrowserFetchStreamResponse(
+                            status_code=status_code,
+                            headers=result.get("headers", {}) if isinstance(result, dict) else {},
+                            text=candidate_body,
+                            method=http_method,
+                            url=url,
+                        )
+
+                    async def _wait_for_finish():
+                        finish_broken = False
+                        try:
+                            await fetch_task
+                        except BaseException:
+                            finish_broken = True
+                        finally:
+                            done_event.set()
+                            lines_queue.close()
+                            pool.release(slot, broken=finish_broken)
+                    release_on_exit = False
+                    asyncio.create_task(_wait_for_finish())
+                    
+                    return BrowserFetchStreamResponse(
+                        status_code=status_code,
+                        headers=result.get("headers", {}),
+                        method=http_method,
+                        url=url,
+                        lines_queue=lines_queue,
+                        done_event=done_event,
+                        # Client gone: abort the in-page fetch so `_wait_for_finish` returns the lease now.
+                        on_abandon=lambda task=fetch_task, fid=fetch_id: asyncio.create_task(_abort_fetch(task, fid)),
+                    )
+                break
+
+            if attempt < max_recaptcha_attempts - 1:
+                # ... retry logic ...
+                if isinstance(payload, dict) and not bool(payload.get("recaptchaV2Token")):
+                    try:
+                        v2_token = await _mint_recaptcha_v2_token()
+                    except Exception:
+                        v2_token = None
+                    if v2_token:
+                        payload["recaptchaV2Token"] = v2_token
+                        payload.pop("recaptchaV3Token", None)
+                        await asyncio.sleep(0.5)
+                        continue
+
+                try:
+                    await click_turnstile(page)
+                except Exception:
+                    pass
 
-                    if cookies_to_add:
-                        await context.add_cookies(cookies_to_add)
+                try:
+                    await page.mouse.move(120 + (attempt * 10), 120 + (attempt * 10))
+                    await page.mouse.wheel(0, 250)
                 except Exception:
                     pass
+                await asyncio.sleep(min(2.0 * (2**attempt), 15.0))
 
-            page = await context.new_page()
-            await page.goto("https://lmarena.ai/?mode=direct", wait_until="domcontentloaded", timeout=120000)
+        response = BrowserFetchStreamResponse(
+            int(result.get("status") or 0),
+            result.get("headers") if isinstance(result, dict) else {},
+            result.get("text") if isinstance(result, dict) else "",
+            method=http_method,
+            url=url,
+        )
+        return response
+    except Exception as e:
+        debug_print(f"??? Chrome fetch transport failed: {e}")
+        broken = True
+        return None
+    finally:
+        if release_on_exit:
+            # The last attempt's fetch may still be reading an error body; don't leave it running on a free slot.
+            if fetch_task is not None and not fetch_task.done():
+                await _abort_fetch(fetch_task, fetch_id)
+            pool.release(slot, broken=broken)
+
+
+async def fetch_lmarena_stream_via_camoufox(
+    http_method: str,
+    url: str,
+    payload: dict,
+    auth_token: str,
+    timeout_seconds: int = 120,
+    max_recaptcha_attempts: int = 3,
+) -> Optional[BrowserFetchStreamResponse]:
+    """
+    Fallback transport: fetch via Camoufox (Firefox) in-page fetch.
+    Uses 'window.wrappedJSObject' for reCAPTCHA access when Chrome is blocked.
+    """
+    debug_print("🦊 Attempting Camoufox fetch transport...")
+    
+    config = get_config()
+    recaptcha_sitekey, recaptcha_action = get_recaptcha_settings(config)
+    
+    cookie_store = config.get("browser_cookies")
+    cookie_map: dict[str, str] = {}
+    if isinstance(cookie_store, dict):
+        for name, value in cookie_store.items():
+            if not name or not value:
+                continue
+            cookie_map[str(name)] = str(value)
+
+    cf_clearance = str(config.get("cf_clearance") or cookie_map.get("cf_clearance") or "").strip()
+    cf_bm = str(config.get("cf_bm") or cookie_map.get("__cf_bm") or "").strip()
+    cfuvid = str(config.get("cfuvid") or cookie_map.get("_cfuvid") or "").strip()
+    provisional_user_id = str(config.get("provisional_user_id") or cookie_map.get("provisional_user_id") or "").strip()
+    grecaptcha_cookie = str(cookie_map.get("_GRECAPTCHA") or "").strip()
+
+    desired_cookies: list[dict] = []
+    if cf_clearance:
+        desired_cookies.append({"name": "cf_clearance", "value": cf_clearance, "domain": ".lmarena.ai", "path": "/"})
+    if cf_bm:
+        desired_cookies.append({"name": "__cf_bm", "value": cf_bm, "domain": ".lmarena.ai", "path": "/"})
+    if cfuvid:
+        desired_cookies.append({"name": "_cfuvid", "value": cfuvid, "domain": ".lmarena.ai", "path": "/"})
+    if provisional_user_id:
+        desired_cookies.append(
+            {"name": "provisional_user_id", "value": provisional_user_id, "domain": ".lmarena.ai", "path": "/"}
+        )
+    if grecaptcha_cookie:
+        desired_cookies.append({"name": "_GRECAPTCHA", "value": grecaptcha_cookie, "domain": ".lmarena.ai", "path": "/"})
+    if auth_token:
+        # arena-auth-prod-v1 is commonly stored as a host-only cookie on `lmarena.ai` (no leading dot).
+        desired_cookies.append({"name": "arena-auth-prod-v1", "value": auth_token, "domain": "lmarena.ai", "path": "/"})
+
+    # Inject split cookies if present
+    if isinstance(cookie_store, dict):
+        v1_0 = str(cookie_store.get("arena-auth-prod-v1.0") or "").strip()
+        v1_1 = str(cookie_store.get("arena-auth-prod-v1.1") or "").strip()
+        if v1_0:
+            desired_cookies.append({"name": "arena-auth-prod-v1.0", "value": v1_0, "domain": "lmarena.ai", "path": "/"})
+        if v1_1:
+            desired_cookies.append({"name": "arena-auth-prod-v1.1", "value": v1_1, "domain": "lmarena.ai", "path": "/"})
+
+    user_agent = normalize_user_agent_value(config.get("user_agent"))
+
+    fetch_url = url
+    if fetch_url.startswith("https://lmarena.ai"):
+        fetch_url = fetch_url[len("https://lmarena.ai") :]
+    if not fetch_url.startswith("/"):
+        fetch_url = "/" + fetch_url
+
+    def _is_recaptcha_validation_failed(status: int, text: object) -> bool:
+        if int(status or 0) != HTTPStatus.FORBIDDEN:
+            return False
+        if not isinstance(text, str) or not text:
+            return False
+        try:
+            body = json.loads(text)
+        except Exception:
+            return False
+        return isinstance(body, dict) and body.get("error") == "recaptcha validation failed"
+
+    try:
+        # Default to headful for better Turnstile/reCAPTCHA reliability; allow override via config.
+        try:
+            headless_value = config.get("camoufox_fetch_headless", None)
+            headless = bool(headless_value) if headless_value is not None else False
+        except Exception:
+            headless = False
 
-            # Best-effort: if we land on a Cloudflare challenge page, try clicking Turnstile before minting tokens.
+        async with AsyncCamoufox(headless=headless, main_world_eval=True) as browser:
+            context = await browser.new_context(user_agent=user_agent or None)
+            # Small stealth tweak: reduces bot-detection surface for reCAPTCHA v3 scoring.
             try:
-                for i in range(10): # Up to 30 seconds
-                    title = await page.title()
-                    if "Just a moment" not in title:
-                        break
-                    debug_print(f"  ⏳ Waiting for Cloudflare challenge in Chrome... (attempt {i+1}/10)")
-                    await click_turnstile(page)
-                    await asyncio.sleep(3)
+                await context.add_init_script(
+                    "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
+                )
+            except Exception:
+                pass
+            if desired_cookies:
                 try:
-                    await page.wait_for_load_state("domcontentloaded", timeout=15000)
+                    await context.add_cookies(desired_cookies)
                 except Exception:
                     pass
+
+            page = await context.new_page()
+            await _maybe_apply_camoufox_window_mode(
+                page,
+                config,
+                mode_key="camoufox_fetch_window_mode",
+                marker="LMArenaBridge Camoufox Fetch",
+                headless=headless,
+            )
+              
+            debug_print(f"  🦊 Navigating to lmarena.ai...")
+            try:
+                await asyncio.wait_for(
+                    page.goto("https://lmarena.ai/?mode=direct", wait_until="domcontentloaded", timeout=60000),
+                    timeout=70.0,
+                )
             except Exception:
                 pass
 
-            # Light warm-up (often improves reCAPTCHA v3 score vs firing immediately).
+            # Try to handle Cloudflare Turnstile if present
             try:
-                await page.mouse.move(100, 100)
-                await asyncio.sleep(0.5)
-                await page.mouse.wheel(0, 200)
-                await asyncio.sleep(1)
-                await page.mouse.move(200, 300)
-                await asyncio.sleep(0.5)
-                await page.mouse.wheel(0, 300)
-                await asyncio.sleep(2) # Reduced "Human" pause for faster response
+                for _ in range(5):
+                    title = await page.title()
+                    if "Just a moment" not in title:
+                        break
+                    await click_turnstile(page)
+                    await asyncio.sleep(2)
             except Exception:
                 pass
-
-            # Persist updated cookies/UA from this browser context (helps keep auth + cf cookies fresh).
+            
+            # Persist cookies
             try:
                 fresh_cookies = await context.cookies("https://lmarena.ai")
                 _capture_ephemeral_arena_auth_token_from_cookies(fresh_cookies)
@@ -1358,92 +2510,126 @@ async def fetch_lmarena_stream_via_chrome(
                 pass
 
             async def _mint_recaptcha_v3_token() -> Optional[str]:
+                # Wait for grecaptcha using wrappedJSObject
                 await page.wait_for_function(
-                    "window.grecaptcha && ("
-                    "(window.grecaptcha.enterprise && typeof window.grecaptcha.enterprise.execute === 'function') || "
-                    "typeof window.grecaptcha.execute === 'function'"
-                    ")",
+                    "() => { const w = window.wrappedJSObject || window; return !!(w.grecaptcha && ((w.grecaptcha.enterprise && typeof w.grecaptcha.enterprise.execute === 'function') || typeof w.grecaptcha.execute === 'function')); }",
                     timeout=60000,
                 )
-                token = await page.evaluate(
-                    """({sitekey, action}) => new Promise((resolve, reject) => {
-                      const g = (window.grecaptcha?.enterprise && typeof window.grecaptcha.enterprise.execute === 'function')
-                        ? window.grecaptcha.enterprise
-                        : window.grecaptcha;
-                      if (!g || typeof g.execute !== 'function') return reject('NO_GRECAPTCHA');
-                      try {
-                        g.execute(sitekey, { action }).then(resolve).catch((err) => reject(String(err)));
-                      } catch (e) { reject(String(e)); }
-                    })""",
-                    {"sitekey": recaptcha_sitekey, "action": recaptcha_action},
-                )
-                if isinstance(token, str) and token:
-                    return token
-                return None
-
-            async def _mint_recaptcha_v2_token() -> Optional[str]:
-                """
-                Best-effort: try to obtain a reCAPTCHA Enterprise v2 token (checkbox/invisible).
-                LMArena falls back to v2 when v3 scoring is rejected.
-                """
-                try:
-                    await page.wait_for_function(
-                        "window.grecaptcha && window.grecaptcha.enterprise && typeof window.grecaptcha.enterprise.render === 'function'",
-                        timeout=60000,
-                    )
-                except Exception:
-                    return None
-
-                token = await page.evaluate(
-                    """({sitekey, timeoutMs}) => new Promise((resolve, reject) => {
-                      const g = window.grecaptcha?.enterprise;
-                      if (!g || typeof g.render !== 'function') return reject('NO_GRECAPTCHA_V2');
-                      let settled = false;
-                      const done = (fn, arg) => {
-                        if (settled) return;
-                        settled = true;
-                        fn(arg);
-                      };
-                      try {
-                        const el = document.createElement('div');
-                        el.style.cssText = 'position:fixed;left:-9999px;top:-9999px;width:1px;height:1px;';
-                        document.body.appendChild(el);
-                        const timer = setTimeout(() => done(reject, 'V2_TIMEOUT'), timeoutMs || 60000);
-                        const wid = g.render(el, {
-                          sitekey,
-                          size: 'invisible',
-                          callback: (tok) => { clearTimeout(timer); done(resolve, tok); },
-                          'error-callback': () => { clearTimeout(timer); done(reject, 'V2_ERROR'); },
-                        });
-                        try {
-                          if (typeof g.execute === 'function') g.execute(wid);
-                        } catch (e) {}
-                      } catch (e) {
-                        done(reject, String(e));
-                      }
-                    })""",
-                    {"sitekey": RECAPTCHA_V2_SITEKEY, "timeoutMs": 60000},
-                )
-                if isinstance(token, str) and token:
-                    return token
-                return None
 
-            lines_queue: asyncio.Queue = asyncio.Queue()
-            done_event: asyncio.Event = asyncio.Event()
-
-            # Buffer for splitlines handling in browser
-            async def _report_chunk(source, line: str):
-                if line and line.strip():
-                    await lines_queue.put(line)
-
-            await page.expose_binding("reportChunk", _report_chunk)
+                # SIDE-CHANNEL MINTING:
+                # 1. Setup result variable
+                await safe_page_evaluate(page, "() => { (window.wrappedJSObject || window).__token_result = 'PENDING'; }")
 
-            fetch_script = """async ({url, method, body, extraHeaders, timeoutMs}) => {
-              const controller = new AbortController();
-              const timer = setTimeout(() => controller.abort('timeout'), timeoutMs);
-              try {
-                const res = await fetch(url, {
-                  method,
+                # 2. Trigger execution (fire and forget from Python's perspective)
+                trigger_script = f"""() => {{
+                    const w = window.wrappedJSObject || window;
+                    const sitekey = {json.dumps(recaptcha_sitekey)};
+                    const action = {json.dumps(recaptcha_action)};
+                    try {{
+                        const raw = w.grecaptcha;
+                        const g = (raw?.enterprise && typeof raw.enterprise.execute === 'function')
+                            ? raw.enterprise
+                            : raw;
+                        if (!g || typeof g.execute !== 'function') {{
+                            w.__token_result = 'ERROR: NO_GRECAPTCHA';
+                            return;
+                        }}
+                        const readyFn = (typeof g.ready === 'function')
+                            ? g.ready.bind(g)
+                            : (raw && typeof raw.ready === 'function')
+                              ? raw.ready.bind(raw)
+                              : null;
+                        const run = () => {{
+                            try {{
+                                Promise.resolve(g.execute(sitekey, {{ action }}))
+                                    .then(token => {{ w.__token_result = token; }})
+                                    .catch(err => {{ w.__token_result = 'ERROR: ' + String(err); }});
+                            }} catch (e) {{
+                                w.__token_result = 'SYNC_ERROR: ' + String(e);
+                            }}
+                        }};
+                        try {{
+                            if (readyFn) readyFn(run);
+                            else run();
+                        }} catch (e) {{
+                            run();
+                        }}
+                    }} catch (e) {{
+                        w.__token_result = 'SYNC_ERROR: ' + String(e);
+                    }}
+                }}"""
+                await safe_page_evaluate(page, trigger_script)
+
+                # 3. Poll for result
+                for _ in range(40): # 20 seconds max (0.5s interval)
+                    val = await safe_page_evaluate(page, "() => (window.wrappedJSObject || window).__token_result")
+                    if val != 'PENDING':
+                        if isinstance(val, str) and (val.startswith('ERROR') or val.startswith('SYNC_ERROR')):
+                            debug_print(f"  ⚠️ Camoufox token mint error: {val}")
+                            return None
+                        return val
+                    await asyncio.sleep(0.5)
+                
+                debug_print("  ⚠️ Camoufox token mint timed out.")
+                return None
+
+            async def _mint_recaptcha_v2_token() -> Optional[str]:
+                """
+                Best-effort: try to obtain a reCAPTCHA Enterprise v2 token (checkbox/invisible).
+                """
+                try:
+                    await page.wait_for_function(
+                        "() => { const w = window.wrappedJSObject || window; return !!(w.grecaptcha && w.grecaptcha.enterprise && typeof w.grecaptcha.enterprise.render === 'function'); }",
+                        timeout=60000,
+                    )
+                except Exception:
+                    return None
+
+                v2_script = f"""() => new Promise((resolve, reject) => {{
+                    const w = window.wrappedJSObject || window;
+                    const g = w.grecaptcha?.enterprise;
+                    if (!g || typeof g.render !== 'function') return reject('NO_GRECAPTCHA_V2');
+                    let settled = false;
+                    const done = (fn, arg) => {{ if (settled) return; settled = true; fn(arg); }};
+                    try {{
+                        const el = w.document.createElement('div');
+                        el.style.cssText = 'position:fixed;left:-9999px;top:-9999px;width:1px;height:1px;';
+                        w.document.body.appendChild(el);
+                        const timer = w.setTimeout(() => done(reject, 'V2_TIMEOUT'), 60000);
+                        const wid = g.render(el, {{
+                            sitekey: {json.dumps(RECAPTCHA_V2_SITEKEY)},
+                            size: 'invisible',
+                            callback: (tok) => {{ w.clearTimeout(timer); done(resolve, tok); }},
+                            'error-callback': () => {{ w.clearTimeout(timer); done(reject, 'V2_ERROR'); }},
+                        }});
+                        try {{ if (typeof g.execute === 'function') g.execute(wid); }} catch (e) {{}}
+                    }} catch (e) {{
+                        done(reject, String(e));
+                    }}
+                }})"""
+                try:
+                    token = await safe_page_evaluate(page, v2_script)
+                except Exception:
+                    return None
+                if isinstance(token, str) and token:
+                    return token
+                return None
+
+            lines_queue = StreamLineChannel.bounded(label="camoufox")
+            done_event: asyncio.Event = asyncio.Event()
+
+            async def _report_chunk(source, line: str):
+                if line and line.strip():
+                    await lines_queue.put(line)
+
+            await page.expose_binding("reportChunk", _report_chunk)
+
+            fetch_script = """async ({url, method, body, extraHeaders, timeoutMs}) => {
+              const controller = new AbortController();
+              const timer = setTimeout(() => controller.abort('timeout'), timeoutMs);
+              try {
+                const res = await fetch(url, {
+                  method,
                   headers: { 
                     'content-type': 'text/plain;charset=UTF-8',
                     ...extraHeaders
@@ -1505,14 +2691,16 @@ async def fetch_lmarena_stream_via_chrome(
                 done_event.clear()
 
                 current_recaptcha_token = ""
-                # Mint a new token if not already present or if it's empty
                 has_v2 = isinstance(payload, dict) and bool(payload.get("recaptchaV2Token"))
                 has_v3 = isinstance(payload, dict) and bool(payload.get("recaptchaV3Token"))
                 
                 if isinstance(payload, dict) and not has_v2 and (attempt > 0 or not has_v3):
-                    current_recaptcha_token = await _mint_recaptcha_v3_token()
-                    if current_recaptcha_token:
-                        payload["recaptchaV3Token"] = current_recaptcha_token
+                    try:
+                        current_recaptcha_token = await _mint_recaptcha_v3_token()
+                        if current_recaptcha_token:
+                            payload["recaptchaV3Token"] = current_recaptcha_token
+                    except Exception as e:
+                        debug_print(f"  ⚠️ Error minting token in Camoufox: {e}")
 
                 extra_headers = {}
                 token_for_headers = current_recaptcha_token
@@ -1524,7 +2712,7 @@ async def fetch_lmarena_stream_via_chrome(
 
                 body = json.dumps(payload) if payload is not None else ""
                 
-                # Start fetch task
+                # Execute fetch
                 fetch_task = asyncio.create_task(page.evaluate(
                     fetch_script,
                     {
@@ -1536,26 +2724,21 @@ async def fetch_lmarena_stream_via_chrome(
                     },
                 ))
 
-                # Wait for initial meta (status/headers) OR task completion
+                # Wait for initial meta (status/headers) OR task completion (which wakes the channel).
                 meta = None
+                fetch_task.add_done_callback(lambda _task: lines_queue.wake())
                 while not fetch_task.done():
-                    try:
-                        # Peek at queue for meta
-                        item = await asyncio.wait_for(lines_queue.get(), timeout=0.1)
-                        if isinstance(item, str) and item.startswith('{"__type":"meta"'):
-                            meta = json.loads(item)
-                            break
-                        else:
-                            # Not meta, put it back (though it shouldn't happen before meta)
-                            # Actually, LMArena might send data immediately.
-                            # If it's not meta, it's likely already content.
-                            # For safety, let's assume if it doesn't look like meta, status is 200.
-                            if not item.startswith('{"__type":"meta"'):
-                                await lines_queue.put(item)
-                                meta = {"status": 200, "headers": {}}
-                                break
-                    except asyncio.TimeoutError:
+                    item = await lines_queue.get()
+                    if item is STREAM_CHANNEL_EOF:
+                        break
+                    if item is None:
                         continue
+                    if isinstance(item, str) and item.startswith('{"__type":"meta"'):
+                        meta = json.loads(item)
+                        break
+                    lines_queue.unget(item)
+                    meta = {"status": 200, "headers": {}}
+                    break
                 
                 if fetch_task.done() and meta is None:
                     try:
@@ -1568,47 +2751,21 @@ async def fetch_lmarena_stream_via_chrome(
                         result = {"status": 502, "text": f"FETCH_EXCEPTION: {e}"}
                 elif meta:
                     result = meta
-                
+
                 status_code = int(result.get("status") or 0)
 
-                # If upstream rate limits us, wait and retry inside the same browser session to avoid hammering.
                 if status_code == HTTPStatus.TOO_MANY_REQUESTS and attempt < max_recaptcha_attempts - 1:
-                    retry_after = None
-                    if isinstance(result, dict) and isinstance(result.get("headers"), dict):
-                        headers_map = result.get("headers") or {}
-                        retry_after = headers_map.get("retry-after") or headers_map.get("Retry-After")
-                    sleep_seconds = get_rate_limit_sleep_seconds(
-                        str(retry_after) if retry_after is not None else None,
-                        attempt,
-                    )
-                    await asyncio.sleep(sleep_seconds)
+                    await asyncio.sleep(5)
                     continue
 
                 if not _is_recaptcha_validation_failed(status_code, result.get("text")):
-                    # Success or non-recaptcha error. 
-                    # If success, start a task to wait for fetch_task to finish and set done_event.
                     if status_code < 400:
-                        # If the in-page script returned a buffered body (e.g. in unit tests/mocks where
-                        # `reportChunk` isn't exercised), fall back to a plain buffered response.
-                        body_text = ""
-                        try:
-                            candidate_body = result.get("text") if isinstance(result, dict) else None
-                        except Exception:
-                            candidate_body = None
-                        if isinstance(candidate_body, str) and candidate_body:
-                            return BrowserFetchStreamResponse(
-                                status_code=status_code,
-                                headers=result.get("headers", {}) if isinstance(result, dict) else {},
-                                text=candidate_body,
-                                method=http_method,
-                                url=url,
-                            )
-
                         async def _wait_for_finish():
                             try:
                                 await fetch_task
                             finally:
                                 done_event.set()
+                                lines_queue.close()
                         asyncio.create_task(_wait_for_finish())
                         
                         return BrowserFetchStreamResponse(
@@ -1621,1477 +2778,2894 @@ async def fetch_lmarena_stream_via_chrome(
                         )
                     break
 
-                if attempt < max_recaptcha_attempts - 1:
-                    # ... retry logic ...
-                    if isinstance(payload, dict) and not bool(payload.get("recaptchaV2Token")):
-                        try:
-                            v2_token = await _mint_recaptcha_v2_token()
-                        except Exception:
-                            v2_token = None
-                        if v2_token:
-                            payload["recaptchaV2Token"] = v2_token
-                            payload.pop("recaptchaV3Token", None)
-                            await asyncio.sleep(0.5)
-                            continue
-
-                    try:
-                        await click_turnstile(page)
-                    except Exception:
-                        pass
-
+                if attempt < max_recaptcha_attempts - 1 and isinstance(payload, dict) and not bool(payload.get("recaptchaV2Token")):
                     try:
-                        await page.mouse.move(120 + (attempt * 10), 120 + (attempt * 10))
-                        await page.mouse.wheel(0, 250)
+                        v2_token = await _mint_recaptcha_v2_token()
                     except Exception:
-                        pass
-                    await asyncio.sleep(min(2.0 * (2**attempt), 15.0))
+                        v2_token = None
+                    if v2_token:
+                        payload["recaptchaV2Token"] = v2_token
+                        payload.pop("recaptchaV3Token", None)
+                        await asyncio.sleep(0.5)
+                        continue
+                
+                await asyncio.sleep(2)
 
-            response = BrowserFetchStreamResponse(
+            return BrowserFetchStreamResponse(
                 int(result.get("status") or 0),
                 result.get("headers") if isinstance(result, dict) else {},
                 result.get("text") if isinstance(result, dict) else "",
                 method=http_method,
                 url=url,
             )
-            return response
-        except Exception as e:
-            debug_print(f"??? Chrome fetch transport failed: {e}")
-            return None
-        finally:
-            await context.close()
+
+    except Exception as e:
+        debug_print(f"❌ Camoufox fetch transport failed: {e}")
+        return None
 
 
-async def fetch_lmarena_stream_via_camoufox(
-    http_method: str,
+async def fetch_via_proxy_queue(
     url: str,
     payload: dict,
-    auth_token: str,
+    http_method: str = "POST",
     timeout_seconds: int = 120,
-    max_recaptcha_attempts: int = 3,
-) -> Optional[BrowserFetchStreamResponse]:
+    streaming: bool = False,
+    auth_token: str = "",
+) -> Optional[object]:
     """
-    Fallback transport: fetch via Camoufox (Firefox) in-page fetch.
-    Uses 'window.wrappedJSObject' for reCAPTCHA access when Chrome is blocked.
+    Fallback transport: delegates the request to a connected Userscript via the Task Queue.
     """
-    debug_print("🦊 Attempting Camoufox fetch transport...")
-    
-    config = get_config()
-    recaptcha_sitekey, recaptcha_action = get_recaptcha_settings(config)
-    
-    cookie_store = config.get("browser_cookies")
-    cookie_map: dict[str, str] = {}
-    if isinstance(cookie_store, dict):
-        for name, value in cookie_store.items():
-            if not name or not value:
-                continue
-            cookie_map[str(name)] = str(value)
-
-    cf_clearance = str(config.get("cf_clearance") or cookie_map.get("cf_clearance") or "").strip()
-    cf_bm = str(config.get("cf_bm") or cookie_map.get("__cf_bm") or "").strip()
-    cfuvid = str(config.get("cfuvid") or cookie_map.get("_cfuvid") or "").strip()
-    provisional_user_id = str(config.get("provisional_user_id") or cookie_map.get("provisional_user_id") or "").strip()
-    grecaptcha_cookie = str(cookie_map.get("_GRECAPTCHA") or "").strip()
+    # Prefer the streaming-capable proxy endpoints when available.
+    proxy_stream = await fetch_lmarena_stream_via_userscript_proxy(
+        http_method=http_method,
+        url=url,
+        payload=payload or {},
+        timeout_seconds=timeout_seconds,
+        auth_token=auth_token,
+    )
+    if proxy_stream is not None:
+        if streaming:
+            return proxy_stream
 
-    desired_cookies: list[dict] = []
-    if cf_clearance:
-        desired_cookies.append({"name": "cf_clearance", "value": cf_clearance, "domain": ".lmarena.ai", "path": "/"})
-    if cf_bm:
-        desired_cookies.append({"name": "__cf_bm", "value": cf_bm, "domain": ".lmarena.ai", "path": "/"})
-    if cfuvid:
-        desired_cookies.append({"name": "_cfuvid", "value": cfuvid, "domain": ".lmarena.ai", "path": "/"})
-    if provisional_user_id:
-        desired_cookies.append(
-            {"name": "provisional_user_id", "value": provisional_user_id, "domain": ".lmarena.ai", "path": "/"}
+        # Non-streaming call: wait for the upstream status, then let the caller consume lines incrementally.
+        response = await proxy_stream.__aenter__()
+        status = int(response.status_code or 0)
+        if status < 400:
+            return response
+        # Error bodies are small and carry the details the error handling needs (e.g. the 403 reCAPTCHA payload),
+        # so buffer them like the direct httpx path does and release the channel.
+        try:
+            body = await response.aread()
+        finally:
+            job = _USERSCRIPT_PROXY_JOBS.get(response.job_id)
+            channel = job.get("lines_queue") if isinstance(job, dict) else None
+            if isinstance(channel, StreamLineChannel):
+                channel.abandon()
+        return BrowserFetchStreamResponse(
+            status_code=status,
+            headers=response.headers,
+            text=body.decode("utf-8", errors="replace"),
+            method=http_method,
+            url=url,
         )
-    if grecaptcha_cookie:
-        desired_cookies.append({"name": "_GRECAPTCHA", "value": grecaptcha_cookie, "domain": ".lmarena.ai", "path": "/"})
-    if auth_token:
-        # arena-auth-prod-v1 is commonly stored as a host-only cookie on `lmarena.ai` (no leading dot).
-        desired_cookies.append({"name": "arena-auth-prod-v1", "value": auth_token, "domain": "lmarena.ai", "path": "/"})
 
-    # Inject split cookies if present
-    if isinstance(cookie_store, dict):
-        v1_0 = str(cookie_store.get("arena-auth-prod-v1.0") or "").strip()
-        v1_1 = str(cookie_store.get("arena-auth-prod-v1.1") or "").strip()
-        if v1_0:
-            desired_cookies.append({"name": "arena-auth-prod-v1.0", "value": v1_0, "domain": "lmarena.ai", "path": "/"})
-        if v1_1:
-            desired_cookies.append({"name": "arena-auth-prod-v1.1", "value": v1_1, "domain": "lmarena.ai", "path": "/"})
-
-    user_agent = normalize_user_agent_value(config.get("user_agent"))
+    task_id = str(uuid.uuid4())
+    future = asyncio.Future()
+    proxy_pending_tasks[task_id] = future
 
-    fetch_url = url
-    if fetch_url.startswith("https://lmarena.ai"):
-        fetch_url = fetch_url[len("https://lmarena.ai") :]
-    if not fetch_url.startswith("/"):
-        fetch_url = "/" + fetch_url
+    # Add to queue
+    proxy_task_queue.append({
+        "id": task_id,
+        "url": url,
+        "method": http_method,
+        "body": json.dumps(payload) if payload else ""
+    })
+    
+    debug_print(f"📫 Added task {task_id} to Proxy Queue. Waiting for Userscript...")
 
-    def _is_recaptcha_validation_failed(status: int, text: object) -> bool:
-        if int(status or 0) != HTTPStatus.FORBIDDEN:
-            return False
-        if not isinstance(text, str) or not text:
-            return False
-        try:
-            body = json.loads(text)
-        except Exception:
-            return False
-        return isinstance(body, dict) and body.get("error") == "recaptcha validation failed"
+    try:
+        # Wait for the first chunk/response from the userscript
+        # In a full implementation, we'd handle a stream of chunks.
+        # For simplicity here, we await the *first* signal which might be the full text or start of stream.
+        # But wait, the userscript sends chunks via POST.
+        # We need a way to feed those chunks into a generator.
+        # For this MVP, let's assume the userscript sends the FULL response or we handle it via a shared buffer.
+        
+        # ACTUALLY: The `BrowserFetchStreamResponse` expects a full text or an iterator.
+        # If we want true streaming via proxy, we need a Queue, not a Future.
+        
+        # Let's upgrade `proxy_pending_tasks` to hold an asyncio.Queue for this task_id
+        # But `proxy_pending_tasks` type definition above was Future. 
+        # For this step, let's implement a simple non-streaming wait (or buffered stream) to keep it KISS as requested.
+        # If the userscript sends chunks, we can accumulate them? 
+        # No, "stream: True" needs real-time chunks.
+        
+        # Revised approach for `fetch_via_proxy_queue`:
+        # We will wait for the userscript to signal "start" or provide content.
+        # Since `BrowserFetchStreamResponse` is designed to wrap a completed text OR an async iterator,
+        # let's make it wrap an async iterator that pulls from a Queue.
+        
+        # We'll need to change `proxy_pending_tasks` value type to `asyncio.Queue` dynamically.
+        # But the endpoint `post_proxy_result` expects to set_result on a Future.
+        
+        # Let's stick to the Future for the *initial connection* / *first byte*.
+        result = await asyncio.wait_for(future, timeout=timeout_seconds)
+        
+        # If result contains "chunk", it's a stream part. 
+        # This simple implementation assumes the userscript might send the full text for now OR we accept that
+        # we only support non-streaming or buffered-streaming via this simple Future mechanism for the MVP.
+        #
+        # TO SUPPORT REAL STREAMING:
+        # We would need a dedicated WebSocket or a polling mechanism for the *response* too.
+        # Given "minimal code changes", let's assume the Userscript gathers the response and sends it back.
+        # This might delay the "first token" but ensures reliability.
+        
+        if isinstance(result, dict):
+            if "error" in result:
+                debug_print(f"❌ Proxy Task Error: {result['error']}")
+                return None
+            
+            text = result.get("text", "")
+            # If the userscript sent "chunk", we might have missed subsequent chunks if we only waited for one Future.
+            # So for this MVP, the userscript should buffer and send the full text, 
+            # OR we need a more complex "Queue" based mechanism.
+            
+            # Let's return a response with the text we got.
+            return BrowserFetchStreamResponse(
+                status_code=result.get("status", 200),
+                headers=result.get("headers", {}),
+                text=text,
+                method=http_method,
+                url=url
+            )
+            
+    except asyncio.TimeoutError:
+        debug_print(f"❌ Proxy Task {task_id} timed out. Is the Userscript running?")
+        if task_id in proxy_pending_tasks:
+            del proxy_pending_tasks[task_id]
+        if task_id in [t['id'] for t in proxy_task_queue]:
+            # Remove from queue if not picked up
+            proxy_task_queue[:] = [t for t in proxy_task_queue if t['id'] != task_id]
+        return None
+    except Exception as e:
+        debug_print(f"❌ Proxy Task Exception: {e}")
+        return None
+
+    return None
+
+# --- Single-flight ---
+# Concurrent callers asking for the same expensive operation (arena session refresh) share one in-flight call instead
+# of each spending the same refresh token. Never share a single-use result such as a reCAPTCHA token; the reCAPTCHA
+# mint flight instead mints one token per waiter (see `_mint_recaptcha_token_for_caller`).
+# { key: [task, coalesced_callers] }
+_SINGLE_FLIGHTS: dict[tuple, list] = {}
+# { operation: {"flights", "coalesced", "max_coalesced", "last_coalesced"} }
+_SINGLE_FLIGHT_STATS: Dict[str, dict] = {}
+
+
+async def single_flight(key: tuple, factory):
+    """
+    Await `factory()` at most once per `key` at a time. Callers that arrive while a flight for the same key is
+    running await that flight and share its result (or exception). `key[0]` names the operation in the metrics.
+    """
+    loop = asyncio.get_running_loop()
+    stats = _SINGLE_FLIGHT_STATS.setdefault(
+        str(key[0]), {"flights": 0, "coalesced": 0, "max_coalesced": 0, "last_coalesced": 0}
+    )
+    entry = _SINGLE_FLIGHTS.get(key)
+    if entry is not None and not entry[0].done() and entry[0].get_loop() is loop:
+        entry[1] += 1
+        stats["coalesced"] += 1
+        return await asyncio.shield(entry[0])
+
+    task = loop.create_task(factory())
+    entry = [task, 0]
+    _SINGLE_FLIGHTS[key] = entry
+    stats["flights"] += 1
+
+    def _finished(t: asyncio.Task) -> None:
+        if _SINGLE_FLIGHTS.get(key) is entry:
+            del _SINGLE_FLIGHTS[key]
+        stats["last_coalesced"] = entry[1]
+        stats["max_coalesced"] = max(stats["max_coalesced"], entry[1])
+        # Mark the exception retrieved even if every caller was cancelled.
+        if not t.cancelled():
+            t.exception()
+
+    task.add_done_callback(_finished)
+    # Shield so one caller being cancelled doesn't cancel the flight for everyone else.
+    return await asyncio.shield(task)
+
+
+def get_single_flight_stats() -> dict:
+    return {
+        "in_flight": len(_SINGLE_FLIGHTS),
+        "operations": {op: dict(stats) for op, stats in _SINGLE_FLIGHT_STATS.items()},
+    }
+
+
+async def get_recaptcha_v3_token(remember: bool = True) -> Optional[str]:
+    """
+    Retrieves reCAPTCHA v3 token using a 'Side-Channel' approach.
+    We write the token to a global window variable and poll for it, 
+    bypassing Promise serialization issues in the Main World bridge.
 
+    `remember=False` skips updating the global cached token (used by the token reservoir, whose tokens are
+    single-use and must not also be handed out through `get_cached_recaptcha_token`).
+    """
+    global RECAPTCHA_TOKEN, RECAPTCHA_EXPIRY
+    debug_print("🔐 Starting reCAPTCHA v3 token retrieval (Side-Channel Mode)...")
+    
+    config = get_config()
+    cf_clearance = config.get("cf_clearance", "")
+    recaptcha_sitekey, recaptcha_action = get_recaptcha_settings(config)
+    
     try:
-        # Default to headful for better Turnstile/reCAPTCHA reliability; allow override via config.
-        try:
-            headless_value = config.get("camoufox_fetch_headless", None)
-            headless = bool(headless_value) if headless_value is not None else False
-        except Exception:
-            headless = False
+        chrome_token = await get_recaptcha_v3_token_with_chrome(config)
+        if chrome_token:
+            if remember:
+                RECAPTCHA_TOKEN = chrome_token
+                RECAPTCHA_EXPIRY = datetime.now(timezone.utc) + timedelta(seconds=110)
+            return chrome_token
 
-        async with AsyncCamoufox(headless=headless, main_world_eval=True) as browser:
-            context = await browser.new_context(user_agent=user_agent or None)
-            # Small stealth tweak: reduces bot-detection surface for reCAPTCHA v3 scoring.
-            try:
-                await context.add_init_script(
-                    "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
-                )
-            except Exception:
-                pass
-            if desired_cookies:
-                try:
-                    await context.add_cookies(desired_cookies)
-                except Exception:
-                    pass
+        # Use isolated world (main_world_eval=False) to avoid execution context destruction issues.
+        # We will access the main world objects via window.wrappedJSObject.
+        async with AsyncCamoufox(headless=True, main_world_eval=False) as browser:
+            context = await browser.new_context()
+            if cf_clearance:
+                await context.add_cookies([{
+                    "name": "cf_clearance",
+                    "value": cf_clearance,
+                    "domain": ".lmarena.ai",
+                    "path": "/"
+                }])
 
             page = await context.new_page()
-            await _maybe_apply_camoufox_window_mode(
-                page,
-                config,
-                mode_key="camoufox_fetch_window_mode",
-                marker="LMArenaBridge Camoufox Fetch",
-                headless=headless,
-            )
-              
-            debug_print(f"  🦊 Navigating to lmarena.ai...")
-            try:
-                await asyncio.wait_for(
-                    page.goto("https://lmarena.ai/?mode=direct", wait_until="domcontentloaded", timeout=60000),
-                    timeout=70.0,
-                )
-            except Exception:
-                pass
+            
+            debug_print("  🌐 Navigating to lmarena.ai...")
+            await page.goto("https://lmarena.ai/", wait_until="domcontentloaded")
 
-            # Try to handle Cloudflare Turnstile if present
+            # --- NEW: Cloudflare/Turnstile Pass-Through ---
+            debug_print("  🛡️  Checking for Cloudflare Turnstile...")
+            
+            # Allow time for the widget to render if it's going to
             try:
+                # Check for challenge title or widget presence
                 for _ in range(5):
                     title = await page.title()
-                    if "Just a moment" not in title:
+                    if "Just a moment" in title:
+                        debug_print("  🔒 Cloudflare challenge active. Attempting to click...")
+                        clicked = await click_turnstile(page)
+                        if clicked:
+                            debug_print("  ✅ Clicked Turnstile.")
+                            # Give it time to verify
+                            await asyncio.sleep(3)
+                    else:
+                        # If title is normal, we might still have a widget on the page
+                        await click_turnstile(page)
                         break
-                    await click_turnstile(page)
-                    await asyncio.sleep(2)
-            except Exception:
-                pass
-            
-            # Persist cookies
-            try:
-                fresh_cookies = await context.cookies("https://lmarena.ai")
-                _capture_ephemeral_arena_auth_token_from_cookies(fresh_cookies)
-                try:
-                    ua_now = await page.evaluate("() => navigator.userAgent")
-                except Exception:
-                    ua_now = user_agent
-                if _upsert_browser_session_into_config(config, fresh_cookies, user_agent=ua_now):
-                    save_config(config)
-            except Exception:
-                pass
+                    await asyncio.sleep(1)
+                
+                # Wait for the page to actually settle into the main app
+                await page.wait_for_load_state("domcontentloaded")
+            except Exception as e:
+                debug_print(f"  ⚠️ Error handling Turnstile: {e}")
+            # ----------------------------------------------
 
-            async def _mint_recaptcha_v3_token() -> Optional[str]:
-                # Wait for grecaptcha using wrappedJSObject
-                await page.wait_for_function(
-                    "() => { const w = window.wrappedJSObject || window; return !!(w.grecaptcha && ((w.grecaptcha.enterprise && typeof w.grecaptcha.enterprise.execute === 'function') || typeof w.grecaptcha.execute === 'function')); }",
-                    timeout=60000,
+            # 1. Wake up the page (Humanize)
+            debug_print("  🖱️  Waking up page...")
+            await page.mouse.move(100, 100)
+            await page.mouse.wheel(0, 200)
+            await asyncio.sleep(2) # Vital "Human" pause
+
+            # 2. Check for Library
+            debug_print("  ⏳ Checking for library...")
+            # Use wrappedJSObject to check for grecaptcha in the main world
+            lib_ready = await safe_page_evaluate(
+                page,
+                "() => { const w = window.wrappedJSObject || window; return !!(w.grecaptcha && w.grecaptcha.enterprise); }",
+            )
+            if not lib_ready:
+                debug_print("  ⚠️ Library not found immediately. Waiting...")
+                await asyncio.sleep(3)
+                lib_ready = await safe_page_evaluate(
+                    page,
+                    "() => { const w = window.wrappedJSObject || window; return !!(w.grecaptcha && w.grecaptcha.enterprise); }",
                 )
+                if not lib_ready:
+                    debug_print("❌ reCAPTCHA library never loaded.")
+                    return None
 
-                # SIDE-CHANNEL MINTING:
-                # 1. Setup result variable
-                await safe_page_evaluate(page, "() => { (window.wrappedJSObject || window).__token_result = 'PENDING'; }")
+            # 3. SETUP: Initialize our global result variable
+            # We use a unique name to avoid conflicts
+            await safe_page_evaluate(page, "() => { (window.wrappedJSObject || window).__token_result = 'PENDING'; }")
 
-                # 2. Trigger execution (fire and forget from Python's perspective)
-                trigger_script = f"""() => {{
-                    const w = window.wrappedJSObject || window;
-                    const sitekey = {json.dumps(recaptcha_sitekey)};
-                    const action = {json.dumps(recaptcha_action)};
-                    try {{
-                        const raw = w.grecaptcha;
-                        const g = (raw?.enterprise && typeof raw.enterprise.execute === 'function')
-                            ? raw.enterprise
-                            : raw;
-                        if (!g || typeof g.execute !== 'function') {{
-                            w.__token_result = 'ERROR: NO_GRECAPTCHA';
-                            return;
-                        }}
-                        const readyFn = (typeof g.ready === 'function')
-                            ? g.ready.bind(g)
-                            : (raw && typeof raw.ready === 'function')
-                              ? raw.ready.bind(raw)
-                              : null;
-                        const run = () => {{
-                            try {{
-                                Promise.resolve(g.execute(sitekey, {{ action }}))
-                                    .then(token => {{ w.__token_result = token; }})
-                                    .catch(err => {{ w.__token_result = 'ERROR: ' + String(err); }});
-                            }} catch (e) {{
-                                w.__token_result = 'SYNC_ERROR: ' + String(e);
-                            }}
-                        }};
-                        try {{
-                            if (readyFn) readyFn(run);
-                            else run();
-                        }} catch (e) {{
-                            run();
-                        }}
-                    }} catch (e) {{
-                        w.__token_result = 'SYNC_ERROR: ' + String(e);
-                    }}
-                }}"""
-                await safe_page_evaluate(page, trigger_script)
+            # 4. TRIGGER: Execute reCAPTCHA and write to the variable
+            # We do NOT await the result here. We just fire the process.
+            debug_print("  🚀 Triggering reCAPTCHA execution...")
+            trigger_script = f"""() => {{
+                const w = window.wrappedJSObject || window;
+                try {{
+                    w.grecaptcha.enterprise.execute('{recaptcha_sitekey}', {{ action: '{recaptcha_action}' }})
+                    .then(token => {{
+                        w.__token_result = token;
+                    }})
+                    .catch(err => {{
+                        w.__token_result = 'ERROR: ' + err.toString();
+                    }});
+                }} catch (e) {{
+                    w.__token_result = 'SYNC_ERROR: ' + e.toString();
+                }}
+            }}"""
+            
+            await safe_page_evaluate(page, trigger_script)
 
-                # 3. Poll for result
-                for _ in range(40): # 20 seconds max (0.5s interval)
-                    val = await safe_page_evaluate(page, "() => (window.wrappedJSObject || window).__token_result")
-                    if val != 'PENDING':
-                        if isinstance(val, str) and (val.startswith('ERROR') or val.startswith('SYNC_ERROR')):
-                            debug_print(f"  ⚠️ Camoufox token mint error: {val}")
-                            return None
-                        return val
-                    await asyncio.sleep(0.5)
+            # 5. POLL: Watch the variable for changes
+            debug_print("  👀 Polling for result...")
+            token = None
+            
+            for i in range(20): # Wait up to 20 seconds
+                # Read the global variable
+                result = await safe_page_evaluate(page, "() => (window.wrappedJSObject || window).__token_result", retries=2)
                 
-                debug_print("  ⚠️ Camoufox token mint timed out.")
+                if result != 'PENDING':
+                    if result and result.startswith('ERROR'):
+                        debug_print(f"❌ JS Execution Error: {result}")
+                        return None
+                    elif result and result.startswith('SYNC_ERROR'):
+                        debug_print(f"❌ JS Sync Error: {result}")
+                        return None
+                    else:
+                        token = result
+                        debug_print(f"✅ Token captured! ({len(token)} chars)")
+                        break
+                
+                if i % 2 == 0:
+                    debug_print(f"    ... waiting ({i}s)")
+                await asyncio.sleep(1)
+
+            if token:
+                if remember:
+                    RECAPTCHA_TOKEN = token
+                    RECAPTCHA_EXPIRY = datetime.now(timezone.utc) + timedelta(seconds=110)
+                return token
+            else:
+                debug_print("❌ Timed out waiting for token variable to update.")
                 return None
 
-            async def _mint_recaptcha_v2_token() -> Optional[str]:
-                """
-                Best-effort: try to obtain a reCAPTCHA Enterprise v2 token (checkbox/invisible).
-                """
-                try:
-                    await page.wait_for_function(
-                        "() => { const w = window.wrappedJSObject || window; return !!(w.grecaptcha && w.grecaptcha.enterprise && typeof w.grecaptcha.enterprise.render === 'function'); }",
-                        timeout=60000,
-                    )
-                except Exception:
-                    return None
+    except Exception as e:
+        debug_print(f"❌ Unexpected error: {e}")
+        return None
 
-                v2_script = f"""() => new Promise((resolve, reject) => {{
-                    const w = window.wrappedJSObject || window;
-                    const g = w.grecaptcha?.enterprise;
-                    if (!g || typeof g.render !== 'function') return reject('NO_GRECAPTCHA_V2');
-                    let settled = false;
-                    const done = (fn, arg) => {{ if (settled) return; settled = true; fn(arg); }};
-                    try {{
-                        const el = w.document.createElement('div');
-                        el.style.cssText = 'position:fixed;left:-9999px;top:-9999px;width:1px;height:1px;';
-                        w.document.body.appendChild(el);
-                        const timer = w.setTimeout(() => done(reject, 'V2_TIMEOUT'), 60000);
-                        const wid = g.render(el, {{
-                            sitekey: {json.dumps(RECAPTCHA_V2_SITEKEY)},
-                            size: 'invisible',
-                            callback: (tok) => {{ w.clearTimeout(timer); done(resolve, tok); }},
-                            'error-callback': () => {{ w.clearTimeout(timer); done(reject, 'V2_ERROR'); }},
-                        }});
-                        try {{ if (typeof g.execute === 'function') g.execute(wid); }} catch (e) {{}}
-                    }} catch (e) {{
-                        done(reject, String(e));
-                    }}
-                }})"""
-                try:
-                    token = await safe_page_evaluate(page, v2_script)
-                except Exception:
-                    return None
-                if isinstance(token, str) and token:
-                    return token
+# Callers currently waiting on the inline reCAPTCHA mint flight; the flight mints one token per waiter.
+_RECAPTCHA_MINT_WAITERS = 0
+# Upper bound on tokens one mint flight produces back to back before handing off to a fresh flight.
+_RECAPTCHA_MINT_MAX_BATCH = 8
+
+
+async def _mint_recaptcha_tokens_for_waiters() -> int:
+    """
+    Mint one token per current waiter, strictly one at a time (so at most one browser launch is in flight), and
+    park them in the reservoir for the waiters to pop. Returns how many tokens were minted.
+    """
+    minted = 0
+    while minted < min(_RECAPTCHA_MINT_WAITERS, _RECAPTCHA_MINT_MAX_BATCH):
+        token = await get_recaptcha_v3_token(remember=False)
+        if not token:
+            break
+        add_recaptcha_token_to_reservoir(token)
+        minted += 1
+    return minted
+
+
+async def _mint_recaptcha_token_for_caller() -> Optional[str]:
+    """
+    Get a token of this caller's own when the reservoir had none. Concurrent callers join a single mint flight
+    instead of each driving a browser, then each pops a distinct token from what the flight minted.
+    """
+    global _RECAPTCHA_MINT_WAITERS
+    _RECAPTCHA_MINT_WAITERS += 1
+    try:
+        while True:
+            minted = await single_flight(("recaptcha_v3_mint",), _mint_recaptcha_tokens_for_waiters)
+            # Take directly rather than via `pop_recaptcha_token`: this caller's demand was already recorded.
+            _prune_recaptcha_reservoir(time.monotonic())
+            if _RECAPTCHA_RESERVOIR:
+                return _RECAPTCHA_RESERVOIR.popleft()[0]
+            if not minted:
                 return None
+            # Everything minted was taken by waiters ahead of us (or the batch cap): join the next flight.
+    finally:
+        _RECAPTCHA_MINT_WAITERS -= 1
 
-            lines_queue: asyncio.Queue = asyncio.Queue()
-            done_event: asyncio.Event = asyncio.Event()
 
-            async def _report_chunk(source, line: str):
-                if line and line.strip():
-                    await lines_queue.put(line)
+async def refresh_recaptcha_token(force_new: bool = False):
+    """Checks if the global reCAPTCHA token is expired and refreshes it if necessary."""
+    global RECAPTCHA_TOKEN, RECAPTCHA_EXPIRY
+    
+    current_time = datetime.now(timezone.utc)
+    if force_new:
+        RECAPTCHA_TOKEN = None
+        RECAPTCHA_EXPIRY = current_time - timedelta(days=365)
+    if RECAPTCHA_TOKEN is None or current_time > RECAPTCHA_EXPIRY - timedelta(seconds=10):
+        # Prefer a pre-minted token from the reservoir over minting inline.
+        pooled_token, remaining = pop_recaptcha_token()
+        if pooled_token:
+            RECAPTCHA_TOKEN = pooled_token
+            RECAPTCHA_EXPIRY = current_time + timedelta(seconds=remaining)
+            return pooled_token
+    # Unit tests should never launch real browser automation. Tests that need a token patch
+    # `refresh_recaptcha_token` / `get_recaptcha_v3_token` explicitly.
+    if os.environ.get("PYTEST_CURRENT_TEST"):
+        return get_cached_recaptcha_token() or None
+    # Check if token is expired (set a refresh margin of 10 seconds)
+    if RECAPTCHA_TOKEN is None or current_time > RECAPTCHA_EXPIRY - timedelta(seconds=10):
+        debug_print("🔄 Recaptcha token expired or missing. Refreshing...")
+        # reCAPTCHA tokens are single-use, so every caller needs its own: bursts are absorbed by the reservoir above
+        # (whose refill follows this demand), and only callers it could not serve wait on the shared mint flight.
+        new_token = await _mint_recaptcha_token_for_caller()
+        if new_token:
+            RECAPTCHA_TOKEN = new_token
+            # reCAPTCHA v3 tokens typically last 120 seconds (2 minutes)
+            RECAPTCHA_EXPIRY = current_time + timedelta(seconds=120)
+            debug_print(f"✅ Recaptcha token refreshed, expires at {RECAPTCHA_EXPIRY.isoformat()}")
+            return new_token
+        else:
+            debug_print("❌ Failed to refresh recaptcha token.")
+            # Set a short retry delay if refresh fails
+            RECAPTCHA_EXPIRY = current_time + timedelta(seconds=10)
+            return None
+    
+    return RECAPTCHA_TOKEN
 
-            await page.expose_binding("reportChunk", _report_chunk)
+# --- End New reCAPTCHA Functions ---
 
-            fetch_script = """async ({url, method, body, extraHeaders, timeoutMs}) => {
-              const controller = new AbortController();
-              const timer = setTimeout(() => controller.abort('timeout'), timeoutMs);
-              try {
-                const res = await fetch(url, {
-                  method,
-                  headers: { 
-                    'content-type': 'text/plain;charset=UTF-8',
-                    ...extraHeaders
-                  },
-                  body,
-                  credentials: 'include',
-                  signal: controller.signal,
-                });
-                const headers = {};
-                try {
-                  if (res.headers && typeof res.headers.forEach === 'function') {
-                    res.headers.forEach((value, key) => { headers[key] = value; });
-                  }
-                } catch (e) {}
+def get_cached_recaptcha_token() -> str:
+    """Return the current reCAPTCHA v3 token if it's still valid, without refreshing."""
+    global RECAPTCHA_TOKEN, RECAPTCHA_EXPIRY
+    token = RECAPTCHA_TOKEN
+    if not token:
+        return ""
+    current_time = datetime.now(timezone.utc)
+    if current_time > RECAPTCHA_EXPIRY - timedelta(seconds=10):
+        return ""
+    return str(token)
 
-                // Send initial status and headers
-                if (window.reportChunk) {
-                    await window.reportChunk(JSON.stringify({ __type: 'meta', status: res.status, headers }));
-                }
+def _get_recaptcha_reservoir_settings(config: Optional[dict] = None) -> tuple[bool, int, int, float]:
+    cfg = config or get_config_view()
+    enabled = bool(cfg.get("recaptcha_reservoir_enabled", True))
+    try:
+        min_depth = int(cfg.get("recaptcha_reservoir_min_depth", 1))
+    except Exception:
+        min_depth = 1
+    try:
+        max_depth = int(cfg.get("recaptcha_reservoir_max_depth", 4))
+    except Exception:
+        max_depth = 4
+    try:
+        idle_seconds = float(cfg.get("recaptcha_reservoir_idle_seconds", 300))
+    except Exception:
+        idle_seconds = 300.0
+    max_depth = max(1, min(max_depth, 20))
+    min_depth = max(0, min(min_depth, max_depth))
+    return enabled, min_depth, max_depth, max(0.0, idle_seconds)
 
-                if (res.body) {
-                  const reader = res.body.getReader();
-                  const decoder = new TextDecoder();
-                  let buffer = '';
-                  while (true) {
-                    const { value, done } = await reader.read();
-                    if (value) buffer += decoder.decode(value, { stream: true });
-                    if (done) buffer += decoder.decode();
-                    
-                    const parts = buffer.split(/\\r?\\n/);
-                    buffer = parts.pop() || '';
-                    for (const line of parts) {
-                        if (line.trim() && window.reportChunk) {
-                            await window.reportChunk(line);
-                        }
-                    }
-                    if (done) break;
-                  }
-                  if (buffer.trim() && window.reportChunk) {
-                      await window.reportChunk(buffer);
-                  }
-                } else {
-                  const text = await res.text();
-                  if (window.reportChunk) await window.reportChunk(text);
-                }
-                return { __streaming: true };
-              } catch (e) {
-                return { status: 502, headers: {}, text: 'FETCH_ERROR:' + String(e) };
-              } finally {
-                clearTimeout(timer);
-              }
-            }"""
 
-            result: dict = {"status": 0, "headers": {}, "text": ""}
-            for attempt in range(max_recaptcha_attempts):
-                # Clear queue for each attempt
-                while not lines_queue.empty():
-                    lines_queue.get_nowait()
-                done_event.clear()
+def _prune_recaptcha_reservoir(now: float) -> None:
+    # Tokens are appended in mint order with the same TTL, so expired ones are always at the left.
+    while _RECAPTCHA_RESERVOIR and _RECAPTCHA_RESERVOIR[0][1] - _RECAPTCHA_RESERVOIR_EXPIRY_MARGIN_SECONDS <= now:
+        _RECAPTCHA_RESERVOIR.popleft()
+        _RECAPTCHA_RESERVOIR_STATS["expired"] += 1
+    while _RECAPTCHA_RESERVOIR_DEMAND and _RECAPTCHA_RESERVOIR_DEMAND[0] <= now - _RECAPTCHA_RESERVOIR_DEMAND_WINDOW_SECONDS:
+        _RECAPTCHA_RESERVOIR_DEMAND.popleft()
 
-                current_recaptcha_token = ""
-                has_v2 = isinstance(payload, dict) and bool(payload.get("recaptchaV2Token"))
-                has_v3 = isinstance(payload, dict) and bool(payload.get("recaptchaV3Token"))
-                
-                if isinstance(payload, dict) and not has_v2 and (attempt > 0 or not has_v3):
-                    try:
-                        current_recaptcha_token = await _mint_recaptcha_v3_token()
-                        if current_recaptcha_token:
-                            payload["recaptchaV3Token"] = current_recaptcha_token
-                    except Exception as e:
-                        debug_print(f"  ⚠️ Error minting token in Camoufox: {e}")
 
-                extra_headers = {}
-                token_for_headers = current_recaptcha_token
-                if not token_for_headers and isinstance(payload, dict):
-                    token_for_headers = str(payload.get("recaptchaV3Token") or "").strip()
-                if token_for_headers:
-                    extra_headers["X-Recaptcha-Token"] = token_for_headers
-                    extra_headers["X-Recaptcha-Action"] = recaptcha_action
+def get_recaptcha_reservoir_target_depth(config: Optional[dict] = None) -> int:
+    """
+    Desired number of ready tokens: enough to cover ~30s of the recent request rate, clamped to the configured
+    min/max. Drops to zero when nothing asked for a token within `recaptcha_reservoir_idle_seconds`, so an idle
+    bridge stops driving the browser.
+    """
+    enabled, min_depth, max_depth, idle_seconds = _get_recaptcha_reservoir_settings(config)
+    if not enabled:
+        return 0
+    now = time.monotonic()
+    _prune_recaptcha_reservoir(now)
+    last_demand = _RECAPTCHA_RESERVOIR_LAST_DEMAND_AT
+    if last_demand is None or now - last_demand > idle_seconds:
+        return 0
+    # Requests seen in the last 60s, halved (rounded up): ~30s of demand.
+    wanted = (len(_RECAPTCHA_RESERVOIR_DEMAND) + 1) // 2
+    return max(min_depth, min(wanted, max_depth))
+
+
+def add_recaptcha_token_to_reservoir(token: str, ttl_seconds: Optional[float] = None) -> None:
+    if not token:
+        return
+    ttl = RECAPTCHA_TOKEN_TTL_SECONDS if ttl_seconds is None else float(ttl_seconds)
+    _RECAPTCHA_RESERVOIR.append((str(token), time.monotonic() + ttl))
 
-                body = json.dumps(payload) if payload is not None else ""
-                
-                # Execute fetch
-                fetch_task = asyncio.create_task(page.evaluate(
-                    fetch_script,
-                    {
-                        "url": fetch_url,
-                        "method": http_method,
-                        "body": body,
-                        "extraHeaders": extra_headers,
-                        "timeoutMs": int(timeout_seconds * 1000),
-                    },
-                ))
-
-                # Wait for initial meta (status/headers) OR task completion
-                meta = None
-                while not fetch_task.done():
-                    try:
-                        item = await asyncio.wait_for(lines_queue.get(), timeout=0.1)
-                        if isinstance(item, str) and item.startswith('{"__type":"meta"'):
-                            meta = json.loads(item)
-                            break
-                        else:
-                            if not item.startswith('{"__type":"meta"'):
-                                await lines_queue.put(item)
-                                meta = {"status": 200, "headers": {}}
-                                break
-                    except asyncio.TimeoutError:
-                        continue
-                
-                if fetch_task.done() and meta is None:
-                    try:
-                        res = fetch_task.result()
-                        if isinstance(res, dict) and not res.get("__streaming"):
-                            result = res
-                        else:
-                            result = {"status": 502, "text": "FETCH_DONE_WITHOUT_META"}
-                    except Exception as e:
-                        result = {"status": 502, "text": f"FETCH_EXCEPTION: {e}"}
-                elif meta:
-                    result = meta
-
-                status_code = int(result.get("status") or 0)
-
-                if status_code == HTTPStatus.TOO_MANY_REQUESTS and attempt < max_recaptcha_attempts - 1:
-                    await asyncio.sleep(5)
-                    continue
 
-                if not _is_recaptcha_validation_failed(status_code, result.get("text")):
-                    if status_code < 400:
-                        async def _wait_for_finish():
-                            try:
-                                await fetch_task
-                            finally:
-                                done_event.set()
-                        asyncio.create_task(_wait_for_finish())
-                        
-                        return BrowserFetchStreamResponse(
-                            status_code=status_code,
-                            headers=result.get("headers", {}),
-                            method=http_method,
-                            url=url,
-                            lines_queue=lines_queue,
-                            done_event=done_event
-                        )
-                    break
+def pop_recaptcha_token() -> tuple[str, float]:
+    """
+    Take the oldest still-valid pre-minted token in O(1) (amortized over expired entries).
+    Returns `(token, seconds_until_expiry)`, or `("", 0.0)` when the reservoir is empty.
+    """
+    global _RECAPTCHA_RESERVOIR_LAST_DEMAND_AT
+    now = time.monotonic()
+    _prune_recaptcha_reservoir(now)
+    _RECAPTCHA_RESERVOIR_DEMAND.append(now)
+    _RECAPTCHA_RESERVOIR_LAST_DEMAND_AT = now
+    wake = _RECAPTCHA_RESERVOIR_WAKE
+    if wake is not None:
+        wake.set()
+    if not _RECAPTCHA_RESERVOIR:
+        _RECAPTCHA_RESERVOIR_STATS["misses"] += 1
+        return "", 0.0
+    token, expires_at = _RECAPTCHA_RESERVOIR.popleft()
+    _RECAPTCHA_RESERVOIR_STATS["hits"] += 1
+    return token, max(0.0, expires_at - now)
+
+
+def get_recaptcha_reservoir_stats() -> dict:
+    now = time.monotonic()
+    _prune_recaptcha_reservoir(now)
+    return {
+        "depth": len(_RECAPTCHA_RESERVOIR),
+        "target_depth": get_recaptcha_reservoir_target_depth(),
+        "recent_requests": len(_RECAPTCHA_RESERVOIR_DEMAND),
+        **_RECAPTCHA_RESERVOIR_STATS,
+    }
 
-                if attempt < max_recaptcha_attempts - 1 and isinstance(payload, dict) and not bool(payload.get("recaptchaV2Token")):
-                    try:
-                        v2_token = await _mint_recaptcha_v2_token()
-                    except Exception:
-                        v2_token = None
-                    if v2_token:
-                        payload["recaptchaV2Token"] = v2_token
-                        payload.pop("recaptchaV3Token", None)
-                        await asyncio.sleep(0.5)
-                        continue
-                
-                await asyncio.sleep(2)
 
-            return BrowserFetchStreamResponse(
-                int(result.get("status") or 0),
-                result.get("headers") if isinstance(result, dict) else {},
-                result.get("text") if isinstance(result, dict) else "",
-                method=http_method,
-                url=url,
-            )
+async def recaptcha_reservoir_task() -> None:
+    """Background minter: keeps the reservoir at its target depth using the warm browser page."""
+    global _RECAPTCHA_RESERVOIR_WAKE
+    _RECAPTCHA_RESERVOIR_WAKE = asyncio.Event()
+    failures = 0
+    while True:
+        try:
+            if len(_RECAPTCHA_RESERVOIR) >= get_recaptcha_reservoir_target_depth():
+                _RECAPTCHA_RESERVOIR_WAKE.clear()
+                # Wake on demand, or periodically to replace tokens that are about to expire.
+                try:
+                    await asyncio.wait_for(_RECAPTCHA_RESERVOIR_WAKE.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
 
-    except Exception as e:
-        debug_print(f"❌ Camoufox fetch transport failed: {e}")
-        return None
+            token = await get_recaptcha_v3_token(remember=False)
+            if token:
+                failures = 0
+                add_recaptcha_token_to_reservoir(token)
+                _RECAPTCHA_RESERVOIR_STATS["minted"] += 1
+                debug_print(f"🔐 reCAPTCHA reservoir: minted token (depth {len(_RECAPTCHA_RESERVOIR)})")
+            else:
+                failures += 1
+                _RECAPTCHA_RESERVOIR_STATS["mint_failures"] += 1
+                await asyncio.sleep(min(60.0, 2.0 ** failures))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            debug_print(f"⚠️  reCAPTCHA reservoir refill error: {e}")
+            await asyncio.sleep(5.0)
 
 
-async def fetch_via_proxy_queue(
-    url: str,
-    payload: dict,
-    http_method: str = "POST",
-    timeout_seconds: int = 120,
-    streaming: bool = False,
-    auth_token: str = "",
-) -> Optional[object]:
+# Custom UUIDv7 implementation (using correct Unix epoch)
+def uuid7():
     """
-    Fallback transport: delegates the request to a connected Userscript via the Task Queue.
+    Generate a UUIDv7 using Unix epoch (milliseconds since 1970-01-01)
+    matching the browser's implementation.
     """
-    # Prefer the streaming-capable proxy endpoints when available.
-    proxy_stream = await fetch_lmarena_stream_via_userscript_proxy(
-        http_method=http_method,
-        url=url,
-        payload=payload or {},
-        timeout_seconds=timeout_seconds,
-        auth_token=auth_token,
-    )
-    if proxy_stream is not None:
-        if streaming:
-            return proxy_stream
-
-        # Non-streaming call: buffer everything and return a plain response wrapper.
-        collected_lines: list[str] = []
-        async with proxy_stream as response:
-            async for line in response.aiter_lines():
-                collected_lines.append(str(line))
-
-        return BrowserFetchStreamResponse(
-            status_code=getattr(proxy_stream, "status_code", 200),
-            headers=getattr(proxy_stream, "headers", {}),
-            text="\n".join(collected_lines),
-            method=http_method,
-            url=url,
-        )
-
-    task_id = str(uuid.uuid4())
-    future = asyncio.Future()
-    proxy_pending_tasks[task_id] = future
-
-    # Add to queue
-    proxy_task_queue.append({
-        "id": task_id,
-        "url": url,
-        "method": http_method,
-        "body": json.dumps(payload) if payload else ""
-    })
+    timestamp_ms = int(time.time() * 1000)
+    rand_a = secrets.randbits(12)
+    rand_b = secrets.randbits(62)
     
-    debug_print(f"📫 Added task {task_id} to Proxy Queue. Waiting for Userscript...")
+    uuid_int = timestamp_ms << 80
+    uuid_int |= (0x7000 | rand_a) << 64
+    uuid_int |= (0x8000000000000000 | rand_b)
+    
+    hex_str = f"{uuid_int:032x}"
+    return f"{hex_str[0:8]}-{hex_str[8:12]}-{hex_str[12:16]}-{hex_str[16:20]}-{hex_str[20:32]}"
 
+# Image upload helper functions
+async def upload_image_to_lmarena(image_data: bytes, mime_type: str, filename: str) -> Optional[tuple]:
+    """
+    Upload an image to LMArena R2 storage and return the key and download URL.
+    
+    Args:
+        image_data: Binary image data
+        mime_type: MIME type of the image (e.g., 'image/png')
+        filename: Original filename for the image
+    
+    Returns:
+        Tuple of (key, download_url) if successful, or None if upload fails
+    """
     try:
-        # Wait for the first chunk/response from the userscript
-        # In a full implementation, we'd handle a stream of chunks.
-        # For simplicity here, we await the *first* signal which might be the full text or start of stream.
-        # But wait, the userscript sends chunks via POST.
-        # We need a way to feed those chunks into a generator.
-        # For this MVP, let's assume the userscript sends the FULL response or we handle it via a shared buffer.
+        # Validate inputs
+        if not image_data:
+            debug_print("❌ Image data is empty")
+            return None
         
-        # ACTUALLY: The `BrowserFetchStreamResponse` expects a full text or an iterator.
-        # If we want true streaming via proxy, we need a Queue, not a Future.
+        if not mime_type or not mime_type.startswith('image/'):
+            debug_print(f"❌ Invalid MIME type: {mime_type}")
+            return None
         
-        # Let's upgrade `proxy_pending_tasks` to hold an asyncio.Queue for this task_id
-        # But `proxy_pending_tasks` type definition above was Future. 
-        # For this step, let's implement a simple non-streaming wait (or buffered stream) to keep it KISS as requested.
-        # If the userscript sends chunks, we can accumulate them? 
-        # No, "stream: True" needs real-time chunks.
+        # Step 1: Request upload URL
+        debug_print(f"📤 Step 1: Requesting upload URL for {filename}")
         
-        # Revised approach for `fetch_via_proxy_queue`:
-        # We will wait for the userscript to signal "start" or provide content.
-        # Since `BrowserFetchStreamResponse` is designed to wrap a completed text OR an async iterator,
-        # let's make it wrap an async iterator that pulls from a Queue.
+        # Get Next-Action IDs from config
+        config = get_config()
+        upload_action_id = config.get("next_action_upload")
+        signed_url_action_id = config.get("next_action_signed_url")
         
-        # We'll need to change `proxy_pending_tasks` value type to `asyncio.Queue` dynamically.
-        # But the endpoint `post_proxy_result` expects to set_result on a Future.
+        if not upload_action_id or not signed_url_action_id:
+            debug_print("❌ Next-Action IDs not found in config. Please refresh tokens from dashboard.")
+            return None
         
-        # Let's stick to the Future for the *initial connection* / *first byte*.
-        result = await asyncio.wait_for(future, timeout=timeout_seconds)
+        # Prepare headers for Next.js Server Action
+        request_headers = get_request_headers()
+        request_headers.update({
+            "Accept": "text/x-component",
+            "Content-Type": "text/plain;charset=UTF-8",
+            "Next-Action": upload_action_id,
+            "Referer": "https://lmarena.ai/?mode=direct",
+        })
         
-        # If result contains "chunk", it's a stream part. 
-        # This simple implementation assumes the userscript might send the full text for now OR we accept that
-        # we only support non-streaming or buffered-streaming via this simple Future mechanism for the MVP.
-        #
-        # TO SUPPORT REAL STREAMING:
-        # We would need a dedicated WebSocket or a polling mechanism for the *response* too.
-        # Given "minimal code changes", let's assume the Userscript gathers the response and sends it back.
-        # This might delay the "first token" but ensures reliability.
+        client = get_upstream_http_client()
+        try:
+            response = await client.post(
+                "https://lmarena.ai/?mode=direct",
+                headers=request_headers,
+                content=json.dumps([filename, mime_type]),
+                timeout=30.0
+            )
+            response.raise_for_status()
+        except httpx.TimeoutException:
+            debug_print("❌ Timeout while requesting upload URL")
+            return None
+        except httpx.HTTPError as e:
+            debug_print(f"❌ HTTP error while requesting upload URL: {e}")
+            return None
         
-        if isinstance(result, dict):
-            if "error" in result:
-                debug_print(f"❌ Proxy Task Error: {result['error']}")
-                return None
+        # Parse response - format: 0:{...}\n1:{...}\n
+        try:
+            lines = response.text.strip().split('\n')
+            upload_data = None
+            for line in lines:
+                if line.startswith('1:'):
+                    upload_data = json.loads(line[2:])
+                    break
             
-            text = result.get("text", "")
-            # If the userscript sent "chunk", we might have missed subsequent chunks if we only waited for one Future.
-            # So for this MVP, the userscript should buffer and send the full text, 
-            # OR we need a more complex "Queue" based mechanism.
+            if not upload_data or not upload_data.get('success'):
+                debug_print(f"❌ Failed to get upload URL: {response.text[:200]}")
+                return None
             
-            # Let's return a response with the text we got.
-            return BrowserFetchStreamResponse(
-                status_code=result.get("status", 200),
-                headers=result.get("headers", {}),
-                text=text,
-                method=http_method,
-                url=url
+            upload_url = upload_data['data']['uploadUrl']
+            key = upload_data['data']['key']
+            debug_print(f"✅ Got upload URL and key: {key}")
+        except (json.JSONDecodeError, KeyError, IndexError) as e:
+            debug_print(f"❌ Failed to parse upload URL response: {e}")
+            return None
+        
+        # Step 2: Upload image to R2 storage
+        debug_print(f"📤 Step 2: Uploading image to R2 storage ({len(image_data)} bytes)")
+        try:
+            response = await client.put(
+                upload_url,
+                content=image_data,
+                headers={"Content-Type": mime_type},
+                timeout=60.0
             )
+            response.raise_for_status()
+            debug_print(f"✅ Image uploaded successfully")
+        except httpx.TimeoutException:
+            debug_print("❌ Timeout while uploading image to R2 storage")
+            return None
+        except httpx.HTTPError as e:
+            debug_print(f"❌ HTTP error while uploading image: {e}")
+            return None
+        
+        # Step 3: Get signed download URL (uses different Next-Action)
+        debug_print(f"📤 Step 3: Requesting signed download URL")
+        request_headers_step3 = request_headers.copy()
+        request_headers_step3["Next-Action"] = signed_url_action_id
+        
+        try:
+            response = await client.post(
+                "https://lmarena.ai/?mode=direct",
+                headers=request_headers_step3,
+                content=json.dumps([key]),
+                timeout=30.0
+            )
+            response.raise_for_status()
+        except httpx.TimeoutException:
+            debug_print("❌ Timeout while requesting download URL")
+            return None
+        except httpx.HTTPError as e:
+            debug_print(f"❌ HTTP error while requesting download URL: {e}")
+            return None
+        
+        # Parse response
+        try:
+            lines = response.text.strip().split('\n')
+            download_data = None
+            for line in lines:
+                if line.startswith('1:'):
+                    download_data = json.loads(line[2:])
+                    break
             
-    except asyncio.TimeoutError:
-        debug_print(f"❌ Proxy Task {task_id} timed out. Is the Userscript running?")
-        if task_id in proxy_pending_tasks:
-            del proxy_pending_tasks[task_id]
-        if task_id in [t['id'] for t in proxy_task_queue]:
-            # Remove from queue if not picked up
-            proxy_task_queue[:] = [t for t in proxy_task_queue if t['id'] != task_id]
-        return None
+            if not download_data or not download_data.get('success'):
+                debug_print(f"❌ Failed to get download URL: {response.text[:200]}")
+                return None
+            
+            download_url = download_data['data']['url']
+            debug_print(f"✅ Got signed download URL: {download_url[:100]}...")
+            return (key, download_url)
+        except (json.JSONDecodeError, KeyError, IndexError) as e:
+            debug_print(f"❌ Failed to parse download URL response: {e}")
+            return None
+        
     except Exception as e:
-        debug_print(f"❌ Proxy Task Exception: {e}")
+        debug_print(f"❌ Unexpected error uploading image: {type(e).__name__}: {e}")
         return None
 
-    return None
-
-async def get_recaptcha_v3_token() -> Optional[str]:
+async def process_message_content(content, model_capabilities: dict) -> tuple[str, List[dict]]:
     """
-    Retrieves reCAPTCHA v3 token using a 'Side-Channel' approach.
-    We write the token to a global window variable and poll for it, 
-    bypassing Promise serialization issues in the Main World bridge.
+    Process message content, handle images if present and model supports them.
+    
+    Args:
+        content: Message content (string or list of content parts)
+        model_capabilities: Model's capability dictionary
+    
+    Returns:
+        Tuple of (text_content, experimental_attachments)
     """
-    global RECAPTCHA_TOKEN, RECAPTCHA_EXPIRY
-    debug_print("🔐 Starting reCAPTCHA v3 token retrieval (Side-Channel Mode)...")
+    # Check if model supports image input
+    supports_images = model_capabilities.get('inputCapabilities', {}).get('image', False)
     
-    config = get_config()
-    cf_clearance = config.get("cf_clearance", "")
-    recaptcha_sitekey, recaptcha_action = get_recaptcha_settings(config)
+    # If content is a string, return it as-is
+    if isinstance(content, str):
+        return content, []
+    
+    # If content is a list (OpenAI format with multiple parts)
+    if isinstance(content, list):
+        text_parts = []
+        attachments = []
+        
+        for part in content:
+            if isinstance(part, dict):
+                if part.get('type') == 'text':
+                    text_parts.append(part.get('text', ''))
+                    
+                elif part.get('type') == 'image_url' and supports_images:
+                    image_url = part.get('image_url', {})
+                    if isinstance(image_url, dict):
+                        url = image_url.get('url', '')
+                    else:
+                        url = image_url
+                    
+                    # Handle base64-encoded images
+                    if url.startswith('data:'):
+                        # Format: data:image/png;base64,iVBORw0KGgo...
+                        try:
+                            # Validate and parse data URI
+                            if ',' not in url:
+                                debug_print(f"❌ Invalid data URI format (no comma separator)")
+                                continue
+                            
+                            header, data = url.split(',', 1)
+                            
+                            # Parse MIME type
+                            if ';' not in header or ':' not in header:
+                                debug_print(f"❌ Invalid data URI header format")
+                                continue
+                            
+                            mime_type = header.split(';')[0].split(':')[1]
+                            
+                            # Validate MIME type
+                            if not mime_type.startswith('image/'):
+                                debug_print(f"❌ Invalid MIME type: {mime_type}")
+                                continue
+                            
+                            # Decode base64
+                            try:
+                                image_data = base64.b64decode(data)
+                            except Exception as e:
+                                debug_print(f"❌ Failed to decode base64 data: {e}")
+                                continue
+                            
+                            # Validate image size (max 10MB)
+                            if len(image_data) > 10 * 1024 * 1024:
+                                debug_print(f"❌ Image too large: {len(image_data)} bytes (max 10MB)")
+                                continue
+                            
+                            # Generate filename
+                            ext = mimetypes.guess_extension(mime_type) or '.png'
+                            filename = f"upload-{uuid.uuid4()}{ext}"
+                            
+                            debug_print(f"🖼️  Processing base64 image: {filename}, size: {len(image_data)} bytes")
+                            
+                            # Upload to LMArena
+                            upload_result = await upload_image_to_lmarena(image_data, mime_type, filename)
+                            
+                            if upload_result:
+                                key, download_url = upload_result
+                                # Add as attachment in LMArena format
+                                attachments.append({
+                                    "name": key,
+                                    "contentType": mime_type,
+                                    "url": download_url
+                                })
+                                debug_print(f"✅ Image uploaded and added to attachments")
+                            else:
+                                debug_print(f"⚠️  Failed to upload image, skipping")
+                        except Exception as e:
+                            debug_print(f"❌ Unexpected error processing base64 image: {type(e).__name__}: {e}")
+                    
+                    # Handle URL images (direct URLs)
+                    elif url.startswith('http://') or url.startswith('https://'):
+                        # For external URLs, we'd need to download and re-upload
+                        # For now, skip this case
+                        debug_print(f"⚠️  External image URLs not yet supported: {url[:100]}")
+                        
+                elif part.get('type') == 'image_url' and not supports_images:
+                    debug_print(f"⚠️  Image provided but model doesn't support images")
+        
+        # Combine text parts
+        text_content = '\n'.join(text_parts).strip()
+        return text_content, attachments
     
+    # Fallback
+    return str(content), []
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     try:
-        chrome_token = await get_recaptcha_v3_token_with_chrome(config)
-        if chrome_token:
-            RECAPTCHA_TOKEN = chrome_token
-            RECAPTCHA_EXPIRY = datetime.now(timezone.utc) + timedelta(seconds=110)
-            return chrome_token
+        await startup_event()
+    except Exception as e:
+        debug_print(f"❌ Error during startup: {e}")
+    yield
+    try:
+        if _USAGE_STATS_FLUSH_TASK is not None:
+            _USAGE_STATS_FLUSH_TASK.cancel()
+        flush_usage_stats()
+    except Exception as e:
+        debug_print(f"⚠️  Error flushing usage stats on shutdown: {e}")
+    if _RECAPTCHA_RESERVOIR_TASK is not None:
+        _RECAPTCHA_RESERVOIR_TASK.cancel()
+    if _ARENA_AUTH_REFRESH_TASK is not None:
+        _ARENA_AUTH_REFRESH_TASK.cancel()
+    await close_chrome_page_pool()
+    await close_upstream_http_client()
 
-        # Use isolated world (main_world_eval=False) to avoid execution context destruction issues.
-        # We will access the main world objects via window.wrappedJSObject.
-        async with AsyncCamoufox(headless=True, main_world_eval=False) as browser:
-            context = await browser.new_context()
-            if cf_clearance:
-                await context.add_cookies([{
-                    "name": "cf_clearance",
-                    "value": cf_clearance,
-                    "domain": ".lmarena.ai",
-                    "path": "/"
-                }])
+app = FastAPI(lifespan=lifespan)
 
-            page = await context.new_page()
-            
-            debug_print("  🌐 Navigating to lmarena.ai...")
-            await page.goto("https://lmarena.ai/", wait_until="domcontentloaded")
+# --- Constants & Global State ---
+CONFIG_FILE = "config.json"
+MODELS_FILE = "models.json"
+API_KEY_HEADER = APIKeyHeader(name="Authorization", auto_error=False)
 
-            # --- NEW: Cloudflare/Turnstile Pass-Through ---
-            debug_print("  🛡️  Checking for Cloudflare Turnstile...")
-            
-            # Allow time for the widget to render if it's going to
-            try:
-                # Check for challenge title or widget presence
-                for _ in range(5):
-                    title = await page.title()
-                    if "Just a moment" in title:
-                        debug_print("  🔒 Cloudflare challenge active. Attempting to click...")
-                        clicked = await click_turnstile(page)
-                        if clicked:
-                            debug_print("  ✅ Clicked Turnstile.")
-                            # Give it time to verify
-                            await asyncio.sleep(3)
-                    else:
-                        # If title is normal, we might still have a widget on the page
-                        await click_turnstile(page)
-                        break
-                    await asyncio.sleep(1)
-                
-                # Wait for the page to actually settle into the main app
-                await page.wait_for_load_state("domcontentloaded")
-            except Exception as e:
-                debug_print(f"  ⚠️ Error handling Turnstile: {e}")
-            # ----------------------------------------------
+# In-memory stores
+# { "api_key": { "conversation_id": session_data } }
+chat_sessions: Dict[str, Dict[str, dict]] = defaultdict(dict)
+# { "session_id": "username" }
+dashboard_sessions = {}
+# { "api_key": ApiKeyUsage } (rate-limit window + 24h activity counters)
+api_key_usage: Dict[str, "ApiKeyUsage"] = {}
+# { "model_id": count }
+model_usage_stats = defaultdict(int)
+# Token cycling: current index for round-robin selection
+current_token_index = 0
+# Track config file path changes to reset per-config state in tests/dev.
+_LAST_CONFIG_FILE: Optional[str] = None
+# Track which token is assigned to each conversation (LMArena session id -> token)
+conversation_tokens: Dict[str, str] = {}
+# Monotonic expiry for each `conversation_tokens` entry (dict order == least recently used first).
+conversation_token_expiry: Dict[str, float] = {}
+# Track failed tokens per request to avoid retrying with same token
+request_failed_tokens: Dict[str, set] = {}
 
-            # 1. Wake up the page (Humanize)
-            debug_print("  🖱️  Waking up page...")
-            await page.mouse.move(100, 100)
-            await page.mouse.wheel(0, 200)
-            await asyncio.sleep(2) # Vital "Human" pause
+# Ephemeral Arena auth cookie captured from browser sessions (not persisted unless enabled).
+EPHEMERAL_ARENA_AUTH_TOKEN: Optional[str] = None
 
-            # 2. Check for Library
-            debug_print("  ⏳ Checking for library...")
-            # Use wrappedJSObject to check for grecaptcha in the main world
-            lib_ready = await safe_page_evaluate(
-                page,
-                "() => { const w = window.wrappedJSObject || window; return !!(w.grecaptcha && w.grecaptcha.enterprise); }",
-            )
-            if not lib_ready:
-                debug_print("  ⚠️ Library not found immediately. Waiting...")
-                await asyncio.sleep(3)
-                lib_ready = await safe_page_evaluate(
-                    page,
-                    "() => { const w = window.wrappedJSObject || window; return !!(w.grecaptcha && w.grecaptcha.enterprise); }",
-                )
-                if not lib_ready:
-                    debug_print("❌ reCAPTCHA library never loaded.")
-                    return None
+# Supabase anon key (public client key) discovered from LMArena's JS bundles. Kept in-memory by default.
+SUPABASE_ANON_KEY: Optional[str] = None
 
-            # 3. SETUP: Initialize our global result variable
-            # We use a unique name to avoid conflicts
-            await safe_page_evaluate(page, "() => { (window.wrappedJSObject || window).__token_result = 'PENDING'; }")
+# --- New Global State for reCAPTCHA ---
+RECAPTCHA_TOKEN: Optional[str] = None
+# Initialize expiry far in the past to force a refresh on startup
+RECAPTCHA_EXPIRY: datetime = datetime.now(timezone.utc) - timedelta(days=365)
 
-            # 4. TRIGGER: Execute reCAPTCHA and write to the variable
-            # We do NOT await the result here. We just fire the process.
-            debug_print("  🚀 Triggering reCAPTCHA execution...")
-            trigger_script = f"""() => {{
-                const w = window.wrappedJSObject || window;
-                try {{
-                    w.grecaptcha.enterprise.execute('{recaptcha_sitekey}', {{ action: '{recaptcha_action}' }})
-                    .then(token => {{
-                        w.__token_result = token;
-                    }})
-                    .catch(err => {{
-                        w.__token_result = 'ERROR: ' + err.toString();
-                    }});
-                }} catch (e) {{
-                    w.__token_result = 'SYNC_ERROR: ' + e.toString();
-                }}
-            }}"""
-            
-            await safe_page_evaluate(page, trigger_script)
+# Reservoir of pre-minted, single-use reCAPTCHA v3 tokens: deque of (token, monotonic expiry), oldest first.
+# Topped up in the background by `recaptcha_reservoir_task` so requests don't wait on inline minting.
+_RECAPTCHA_RESERVOIR: deque = deque()
+# Monotonic timestamps of recent token requests (hits and misses); drives the adaptive target depth.
+_RECAPTCHA_RESERVOIR_DEMAND: deque = deque()
+_RECAPTCHA_RESERVOIR_WAKE: Optional[asyncio.Event] = None
+_RECAPTCHA_RESERVOIR_TASK: Optional[asyncio.Task] = None
+_RECAPTCHA_RESERVOIR_LAST_DEMAND_AT: Optional[float] = None
+_RECAPTCHA_RESERVOIR_STATS: dict = {"hits": 0, "misses": 0, "minted": 0, "expired": 0, "mint_failures": 0}
+RECAPTCHA_TOKEN_TTL_SECONDS = 110.0
+# Tokens this close to expiry are discarded rather than handed out.
+_RECAPTCHA_RESERVOIR_EXPIRY_MARGIN_SECONDS = 10.0
+_RECAPTCHA_RESERVOIR_DEMAND_WINDOW_SECONDS = 60.0
+# --------------------------------------
 
-            # 5. POLL: Watch the variable for changes
-            debug_print("  👀 Polling for result...")
-            token = None
-            
-            for i in range(20): # Wait up to 20 seconds
-                # Read the global variable
-                result = await safe_page_evaluate(page, "() => (window.wrappedJSObject || window).__token_result", retries=2)
-                
-                if result != 'PENDING':
-                    if result and result.startswith('ERROR'):
-                        debug_print(f"❌ JS Execution Error: {result}")
-                        return None
-                    elif result and result.startswith('SYNC_ERROR'):
-                        debug_print(f"❌ JS Sync Error: {result}")
-                        return None
-                    else:
-                        token = result
-                        debug_print(f"✅ Token captured! ({len(token)} chars)")
-                        break
-                
-                if i % 2 == 0:
-                    debug_print(f"    ... waiting ({i}s)")
-                await asyncio.sleep(1)
+# --- Helper Functions ---
 
-            if token:
-                RECAPTCHA_TOKEN = token
-                RECAPTCHA_EXPIRY = datetime.now(timezone.utc) + timedelta(seconds=110)
-                return token
-            else:
-                debug_print("❌ Timed out waiting for token variable to update.")
-                return None
+# --- Config store ---
+# config.json is read on the hot path of every completion (rate limiting, token selection, header building and
+# the retry loop in `generate_stream`). Keep one parsed + normalized snapshot per process and only reload it when
+# the file's identity (path, mtime, size, inode) changes.
+_CONFIG_SNAPSHOT: Optional[dict] = None
+_CONFIG_SNAPSHOT_KEY: Optional[tuple] = None
+_CONFIG_SNAPSHOT_RAW: Optional[bytes] = None
+_CONFIG_SNAPSHOT_LOADED_NS: int = 0
+# Bumped whenever a different config.json payload is loaded (lets callers cache derived data per version).
+CONFIG_VERSION: int = 0
+# Some filesystems have coarse mtime resolution: a file rewritten in the same tick can keep its mtime/size.
+# Within this window after a write we also compare the raw bytes (cheap; skips the JSON parse when unchanged).
+_CONFIG_RACY_WINDOW_NS = 2_000_000_000
+
+
+class _FrozenDict(dict):
+    """Read-only dict handed out by `get_config_view()` (still passes `isinstance(x, dict)` checks)."""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("config view is read-only; use get_config() for a mutable copy")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def copy(self):
+        return _thaw_config_value(self)
+
+    def __copy__(self):
+        return _thaw_config_value(self)
+
+    def __deepcopy__(self, memo):
+        return _thaw_config_value(self)
+
+    def __reduce__(self):
+        return (dict, (_thaw_config_value(self),))
+
+
+class _FrozenList(list):
+    """Read-only list counterpart of `_FrozenDict`."""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("config view is read-only; use get_config() for a mutable copy")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = remove = pop = clear = sort = reverse = _readonly
+
+    def copy(self):
+        return _thaw_config_value(self)
+
+    def __copy__(self):
+        return _thaw_config_value(self)
+
+    def __deepcopy__(self, memo):
+        return _thaw_config_value(self)
+
+    def __reduce__(self):
+        return (list, (_thaw_config_value(self),))
 
+
+def _freeze_config_value(value):
+    if isinstance(value, dict):
+        frozen = _FrozenDict()
+        for k, v in value.items():
+            dict.__setitem__(frozen, k, _freeze_config_value(v))
+        return frozen
+    if isinstance(value, list):
+        return _FrozenList(_freeze_config_value(v) for v in value)
+    return value
+
+
+def _thaw_config_value(value):
+    if isinstance(value, dict):
+        return {k: _thaw_config_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_thaw_config_value(v) for v in value]
+    return value
+
+
+def _apply_config_defaults(config: dict) -> dict:
+    # Ensure default keys exist
+    try:
+        config.setdefault("password", "admin")
+        config.setdefault("auth_token", "")
+        config.setdefault("auth_tokens", [])  # Multiple auth tokens
+        config.setdefault("cf_clearance", "")
+        config.setdefault("api_keys", [])
+        config.setdefault("usage_stats", {})
+        config.setdefault("prune_invalid_tokens", False)
+        config.setdefault("persist_arena_auth_cookie", False)
+        
+        # Normalize api_keys to prevent KeyErrors in dashboard and rate limiting
+        if isinstance(config.get("api_keys"), list):
+            normalized_keys = []
+            for i, key_entry in enumerate(config["api_keys"]):
+                if isinstance(key_entry, dict):
+                    # Ensure 'key' exists as it's critical
+                    if "key" not in key_entry:
+                        continue # Skip invalid entries missing the actual key
+                    
+                    if "name" not in key_entry:
+                        key_entry["name"] = "Unnamed Key"
+                    if "created" not in key_entry:
+                        # Use a default old timestamp (Jan 3 2024)
+                        key_entry["created"] = 1704236400
+                    if "rpm" not in key_entry:
+                        key_entry["rpm"] = 60
+                    normalized_keys.append(key_entry)
+            config["api_keys"] = normalized_keys
     except Exception as e:
-        debug_print(f"❌ Unexpected error: {e}")
-        return None
+        debug_print(f"⚠️  Error setting config defaults: {e}")
+    return config
 
-async def refresh_recaptcha_token(force_new: bool = False):
-    """Checks if the global reCAPTCHA token is expired and refreshes it if necessary."""
-    global RECAPTCHA_TOKEN, RECAPTCHA_EXPIRY
-    
-    current_time = datetime.now(timezone.utc)
-    if force_new:
-        RECAPTCHA_TOKEN = None
-        RECAPTCHA_EXPIRY = current_time - timedelta(days=365)
-    # Unit tests should never launch real browser automation. Tests that need a token patch
-    # `refresh_recaptcha_token` / `get_recaptcha_v3_token` explicitly.
-    if os.environ.get("PYTEST_CURRENT_TEST"):
-        return get_cached_recaptcha_token() or None
-    # Check if token is expired (set a refresh margin of 10 seconds)
-    if RECAPTCHA_TOKEN is None or current_time > RECAPTCHA_EXPIRY - timedelta(seconds=10):
-        debug_print("🔄 Recaptcha token expired or missing. Refreshing...")
-        new_token = await get_recaptcha_v3_token()
-        if new_token:
-            RECAPTCHA_TOKEN = new_token
-            # reCAPTCHA v3 tokens typically last 120 seconds (2 minutes)
-            RECAPTCHA_EXPIRY = current_time + timedelta(seconds=120)
-            debug_print(f"✅ Recaptcha token refreshed, expires at {RECAPTCHA_EXPIRY.isoformat()}")
-            return new_token
-        else:
-            debug_print("❌ Failed to refresh recaptcha token.")
-            # Set a short retry delay if refresh fails
-            RECAPTCHA_EXPIRY = current_time + timedelta(seconds=10)
-            return None
-    
-    return RECAPTCHA_TOKEN
 
-# --- End New reCAPTCHA Functions ---
+def _file_identity_key(path: str) -> tuple:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (path, None, None, None)
+    return (path, st.st_mtime_ns, st.st_size, st.st_ino)
 
-def get_cached_recaptcha_token() -> str:
-    """Return the current reCAPTCHA v3 token if it's still valid, without refreshing."""
-    global RECAPTCHA_TOKEN, RECAPTCHA_EXPIRY
-    token = RECAPTCHA_TOKEN
-    if not token:
-        return ""
-    current_time = datetime.now(timezone.utc)
-    if current_time > RECAPTCHA_EXPIRY - timedelta(seconds=10):
-        return ""
-    return str(token)
 
-# Custom UUIDv7 implementation (using correct Unix epoch)
-def uuid7():
-    """
-    Generate a UUIDv7 using Unix epoch (milliseconds since 1970-01-01)
-    matching the browser's implementation.
-    """
-    timestamp_ms = int(time.time() * 1000)
-    rand_a = secrets.randbits(12)
-    rand_b = secrets.randbits(62)
-    
-    uuid_int = timestamp_ms << 80
-    uuid_int |= (0x7000 | rand_a) << 64
-    uuid_int |= (0x8000000000000000 | rand_b)
-    
-    hex_str = f"{uuid_int:032x}"
-    return f"{hex_str[0:8]}-{hex_str[8:12]}-{hex_str[12:16]}-{hex_str[16:20]}-{hex_str[20:32]}"
+def invalidate_config_cache() -> None:
+    """Drop the cached config snapshot so the next read reloads config.json."""
+    global _CONFIG_SNAPSHOT_KEY
+    _CONFIG_SNAPSHOT_KEY = None
 
-# Image upload helper functions
-async def upload_image_to_lmarena(image_data: bytes, mime_type: str, filename: str) -> Optional[tuple]:
+
+def _load_config_snapshot() -> dict:
+    global _CONFIG_SNAPSHOT, _CONFIG_SNAPSHOT_KEY, _CONFIG_SNAPSHOT_RAW, _CONFIG_SNAPSHOT_LOADED_NS, CONFIG_VERSION
+    global current_token_index, _LAST_CONFIG_FILE
+    # If tests or callers swap CONFIG_FILE at runtime, reset the token round-robin index so token selection
+    # is deterministic per config file.
+    if _LAST_CONFIG_FILE != CONFIG_FILE:
+        _LAST_CONFIG_FILE = CONFIG_FILE
+        current_token_index = 0
+
+    path = CONFIG_FILE
+    key = _file_identity_key(path)
+    raw: Optional[bytes] = None
+    if _CONFIG_SNAPSHOT is not None and key == _CONFIG_SNAPSHOT_KEY:
+        mtime_ns = key[1]
+        if mtime_ns is None or (_CONFIG_SNAPSHOT_LOADED_NS - int(mtime_ns)) >= _CONFIG_RACY_WINDOW_NS:
+            return _CONFIG_SNAPSHOT
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except Exception:
+            raw = None
+        if raw is not None and raw == _CONFIG_SNAPSHOT_RAW:
+            _CONFIG_SNAPSHOT_LOADED_NS = time.time_ns()
+            return _CONFIG_SNAPSHOT
+
+    loaded_ns = time.time_ns()
+    try:
+        if raw is None:
+            with open(path, "rb") as f:
+                raw = f.read()
+        config = json.loads(raw)
+        if not isinstance(config, dict):
+            raise json.JSONDecodeError("config root must be an object", "", 0)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        debug_print(f"⚠️  Config file error: {e}, using defaults")
+        config = {}
+    except Exception as e:
+        debug_print(f"⚠️  Unexpected error reading config: {e}, using defaults")
+        config = {}
+
+    snapshot = _freeze_config_value(_apply_config_defaults(config))
+    if raw != _CONFIG_SNAPSHOT_RAW or _CONFIG_SNAPSHOT is None:
+        CONFIG_VERSION += 1
+    _CONFIG_SNAPSHOT = snapshot
+    _CONFIG_SNAPSHOT_RAW = raw
+    _CONFIG_SNAPSHOT_KEY = key
+    _CONFIG_SNAPSHOT_LOADED_NS = loaded_ns
+    return snapshot
+
+
+def get_config_view() -> dict:
     """
-    Upload an image to LMArena R2 storage and return the key and download URL.
-    
-    Args:
-        image_data: Binary image data
-        mime_type: MIME type of the image (e.g., 'image/png')
-        filename: Original filename for the image
-    
-    Returns:
-        Tuple of (key, download_url) if successful, or None if upload fails
+    Return the shared, read-only config snapshot.
+
+    Use this for hot-path reads. Callers that need to modify and `save_config()` must use `get_config()`.
     """
+    return _load_config_snapshot()
+
+
+def get_config():
+    """Return a mutable copy of the current config (safe to modify and pass to `save_config()`)."""
+    return _thaw_config_value(_load_config_snapshot())
+
+# --- Usage stats journal ---
+# Completions record per-model counters in memory and a background task appends the deltas to a small
+# append-only journal next to config.json, instead of rewriting the whole config file on every request.
+# Each journal line carries the sequence number of its last increment; config.json stores the sequence already
+# folded into `usage_stats` so replay never double counts.
+_USAGE_STATS_SEQ: int = 0
+_USAGE_STATS_PENDING: Dict[str, int] = {}
+_USAGE_STATS_FLUSH_TASK: Optional[asyncio.Task] = None
+
+
+def _usage_stats_journal_path() -> str:
+    base, _ = os.path.splitext(CONFIG_FILE)
+    return f"{base}.usage.jsonl"
+
+
+def _read_usage_stats_journal(path: str, after_seq: int) -> tuple[dict, int, int]:
+    """Return (summed counts newer than `after_seq`, highest seq seen, number of journal lines)."""
+    counts: Dict[str, int] = defaultdict(int)
+    max_seq = int(after_seq)
+    lines = 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for raw_line in f:
+                raw_line = raw_line.strip()
+                if not raw_line:
+                    continue
+                lines += 1
+                try:
+                    entry = json.loads(raw_line)
+                    seq = int(entry.get("seq") or 0)
+                    entry_counts = entry.get("counts") or {}
+                except Exception:
+                    # A torn trailing write (crash mid-append) only loses that batch.
+                    continue
+                if seq <= after_seq or not isinstance(entry_counts, dict):
+                    continue
+                max_seq = max(max_seq, seq)
+                for model, count in entry_counts.items():
+                    try:
+                        counts[str(model)] += int(count)
+                    except Exception:
+                        continue
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        debug_print(f"⚠️  Error reading usage stats journal: {e}")
+    return dict(counts), max_seq, lines
+
+
+def record_model_usage(model_public_name: str) -> None:
+    """Count one completion for `model_public_name` (journaled by `flush_usage_stats`)."""
+    global _USAGE_STATS_SEQ
+    model_usage_stats[model_public_name] += 1
+    _USAGE_STATS_SEQ += 1
+    _USAGE_STATS_PENDING[model_public_name] = _USAGE_STATS_PENDING.get(model_public_name, 0) + 1
+
+
+def flush_usage_stats() -> None:
+    """Append pending usage counters to the journal as one compact line."""
+    global _USAGE_STATS_PENDING
+    if not _USAGE_STATS_PENDING:
+        return
+    pending = _USAGE_STATS_PENDING
+    _USAGE_STATS_PENDING = {}
+    line = json.dumps({"seq": _USAGE_STATS_SEQ, "counts": pending}, separators=(",", ":"))
+    try:
+        with open(_usage_stats_journal_path(), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except Exception as e:
+        # Keep the deltas for the next flush attempt.
+        for model, count in pending.items():
+            _USAGE_STATS_PENDING[model] = _USAGE_STATS_PENDING.get(model, 0) + count
+        debug_print(f"⚠️  Error writing usage stats journal: {e}")
+
+
+async def usage_stats_flush_task():
+    """Background task that periodically flushes journaled usage counters."""
+    while True:
+        try:
+            interval = float(get_config_view().get("usage_stats_flush_interval_seconds", 5))
+        except Exception:
+            interval = 5.0
+        interval = max(0.5, min(interval, 300.0))
+        try:
+            await asyncio.sleep(interval)
+            flush_usage_stats()
+        except asyncio.CancelledError:
+            flush_usage_stats()
+            raise
+        except Exception as e:
+            debug_print(f"❌ Error in usage stats flush task: {e}")
+
+
+def load_usage_stats():
+    """Load usage stats (config.json totals + journal) into memory, compacting the journal into config.json."""
+    global model_usage_stats, _USAGE_STATS_SEQ, _USAGE_STATS_PENDING
     try:
-        # Validate inputs
-        if not image_data:
-            debug_print("❌ Image data is empty")
-            return None
-        
-        if not mime_type or not mime_type.startswith('image/'):
-            debug_print(f"❌ Invalid MIME type: {mime_type}")
-            return None
-        
-        # Step 1: Request upload URL
-        debug_print(f"📤 Step 1: Requesting upload URL for {filename}")
-        
-        # Get Next-Action IDs from config
         config = get_config()
-        upload_action_id = config.get("next_action_upload")
-        signed_url_action_id = config.get("next_action_signed_url")
-        
-        if not upload_action_id or not signed_url_action_id:
-            debug_print("❌ Next-Action IDs not found in config. Please refresh tokens from dashboard.")
-            return None
-        
-        # Prepare headers for Next.js Server Action
-        request_headers = get_request_headers()
-        request_headers.update({
-            "Accept": "text/x-component",
-            "Content-Type": "text/plain;charset=UTF-8",
-            "Next-Action": upload_action_id,
-            "Referer": "https://lmarena.ai/?mode=direct",
-        })
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    "https://lmarena.ai/?mode=direct",
-                    headers=request_headers,
-                    content=json.dumps([filename, mime_type]),
-                    timeout=30.0
-                )
-                response.raise_for_status()
-            except httpx.TimeoutException:
-                debug_print("❌ Timeout while requesting upload URL")
-                return None
-            except httpx.HTTPError as e:
-                debug_print(f"❌ HTTP error while requesting upload URL: {e}")
-                return None
-            
-            # Parse response - format: 0:{...}\n1:{...}\n
+        base = config.get("usage_stats", {})
+        if not isinstance(base, dict):
+            base = {}
+        try:
+            stored_seq = int(config.get("usage_stats_journal_seq") or 0)
+        except Exception:
+            stored_seq = 0
+        journal_path = _usage_stats_journal_path()
+        delta, max_seq, journal_lines = _read_usage_stats_journal(journal_path, stored_seq)
+
+        model_usage_stats = defaultdict(int, base)
+        for model, count in delta.items():
+            model_usage_stats[model] += count
+        _USAGE_STATS_SEQ = max_seq
+        _USAGE_STATS_PENDING = {}
+
+        if journal_lines:
+            # Fold the journal into config.json first, then drop it: a crash in between is harmless because
+            # replay skips entries at or below the stored sequence.
+            save_config(config)
             try:
-                lines = response.text.strip().split('\n')
-                upload_data = None
-                for line in lines:
-                    if line.startswith('1:'):
-                        upload_data = json.loads(line[2:])
-                        break
-                
-                if not upload_data or not upload_data.get('success'):
-                    debug_print(f"❌ Failed to get upload URL: {response.text[:200]}")
-                    return None
-                
-                upload_url = upload_data['data']['uploadUrl']
-                key = upload_data['data']['key']
-                debug_print(f"✅ Got upload URL and key: {key}")
-            except (json.JSONDecodeError, KeyError, IndexError) as e:
-                debug_print(f"❌ Failed to parse upload URL response: {e}")
-                return None
-            
-            # Step 2: Upload image to R2 storage
-            debug_print(f"📤 Step 2: Uploading image to R2 storage ({len(image_data)} bytes)")
+                os.remove(journal_path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                debug_print(f"⚠️  Error compacting usage stats journal: {e}")
+    except Exception as e:
+        debug_print(f"⚠️  Error loading usage stats: {e}, using empty stats")
+        model_usage_stats = defaultdict(int)
+
+def save_config(config, *, preserve_auth_tokens: bool = True):
+    try:
+        # Avoid clobbering user-provided auth tokens when multiple tasks write config.json concurrently.
+        # Background refreshes/cookie upserts shouldn't overwrite auth tokens that may have been added via the dashboard.
+        if preserve_auth_tokens:
             try:
-                response = await client.put(
-                    upload_url,
-                    content=image_data,
-                    headers={"Content-Type": mime_type},
-                    timeout=60.0
-                )
-                response.raise_for_status()
-                debug_print(f"✅ Image uploaded successfully")
-            except httpx.TimeoutException:
-                debug_print("❌ Timeout while uploading image to R2 storage")
-                return None
-            except httpx.HTTPError as e:
-                debug_print(f"❌ HTTP error while uploading image: {e}")
-                return None
-            
-            # Step 3: Get signed download URL (uses different Next-Action)
-            debug_print(f"📤 Step 3: Requesting signed download URL")
-            request_headers_step3 = request_headers.copy()
-            request_headers_step3["Next-Action"] = signed_url_action_id
-            
+                with open(CONFIG_FILE, "r") as f:
+                    on_disk = json.load(f)
+            except Exception:
+                on_disk = None
+
+            if isinstance(on_disk, dict):
+                if "auth_tokens" in on_disk and isinstance(on_disk.get("auth_tokens"), list):
+                    config["auth_tokens"] = list(on_disk.get("auth_tokens") or [])
+                if "auth_token" in on_disk:
+                    config["auth_token"] = str(on_disk.get("auth_token") or "")
+
+        # Persist in-memory stats to the config dict before saving
+        config["usage_stats"] = dict(model_usage_stats)
+        config["usage_stats_journal_seq"] = _USAGE_STATS_SEQ
+        tmp_path = f"{CONFIG_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(config, f, indent=4)
+        os.replace(tmp_path, CONFIG_FILE)
+        # Everything counted so far is now in config.json; unflushed journal deltas are redundant.
+        _USAGE_STATS_PENDING.clear()
+    except Exception as e:
+        debug_print(f"❌ Error saving config: {e}")
+    finally:
+        invalidate_config_cache()
+
+
+def _capture_ephemeral_arena_auth_token_from_cookies(cookies: list[dict]) -> None:
+    """
+    Capture the current `arena-auth-prod-v1` cookie value into an in-memory global.
+
+    This keeps the bridge usable even if the user hasn't pasted tokens into config.json,
+    while still honoring `persist_arena_auth_cookie` for persistence.
+    """
+    global EPHEMERAL_ARENA_AUTH_TOKEN
+    try:
+        best: Optional[str] = None
+        fallback: Optional[str] = None
+        for cookie in cookies or []:
+            if str(cookie.get("name") or "") != "arena-auth-prod-v1":
+                continue
+            value = str(cookie.get("value") or "").strip()
+            if not value:
+                continue
+            if fallback is None:
+                fallback = value
             try:
-                response = await client.post(
-                    "https://lmarena.ai/?mode=direct",
-                    headers=request_headers_step3,
-                    content=json.dumps([key]),
-                    timeout=30.0
-                )
-                response.raise_for_status()
-            except httpx.TimeoutException:
-                debug_print("❌ Timeout while requesting download URL")
-                return None
-            except httpx.HTTPError as e:
-                debug_print(f"❌ HTTP error while requesting download URL: {e}")
-                return None
-            
-            # Parse response
+                if not is_arena_auth_token_expired(value, skew_seconds=0):
+                    best = value
+                    break
+            except Exception:
+                # Unknown formats: treat as usable if we don't have anything better yet.
+                if best is None:
+                    best = value
+        if best:
+            EPHEMERAL_ARENA_AUTH_TOKEN = best
+        elif fallback:
+            EPHEMERAL_ARENA_AUTH_TOKEN = fallback
+    except Exception:
+        return None
+
+def _upsert_browser_session_into_config(config: dict, cookies: list[dict], user_agent: str | None = None) -> bool:
+    """
+    Persist useful browser session identity (cookies + UA) into config.json.
+    This helps keep Cloudflare + LMArena auth aligned with reCAPTCHA/browser fetch flows.
+    """
+    changed = False
+
+    cookie_store = config.get("browser_cookies")
+    if not isinstance(cookie_store, dict):
+        cookie_store = {}
+        config["browser_cookies"] = cookie_store
+        changed = True
+
+    for cookie in cookies or []:
+        name = cookie.get("name")
+        value = cookie.get("value")
+        if not name or value is None:
+            continue
+        name = str(name)
+        if name == "arena-auth-prod-v1" and not bool(config.get("persist_arena_auth_cookie")):
+            continue
+        value = str(value)
+        if cookie_store.get(name) != value:
+            cookie_store[name] = value
+            changed = True
+
+    # Promote frequently-used cookies to top-level config keys.
+    cf_clearance = str(cookie_store.get("cf_clearance") or "").strip()
+    cf_bm = str(cookie_store.get("__cf_bm") or "").strip()
+    cfuvid = str(cookie_store.get("_cfuvid") or "").strip()
+    provisional_user_id = str(cookie_store.get("provisional_user_id") or "").strip()
+
+    if cf_clearance and config.get("cf_clearance") != cf_clearance:
+        config["cf_clearance"] = cf_clearance
+        changed = True
+    if cf_bm and config.get("cf_bm") != cf_bm:
+        config["cf_bm"] = cf_bm
+        changed = True
+    if cfuvid and config.get("cfuvid") != cfuvid:
+        config["cfuvid"] = cfuvid
+        changed = True
+    if provisional_user_id and config.get("provisional_user_id") != provisional_user_id:
+        config["provisional_user_id"] = provisional_user_id
+        changed = True
+
+    ua = str(user_agent or "").strip()
+    if ua and str(config.get("user_agent") or "").strip() != ua:
+        config["user_agent"] = ua
+        changed = True
+
+    if changed:
+        # Don't keep signing requests with the previous cookies until the config reload bumps CONFIG_VERSION.
+        invalidate_request_header_cache()
+    return changed
+
+# --- Model registry ---
+# models.json is ~130 KB; parse it once per file version and index it so completions don't re-parse and scan it.
+_MODELS_CACHE: Optional[list] = None
+_MODELS_CACHE_KEY: Optional[tuple] = None
+
+
+class ModelInfo:
+    """Precomputed lookup data for one LMArena model entry."""
+
+    __slots__ = (
+        "id",
+        "public_name",
+        "organization",
+        "capabilities",
+        "modality",
+        "is_stealth",
+        "input_text",
+        "input_image",
+        "output_text",
+        "output_search",
+        "output_image",
+        "raw",
+    )
+
+    def __init__(self, model: dict) -> None:
+        self.raw = model
+        self.id = model.get("id")
+        self.public_name = model.get("publicName")
+        self.organization = model.get("organization")
+        self.capabilities = model.get("capabilities", {})
+        caps = self.capabilities if isinstance(self.capabilities, dict) else {}
+        input_caps = caps.get("inputCapabilities", {})
+        output_caps = caps.get("outputCapabilities", {})
+        if not isinstance(input_caps, dict):
+            input_caps = {}
+        if not isinstance(output_caps, dict):
+            output_caps = {}
+        self.input_text = bool(input_caps.get("text"))
+        self.input_image = bool(input_caps.get("image"))
+        self.output_text = bool(output_caps.get("text"))
+        self.output_search = bool(output_caps.get("search"))
+        self.output_image = bool(output_caps.get("image"))
+        # Stealth models have no organization and are not exposed to API clients.
+        self.is_stealth = not self.organization
+        # Priority: image > search > chat
+        if self.output_image:
+            self.modality = "image"
+        elif self.output_search:
+            self.modality = "search"
+        else:
+            self.modality = "chat"
+
+
+class ModelRegistry:
+    """Immutable index over one version of the model list (by publicName and id)."""
+
+    __slots__ = ("models", "entries", "by_public_name", "by_id", "listed")
+
+    def __init__(self, models: list) -> None:
+        self.models = models
+        self.entries: list[ModelInfo] = []
+        self.by_public_name: Dict[str, ModelInfo] = {}
+        self.by_id: Dict[str, ModelInfo] = {}
+        for model in models or []:
+            if not isinstance(model, dict):
+                continue
+            info = ModelInfo(model)
+            self.entries.append(info)
+            # First entry wins, matching the previous linear scan.
+            if info.public_name:
+                self.by_public_name.setdefault(info.public_name, info)
+            if info.id:
+                self.by_id.setdefault(info.id, info)
+        # Models exposed via /api/v1/models: text/search/image output and a known organization.
+        self.listed: list[ModelInfo] = [
+            info
+            for info in self.entries
+            if (info.output_text or info.output_search or info.output_image)
+            and info.organization
+            and info.public_name
+        ]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, public_name: Optional[str]) -> Optional[ModelInfo]:
+        return self.by_public_name.get(public_name) if public_name else None
+
+    def get_by_id(self, model_id: Optional[str]) -> Optional[ModelInfo]:
+        return self.by_id.get(model_id) if model_id else None
+
+
+_MODEL_REGISTRY: Optional[ModelRegistry] = None
+
+
+def get_models():
+    """Return the cached model list (shared; do not mutate). Reloaded when models.json changes."""
+    global _MODELS_CACHE, _MODELS_CACHE_KEY
+    key = _file_identity_key(MODELS_FILE)
+    if _MODELS_CACHE is not None and key == _MODELS_CACHE_KEY:
+        return _MODELS_CACHE
+    try:
+        with open(MODELS_FILE, "r") as f:
+            models = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        models = []
+    _MODELS_CACHE = models
+    _MODELS_CACHE_KEY = key
+    return models
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the registry for the current model list, rebuilding it only when the list changes."""
+    global _MODEL_REGISTRY
+    models = get_models()
+    registry = _MODEL_REGISTRY
+    if registry is None or registry.models is not models:
+        registry = ModelRegistry(models)
+        _MODEL_REGISTRY = registry
+    return registry
+
+
+# Serialized /api/v1/models body + ETag, rebuilt only when the exposed model set changes.
+_MODELS_RESPONSE_REGISTRY: Optional[ModelRegistry] = None
+_MODELS_RESPONSE_DATA: Optional[list] = None
+_MODELS_RESPONSE_BODY: bytes = b""
+_MODELS_RESPONSE_ETAG: str = ""
+# publicName -> first-seen epoch, for models whose id doesn't carry a UUIDv7 timestamp.
+_MODEL_CREATED_FALLBACK: Dict[str, int] = {}
+
+
+def _model_created_timestamp(model: ModelInfo) -> int:
+    """Stable `created` value: the UUIDv7 timestamp embedded in LMArena model ids, else first-seen time."""
+    model_id = str(model.id or "")
+    try:
+        parsed = uuid.UUID(model_id)
+        if parsed.version == 7:
+            return int(parsed.int >> 80) // 1000
+    except Exception:
+        pass
+    name = str(model.public_name or "")
+    created = _MODEL_CREATED_FALLBACK.get(name)
+    if created is None:
+        created = int(time.time())
+        _MODEL_CREATED_FALLBACK[name] = created
+    return created
+
+
+def get_models_response() -> tuple[bytes, str]:
+    """Return the cached OpenAI-format model list body and its ETag."""
+    global _MODELS_RESPONSE_REGISTRY, _MODELS_RESPONSE_DATA, _MODELS_RESPONSE_BODY, _MODELS_RESPONSE_ETAG
+    registry = get_model_registry()
+    if registry is _MODELS_RESPONSE_REGISTRY:
+        return _MODELS_RESPONSE_BODY, _MODELS_RESPONSE_ETAG
+
+    data = [
+        {
+            "id": model.public_name,
+            "object": "model",
+            "created": _model_created_timestamp(model),
+            "owned_by": model.organization or "lmarena",
+        }
+        for model in registry.listed
+    ]
+    # Periodic refreshes usually rewrite models.json with the same set; keep the existing body/ETag then.
+    if data != _MODELS_RESPONSE_DATA:
+        body = json.dumps({"object": "list", "data": data}, separators=(",", ":")).encode("utf-8")
+        _MODELS_RESPONSE_DATA = data
+        _MODELS_RESPONSE_BODY = body
+        _MODELS_RESPONSE_ETAG = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    _MODELS_RESPONSE_REGISTRY = registry
+    return _MODELS_RESPONSE_BODY, _MODELS_RESPONSE_ETAG
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def save_models(models):
+    global _MODELS_CACHE, _MODELS_CACHE_KEY, _MODEL_REGISTRY
+    try:
+        tmp_path = f"{MODELS_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(models, f, indent=2)
+        os.replace(tmp_path, MODELS_FILE)
+        # Swap in the new list + index together so readers never see a half-updated registry.
+        registry = ModelRegistry(models)
+        _MODELS_CACHE = models
+        _MODELS_CACHE_KEY = _file_identity_key(MODELS_FILE)
+        _MODEL_REGISTRY = registry
+    except Exception as e:
+        debug_print(f"❌ Error saving models: {e}")
+
+
+# --- Shared upstream HTTP client ---
+# One pooled httpx client for all direct upstream traffic (LMArena API, image uploads, session refreshes) so
+# requests and retries reuse keep-alive connections instead of paying a TCP+TLS handshake each time.
+# Cookies are always sent per request via headers; the client never stores Set-Cookie values, so accounts
+# cannot leak into each other through a shared cookie jar.
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except Exception:
+    HTTP2_AVAILABLE = False
+
+_UPSTREAM_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+_UPSTREAM_HTTP_CLIENT_LOOP = None
+_UPSTREAM_HTTP_CLIENT_SETTINGS: Optional[tuple] = None
+_UPSTREAM_HTTP_CLIENTS_CREATED = 0
+# A retired client is closed once its pool has no requests or open streams left (checked every poll interval).
+_UPSTREAM_HTTP_RETIRE_POLL_SECONDS = 5.0
+# Only used when the pool cannot be inspected (httpcore internals changed).
+_UPSTREAM_HTTP_RETIRE_AFTER_SECONDS = 900.0
+
+
+def _get_upstream_http_settings(config: Optional[dict] = None) -> tuple:
+    cfg = config or get_config_view()
+
+    def _num(key: str, default: float, lo: float, hi: float) -> float:
+        try:
+            value = float(cfg.get(key, default))
+        except Exception:
+            value = float(default)
+        return max(lo, min(value, hi))
+
+    max_connections = int(_num("upstream_max_connections", 100, 1, 1000))
+    max_keepalive = int(_num("upstream_max_keepalive_connections", 20, 0, 1000))
+    keepalive_expiry = _num("upstream_keepalive_expiry_seconds", 30.0, 1.0, 600.0)
+    connect_timeout = _num("upstream_connect_timeout_seconds", 10.0, 1.0, 120.0)
+    read_timeout = _num("upstream_read_timeout_seconds", 120.0, 5.0, 600.0)
+    write_timeout = _num("upstream_write_timeout_seconds", 30.0, 1.0, 600.0)
+    pool_timeout = _num("upstream_pool_timeout_seconds", 30.0, 1.0, 600.0)
+    try:
+        http2 = bool(cfg.get("upstream_http2", True)) and HTTP2_AVAILABLE
+    except Exception:
+        http2 = HTTP2_AVAILABLE
+    return (
+        max_connections,
+        min(max_keepalive, max_connections),
+        keepalive_expiry,
+        connect_timeout,
+        read_timeout,
+        write_timeout,
+        pool_timeout,
+        http2,
+    )
+
+
+def _build_upstream_http_client(settings: tuple) -> httpx.AsyncClient:
+    import http.cookiejar
+
+    (
+        max_connections,
+        max_keepalive,
+        keepalive_expiry,
+        connect_timeout,
+        read_timeout,
+        write_timeout,
+        pool_timeout,
+        http2,
+    ) = settings
+    # `allowed_domains=[]` makes the jar reject every Set-Cookie.
+    jar = http.cookiejar.CookieJar(policy=http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    return httpx.AsyncClient(
+        http2=http2,
+        cookies=jar,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout),
+    )
+
+
+def _upstream_http_in_flight(client: httpx.AsyncClient) -> Optional[int]:
+    """Requests still holding `client`'s pool (queued, active, or streaming a body); None if unknown."""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    requests = getattr(pool, "_requests", None)
+    if requests is None:
+        return None
+    try:
+        return len(requests)
+    except Exception:
+        return None
+
+
+async def _retire_upstream_http_client(client: httpx.AsyncClient) -> None:
+    # Let in-flight streams on the old pool finish before closing it; a long stream can outlive any fixed delay.
+    try:
+        if _upstream_http_in_flight(client) is None:
+            await asyncio.sleep(_UPSTREAM_HTTP_RETIRE_AFTER_SECONDS)
+        else:
+            while _upstream_http_in_flight(client):
+                await asyncio.sleep(_UPSTREAM_HTTP_RETIRE_POLL_SECONDS)
+        await client.aclose()
+    except Exception:
+        pass
+
+
+def get_upstream_http_client() -> httpx.AsyncClient:
+    """Return the shared pooled upstream client, (re)creating it for the running loop or new pool settings."""
+    global _UPSTREAM_HTTP_CLIENT, _UPSTREAM_HTTP_CLIENT_LOOP, _UPSTREAM_HTTP_CLIENT_SETTINGS
+    global _UPSTREAM_HTTP_CLIENTS_CREATED
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    try:
+        settings = _get_upstream_http_settings()
+    except Exception:
+        settings = _UPSTREAM_HTTP_CLIENT_SETTINGS or _get_upstream_http_settings({})
+
+    client = _UPSTREAM_HTTP_CLIENT
+    if (
+        client is not None
+        and not client.is_closed
+        and _UPSTREAM_HTTP_CLIENT_LOOP is loop
+        and _UPSTREAM_HTTP_CLIENT_SETTINGS == settings
+    ):
+        return client
+
+    if client is not None and not client.is_closed and _UPSTREAM_HTTP_CLIENT_LOOP is loop and loop is not None:
+        # Pool settings changed: retire the old client in the background.
+        try:
+            loop.create_task(_retire_upstream_http_client(client))
+        except Exception:
+            pass
+    # (A client bound to a different, possibly closed, event loop is simply dropped.)
+
+    client = _build_upstream_http_client(settings)
+    _UPSTREAM_HTTP_CLIENT = client
+    _UPSTREAM_HTTP_CLIENT_LOOP = loop
+    _UPSTREAM_HTTP_CLIENT_SETTINGS = settings
+    _UPSTREAM_HTTP_CLIENTS_CREATED += 1
+    debug_print(
+        f"🔌 Created shared upstream HTTP client (http2={settings[7]}, max_connections={settings[0]}, "
+        f"keepalive={settings[1]})"
+    )
+    return client
+
+
+async def close_upstream_http_client() -> None:
+    global _UPSTREAM_HTTP_CLIENT, _UPSTREAM_HTTP_CLIENT_LOOP
+    client = _UPSTREAM_HTTP_CLIENT
+    _UPSTREAM_HTTP_CLIENT = None
+    _UPSTREAM_HTTP_CLIENT_LOOP = None
+    if client is not None:
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+
+
+def get_upstream_http_pool_stats() -> dict:
+    """Best-effort connection pool utilization for the shared upstream client."""
+    settings = _UPSTREAM_HTTP_CLIENT_SETTINGS
+    stats: dict = {
+        "clients_created": _UPSTREAM_HTTP_CLIENTS_CREATED,
+        "active": _UPSTREAM_HTTP_CLIENT is not None and not _UPSTREAM_HTTP_CLIENT.is_closed,
+        "http2_available": HTTP2_AVAILABLE,
+        "http2": bool(settings[7]) if settings else False,
+        "max_connections": settings[0] if settings else None,
+        "max_keepalive_connections": settings[1] if settings else None,
+        "connections": 0,
+        "idle_connections": 0,
+        "busy_connections": 0,
+        "http2_connections": 0,
+        "queued_requests": 0,
+    }
+    client = _UPSTREAM_HTTP_CLIENT
+    if client is None:
+        return stats
+    try:
+        # httpx doesn't expose pool stats publicly; read the httpcore pool when available.
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        stats["connections"] = len(connections)
+        for conn in connections:
             try:
-                lines = response.text.strip().split('\n')
-                download_data = None
-                for line in lines:
-                    if line.startswith('1:'):
-                        download_data = json.loads(line[2:])
-                        break
-                
-                if not download_data or not download_data.get('success'):
-                    debug_print(f"❌ Failed to get download URL: {response.text[:200]}")
-                    return None
-                
-                download_url = download_data['data']['url']
-                debug_print(f"✅ Got signed download URL: {download_url[:100]}...")
-                return (key, download_url)
-            except (json.JSONDecodeError, KeyError, IndexError) as e:
-                debug_print(f"❌ Failed to parse download URL response: {e}")
-                return None
+                if conn.is_idle():
+                    stats["idle_connections"] += 1
+                else:
+                    stats["busy_connections"] += 1
+                if "HTTP/2" in str(conn.info()):
+                    stats["http2_connections"] += 1
+            except Exception:
+                continue
+        stats["queued_requests"] = len(list(getattr(pool, "_requests", []) or [])) - stats["busy_connections"]
+        stats["queued_requests"] = max(0, stats["queued_requests"])
+    except Exception:
+        pass
+    return stats
+
+
+def get_request_headers():
+    """Get request headers with the first available auth token (for compatibility)"""
+    config = get_config()
+    
+    # Try to get token from auth_tokens first, then fallback to single token
+    auth_tokens = config.get("auth_tokens", [])
+    if auth_tokens:
+        token = auth_tokens[0]  # Just use first token for non-API requests
+    else:
+        token = config.get("auth_token", "").strip()
+        if not token:
+            cookie_store = config.get("browser_cookies")
+            if isinstance(cookie_store, dict) and bool(config.get("persist_arena_auth_cookie")):
+                token = str(cookie_store.get("arena-auth-prod-v1") or "").strip()
+                if token:
+                    config["auth_tokens"] = [token]
+                    save_config(config, preserve_auth_tokens=False)
+        if not token:
+            # Check for split cookies in browser_cookies
+            cookie_store = config.get("browser_cookies")
+            has_split = False
+            if isinstance(cookie_store, dict):
+                if cookie_store.get("arena-auth-prod-v1.0") or cookie_store.get("arena-auth-prod-v1.1"):
+                    has_split = True
             
-    except Exception as e:
-        debug_print(f"❌ Unexpected error uploading image: {type(e).__name__}: {e}")
+            if not has_split:
+                raise HTTPException(status_code=500, detail="Arena auth token not set in dashboard.")
+    
+    return get_request_headers_with_token(token)
+
+def normalize_user_agent_value(user_agent: object) -> str:
+    ua = str(user_agent or "").strip()
+    if not ua:
+        return ""
+    if ua.lower() in ("user-agent", "user agent"):
+        return ""
+    return ua
+
+# Static part of the upstream request headers (cookies, UA, reCAPTCHA action), rebuilt once per config version.
+# Retries and token rotations only splice in the auth token and reCAPTCHA token.
+_REQUEST_HEADER_TEMPLATE: Optional[tuple] = None
+
+
+def invalidate_request_header_cache() -> None:
+    global _REQUEST_HEADER_TEMPLATE
+    _REQUEST_HEADER_TEMPLATE = None
+
+
+def _build_request_header_template(config: dict) -> tuple:
+    cf_clearance = str(config.get("cf_clearance") or "").strip()
+    cf_bm = str(config.get("cf_bm") or "").strip()
+    cfuvid = str(config.get("cfuvid") or "").strip()
+    provisional_user_id = str(config.get("provisional_user_id") or "").strip()
+
+    cookie_store = config.get("browser_cookies")
+    if isinstance(cookie_store, dict):
+        if not cf_clearance:
+            cf_clearance = str(cookie_store.get("cf_clearance") or "").strip()
+        if not cf_bm:
+            cf_bm = str(cookie_store.get("__cf_bm") or "").strip()
+        if not cfuvid:
+            cfuvid = str(cookie_store.get("_cfuvid") or "").strip()
+        if not provisional_user_id:
+            provisional_user_id = str(cookie_store.get("provisional_user_id") or "").strip()
+
+    def _cookies(pairs) -> str:
+        return "; ".join(f"{name}={value}" for name, value in pairs if value)
+
+    # The auth cookie goes between these two groups.
+    cookie_prefix = _cookies(
+        (
+            ("cf_clearance", cf_clearance),
+            ("__cf_bm", cf_bm),
+            ("_cfuvid", cfuvid),
+            ("provisional_user_id", provisional_user_id),
+        )
+    )
+    cookie_suffix = ""
+    if isinstance(cookie_store, dict):
+        cookie_suffix = _cookies(
+            (
+                ("arena-auth-prod-v1.0", str(cookie_store.get("arena-auth-prod-v1.0") or "").strip()),
+                ("arena-auth-prod-v1.1", str(cookie_store.get("arena-auth-prod-v1.1") or "").strip()),
+            )
+        )
+
+    base_headers: dict[str, str] = {
+        "Content-Type": "text/plain;charset=UTF-8",
+        "Cookie": "",
+        "Origin": "https://lmarena.ai",
+        "Referer": "https://lmarena.ai/?mode=direct",
+    }
+    user_agent = normalize_user_agent_value(config.get("user_agent"))
+    if user_agent:
+        base_headers["User-Agent"] = user_agent
+    _, recaptcha_action = get_recaptcha_settings(config)
+    return CONFIG_VERSION, cookie_prefix, cookie_suffix, base_headers, recaptcha_action
+
+
+def get_request_headers_with_token(token: str, recaptcha_v3_token: Optional[str] = None):
+    """Get request headers with a specific auth token and optional reCAPTCHA v3 token"""
+    global _REQUEST_HEADER_TEMPLATE
+    config = get_config_view()
+    template = _REQUEST_HEADER_TEMPLATE
+    if template is None or template[0] != CONFIG_VERSION:
+        template = _build_request_header_template(config)
+        _REQUEST_HEADER_TEMPLATE = template
+    _, cookie_prefix, cookie_suffix, base_headers, recaptcha_action = template
+
+    token = str(token or "").strip()
+    cookie_parts = [cookie_prefix] if cookie_prefix else []
+    if token:
+        cookie_parts.append(f"arena-auth-prod-v1={token}")
+    if cookie_suffix:
+        cookie_parts.append(cookie_suffix)
+
+    headers = dict(base_headers)
+    headers["Cookie"] = "; ".join(cookie_parts)
+    if recaptcha_v3_token:
+        headers["X-Recaptcha-Token"] = recaptcha_v3_token
+        headers["X-Recaptcha-Action"] = recaptcha_action
+    return headers
+
+def _decode_arena_auth_session_token(token: str) -> Optional[dict]:
+    """
+    Decode the `arena-auth-prod-v1` cookie value when it is stored as `base64-<json>`.
+
+    LMArena commonly stores a base64-encoded JSON session payload containing:
+      - access_token (JWT)
+      - refresh_token
+      - expires_at (unix seconds)
+    """
+    token = str(token or "").strip()
+    if not token.startswith("base64-"):
+        return None
+    b64 = token[len("base64-") :]
+    if not b64:
+        return None
+    try:
+        b64 += "=" * ((4 - (len(b64) % 4)) % 4)
+        raw = base64.b64decode(b64.encode("utf-8"))
+        obj = json.loads(raw.decode("utf-8"))
+    except Exception:
         return None
+    if isinstance(obj, dict):
+        return obj
+    return None
 
-async def process_message_content(content, model_capabilities: dict) -> tuple[str, List[dict]]:
+
+def maybe_build_arena_auth_cookie_from_signup_response_body(
+    body_text: str, *, now: Optional[float] = None
+) -> Optional[str]:
     """
-    Process message content, handle images if present and model supports them.
-    
-    Args:
-        content: Message content (string or list of content parts)
-        model_capabilities: Model's capability dictionary
-    
-    Returns:
-        Tuple of (text_content, experimental_attachments)
+    Best-effort: derive an `arena-auth-prod-v1` cookie value from the /nextjs-api/sign-up response body.
+
+    LMArena often uses a base64-encoded Supabase session payload as the cookie value. Some sign-up responses return
+    the session JSON in the response body (instead of a Set-Cookie header). When that happens, we can encode it into
+    the `base64-<json>` cookie format and inject it into the browser context.
     """
-    # Check if model supports image input
-    supports_images = model_capabilities.get('inputCapabilities', {}).get('image', False)
-    
-    # If content is a string, return it as-is
-    if isinstance(content, str):
-        return content, []
-    
-    # If content is a list (OpenAI format with multiple parts)
-    if isinstance(content, list):
-        text_parts = []
-        attachments = []
-        
-        for part in content:
-            if isinstance(part, dict):
-                if part.get('type') == 'text':
-                    text_parts.append(part.get('text', ''))
-                    
-                elif part.get('type') == 'image_url' and supports_images:
-                    image_url = part.get('image_url', {})
-                    if isinstance(image_url, dict):
-                        url = image_url.get('url', '')
+    text = str(body_text or "").strip()
+    if not text:
+        return None
+    if text.startswith("base64-"):
+        return text
+
+    try:
+        obj = json.loads(text)
+    except Exception:
+        return None
+
+    def _looks_like_session(val: object) -> bool:
+        if not isinstance(val, dict):
+            return False
+        access = str(val.get("access_token") or "").strip()
+        refresh = str(val.get("refresh_token") or "").strip()
+        return bool(access and refresh)
+
+    session: Optional[dict] = None
+    if isinstance(obj, dict):
+        if _looks_like_session(obj):
+            session = obj
+        else:
+            nested = obj.get("session")
+            if _looks_like_session(nested):
+                session = nested  # type: ignore[assignment]
+            else:
+                data = obj.get("data")
+                if isinstance(data, dict):
+                    if _looks_like_session(data):
+                        session = data
                     else:
-                        url = image_url
-                    
-                    # Handle base64-encoded images
-                    if url.startswith('data:'):
-                        # Format: data:image/png;base64,iVBORw0KGgo...
-                        try:
-                            # Validate and parse data URI
-                            if ',' not in url:
-                                debug_print(f"❌ Invalid data URI format (no comma separator)")
-                                continue
-                            
-                            header, data = url.split(',', 1)
-                            
-                            # Parse MIME type
-                            if ';' not in header or ':' not in header:
-                                debug_print(f"❌ Invalid data URI header format")
-                                continue
-                            
-                            mime_type = header.split(';')[0].split(':')[1]
-                            
-                            # Validate MIME type
-                            if not mime_type.startswith('image/'):
-                                debug_print(f"❌ Invalid MIME type: {mime_type}")
-                                continue
-                            
-                            # Decode base64
-                            try:
-                                image_data = base64.b64decode(data)
-                            except Exception as e:
-                                debug_print(f"❌ Failed to decode base64 data: {e}")
-                                continue
-                            
-                            # Validate image size (max 10MB)
-                            if len(image_data) > 10 * 1024 * 1024:
-                                debug_print(f"❌ Image too large: {len(image_data)} bytes (max 10MB)")
-                                continue
-                            
-                            # Generate filename
-                            ext = mimetypes.guess_extension(mime_type) or '.png'
-                            filename = f"upload-{uuid.uuid4()}{ext}"
-                            
-                            debug_print(f"🖼️  Processing base64 image: {filename}, size: {len(image_data)} bytes")
-                            
-                            # Upload to LMArena
-                            upload_result = await upload_image_to_lmarena(image_data, mime_type, filename)
-                            
-                            if upload_result:
-                                key, download_url = upload_result
-                                # Add as attachment in LMArena format
-                                attachments.append({
-                                    "name": key,
-                                    "contentType": mime_type,
-                                    "url": download_url
-                                })
-                                debug_print(f"✅ Image uploaded and added to attachments")
-                            else:
-                                debug_print(f"⚠️  Failed to upload image, skipping")
-                        except Exception as e:
-                            debug_print(f"❌ Unexpected error processing base64 image: {type(e).__name__}: {e}")
-                    
-                    # Handle URL images (direct URLs)
-                    elif url.startswith('http://') or url.startswith('https://'):
-                        # For external URLs, we'd need to download and re-upload
-                        # For now, skip this case
-                        debug_print(f"⚠️  External image URLs not yet supported: {url[:100]}")
-                        
-                elif part.get('type') == 'image_url' and not supports_images:
-                    debug_print(f"⚠️  Image provided but model doesn't support images")
-        
-        # Combine text parts
-        text_content = '\n'.join(text_parts).strip()
-        return text_content, attachments
-    
-    # Fallback
-    return str(content), []
+                        nested2 = data.get("session")
+                        if _looks_like_session(nested2):
+                            session = nested2  # type: ignore[assignment]
+    if not isinstance(session, dict):
+        return None
+
+    updated = dict(session)
+    if not str(updated.get("expires_at") or "").strip():
+        try:
+            expires_in = int(updated.get("expires_in") or 0)
+        except Exception:
+            expires_in = 0
+        if expires_in > 0:
+            base = float(now) if now is not None else float(time.time())
+            updated["expires_at"] = int(base) + int(expires_in)
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
     try:
-        await startup_event()
-    except Exception as e:
-        debug_print(f"❌ Error during startup: {e}")
-    yield
+        raw = json.dumps(updated, separators=(",", ":")).encode("utf-8")
+        b64 = base64.b64encode(raw).decode("utf-8").rstrip("=")
+        return "base64-" + b64
+    except Exception:
+        return None
+
+def _decode_jwt_payload(token: str) -> Optional[dict]:
+    token = str(token or "").strip()
+    if token.count(".") < 2:
+        return None
+    parts = token.split(".")
+    if len(parts) < 2:
+        return None
+    payload_b64 = str(parts[1] or "")
+    if not payload_b64:
+        return None
+    try:
+        payload_b64 += "=" * ((4 - (len(payload_b64) % 4)) % 4)
+        raw = base64.urlsafe_b64decode(payload_b64.encode("utf-8"))
+        obj = json.loads(raw.decode("utf-8"))
+    except Exception:
+        return None
+    if isinstance(obj, dict):
+        return obj
+    return None
+
+_SUPABASE_JWT_RE = re.compile(r"eyJ[a-zA-Z0-9_-]+\.[a-zA-Z0-9_-]+\.[a-zA-Z0-9_-]+")
+
+
+def extract_supabase_anon_key_from_text(text: str) -> Optional[str]:
+    """
+    Best-effort extraction of Supabase anon key from minified HTML/JS.
+
+    The Supabase anon key is a JWT-like string whose payload commonly contains: {"role":"anon"}.
+    """
+    text = str(text or "")
+    if not text:
+        return None
+
+    try:
+        matches = _SUPABASE_JWT_RE.findall(text)
+    except Exception:
+        matches = []
+
+    seen: set[str] = set()
+    for cand in matches or []:
+        cand = str(cand or "").strip()
+        if not cand or cand in seen:
+            continue
+        seen.add(cand)
+        payload = _decode_jwt_payload(cand)
+        if not isinstance(payload, dict):
+            continue
+        if str(payload.get("role") or "") == "anon":
+            return cand
+    return None
 
-app = FastAPI(lifespan=lifespan)
 
-# --- Constants & Global State ---
-CONFIG_FILE = "config.json"
-MODELS_FILE = "models.json"
-API_KEY_HEADER = APIKeyHeader(name="Authorization", auto_error=False)
+def _derive_supabase_auth_base_url_from_arena_auth_token(token: str) -> Optional[str]:
+    """
+    Derive the Supabase Auth base URL (e.g. https://<ref>.supabase.co/auth/v1) from an arena-auth session cookie.
+    """
+    session = _decode_arena_auth_session_token(token)
+    if not isinstance(session, dict):
+        return None
+    access = str(session.get("access_token") or "").strip()
+    if not access:
+        return None
+    payload = _decode_jwt_payload(access)
+    if not isinstance(payload, dict):
+        return None
+    iss = str(payload.get("iss") or "").strip()
+    if not iss:
+        return None
+    if "/auth/v1" in iss:
+        base = iss.split("/auth/v1", 1)[0] + "/auth/v1"
+        return base
+    return iss
 
-# In-memory stores
-# { "api_key": { "conversation_id": session_data } }
-chat_sessions: Dict[str, Dict[str, dict]] = defaultdict(dict)
-# { "session_id": "username" }
-dashboard_sessions = {}
-# { "api_key": [timestamp1, timestamp2, ...] }
-api_key_usage = defaultdict(list)
-# { "model_id": count }
-model_usage_stats = defaultdict(int)
-# Token cycling: current index for round-robin selection
-current_token_index = 0
-# Track config file path changes to reset per-config state in tests/dev.
-_LAST_CONFIG_FILE: Optional[str] = None
-# Track which token is assigned to each conversation (conversation_id -> token)
-conversation_tokens: Dict[str, str] = {}
-# Track failed tokens per request to avoid retrying with same token
-request_failed_tokens: Dict[str, set] = {}
+class ArenaAuthTokenRecord:
+    """Parsed, time-independent facts about one `arena-auth-prod-v1` value (decoded once, then cached)."""
 
-# Ephemeral Arena auth cookie captured from browser sessions (not persisted unless enabled).
-EPHEMERAL_ARENA_AUTH_TOKEN: Optional[str] = None
+    __slots__ = ("token", "kind", "expires_at", "well_formed", "has_refresh_token")
 
-# Supabase anon key (public client key) discovered from LMArena's JS bundles. Kept in-memory by default.
-SUPABASE_ANON_KEY: Optional[str] = None
+    def __init__(self, token: str, kind: str, expires_at: Optional[int], well_formed: bool, has_refresh_token: bool):
+        self.token = token
+        # "base64" (Supabase session cookie), "jwt" (JWT-like string) or "opaque".
+        self.kind = kind
+        self.expires_at = expires_at
+        # Recognized as a plausible session cookie format (ignoring expiry).
+        self.well_formed = well_formed
+        self.has_refresh_token = has_refresh_token
 
-# --- New Global State for reCAPTCHA ---
-RECAPTCHA_TOKEN: Optional[str] = None
-# Initialize expiry far in the past to force a refresh on startup
-RECAPTCHA_EXPIRY: datetime = datetime.now(timezone.utc) - timedelta(days=365)
-# --------------------------------------
+    def is_expired(self, skew_seconds: int = 30, now: Optional[float] = None) -> bool:
+        if self.expires_at is None:
+            return False
+        current = float(time.time() if now is None else now)
+        return current >= (float(self.expires_at) - float(max(0, skew_seconds)))
 
-# --- Helper Functions ---
+    def is_probably_valid(self, now: Optional[float] = None) -> bool:
+        return self.well_formed and not self.is_expired(30, now)
 
-def get_config():
-    global current_token_index, _LAST_CONFIG_FILE
-    # If tests or callers swap CONFIG_FILE at runtime, reset the token round-robin index so token selection
-    # is deterministic per config file.
-    if _LAST_CONFIG_FILE != CONFIG_FILE:
-        _LAST_CONFIG_FILE = CONFIG_FILE
-        current_token_index = 0
-    try:
-        with open(CONFIG_FILE, "r") as f:
-            config = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        debug_print(f"⚠️  Config file error: {e}, using defaults")
-        config = {}
-    except Exception as e:
-        debug_print(f"⚠️  Unexpected error reading config: {e}, using defaults")
-        config = {}
 
-    # Ensure default keys exist
-    try:
-        config.setdefault("password", "admin")
-        config.setdefault("auth_token", "")
-        config.setdefault("auth_tokens", [])  # Multiple auth tokens
-        config.setdefault("cf_clearance", "")
-        config.setdefault("api_keys", [])
-        config.setdefault("usage_stats", {})
-        config.setdefault("prune_invalid_tokens", False)
-        config.setdefault("persist_arena_auth_cookie", False)
-        
-        # Normalize api_keys to prevent KeyErrors in dashboard and rate limiting
-        if isinstance(config.get("api_keys"), list):
-            normalized_keys = []
-            for i, key_entry in enumerate(config["api_keys"]):
-                if isinstance(key_entry, dict):
-                    # Ensure 'key' exists as it's critical
-                    if "key" not in key_entry:
-                        continue # Skip invalid entries missing the actual key
-                    
-                    if "name" not in key_entry:
-                        key_entry["name"] = "Unnamed Key"
-                    if "created" not in key_entry:
-                        # Use a default old timestamp (Jan 3 2024)
-                        key_entry["created"] = 1704236400
-                    if "rpm" not in key_entry:
-                        key_entry["rpm"] = 60
-                    normalized_keys.append(key_entry)
-            config["api_keys"] = normalized_keys
-    except Exception as e:
-        debug_print(f"⚠️  Error setting config defaults: {e}")
-    
-    return config
+def _parse_arena_auth_token(token: str) -> ArenaAuthTokenRecord:
+    expires_at: Optional[int] = None
+    well_formed = False
+    has_refresh_token = False
+    kind = "opaque"
 
-def load_usage_stats():
-    """Load usage stats from config into memory"""
-    global model_usage_stats
-    try:
-        config = get_config()
-        model_usage_stats = defaultdict(int, config.get("usage_stats", {}))
-    except Exception as e:
-        debug_print(f"⚠️  Error loading usage stats: {e}, using empty stats")
-        model_usage_stats = defaultdict(int)
+    session = _decode_arena_auth_session_token(token)
+    if token.startswith("base64-"):
+        kind = "base64"
+    elif token.count(".") >= 2:
+        kind = "jwt"
 
-def save_config(config, *, preserve_auth_tokens: bool = True):
-    try:
-        # Avoid clobbering user-provided auth tokens when multiple tasks write config.json concurrently.
-        # Background refreshes/cookie upserts shouldn't overwrite auth tokens that may have been added via the dashboard.
-        if preserve_auth_tokens:
+    if isinstance(session, dict):
+        try:
+            access = str(session.get("access_token") or "").strip()
+        except Exception:
+            access = ""
+        well_formed = access.count(".") >= 2
+        try:
+            has_refresh_token = bool(str(session.get("refresh_token") or "").strip())
+        except Exception:
+            has_refresh_token = False
+        try:
+            exp = session.get("expires_at")
+            if exp is not None:
+                expires_at = int(exp)
+        except Exception:
+            pass
+        if expires_at is None and access:
+            payload = _decode_jwt_payload(access)
+            if isinstance(payload, dict):
+                try:
+                    exp = payload.get("exp")
+                    if exp is not None:
+                        expires_at = int(exp)
+                except Exception:
+                    pass
+
+    if expires_at is None:
+        payload = _decode_jwt_payload(token)
+        if isinstance(payload, dict):
             try:
-                with open(CONFIG_FILE, "r") as f:
-                    on_disk = json.load(f)
+                exp = payload.get("exp")
+                if exp is not None:
+                    expires_at = int(exp)
             except Exception:
-                on_disk = None
+                pass
 
-            if isinstance(on_disk, dict):
-                if "auth_tokens" in on_disk and isinstance(on_disk.get("auth_tokens"), list):
-                    config["auth_tokens"] = list(on_disk.get("auth_tokens") or [])
-                if "auth_token" in on_disk:
-                    config["auth_token"] = str(on_disk.get("auth_token") or "")
+    if kind == "jwt":
+        # JWT-like token: require a reasonable length to avoid treating random short strings as tokens.
+        well_formed = len(token) >= 100
+    return ArenaAuthTokenRecord(token, kind, expires_at, well_formed, has_refresh_token)
 
-        # Persist in-memory stats to the config dict before saving
-        config["usage_stats"] = dict(model_usage_stats)
-        tmp_path = f"{CONFIG_FILE}.tmp"
-        with open(tmp_path, "w") as f:
-            json.dump(config, f, indent=4)
-        os.replace(tmp_path, CONFIG_FILE)
-    except Exception as e:
-        debug_print(f"❌ Error saving config: {e}")
 
+# { token: ArenaAuthTokenRecord } - decoding base64 sessions + JWTs is the expensive part of token checks.
+_ARENA_AUTH_TOKEN_RECORDS: Dict[str, ArenaAuthTokenRecord] = {}
+_ARENA_AUTH_TOKEN_RECORDS_MAX = 4096
 
-def _capture_ephemeral_arena_auth_token_from_cookies(cookies: list[dict]) -> None:
+
+def get_arena_auth_token_record(token: str) -> ArenaAuthTokenRecord:
+    token = str(token or "").strip()
+    record = _ARENA_AUTH_TOKEN_RECORDS.get(token)
+    if record is None:
+        record = _parse_arena_auth_token(token)
+        if len(_ARENA_AUTH_TOKEN_RECORDS) >= _ARENA_AUTH_TOKEN_RECORDS_MAX:
+            _ARENA_AUTH_TOKEN_RECORDS.clear()
+        _ARENA_AUTH_TOKEN_RECORDS[token] = record
+    return record
+
+
+def get_arena_auth_token_expiry_epoch(token: str) -> Optional[int]:
     """
-    Capture the current `arena-auth-prod-v1` cookie value into an in-memory global.
+    Best-effort expiry detection for arena-auth tokens.
 
-    This keeps the bridge usable even if the user hasn't pasted tokens into config.json,
-    while still honoring `persist_arena_auth_cookie` for persistence.
+    Returns a unix epoch (seconds) when the token expires, or None if unknown.
+    """
+    return get_arena_auth_token_record(token).expires_at
+
+def is_arena_auth_token_expired(token: str, *, skew_seconds: int = 30) -> bool:
+    """
+    Return True if we can determine that a token is expired (or about to expire).
+    Unknown/opaque token formats return False (do not assume expired).
     """
-    global EPHEMERAL_ARENA_AUTH_TOKEN
     try:
-        best: Optional[str] = None
-        fallback: Optional[str] = None
-        for cookie in cookies or []:
-            if str(cookie.get("name") or "") != "arena-auth-prod-v1":
-                continue
-            value = str(cookie.get("value") or "").strip()
-            if not value:
+        skew = int(skew_seconds)
+    except Exception:
+        skew = 30
+    return get_arena_auth_token_record(token).is_expired(skew)
+
+def is_probably_valid_arena_auth_token(token: str) -> bool:
+    """
+    LMArena's `arena-auth-prod-v1` cookie is typically a base64-encoded JSON session payload.
+
+    This helper is intentionally conservative: it returns True only for formats we recognize
+    as plausible session cookies (base64 session payloads or JWT-like strings).
+    """
+    token = str(token or "").strip()
+    if not token:
+        return False
+    return get_arena_auth_token_record(token).is_probably_valid()
+
+
+class AuthTokenPool:
+    """
+    Configured `auth_tokens`, parsed once, with the preferred selection tier precomputed.
+
+    Tier order (first non-empty wins):
+      1) plausible, non-expired tokens (base64/JWT-like)
+      2) base64 session cookies (even if expired, refreshable)
+      3) long opaque tokens
+      4) anything else that isn't known to be expired
+    Tiers only change when a token crosses its expiry, so they are recomputed at that moment rather than per call.
+    Configured tokens that were refreshed in memory are served as their latest value (see `publish_refreshed_auth_token`).
+    """
+
+    __slots__ = ("source", "source_key", "successors_version", "records", "members", "tier", "tier_valid_until")
+
+    def __init__(self, source, auth_tokens: list, successors: Optional[dict] = None, successors_version: int = 0):
+        self.source = source
+        self.source_key = tuple(auth_tokens)
+        self.successors_version = successors_version
+        tokens = [str(t or "").strip() for t in auth_tokens if str(t or "").strip()]
+        if successors:
+            tokens = [successors.get(t, t) for t in tokens]
+        self.records = [get_arena_auth_token_record(t) for t in tokens]
+        self.members = frozenset(tokens)
+        self.tier: list[str] = []
+        self.tier_valid_until = float("-inf")
+
+    def matches(self, auth_tokens) -> bool:
+        if self.successors_version != _ARENA_AUTH_TOKEN_SUCCESSORS_VERSION:
+            return False
+        return auth_tokens is self.source or self.source_key == tuple(auth_tokens)
+
+    def _rebuild_tier(self, now: float) -> None:
+        probable: list[str] = []
+        base64_any: list[str] = []
+        long_opaque: list[str] = []
+        remaining: list[str] = []
+        next_change = float("inf")
+        for record in self.records:
+            if record.expires_at is not None:
+                # The 30s-skew expiry boundary is where this token can move between tiers.
+                boundary = float(record.expires_at) - 30.0
+                if boundary > now:
+                    next_change = min(next_change, boundary)
+            # Drop tokens we can confidently determine are expired, *except* base64 session cookies.
+            # Expired base64 session cookies can often be refreshed via `Set-Cookie` (see
+            # `maybe_refresh_expired_auth_tokens_via_lmarena_http`), so we keep them as a better fallback than short
+            # placeholder strings like "test-auth".
+            if record.kind != "base64" and record.is_expired(30, now):
                 continue
-            if fallback is None:
-                fallback = value
-            try:
-                if not is_arena_auth_token_expired(value, skew_seconds=0):
-                    best = value
-                    break
-            except Exception:
-                # Unknown formats: treat as usable if we don't have anything better yet.
-                if best is None:
-                    best = value
-        if best:
-            EPHEMERAL_ARENA_AUTH_TOKEN = best
-        elif fallback:
-            EPHEMERAL_ARENA_AUTH_TOKEN = fallback
+            remaining.append(record.token)
+            if record.is_probably_valid(now):
+                probable.append(record.token)
+            if record.kind == "base64":
+                base64_any.append(record.token)
+            if len(record.token) >= 100:
+                long_opaque.append(record.token)
+        self.tier = probable or base64_any or long_opaque or remaining
+        self.tier_valid_until = next_change
+
+    def candidates(self, now: Optional[float] = None) -> list[str]:
+        current = float(time.time() if now is None else now)
+        if current >= self.tier_valid_until:
+            self._rebuild_tier(current)
+        return self.tier
+
+
+_AUTH_TOKEN_POOL: Optional[AuthTokenPool] = None
+# In-memory refreshes of configured tokens (configured value -> latest refreshed value). Request-path refreshes leave
+# config.json alone; the refresh-ahead task also persists its results (see `_persist_refreshed_auth_token`).
+_ARENA_AUTH_TOKEN_SUCCESSORS: dict[str, str] = {}
+_ARENA_AUTH_TOKEN_SUCCESSORS_VERSION = 0
+
+
+def get_auth_token_pool(config: Optional[dict] = None) -> AuthTokenPool:
+    """Return the token pool for the current `auth_tokens`, rebuilding it only when the list changes."""
+    global _AUTH_TOKEN_POOL
+    cfg = config or get_config_view()
+    auth_tokens = cfg.get("auth_tokens", [])
+    if not isinstance(auth_tokens, list):
+        auth_tokens = []
+    pool = _AUTH_TOKEN_POOL
+    if pool is None or not pool.matches(auth_tokens):
+        pool = AuthTokenPool(
+            auth_tokens, auth_tokens, _ARENA_AUTH_TOKEN_SUCCESSORS, _ARENA_AUTH_TOKEN_SUCCESSORS_VERSION
+        )
+        _AUTH_TOKEN_POOL = pool
+    return pool
+
+
+def get_current_arena_auth_token(token: str) -> str:
+    """Latest in-memory value for a configured token (itself if it has not been refreshed)."""
+    token = str(token or "").strip()
+    return _ARENA_AUTH_TOKEN_SUCCESSORS.get(token, token)
+
+
+def publish_refreshed_auth_token(old_token: str, new_token: str) -> None:
+    """
+    Serve `new_token` wherever `old_token` (or the configured token it replaced) was being served.
+
+    The replacement pool is built first and swapped in with a single assignment, so concurrent selections see either
+    the old token list or the new one, never a mix.
+    """
+    global _AUTH_TOKEN_POOL, _ARENA_AUTH_TOKEN_SUCCESSORS_VERSION, EPHEMERAL_ARENA_AUTH_TOKEN
+    old_token = str(old_token or "").strip()
+    new_token = str(new_token or "").strip()
+    if not old_token or not new_token or old_token == new_token:
+        return
+    successors = dict(_ARENA_AUTH_TOKEN_SUCCESSORS)
+    originals = [k for k, v in successors.items() if v == old_token] or [old_token]
+    for original in originals:
+        successors[original] = new_token
+    cfg = get_config_view()
+    auth_tokens = cfg.get("auth_tokens", [])
+    if not isinstance(auth_tokens, list):
+        auth_tokens = []
+    version = _ARENA_AUTH_TOKEN_SUCCESSORS_VERSION + 1
+    pool = AuthTokenPool(auth_tokens, auth_tokens, successors, version)
+    _ARENA_AUTH_TOKEN_SUCCESSORS.clear()
+    _ARENA_AUTH_TOKEN_SUCCESSORS.update(successors)
+    _ARENA_AUTH_TOKEN_SUCCESSORS_VERSION = version
+    _AUTH_TOKEN_POOL = pool
+    if str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip() == old_token:
+        EPHEMERAL_ARENA_AUTH_TOKEN = new_token
+    # Keep conversation affinity pointing at the same account.
+    for session_id, token in list(conversation_tokens.items()):
+        if token == old_token:
+            conversation_tokens[session_id] = new_token
+
+
+# Shared per-token health used by `get_next_auth_token` to steer traffic away from rate-limited/failing accounts.
+# Unlike a request's `failed_tokens`, this outlives the request so concurrent and later requests benefit too.
+_AUTH_TOKEN_HEALTH: dict[str, "AuthTokenHealth"] = {}
+_AUTH_TOKEN_HEALTH_MAX_ENTRIES = 4096
+_AUTH_TOKEN_ERROR_HALF_LIFE_SECONDS = 60.0
+_AUTH_TOKEN_ERROR_STATUSES = (
+    HTTPStatus.UNAUTHORIZED,
+    HTTPStatus.FORBIDDEN,
+    HTTPStatus.TOO_MANY_REQUESTS,
+)
+
+
+class AuthTokenHealth:
+    """Cooldown deadline, decaying 401/403/429 rate, in-flight count and last use/success for one auth token."""
+
+    __slots__ = (
+        "cooldown_until",
+        "in_flight",
+        "last_used_at",
+        "error_rate",
+        "error_rate_at",
+        "last_success_at",
+        "last_status",
+        "successes",
+        "failures",
+        "rate_limits",
+    )
+
+    def __init__(self):
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.last_used_at: Optional[float] = None
+        self.error_rate = 0.0
+        self.error_rate_at = 0.0
+        self.last_success_at: Optional[float] = None
+        self.last_status: Optional[int] = None
+        self.successes = 0
+        self.failures = 0
+        self.rate_limits = 0
+
+    def current_error_rate(self, now: float) -> float:
+        if self.error_rate <= 0.0:
+            return 0.0
+        elapsed = max(0.0, now - self.error_rate_at)
+        return self.error_rate * (0.5 ** (elapsed / _AUTH_TOKEN_ERROR_HALF_LIFE_SECONDS))
+
+    def record(self, status_code: int, cooldown_seconds: float, now: float) -> None:
+        self.last_status = int(status_code)
+        failed = status_code in _AUTH_TOKEN_ERROR_STATUSES
+        # Exponentially-weighted so one old 429 doesn't pin a token at the back of the queue forever.
+        self.error_rate = self.current_error_rate(now) * 0.8 + (0.2 if failed else 0.0)
+        self.error_rate_at = now
+        if status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            self.rate_limits += 1
+            self.cooldown_until = max(self.cooldown_until, now + max(0.0, float(cooldown_seconds)))
+        if failed:
+            self.failures += 1
+        elif 200 <= status_code < 300:
+            self.successes += 1
+            self.last_success_at = now
+            self.cooldown_until = 0.0
+
+    def sort_key(self, now: float) -> tuple:
+        cooling = self.cooldown_until > now
+        # Error rates are bucketed so tokens with similar health keep rotating fairly, and rank ahead of load: a
+        # token that keeps failing stays behind a busy healthy one instead of soaking up the overflow.
+        return (
+            1 if cooling else 0,
+            self.cooldown_until if cooling else 0.0,
+            int(self.current_error_rate(now) * 10),
+            self.in_flight,
+        )
+
+
+def _get_auth_token_health(token: str) -> "AuthTokenHealth":
+    health = _AUTH_TOKEN_HEALTH.get(token)
+    if health is None:
+        if len(_AUTH_TOKEN_HEALTH) >= _AUTH_TOKEN_HEALTH_MAX_ENTRIES:
+            # Drop idle entries first (tokens removed from config or rotated away).
+            for key in [k for k, v in _AUTH_TOKEN_HEALTH.items() if v.in_flight <= 0]:
+                _AUTH_TOKEN_HEALTH.pop(key, None)
+        health = AuthTokenHealth()
+        _AUTH_TOKEN_HEALTH[token] = health
+    return health
+
+
+def record_auth_token_result(
+    token: str, status_code: int, retry_after: Optional[str] = None, url: Optional[str] = None
+) -> None:
+    """Feed an upstream response status for `token` back into the scheduler (and the backoff governor for `url`)."""
+    token = str(token or "").strip()
+    try:
+        status = int(status_code)
     except Exception:
-        return None
+        return
+    cooldown = 0.0
+    if status == HTTPStatus.TOO_MANY_REQUESTS:
+        cooldown = float(get_rate_limit_sleep_seconds(retry_after, 0))
+        if url:
+            record_upstream_backoff(token, url, cooldown)
+    if not token:
+        return
+    _get_auth_token_health(token).record(status, cooldown, time.monotonic())
+
+
+# --- Upstream backoff governor ---
+# Process-wide memory of upstream 429 cooldowns per (auth token, endpoint family). Every request consults it before
+# sending, so one request's Retry-After stops the others from spending attempts (and reCAPTCHA tokens) on a
+# token/endpoint that is known to be throttled. Token-less (browser cookie) traffic is tracked under "".
+_UPSTREAM_BACKOFF: dict[tuple[str, str], float] = {}
+_UPSTREAM_BACKOFF_MAX_ENTRIES = 4096
+_UPSTREAM_BACKOFF_STATS = {"recorded": 0, "rerouted": 0, "waited": 0, "wait_seconds": 0.0}
+
+
+def get_upstream_endpoint_family(url: str) -> str:
+    url = str(url or "")
+    if "/retry-evaluation-session-message/" in url:
+        return "retry"
+    if "/post-to-evaluation/" in url:
+        return "post-to-evaluation"
+    if "/create-evaluation" in url:
+        return "create-evaluation"
+    return "other"
+
+
+def record_upstream_backoff(token: str, url: str, cooldown_seconds: float) -> None:
+    key = (str(token or "").strip(), get_upstream_endpoint_family(url))
+    now = time.monotonic()
+    if len(_UPSTREAM_BACKOFF) >= _UPSTREAM_BACKOFF_MAX_ENTRIES:
+        for stale in [k for k, until in _UPSTREAM_BACKOFF.items() if until <= now]:
+            _UPSTREAM_BACKOFF.pop(stale, None)
+    _UPSTREAM_BACKOFF[key] = max(_UPSTREAM_BACKOFF.get(key, 0.0), now + max(0.0, float(cooldown_seconds)))
+    _UPSTREAM_BACKOFF_STATS["recorded"] += 1
+
+
+def get_upstream_backoff_remaining(token: str, url: str) -> float:
+    key = (str(token or "").strip(), get_upstream_endpoint_family(url))
+    until = _UPSTREAM_BACKOFF.get(key)
+    if until is None:
+        return 0.0
+    remaining = until - time.monotonic()
+    if remaining <= 0:
+        _UPSTREAM_BACKOFF.pop(key, None)
+        return 0.0
+    return remaining
+
+
+def route_around_upstream_backoff(token: str, url: str, exclude_tokens: Optional[set] = None) -> tuple[str, float]:
+    """
+    Before sending to `url` with `token`: return the token to use and how long to wait first.
 
-def _upsert_browser_session_into_config(config: dict, cookies: list[dict], user_agent: str | None = None) -> bool:
+    A cooling token is swapped for the next candidate with a shorter cooldown on this endpoint family (0 when it is
+    free); if there is none, the caller should wait out the remaining cooldown instead of collecting another 429.
+    """
+    remaining = get_upstream_backoff_remaining(token, url)
+    if remaining <= 0:
+        return token, 0.0
+    if token:
+        excluded = set(exclude_tokens or ())
+        excluded.add(token)
+        try:
+            alternative = get_next_auth_token(exclude_tokens=excluded, allow_ephemeral_fallback=False)
+        except HTTPException:
+            alternative = ""
+        if alternative and alternative != token:
+            alternative_remaining = get_upstream_backoff_remaining(alternative, url)
+            if alternative_remaining < remaining:
+                _UPSTREAM_BACKOFF_STATS["rerouted"] += 1
+                return alternative, alternative_remaining
+    _UPSTREAM_BACKOFF_STATS["waited"] += 1
+    _UPSTREAM_BACKOFF_STATS["wait_seconds"] += remaining
+    return token, remaining
+
+
+def get_upstream_backoff_stats() -> dict:
+    now = time.monotonic()
+    cooling: dict[str, int] = defaultdict(int)
+    for (_, family), until in list(_UPSTREAM_BACKOFF.items()):
+        if until > now:
+            cooling[family] += 1
+    return {
+        "cooling_by_family": dict(cooling),
+        **{k: (round(v, 1) if isinstance(v, float) else v) for k, v in _UPSTREAM_BACKOFF_STATS.items()},
+    }
+
+
+def pick_auth_token(tokens: list, start: int = 0) -> str:
+    """
+    Pick the healthiest token: not cooling down, lowest recent error rate, fewest in flight.
+
+    Ties resolve in rotation order beginning at `start`, so equally-healthy tokens are still used round-robin.
+    """
+    count = len(tokens)
+    if count == 1:
+        return tokens[0]
+    now = time.monotonic()
+    best = None
+    best_key = None
+    for offset in range(count):
+        token = tokens[(start + offset) % count]
+        health = _AUTH_TOKEN_HEALTH.get(token)
+        key = health.sort_key(now) if health is not None else (0, 0.0, 0, 0)
+        if best_key is None or key < best_key:
+            best, best_key = token, key
+            if key == (0, 0.0, 0, 0):
+                break
+    return best
+
+
+class AuthTokenLease:
     """
-    Persist useful browser session identity (cookies + UA) into config.json.
-    This helps keep Cloudflare + LMArena auth aligned with reCAPTCHA/browser fetch flows.
+    Wraps an upstream stream context so the token counts as in flight while the response is open.
+
+    A 429 is recorded as soon as the response starts (so concurrent requests stop picking the token during our own
+    backoff); any other status is recorded on exit, once transports like the userscript proxy settle their status.
+    With `context=None` it only tracks the in-flight count (callers record the status themselves).
     """
-    changed = False
 
-    cookie_store = config.get("browser_cookies")
-    if not isinstance(cookie_store, dict):
-        cookie_store = {}
-        config["browser_cookies"] = cookie_store
-        changed = True
+    def __init__(self, context, token: str, url: Optional[str] = None):
+        self._context = context
+        self._token = str(token or "").strip()
+        self._url = url
+        self._response = None
+        self._recorded = False
 
-    for cookie in cookies or []:
-        name = cookie.get("name")
-        value = cookie.get("value")
-        if not name or value is None:
-            continue
-        name = str(name)
-        if name == "arena-auth-prod-v1" and not bool(config.get("persist_arena_auth_cookie")):
-            continue
-        value = str(value)
-        if cookie_store.get(name) != value:
-            cookie_store[name] = value
-            changed = True
+    def __getattr__(self, name):
+        return getattr(self._context, name)
 
-    # Promote frequently-used cookies to top-level config keys.
-    cf_clearance = str(cookie_store.get("cf_clearance") or "").strip()
-    cf_bm = str(cookie_store.get("__cf_bm") or "").strip()
-    cfuvid = str(cookie_store.get("_cfuvid") or "").strip()
-    provisional_user_id = str(cookie_store.get("provisional_user_id") or "").strip()
+    async def __aenter__(self):
+        if self._token:
+            health = _get_auth_token_health(self._token)
+            health.in_flight += 1
+            health.last_used_at = time.monotonic()
+        if self._context is None:
+            return None
+        try:
+            self._response = await self._context.__aenter__()
+        except BaseException:
+            self._release()
+            raise
+        if getattr(self._response, "status_code", None) == HTTPStatus.TOO_MANY_REQUESTS:
+            self._record()
+        return self._response
 
-    if cf_clearance and config.get("cf_clearance") != cf_clearance:
-        config["cf_clearance"] = cf_clearance
-        changed = True
-    if cf_bm and config.get("cf_bm") != cf_bm:
-        config["cf_bm"] = cf_bm
-        changed = True
-    if cfuvid and config.get("cfuvid") != cfuvid:
-        config["cfuvid"] = cfuvid
-        changed = True
-    if provisional_user_id and config.get("provisional_user_id") != provisional_user_id:
-        config["provisional_user_id"] = provisional_user_id
-        changed = True
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if self._context is not None:
+                return await self._context.__aexit__(exc_type, exc, tb)
+            return False
+        finally:
+            if exc_type is None:
+                self._record()
+            self._release()
 
-    ua = str(user_agent or "").strip()
-    if ua and str(config.get("user_agent") or "").strip() != ua:
-        config["user_agent"] = ua
-        changed = True
+    def _record(self) -> None:
+        if self._recorded or self._response is None:
+            return
+        self._recorded = True
+        try:
+            headers = getattr(self._response, "headers", None) or {}
+            retry_after = headers.get("Retry-After") or headers.get("retry-after")
+            record_auth_token_result(self._token, self._response.status_code, retry_after, self._url)
+        except Exception:
+            pass
 
-    return changed
+    def _release(self) -> None:
+        health = _AUTH_TOKEN_HEALTH.get(self._token) if self._token else None
+        if health is not None:
+            health.in_flight = max(0, health.in_flight - 1)
 
-def get_models():
-    try:
-        with open(MODELS_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
 
-def save_models(models):
+def _get_conversation_token_settings(config: Optional[dict] = None) -> tuple[float, int]:
+    cfg = config or get_config_view()
     try:
-        tmp_path = f"{MODELS_FILE}.tmp"
-        with open(tmp_path, "w") as f:
-            json.dump(models, f, indent=2)
-        os.replace(tmp_path, MODELS_FILE)
-    except Exception as e:
-        debug_print(f"❌ Error saving models: {e}")
-
+        ttl_seconds = float(cfg.get("conversation_token_ttl_seconds", 3600))
+    except Exception:
+        ttl_seconds = 3600.0
+    try:
+        max_entries = int(cfg.get("conversation_token_max_entries", 10000))
+    except Exception:
+        max_entries = 10000
+    return max(0.0, ttl_seconds), max(1, max_entries)
 
-def get_request_headers():
-    """Get request headers with the first available auth token (for compatibility)"""
-    config = get_config()
-    
-    # Try to get token from auth_tokens first, then fallback to single token
-    auth_tokens = config.get("auth_tokens", [])
-    if auth_tokens:
-        token = auth_tokens[0]  # Just use first token for non-API requests
-    else:
-        token = config.get("auth_token", "").strip()
-        if not token:
-            cookie_store = config.get("browser_cookies")
-            if isinstance(cookie_store, dict) and bool(config.get("persist_arena_auth_cookie")):
-                token = str(cookie_store.get("arena-auth-prod-v1") or "").strip()
-                if token:
-                    config["auth_tokens"] = [token]
-                    save_config(config, preserve_auth_tokens=False)
-        if not token:
-            # Check for split cookies in browser_cookies
-            cookie_store = config.get("browser_cookies")
-            has_split = False
-            if isinstance(cookie_store, dict):
-                if cookie_store.get("arena-auth-prod-v1.0") or cookie_store.get("arena-auth-prod-v1.1"):
-                    has_split = True
-            
-            if not has_split:
-                raise HTTPException(status_code=500, detail="Arena auth token not set in dashboard.")
-    
-    return get_request_headers_with_token(token)
 
-def normalize_user_agent_value(user_agent: object) -> str:
-    ua = str(user_agent or "").strip()
-    if not ua:
-        return ""
-    if ua.lower() in ("user-agent", "user agent"):
-        return ""
-    return ua
+def _prune_conversation_tokens(now: float, max_entries: int) -> None:
+    # Entries are re-inserted on every touch, so the oldest (and first to expire) are always at the front.
+    # Only peek at the front: the common case (nothing to prune) stays O(1).
+    while conversation_token_expiry:
+        session_id = next(iter(conversation_token_expiry))
+        if conversation_token_expiry[session_id] > now and len(conversation_token_expiry) <= max_entries:
+            break
+        del conversation_token_expiry[session_id]
+        conversation_tokens.pop(session_id, None)
 
-def get_request_headers_with_token(token: str, recaptcha_v3_token: Optional[str] = None):
-    """Get request headers with a specific auth token and optional reCAPTCHA v3 token"""
-    config = get_config()
-    cf_clearance = str(config.get("cf_clearance") or "").strip()
-    cf_bm = str(config.get("cf_bm") or "").strip()
-    cfuvid = str(config.get("cfuvid") or "").strip()
-    provisional_user_id = str(config.get("provisional_user_id") or "").strip()
 
-    cookie_store = config.get("browser_cookies")
-    if isinstance(cookie_store, dict):
-        if not cf_clearance:
-            cf_clearance = str(cookie_store.get("cf_clearance") or "").strip()
-        if not cf_bm:
-            cf_bm = str(cookie_store.get("__cf_bm") or "").strip()
-        if not cfuvid:
-            cfuvid = str(cookie_store.get("_cfuvid") or "").strip()
-        if not provisional_user_id:
-            provisional_user_id = str(cookie_store.get("provisional_user_id") or "").strip()
+def bind_conversation_token(session_id: str, token: str) -> None:
+    """Remember that LMArena session `session_id` belongs to the account behind `token`."""
+    session_id = str(session_id or "").strip()
+    token = str(token or "").strip()
+    if not session_id or not token:
+        return
+    ttl_seconds, max_entries = _get_conversation_token_settings()
+    if ttl_seconds <= 0:
+        return
+    now = time.monotonic()
+    conversation_token_expiry.pop(session_id, None)
+    conversation_tokens[session_id] = token
+    conversation_token_expiry[session_id] = now + ttl_seconds
+    _prune_conversation_tokens(now, max_entries)
 
-    cookie_parts: list[str] = []
 
-    def _add_cookie(name: str, value: str) -> None:
-        value = str(value or "").strip()
-        if value:
-            cookie_parts.append(f"{name}={value}")
+def get_conversation_token(session_id: str, exclude_tokens: Optional[set] = None) -> str:
+    """
+    Token that created LMArena session `session_id`, if it is still usable; otherwise "".
 
-    _add_cookie("cf_clearance", cf_clearance)
-    _add_cookie("__cf_bm", cf_bm)
-    _add_cookie("_cfuvid", cfuvid)
-    _add_cookie("provisional_user_id", provisional_user_id)
-    _add_cookie("arena-auth-prod-v1", token)
+    The bound token is skipped (not forgotten) while it is excluded for this request, cooling down after a 429, or no
+    longer configured, so callers fall back to normal selection and re-bind whichever token succeeds.
+    """
+    session_id = str(session_id or "").strip()
+    if not session_id:
+        return ""
+    now = time.monotonic()
+    ttl_seconds, max_entries = _get_conversation_token_settings()
+    _prune_conversation_tokens(now, max_entries)
+    token = conversation_tokens.get(session_id, "")
+    if not token or (exclude_tokens and token in exclude_tokens):
+        return ""
+    health = _AUTH_TOKEN_HEALTH.get(token)
+    if health is not None and health.cooldown_until > now:
+        return ""
+    if token not in get_auth_token_pool().members and token != str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip():
+        return ""
+    if is_arena_auth_token_expired(token, skew_seconds=0):
+        return ""
+    # Sliding TTL: active conversations keep their affinity.
+    conversation_token_expiry.pop(session_id, None)
+    conversation_token_expiry[session_id] = now + ttl_seconds
+    return token
 
-    if isinstance(cookie_store, dict):
-        v1_0 = str(cookie_store.get("arena-auth-prod-v1.0") or "").strip()
-        v1_1 = str(cookie_store.get("arena-auth-prod-v1.1") or "").strip()
-        if v1_0:
-            _add_cookie("arena-auth-prod-v1.0", v1_0)
-        if v1_1:
-            _add_cookie("arena-auth-prod-v1.1", v1_1)
 
-    headers: dict[str, str] = {
-        "Content-Type": "text/plain;charset=UTF-8",
-        "Cookie": "; ".join(cookie_parts),
-        "Origin": "https://lmarena.ai",
-        "Referer": "https://lmarena.ai/?mode=direct",
+def get_auth_token_scheduler_stats() -> dict:
+    now = time.monotonic()
+    tokens = []
+    for token, health in list(_AUTH_TOKEN_HEALTH.items()):
+        tokens.append(
+            {
+                "token": token[:12] + "...",
+                "cooldown_seconds": round(max(0.0, health.cooldown_until - now), 1),
+                "in_flight": health.in_flight,
+                "error_rate": round(health.current_error_rate(now), 3),
+                "last_status": health.last_status,
+                "last_success_age_seconds": (
+                    round(now - health.last_success_at, 1) if health.last_success_at is not None else None
+                ),
+                "successes": health.successes,
+                "failures": health.failures,
+                "rate_limits": health.rate_limits,
+            }
+        )
+    return {
+        "tracked": len(tokens),
+        "cooling": sum(1 for t in tokens if t["cooldown_seconds"] > 0),
+        "in_flight": sum(t["in_flight"] for t in tokens),
+        "tokens": tokens,
     }
 
-    user_agent = normalize_user_agent_value(config.get("user_agent"))
-    if user_agent:
-        headers["User-Agent"] = user_agent
-    
-    if recaptcha_v3_token:
-        headers["X-Recaptcha-Token"] = recaptcha_v3_token
-        _, recaptcha_action = get_recaptcha_settings(config)
-        headers["X-Recaptcha-Action"] = recaptcha_action
-    return headers
+ARENA_AUTH_REFRESH_LOCK: asyncio.Lock = asyncio.Lock()
 
-def _decode_arena_auth_session_token(token: str) -> Optional[dict]:
+
+async def refresh_arena_auth_token_via_lmarena_http(old_token: str, config: Optional[dict] = None) -> Optional[str]:
     """
-    Decode the `arena-auth-prod-v1` cookie value when it is stored as `base64-<json>`.
+    Best-effort refresh for `arena-auth-prod-v1` using LMArena itself.
 
-    LMArena commonly stores a base64-encoded JSON session payload containing:
-      - access_token (JWT)
-      - refresh_token
-      - expires_at (unix seconds)
+    LMArena appears to refresh Supabase session cookies server-side when you request a page with an expired session
+    cookie (it rotates refresh tokens and returns a new `arena-auth-prod-v1` via Set-Cookie).
+
+    This avoids needing the Supabase anon key locally and keeps the bridge working even after `expires_at` passes.
+    Concurrent refreshes of the same token share one request (the server rotates the refresh token).
     """
-    token = str(token or "").strip()
-    if not token.startswith("base64-"):
-        return None
-    b64 = token[len("base64-") :]
-    if not b64:
+    old_token = str(old_token or "").strip()
+    if not old_token or not old_token.startswith("base64-"):
         return None
+    return await single_flight(
+        ("arena_auth_refresh_lmarena", old_token),
+        lambda: _refresh_arena_auth_token_via_lmarena_http(old_token, config),
+    )
+
+
+_ARENA_AUTH_REFRESH_MAX_REDIRECTS = 5
+
+
+async def _refresh_arena_auth_token_via_lmarena_http(old_token: str, config: Optional[dict] = None) -> Optional[str]:
+
+    cfg = config or get_config()
+    ua = normalize_user_agent_value((cfg or {}).get("user_agent")) or (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    )
+
+    cookies: dict[str, str] = {}
     try:
-        b64 += "=" * ((4 - (len(b64) % 4)) % 4)
-        raw = base64.b64decode(b64.encode("utf-8"))
-        obj = json.loads(raw.decode("utf-8"))
+        cf_clearance = str((cfg or {}).get("cf_clearance") or "").strip()
+        if cf_clearance:
+            cookies["cf_clearance"] = cf_clearance
+    except Exception:
+        pass
+    try:
+        cf_bm = str((cfg or {}).get("cf_bm") or "").strip()
+        if cf_bm:
+            cookies["__cf_bm"] = cf_bm
+    except Exception:
+        pass
+    try:
+        cfuvid = str((cfg or {}).get("cfuvid") or "").strip()
+        if cfuvid:
+            cookies["_cfuvid"] = cfuvid
+    except Exception:
+        pass
+    try:
+        provisional_user_id = str((cfg or {}).get("provisional_user_id") or "").strip()
+        if provisional_user_id:
+            cookies["provisional_user_id"] = provisional_user_id
+    except Exception:
+        pass
+
+    cookies["arena-auth-prod-v1"] = old_token
+
+    # The shared client's jar ignores cookies and httpx drops an explicit `Cookie` header on redirects, so follow
+    # redirects by hand: resend the session cookies on every lmarena.ai hop and keep what each hop sets.
+    set_cookie_headers: list[str] = []
+    request_url = httpx.URL("https://lmarena.ai/")
+    try:
+        client = get_upstream_http_client()
+        for _ in range(_ARENA_AUTH_REFRESH_MAX_REDIRECTS + 1):
+            headers = {"User-Agent": ua}
+            host = str(request_url.host or "")
+            if host == "lmarena.ai" or host.endswith(".lmarena.ai"):
+                headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in cookies.items())
+            resp = await client.get(
+                request_url,
+                headers=headers,
+                follow_redirects=False,
+                timeout=httpx.Timeout(connect=10.0, read=20.0, write=10.0, pool=10.0),
+            )
+            for sc in resp.headers.get_list("set-cookie"):
+                set_cookie_headers.append(sc)
+                try:
+                    name, value = sc.split(";", 1)[0].split("=", 1)
+                except ValueError:
+                    continue
+                if name.strip() and value.strip():
+                    cookies[name.strip()] = value.strip()
+            location = resp.headers.get("location")
+            if not resp.is_redirect or not location:
+                break
+            request_url = request_url.join(location)
     except Exception:
         return None
-    if isinstance(obj, dict):
-        return obj
+
+    for sc in set_cookie_headers or []:
+        if not isinstance(sc, str) or not sc:
+            continue
+        if not sc.lower().startswith("arena-auth-prod-v1="):
+            continue
+        try:
+            new_value = sc.split(";", 1)[0].split("=", 1)[1].strip()
+        except Exception:
+            continue
+        if not new_value:
+            continue
+        # Accept even if identical (some servers still refresh internal tokens while keeping value stable),
+        # but prefer a clearly-valid, non-expired cookie.
+        if is_probably_valid_arena_auth_token(new_value) and not is_arena_auth_token_expired(new_value, skew_seconds=0):
+            return new_value
+
     return None
 
 
-def maybe_build_arena_auth_cookie_from_signup_response_body(
-    body_text: str, *, now: Optional[float] = None
-) -> Optional[str]:
-    """
-    Best-effort: derive an `arena-auth-prod-v1` cookie value from the /nextjs-api/sign-up response body.
+async def refresh_arena_auth_token_via_supabase(old_token: str, *, anon_key: Optional[str] = None) -> Optional[str]:
+    """
+    Refresh an expired `arena-auth-prod-v1` base64 session directly via Supabase using the embedded refresh_token.
+
+    Requires the Supabase anon key (public client key). We keep it in-memory (SUPABASE_ANON_KEY) by default.
+    Refresh tokens are single-use, so concurrent refreshes of the same session share one grant request.
+    """
+    old_token = str(old_token or "").strip()
+    if not old_token or not old_token.startswith("base64-"):
+        return None
+    return await single_flight(
+        ("arena_auth_refresh_supabase", old_token),
+        lambda: _refresh_arena_auth_token_via_supabase(old_token, anon_key=anon_key),
+    )
+
+
+async def _refresh_arena_auth_token_via_supabase(old_token: str, *, anon_key: Optional[str] = None) -> Optional[str]:
+
+    session = _decode_arena_auth_session_token(old_token)
+    if not isinstance(session, dict):
+        return None
+
+    refresh_token = str(session.get("refresh_token") or "").strip()
+    if not refresh_token:
+        return None
+
+    auth_base = _derive_supabase_auth_base_url_from_arena_auth_token(old_token)
+    if not auth_base:
+        return None
 
-    LMArena often uses a base64-encoded Supabase session payload as the cookie value. Some sign-up responses return
-    the session JSON in the response body (instead of a Set-Cookie header). When that happens, we can encode it into
-    the `base64-<json>` cookie format and inject it into the browser context.
-    """
-    text = str(body_text or "").strip()
-    if not text:
+    key = str(anon_key or SUPABASE_ANON_KEY or "").strip()
+    if not key:
         return None
-    if text.startswith("base64-"):
-        return text
+
+    url = auth_base.rstrip("/") + "/token?grant_type=refresh_token"
+
+    headers = {
+        "apikey": key,
+        "Authorization": f"Bearer {key}",
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+    }
 
     try:
-        obj = json.loads(text)
+        client = get_upstream_http_client()
+        resp = await client.post(
+            url,
+            headers=headers,
+            json={"refresh_token": refresh_token},
+            follow_redirects=True,
+            timeout=httpx.Timeout(connect=10.0, read=20.0, write=10.0, pool=10.0),
+        )
     except Exception:
         return None
 
-    def _looks_like_session(val: object) -> bool:
-        if not isinstance(val, dict):
-            return False
-        access = str(val.get("access_token") or "").strip()
-        refresh = str(val.get("refresh_token") or "").strip()
-        return bool(access and refresh)
+    try:
+        if int(getattr(resp, "status_code", 0) or 0) != 200:
+            return None
+    except Exception:
+        return None
 
-    session: Optional[dict] = None
-    if isinstance(obj, dict):
-        if _looks_like_session(obj):
-            session = obj
-        else:
-            nested = obj.get("session")
-            if _looks_like_session(nested):
-                session = nested  # type: ignore[assignment]
-            else:
-                data = obj.get("data")
-                if isinstance(data, dict):
-                    if _looks_like_session(data):
-                        session = data
-                    else:
-                        nested2 = data.get("session")
-                        if _looks_like_session(nested2):
-                            session = nested2  # type: ignore[assignment]
-    if not isinstance(session, dict):
+    try:
+        data = resp.json()
+    except Exception:
+        return None
+    if not isinstance(data, dict):
         return None
 
     updated = dict(session)
-    if not str(updated.get("expires_at") or "").strip():
+    for k in ("access_token", "refresh_token", "expires_in", "expires_at", "token_type", "user"):
+        if k in data and data.get(k) is not None:
+            updated[k] = data.get(k)
+
+    # Ensure expires_at is populated if possible.
+    try:
+        exp = updated.get("expires_at")
+        if exp is None:
+            exp = None
+        else:
+            exp = int(exp)
+    except Exception:
+        exp = None
+    if exp is None:
         try:
-            expires_in = int(updated.get("expires_in") or 0)
+            access = str(updated.get("access_token") or "").strip()
         except Exception:
-            expires_in = 0
-        if expires_in > 0:
-            base = float(now) if now is not None else float(time.time())
-            updated["expires_at"] = int(base) + int(expires_in)
+            access = ""
+        payload = _decode_jwt_payload(access) if access else None
+        if isinstance(payload, dict):
+            try:
+                jwt_exp = payload.get("exp")
+                if jwt_exp is not None:
+                    updated["expires_at"] = int(jwt_exp)
+            except Exception:
+                pass
+        if "expires_at" not in updated:
+            try:
+                expires_in = int(updated.get("expires_in") or 0)
+            except Exception:
+                expires_in = 0
+            if expires_in > 0:
+                updated["expires_at"] = int(time.time()) + int(expires_in)
 
     try:
         raw = json.dumps(updated, separators=(",", ":")).encode("utf-8")
@@ -3100,677 +5674,1289 @@ def maybe_build_arena_auth_cookie_from_signup_response_body(
     except Exception:
         return None
 
-def _decode_jwt_payload(token: str) -> Optional[dict]:
-    token = str(token or "").strip()
-    if token.count(".") < 2:
-        return None
-    parts = token.split(".")
-    if len(parts) < 2:
-        return None
-    payload_b64 = str(parts[1] or "")
-    if not payload_b64:
-        return None
-    try:
-        payload_b64 += "=" * ((4 - (len(payload_b64) % 4)) % 4)
-        raw = base64.urlsafe_b64decode(payload_b64.encode("utf-8"))
-        obj = json.loads(raw.decode("utf-8"))
-    except Exception:
+
+async def maybe_refresh_expired_auth_tokens_via_lmarena_http(exclude_tokens: Optional[set] = None) -> Optional[str]:
+    """
+    If the on-disk auth token list only contains expired base64 sessions, try to refresh one via LMArena and return it.
+
+    This is in-memory only by default (does not mutate config.json), to avoid surprising users by rewriting tokens.
+    """
+    excluded = exclude_tokens or set()
+
+    cfg = get_config()
+    tokens = cfg.get("auth_tokens", [])
+    if not isinstance(tokens, list):
+        tokens = []
+    tokens = [get_current_arena_auth_token(t) for t in tokens]
+
+    expired_base64: list[str] = []
+    for t in tokens:
+        t = str(t or "").strip()
+        if not t or t in excluded:
+            continue
+        if t.startswith("base64-") and is_arena_auth_token_expired(t, skew_seconds=0):
+            expired_base64.append(t)
+
+    if not expired_base64:
         return None
-    if isinstance(obj, dict):
-        return obj
-    return None
 
-_SUPABASE_JWT_RE = re.compile(r"eyJ[a-zA-Z0-9_-]+\.[a-zA-Z0-9_-]+\.[a-zA-Z0-9_-]+")
+    async with ARENA_AUTH_REFRESH_LOCK:
+        # Reload config within the lock to avoid concurrent writers.
+        cfg = get_config()
+        tokens = cfg.get("auth_tokens", [])
+        if not isinstance(tokens, list):
+            tokens = []
+        tokens = [get_current_arena_auth_token(t) for t in tokens]
+
+        for old in list(expired_base64):
+            if old in excluded:
+                continue
+            if old not in tokens:
+                continue
+            if not is_arena_auth_token_expired(old, skew_seconds=0):
+                continue
 
+            new_token = await refresh_arena_auth_token_via_lmarena_http(old, cfg)
+            if not new_token:
+                continue
 
-def extract_supabase_anon_key_from_text(text: str) -> Optional[str]:
+            # Also prefer it immediately for subsequent requests.
+            global EPHEMERAL_ARENA_AUTH_TOKEN
+            EPHEMERAL_ARENA_AUTH_TOKEN = new_token
+            publish_refreshed_auth_token(old, new_token)
+            return new_token
+
+    return None
+
+
+async def maybe_refresh_expired_auth_tokens(exclude_tokens: Optional[set] = None) -> Optional[str]:
     """
-    Best-effort extraction of Supabase anon key from minified HTML/JS.
+    Refresh an expired `arena-auth-prod-v1` base64 session without mutating user settings.
 
-    The Supabase anon key is a JWT-like string whose payload commonly contains: {"role":"anon"}.
+    Strategy:
+      1) Try LMArena Set-Cookie refresh (no anon key required).
+      2) Fall back to Supabase refresh_token grant (requires Supabase anon key discovered from JS bundles).
     """
-    text = str(text or "")
-    if not text:
-        return None
+    excluded = exclude_tokens or set()
 
     try:
-        matches = _SUPABASE_JWT_RE.findall(text)
+        token = await maybe_refresh_expired_auth_tokens_via_lmarena_http(exclude_tokens=excluded)
     except Exception:
-        matches = []
+        token = None
+    if token:
+        return token
 
-    seen: set[str] = set()
-    for cand in matches or []:
-        cand = str(cand or "").strip()
-        if not cand or cand in seen:
-            continue
-        seen.add(cand)
-        payload = _decode_jwt_payload(cand)
-        if not isinstance(payload, dict):
+    cfg = get_config()
+    tokens = cfg.get("auth_tokens", [])
+    if not isinstance(tokens, list):
+        tokens = []
+    tokens = [get_current_arena_auth_token(t) for t in tokens]
+
+    expired_base64: list[str] = []
+    for t in tokens:
+        t = str(t or "").strip()
+        if not t or t in excluded:
             continue
-        if str(payload.get("role") or "") == "anon":
-            return cand
-    return None
+        if t.startswith("base64-") and is_arena_auth_token_expired(t, skew_seconds=0):
+            expired_base64.append(t)
+    if not expired_base64:
+        return None
 
+    async with ARENA_AUTH_REFRESH_LOCK:
+        cfg = get_config()
+        tokens = cfg.get("auth_tokens", [])
+        if not isinstance(tokens, list):
+            tokens = []
+        tokens = [get_current_arena_auth_token(t) for t in tokens]
 
-def _derive_supabase_auth_base_url_from_arena_auth_token(token: str) -> Optional[str]:
-    """
-    Derive the Supabase Auth base URL (e.g. https://<ref>.supabase.co/auth/v1) from an arena-auth session cookie.
-    """
-    session = _decode_arena_auth_session_token(token)
-    if not isinstance(session, dict):
-        return None
-    access = str(session.get("access_token") or "").strip()
-    if not access:
-        return None
-    payload = _decode_jwt_payload(access)
-    if not isinstance(payload, dict):
-        return None
-    iss = str(payload.get("iss") or "").strip()
-    if not iss:
-        return None
-    if "/auth/v1" in iss:
-        base = iss.split("/auth/v1", 1)[0] + "/auth/v1"
-        return base
-    return iss
+        for old in list(expired_base64):
+            if old in excluded:
+                continue
+            if old not in tokens:
+                continue
+            if not is_arena_auth_token_expired(old, skew_seconds=0):
+                continue
+
+            new_token = await refresh_arena_auth_token_via_supabase(old)
+            if not new_token:
+                continue
+
+            global EPHEMERAL_ARENA_AUTH_TOKEN
+            EPHEMERAL_ARENA_AUTH_TOKEN = new_token
+            publish_refreshed_auth_token(old, new_token)
+            return new_token
+
+    return None
 
-def get_arena_auth_token_expiry_epoch(token: str) -> Optional[int]:
+
+def _get_arena_auth_refresh_ahead_settings(config: Optional[dict] = None) -> tuple[bool, float, float]:
+    cfg = config or get_config_view()
+    enabled = bool(cfg.get("arena_auth_refresh_ahead_enabled", True))
+    try:
+        margin_seconds = float(cfg.get("arena_auth_refresh_ahead_seconds", 300))
+    except Exception:
+        margin_seconds = 300.0
+    try:
+        idle_seconds = float(cfg.get("arena_auth_refresh_ahead_idle_seconds", 1800))
+    except Exception:
+        idle_seconds = 1800.0
+    return enabled, max(0.0, min(margin_seconds, 3600.0)), max(0.0, min(idle_seconds, 86400.0))
+
+
+_ARENA_AUTH_REFRESH_TASK: Optional[asyncio.Task] = None
+# Failed refreshes back off per token so one dead session doesn't spin the loop.
+_ARENA_AUTH_REFRESH_RETRY_AT: dict[str, float] = {}
+_ARENA_AUTH_REFRESH_STATS = {"refreshed": 0, "failures": 0, "next_due_seconds": None}
+
+
+def _was_auth_token_served_recently(token: str, idle_seconds: float) -> bool:
+    health = _AUTH_TOKEN_HEALTH.get(token)
+    if health is None or health.last_used_at is None:
+        return False
+    return time.monotonic() - health.last_used_at <= idle_seconds
+
+
+def _persist_refreshed_auth_token(old_token: str, new_token: str) -> bool:
     """
-    Best-effort expiry detection for arena-auth tokens.
+    Replace `old_token` (or the configured value it succeeded) in config.json's `auth_tokens` with `new_token`.
 
-    Returns a unix epoch (seconds) when the token expires, or None if unknown.
+    The refresh spent the session's single-use refresh token, so the configured value would be dead after a restart.
+    Tokens that are not configured (e.g. the ephemeral browser session) are left to `persist_arena_auth_cookie`.
     """
-    session = _decode_arena_auth_session_token(token)
-    if isinstance(session, dict):
-        try:
-            exp = session.get("expires_at")
-            if exp is not None:
-                return int(exp)
-        except Exception:
-            pass
-        try:
-            access = str(session.get("access_token") or "").strip()
-        except Exception:
-            access = ""
-        if access:
-            payload = _decode_jwt_payload(access)
-            if isinstance(payload, dict):
-                try:
-                    exp = payload.get("exp")
-                    if exp is not None:
-                        return int(exp)
-                except Exception:
-                    pass
+    config = get_config()
+    auth_tokens = config.get("auth_tokens", [])
+    if not isinstance(auth_tokens, list):
+        return False
+    replaced = [old_token] + [k for k, v in _ARENA_AUTH_TOKEN_SUCCESSORS.items() if v == new_token]
+    updated = [new_token if str(t or "").strip() in replaced else t for t in auth_tokens]
+    if updated == auth_tokens:
+        return False
+    # Keep the list free of duplicates if the new value was already configured alongside the old one.
+    config["auth_tokens"] = list(dict.fromkeys(updated))
+    save_config(config, preserve_auth_tokens=False)
+    return True
 
-    payload = _decode_jwt_payload(token)
-    if isinstance(payload, dict):
-        try:
-            exp = payload.get("exp")
-            if exp is not None:
-                return int(exp)
-        except Exception:
-            return None
-    return None
 
-def is_arena_auth_token_expired(token: str, *, skew_seconds: int = 30) -> bool:
+async def refresh_arena_auth_token_ahead(token: str) -> Optional[str]:
     """
-    Return True if we can determine that a token is expired (or about to expire).
-    Unknown/opaque token formats return False (do not assume expired).
+    Refresh one base64 session via LMArena Set-Cookie, falling back to Supabase, publish the result and persist it
+    over the configured value.
     """
-    exp = get_arena_auth_token_expiry_epoch(token)
-    if exp is None:
-        return False
+    new_token = None
     try:
-        skew = int(skew_seconds)
+        new_token = await refresh_arena_auth_token_via_lmarena_http(token)
     except Exception:
-        skew = 30
-    now = time.time()
-    return now >= (float(exp) - float(max(0, skew)))
+        new_token = None
+    if not new_token:
+        try:
+            new_token = await refresh_arena_auth_token_via_supabase(token)
+        except Exception:
+            new_token = None
+    if not new_token or new_token == token:
+        return None
+    publish_refreshed_auth_token(token, new_token)
+    _persist_refreshed_auth_token(token, new_token)
+    # The successor inherits the usage so steady traffic keeps it refreshed ahead too.
+    old_health = _AUTH_TOKEN_HEALTH.get(token)
+    if old_health is not None and old_health.last_used_at is not None:
+        _get_auth_token_health(new_token).last_used_at = old_health.last_used_at
+    return new_token
 
-def is_probably_valid_arena_auth_token(token: str) -> bool:
-    """
-    LMArena's `arena-auth-prod-v1` cookie is typically a base64-encoded JSON session payload.
 
-    This helper is intentionally conservative: it returns True only for formats we recognize
-    as plausible session cookies (base64 session payloads or JWT-like strings).
+async def arena_auth_refresh_task() -> None:
     """
-    token = str(token or "").strip()
-    if not token:
-        return False
-    if token.startswith("base64-"):
-        session = _decode_arena_auth_session_token(token)
-        if not isinstance(session, dict):
-            return False
-        access = str(session.get("access_token") or "").strip()
-        if access.count(".") < 2:
-            return False
-        return not is_arena_auth_token_expired(token)
-    if token.count(".") >= 2:
-        # JWT-like token: require a reasonable length to avoid treating random short strings as tokens.
-        if len(token) < 100:
-            return False
-        return not is_arena_auth_token_expired(token)
-    return False
-
-ARENA_AUTH_REFRESH_LOCK: asyncio.Lock = asyncio.Lock()
-
+    Refresh base64 arena-auth sessions `arena_auth_refresh_ahead_seconds` before they expire.
 
-async def refresh_arena_auth_token_via_lmarena_http(old_token: str, config: Optional[dict] = None) -> Optional[str]:
+    Covers configured tokens (as currently served by the pool) and the in-memory ephemeral token, so requests keep
+    finding a valid session instead of refreshing one on their critical path. Only sessions served within
+    `arena_auth_refresh_ahead_idle_seconds` are refreshed: each refresh spends a single-use refresh token, and idle
+    sessions are still refreshed on demand when a request next needs them.
     """
-    Best-effort refresh for `arena-auth-prod-v1` using LMArena itself.
+    failures: dict[str, int] = {}
+    while True:
+        sleep_seconds = 300.0
+        try:
+            enabled, margin_seconds, idle_seconds = _get_arena_auth_refresh_ahead_settings()
+            if enabled:
+                tokens = [record.token for record in get_auth_token_pool().records]
+                ephemeral = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
+                if ephemeral and ephemeral not in tokens:
+                    tokens.append(ephemeral)
 
-    LMArena appears to refresh Supabase session cookies server-side when you request a page with an expired session
-    cookie (it rotates refresh tokens and returns a new `arena-auth-prod-v1` via Set-Cookie).
+                now = time.time()
+                next_due = None
+                for token in tokens:
+                    record = get_arena_auth_token_record(token)
+                    if record.kind != "base64" or not record.has_refresh_token or record.expires_at is None:
+                        continue
+                    if not _was_auth_token_served_recently(token, idle_seconds):
+                        continue
+                    due_at = max(float(record.expires_at) - margin_seconds, _ARENA_AUTH_REFRESH_RETRY_AT.get(token, 0.0))
+                    if due_at > now:
+                        next_due = due_at if next_due is None else min(next_due, due_at)
+                        continue
+                    new_token = await refresh_arena_auth_token_ahead(token)
+                    if new_token:
+                        failures.pop(token, None)
+                        _ARENA_AUTH_REFRESH_RETRY_AT.pop(token, None)
+                        _ARENA_AUTH_REFRESH_STATS["refreshed"] += 1
+                        debug_print(f"🔄 Refreshed arena-auth session ahead of expiry: {token[:20]}...")
+                        # Re-scan right away so the new token is scheduled from its own expiry.
+                        next_due = now
+                    else:
+                        failures[token] = failures.get(token, 0) + 1
+                        _ARENA_AUTH_REFRESH_STATS["failures"] += 1
+                        retry_at = time.time() + min(300.0, 15.0 * (2 ** (failures[token] - 1)))
+                        _ARENA_AUTH_REFRESH_RETRY_AT[token] = retry_at
+                        next_due = retry_at if next_due is None else min(next_due, retry_at)
+
+                # Drop bookkeeping for tokens that are no longer served.
+                for token in [t for t in _ARENA_AUTH_REFRESH_RETRY_AT if t not in tokens]:
+                    _ARENA_AUTH_REFRESH_RETRY_AT.pop(token, None)
+                    failures.pop(token, None)
+
+                if next_due is not None:
+                    sleep_seconds = next_due - time.time()
+                _ARENA_AUTH_REFRESH_STATS["next_due_seconds"] = (
+                    round(max(0.0, next_due - time.time()), 1) if next_due is not None else None
+                )
+            # Re-check periodically anyway: config edits and newly captured ephemeral tokens aren't signalled.
+            await asyncio.sleep(max(1.0, min(sleep_seconds, 300.0)))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            debug_print(f"⚠️  Arena auth refresh-ahead error: {e}")
+            await asyncio.sleep(30.0)
+
+
+def get_arena_auth_refresh_stats() -> dict:
+    enabled, margin_seconds, idle_seconds = _get_arena_auth_refresh_ahead_settings()
+    return {
+        "enabled": enabled,
+        "margin_seconds": margin_seconds,
+        "idle_seconds": idle_seconds,
+        "refreshed_tokens": len(_ARENA_AUTH_TOKEN_SUCCESSORS),
+        "backing_off": len(_ARENA_AUTH_REFRESH_RETRY_AT),
+        **_ARENA_AUTH_REFRESH_STATS,
+    }
 
-    This avoids needing the Supabase anon key locally and keeps the bridge working even after `expires_at` passes.
+
+def get_next_auth_token(exclude_tokens: set = None, *, allow_ephemeral_fallback: bool = True):
+    """Get next auth token: the healthiest candidate, round-robin among equally healthy ones (see `pick_auth_token`)
+     
+    Args:
+        exclude_tokens: Set of tokens to exclude from selection (e.g., already tried tokens)
+        allow_ephemeral_fallback: If True, may fall back to an in-memory `EPHEMERAL_ARENA_AUTH_TOKEN` when all
+            configured tokens are excluded.
     """
-    old_token = str(old_token or "").strip()
-    if not old_token or not old_token.startswith("base64-"):
-        return None
+    global current_token_index
+    config = get_config_view()
+    
+    # Preferred configured tokens (see `AuthTokenPool` for the tier order). The list is shared; don't mutate it.
+    auth_tokens = get_auth_token_pool(config).candidates()
 
-    cfg = config or get_config()
-    ua = normalize_user_agent_value((cfg or {}).get("user_agent")) or (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/120.0.0.0 Safari/537.36"
-    )
+    # Back-compat: support single-token config without persisting/mutating user settings.
+    if not auth_tokens:
+        single_token = str(config.get("auth_token") or "").strip()
+        if single_token and not is_arena_auth_token_expired(single_token):
+            auth_tokens = [single_token]
+    if not auth_tokens and EPHEMERAL_ARENA_AUTH_TOKEN and not is_arena_auth_token_expired(EPHEMERAL_ARENA_AUTH_TOKEN):
+        # Use an in-memory token captured from the browser session as a fallback (do not override configured tokens).
+        auth_tokens = [EPHEMERAL_ARENA_AUTH_TOKEN]
+    if not auth_tokens:
+        cookie_store = config.get("browser_cookies")
+        if isinstance(cookie_store, dict) and bool(config.get("persist_arena_auth_cookie")):
+            token = str(cookie_store.get("arena-auth-prod-v1") or "").strip()
+            if token and not is_arena_auth_token_expired(token):
+                config = get_config()
+                config["auth_tokens"] = [token]
+                save_config(config, preserve_auth_tokens=False)
+                auth_tokens = config.get("auth_tokens", [])
+        if not auth_tokens:
+            # Check for split cookies in browser_cookies
+            cookie_store = config.get("browser_cookies")
+            if isinstance(cookie_store, dict):
+                if cookie_store.get("arena-auth-prod-v1.0") or cookie_store.get("arena-auth-prod-v1.1"):
+                    return ""
 
-    cookies: dict[str, str] = {}
-    try:
-        cf_clearance = str((cfg or {}).get("cf_clearance") or "").strip()
-        if cf_clearance:
-            cookies["cf_clearance"] = cf_clearance
-    except Exception:
-        pass
-    try:
-        cf_bm = str((cfg or {}).get("cf_bm") or "").strip()
-        if cf_bm:
-            cookies["__cf_bm"] = cf_bm
-    except Exception:
-        pass
-    try:
-        cfuvid = str((cfg or {}).get("cfuvid") or "").strip()
-        if cfuvid:
-            cookies["_cfuvid"] = cfuvid
-    except Exception:
-        pass
+            raise HTTPException(status_code=500, detail="No auth tokens configured")
+    
+    # Filter out excluded tokens
+    if exclude_tokens:
+        available_tokens = [t for t in auth_tokens if t not in exclude_tokens]
+        if not available_tokens:
+            if allow_ephemeral_fallback:
+                # Last resort: if we have a valid in-memory token (captured/refreshed) that isn't excluded,
+                # use it rather than failing hard.
+                try:
+                    candidate = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
+                except Exception:
+                    candidate = ""
+                if (
+                    candidate
+                    and candidate not in exclude_tokens
+                    and is_probably_valid_arena_auth_token(candidate)
+                    and not is_arena_auth_token_expired(candidate, skew_seconds=0)
+                ):
+                    return candidate
+            raise HTTPException(status_code=500, detail="No more auth tokens available to try")
+    else:
+        available_tokens = auth_tokens
+    
+    # Health-weighted selection; the rotating start index keeps plain round-robin when all tokens are equally healthy.
+    token = pick_auth_token(available_tokens, current_token_index % len(available_tokens))
+    current_token_index = (current_token_index + 1) % len(auth_tokens)
+    # If we selected a token we can conclusively determine is expired, prefer a valid in-memory token
+    # captured from the browser session (Camoufox/Chrome) rather than hammering upstream with 401s.
     try:
-        provisional_user_id = str((cfg or {}).get("provisional_user_id") or "").strip()
-        if provisional_user_id:
-            cookies["provisional_user_id"] = provisional_user_id
+        if token and is_arena_auth_token_expired(token, skew_seconds=0):
+            candidate = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
+            if (
+                candidate
+                and (not exclude_tokens or candidate not in exclude_tokens)
+                and is_probably_valid_arena_auth_token(candidate)
+                and not is_arena_auth_token_expired(candidate, skew_seconds=0)
+            ):
+                return candidate
     except Exception:
         pass
+    return token
 
-    cookies["arena-auth-prod-v1"] = old_token
-
+def remove_auth_token(token: str, force: bool = False):
+    """Remove an expired/invalid auth token from the list if prune is enabled or forced"""
     try:
-        async with httpx.AsyncClient(
-            headers={"User-Agent": ua},
-            follow_redirects=True,
-            timeout=httpx.Timeout(connect=10.0, read=20.0, write=10.0, pool=10.0),
-        ) as client:
-            resp = await client.get("https://lmarena.ai/", cookies=cookies)
-    except Exception:
-        return None
+        config = get_config()
+        prune_enabled = config.get("prune_invalid_tokens", False)
+        
+        if not prune_enabled and not force:
+            debug_print(f"🔒 Token failed but pruning is disabled. Keep in config: {token[:20]}...")
+            return
 
-    try:
-        set_cookie_headers = resp.headers.get_list("set-cookie")
-    except Exception:
-        raw = resp.headers.get("set-cookie")
-        set_cookie_headers = [raw] if raw else []
+        auth_tokens = config.get("auth_tokens", [])
+        if token in auth_tokens:
+            auth_tokens.remove(token)
+            config["auth_tokens"] = auth_tokens
+            save_config(config, preserve_auth_tokens=False)
+            debug_print(f"🗑️  Removed expired token from list: {token[:20]}...")
+    except Exception as e:
+        debug_print(f"⚠️  Error removing auth token: {e}")
 
-    for sc in set_cookie_headers or []:
-        if not isinstance(sc, str) or not sc:
-            continue
-        if not sc.lower().startswith("arena-auth-prod-v1="):
-            continue
-        try:
-            new_value = sc.split(";", 1)[0].split("=", 1)[1].strip()
-        except Exception:
-            continue
-        if not new_value:
-            continue
-        # Accept even if identical (some servers still refresh internal tokens while keeping value stable),
-        # but prefer a clearly-valid, non-expired cookie.
-        if is_probably_valid_arena_auth_token(new_value) and not is_arena_auth_token_expired(new_value, skew_seconds=0):
-            return new_value
+# --- Dashboard Authentication ---
 
+async def get_current_session(request: Request):
+    session_id = request.cookies.get("session_id")
+    if session_id and session_id in dashboard_sessions:
+        return dashboard_sessions[session_id]
     return None
 
+# --- API Key Authentication & Rate Limiting ---
 
-async def refresh_arena_auth_token_via_supabase(old_token: str, *, anon_key: Optional[str] = None) -> Optional[str]:
-    """
-    Refresh an expired `arena-auth-prod-v1` base64 session directly via Supabase using the embedded refresh_token.
+RATE_LIMIT_WINDOW_SECONDS = 60.0
+_API_KEY_ACTIVITY_BUCKET_SECONDS = 3600
+_API_KEY_ACTIVITY_BUCKETS = 24
 
-    Requires the Supabase anon key (public client key). We keep it in-memory (SUPABASE_ANON_KEY) by default.
+
+class ApiKeyUsage:
     """
-    old_token = str(old_token or "").strip()
-    if not old_token or not old_token.startswith("base64-"):
-        return None
+    Per-key request counters with O(1) admit/reject.
 
-    session = _decode_arena_auth_session_token(old_token)
-    if not isinstance(session, dict):
-        return None
+    `slots` is a ring of the last `rpm` admitted timestamps: the slot about to be overwritten holds the oldest one, so
+    the key is over its limit exactly when that timestamp is still inside the window (and it also gives Retry-After).
+    Hourly buckets back the dashboard's 24h activity count.
+    """
 
-    refresh_token = str(session.get("refresh_token") or "").strip()
-    if not refresh_token:
-        return None
+    __slots__ = ("rpm", "slots", "head", "activity", "activity_hours")
 
-    auth_base = _derive_supabase_auth_base_url_from_arena_auth_token(old_token)
-    if not auth_base:
-        return None
+    def __init__(self, rpm: int):
+        self.rpm = rpm
+        self.slots: list[float] = [float("-inf")] * rpm
+        self.head = 0
+        self.activity = [0] * _API_KEY_ACTIVITY_BUCKETS
+        self.activity_hours = [-1] * _API_KEY_ACTIVITY_BUCKETS
 
-    key = str(anon_key or SUPABASE_ANON_KEY or "").strip()
-    if not key:
-        return None
+    def resize(self, rpm: int) -> None:
+        # Keep the most recent timestamps so an rpm change doesn't reset the window.
+        ordered = self.slots[self.head :] + self.slots[: self.head]
+        if rpm <= len(ordered):
+            self.slots = ordered[len(ordered) - rpm :]
+        else:
+            self.slots = [float("-inf")] * (rpm - len(ordered)) + ordered
+        self.head = 0
+        self.rpm = rpm
+
+    def try_acquire(self, now: float) -> float:
+        """Admit a request at `now` and return 0, or return the seconds until one would be admitted."""
+        if self.rpm <= 0:
+            return RATE_LIMIT_WINDOW_SECONDS
+        oldest = self.slots[self.head]
+        wait = oldest + RATE_LIMIT_WINDOW_SECONDS - now
+        if wait > 0:
+            return wait
+        self.slots[self.head] = now
+        self.head = (self.head + 1) % self.rpm
+        hour = int(now // _API_KEY_ACTIVITY_BUCKET_SECONDS)
+        idx = hour % _API_KEY_ACTIVITY_BUCKETS
+        if self.activity_hours[idx] != hour:
+            self.activity_hours[idx] = hour
+            self.activity[idx] = 0
+        self.activity[idx] += 1
+        return 0.0
+
+    def recent_activity(self, now: float) -> int:
+        oldest_hour = int(now // _API_KEY_ACTIVITY_BUCKET_SECONDS) - _API_KEY_ACTIVITY_BUCKETS + 1
+        return sum(count for hour, count in zip(self.activity_hours, self.activity) if hour >= oldest_hour)
+
+
+_API_KEY_INDEX: Optional[tuple] = None
+
+
+def get_api_key_index(config: Optional[dict] = None) -> dict:
+    """`{key: key_data}` for the configured API keys, rebuilt once per config version."""
+    global _API_KEY_INDEX
+    cfg = config or get_config_view()
+    index = _API_KEY_INDEX
+    if index is None or index[0] != CONFIG_VERSION:
+        keys: dict = {}
+        for key_data in cfg.get("api_keys", []) or []:
+            if isinstance(key_data, dict) and key_data.get("key") is not None:
+                # First entry wins, matching the previous linear search.
+                keys.setdefault(key_data["key"], key_data)
+        index = (CONFIG_VERSION, keys)
+        _API_KEY_INDEX = index
+    return index[1]
+
+
+def get_api_key_recent_activity(now: Optional[float] = None) -> int:
+    """Requests admitted across all API keys in the last 24 hours (hour granularity)."""
+    current = time.time() if now is None else now
+    return sum(usage.recent_activity(current) for usage in list(api_key_usage.values()))
 
-    url = auth_base.rstrip("/") + "/token?grant_type=refresh_token"
 
-    headers = {
-        "apikey": key,
-        "Authorization": f"Bearer {key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
+async def rate_limit_api_key(key: str = Depends(API_KEY_HEADER)):
+    config = get_config_view()
+    api_keys = config.get("api_keys", [])
+    
+    api_key_str = None
+    if key and key.startswith("Bearer "):
+        api_key_str = key[7:].strip()
+    
+    # Pragmatic fallback: if Authorization is missing/empty, use the first available key
+    if not api_key_str:
+        if api_keys:
+            api_key_str = api_keys[0]["key"]
+            # debug_print(f"ℹ️  No API key provided, using first available key: {api_key_str[:8]}...")
+        else:
+            raise HTTPException(
+                status_code=401, 
+                detail="Authentication required. No API keys configured and none provided in Authorization header."
+            )
+    
+    key_data = get_api_key_index(config).get(api_key_str)
+    if not key_data:
+        raise HTTPException(status_code=401, detail="Invalid API Key.")
 
+    # Rate Limiting (sliding 60s window)
     try:
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(connect=10.0, read=20.0, write=10.0, pool=10.0),
-            follow_redirects=True,
-        ) as client:
-            resp = await client.post(url, headers=headers, json={"refresh_token": refresh_token})
+        rate_limit = max(0, int(key_data.get("rpm", 60)))
     except Exception:
-        return None
+        rate_limit = 60
+    usage = api_key_usage.get(api_key_str)
+    if usage is None:
+        usage = ApiKeyUsage(rate_limit)
+        api_key_usage[api_key_str] = usage
+    elif usage.rpm != rate_limit:
+        usage.resize(rate_limit)
+
+    wait_seconds = usage.try_acquire(time.time())
+    if wait_seconds > 0:
+        retry_after = max(1, math.ceil(wait_seconds))  # At least 1 second
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded. Please try again later.",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
+    return key_data
 
-    try:
-        if int(getattr(resp, "status_code", 0) or 0) != 200:
-            return None
-    except Exception:
-        return None
+# --- LMArena stream protocol ---
+# Upstream bodies are newline-delimited `<tag>:<json>` records:
+#   ag:"…" reasoning delta, a0:"…" text delta, a2:[…] generated image, ac:{…} search citations (tool call),
+#   a3:"…" error message, ad:{…} finish metadata.
+# `LMArenaStreamParser` is fed one line at a time by both the streaming and the non-streaming paths.
+STREAM_EVENT_REASONING = "reasoning"
+STREAM_EVENT_CONTENT = "content"
+STREAM_EVENT_IMAGE = "image"
+STREAM_EVENT_CITATION = "citation"
+STREAM_EVENT_ERROR = "error"
+STREAM_EVENT_FINISH = "finish"
+STREAM_EVENT_UNHANDLED = "unhandled"
+STREAM_EVENT_INVALID = "invalid"
+# Non-streaming completions parse the body incrementally; only this much raw text is kept for debug output.
+NON_STREAM_RAW_PREVIEW_CHARS = 2000
+
+
+class LMArenaStreamParser:
+    """
+    Incremental parser for LMArena's line protocol.
+
+    `feed(line)` returns a list of `(kind, value)` events (usually zero or one):
+      - reasoning / content: the text delta (str)
+      - image: the markdown that replaces the response text
+      - citation: the tool call object (sources are accumulated, deduplicated by URL as they arrive)
+      - error: the `a3:` message; finish: the `ad:` metadata dict
+      - unhandled: the normalized line; invalid: `(tag, raw payload, exception)` for undecodable records
+    Text is accumulated in lists and joined on demand, so long responses stay linear.
+    """
 
-    try:
-        data = resp.json()
-    except Exception:
-        return None
-    if not isinstance(data, dict):
-        return None
+    __slots__ = (
+        "_text_parts",
+        "_text",
+        "_reasoning_parts",
+        "_reasoning",
+        "citations",
+        "_citation_urls",
+        "sources_seen",
+        "error_message",
+        "finish_reason",
+        "metadata",
+        "counts",
+    )
 
-    updated = dict(session)
-    for k in ("access_token", "refresh_token", "expires_in", "expires_at", "token_type", "user"):
-        if k in data and data.get(k) is not None:
-            updated[k] = data.get(k)
+    def __init__(self):
+        self._text_parts: list[str] = []
+        self._text: Optional[str] = ""
+        self._reasoning_parts: list[str] = []
+        self._reasoning: Optional[str] = ""
+        self.citations: list[dict] = []
+        self._citation_urls: set = set()
+        self.sources_seen = 0
+        self.error_message = None
+        self.finish_reason: Optional[str] = None
+        self.metadata: Optional[dict] = None
+        self.counts = {"lines": 0, "ag": 0, "a0": 0, "a2": 0, "ac": 0, "a3": 0, "ad": 0}
 
-    # Ensure expires_at is populated if possible.
-    try:
-        exp = updated.get("expires_at")
-        if exp is None:
-            exp = None
-        else:
-            exp = int(exp)
-    except Exception:
-        exp = None
-    if exp is None:
-        try:
-            access = str(updated.get("access_token") or "").strip()
-        except Exception:
-            access = ""
-        payload = _decode_jwt_payload(access) if access else None
-        if isinstance(payload, dict):
+    @property
+    def response_text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._text_parts)
+            self._text_parts = [self._text] if self._text else []
+        return self._text
+
+    @property
+    def reasoning_text(self) -> str:
+        if self._reasoning is None:
+            self._reasoning = "".join(self._reasoning_parts)
+            self._reasoning_parts = [self._reasoning] if self._reasoning else []
+        return self._reasoning
+
+    @property
+    def has_output(self) -> bool:
+        """True once any non-blank text/reasoning delta or citation source has been seen."""
+        return bool(self.response_text.strip() or self.reasoning_text.strip() or self.sources_seen)
+
+    def _add_text(self, chunk: str) -> None:
+        if chunk:
+            self._text_parts.append(chunk)
+            self._text = None
+
+    def _add_reasoning(self, chunk: str) -> None:
+        if chunk:
+            self._reasoning_parts.append(chunk)
+            self._reasoning = None
+
+    def _add_source(self, source) -> None:
+        if not isinstance(source, dict):
+            return
+        self.sources_seen += 1
+        url = source.get("url")
+        if url and url not in self._citation_urls:
+            self._citation_urls.add(url)
+            self.citations.append(source)
+
+    def feed(self, line) -> list:
+        line = str(line).strip()
+        # Normalize possible SSE framing (e.g. `data: a0:"..."`).
+        if line.startswith("data:"):
+            line = line[5:].lstrip()
+        if not line:
+            return []
+        self.counts["lines"] += 1
+
+        tag = line[:3]
+        payload = line[3:]
+        if tag == "a0:" or tag == "ag:":
+            key = tag[:2]
+            self.counts[key] += 1
             try:
-                jwt_exp = payload.get("exp")
-                if jwt_exp is not None:
-                    updated["expires_at"] = int(jwt_exp)
-            except Exception:
-                pass
-        if "expires_at" not in updated:
+                chunk = json.loads(payload)
+            except json.JSONDecodeError as e:
+                return [(STREAM_EVENT_INVALID, (key, payload, e))]
+            chunk = chunk if isinstance(chunk, str) else str(chunk)
+            if key == "a0":
+                self._add_text(chunk)
+                return [(STREAM_EVENT_CONTENT, chunk)]
+            self._add_reasoning(chunk)
+            return [(STREAM_EVENT_REASONING, chunk)]
+
+        if tag == "a2:":
+            self.counts["a2"] += 1
             try:
-                expires_in = int(updated.get("expires_in") or 0)
+                image_list = json.loads(payload)
+            except json.JSONDecodeError as e:
+                return [(STREAM_EVENT_INVALID, ("a2", payload, e))]
+            if isinstance(image_list, list) and image_list and isinstance(image_list[0], dict):
+                image_obj = image_list[0]
+                if image_obj.get("type") == "image":
+                    # OpenAI clients expect the image URL in content; it replaces any text so far.
+                    markdown = f"![Generated Image]({image_obj.get('image', '')})"
+                    self._text_parts = [markdown]
+                    self._text = markdown
+                    return [(STREAM_EVENT_IMAGE, markdown)]
+            return []
+
+        if tag == "ac:":
+            self.counts["ac"] += 1
+            try:
+                citation_obj = json.loads(payload)
+                args_data = None
+                if isinstance(citation_obj, dict) and "argsTextDelta" in citation_obj:
+                    args_data = json.loads(citation_obj["argsTextDelta"])
+            except (json.JSONDecodeError, TypeError) as e:
+                return [(STREAM_EVENT_INVALID, ("ac", payload, e))]
+            if isinstance(args_data, dict) and "source" in args_data:
+                # Can be a single source or array of sources
+                source = args_data["source"]
+                for item in source if isinstance(source, list) else (source,):
+                    self._add_source(item)
+            return [(STREAM_EVENT_CITATION, citation_obj)]
+
+        if tag == "a3:":
+            self.counts["a3"] += 1
+            try:
+                self.error_message = json.loads(payload)
+            except json.JSONDecodeError as e:
+                self.error_message = payload
+                return [(STREAM_EVENT_INVALID, ("a3", payload, e))]
+            return [(STREAM_EVENT_ERROR, self.error_message)]
+
+        if tag == "ad:":
+            self.counts["ad"] += 1
+            try:
+                metadata = json.loads(payload)
+            except json.JSONDecodeError as e:
+                return [(STREAM_EVENT_INVALID, ("ad", payload, e))]
+            if not isinstance(metadata, dict):
+                metadata = {}
+            self.metadata = metadata
+            self.finish_reason = metadata.get("finishReason")
+            return [(STREAM_EVENT_FINISH, metadata)]
+
+        # Standard OpenAI-style JSON chunks (some proxies or new LMArena endpoints).
+        if line[0] == "{":
+            try:
+                chunk_obj = json.loads(line)
             except Exception:
-                expires_in = 0
-            if expires_in > 0:
-                updated["expires_at"] = int(time.time()) + int(expires_in)
-
+                return []
+            choices = chunk_obj.get("choices") if isinstance(chunk_obj, dict) else None
+            if not isinstance(choices, list) or not choices or not isinstance(choices[0], dict):
+                return []
+            delta = choices[0].get("delta", {})
+            if not isinstance(delta, dict):
+                return []
+            events = []
+            if "reasoning_content" in delta:
+                r_chunk = str(delta["reasoning_content"] or "")
+                self._add_reasoning(r_chunk)
+                events.append((STREAM_EVENT_REASONING, r_chunk))
+            if "content" in delta:
+                c_chunk = str(delta["content"] or "")
+                self._add_text(c_chunk)
+                events.append((STREAM_EVENT_CONTENT, c_chunk))
+            return events
+
+        return [(STREAM_EVENT_UNHANDLED, line)]
+
+
+# --- OpenAI SSE chunk encoding ---
+# Everything in a `chat.completion.chunk` except the delta text is fixed for the life of a stream, so the
+# envelope around the delta is rendered once and each token only pays for escaping its own string.
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+ORJSON_AVAILABLE = orjson is not None
+
+
+def _json_string_stdlib(value: str) -> str:
+    return json.dumps(value)
+
+
+def _json_string_orjson(value: str) -> str:
     try:
-        raw = json.dumps(updated, separators=(",", ":")).encode("utf-8")
-        b64 = base64.b64encode(raw).decode("utf-8").rstrip("=")
-        return "base64-" + b64
+        return orjson.dumps(value).decode("utf-8")
     except Exception:
-        return None
+        # orjson rejects lone surrogates; the stdlib escapes them.
+        return json.dumps(value)
 
 
-async def maybe_refresh_expired_auth_tokens_via_lmarena_http(exclude_tokens: Optional[set] = None) -> Optional[str]:
+class SSEChunkEncoder:
     """
-    If the on-disk auth token list only contains expired base64 sessions, try to refresh one via LMArena and return it.
+    Per-stream encoder for OpenAI `chat.completion.chunk` SSE events.
 
-    This is in-memory only by default (does not mutate config.json), to avoid surprising users by rewriting tokens.
+    Output matches `f"data: {json.dumps(chunk)}\\n\\n"` for the same chunk (with `created` fixed at stream start).
+    With `use_orjson`, non-ASCII text is emitted as UTF-8 instead of `\\uXXXX` escapes, which is equivalent JSON.
     """
-    excluded = exclude_tokens or set()
 
-    cfg = get_config()
-    tokens = cfg.get("auth_tokens", [])
-    if not isinstance(tokens, list):
-        tokens = []
+    __slots__ = ("_head", "_content_prefix", "_reasoning_prefix", "_dumps_string", "backend")
 
-    expired_base64: list[str] = []
-    for t in tokens:
-        t = str(t or "").strip()
-        if not t or t in excluded:
-            continue
-        if t.startswith("base64-") and is_arena_auth_token_expired(t, skew_seconds=0):
-            expired_base64.append(t)
+    _DELTA_SUFFIX = '}, "finish_reason": null}]}\n\n'
 
-    if not expired_base64:
-        return None
+    def __init__(self, chunk_id: str, model: str, created: Optional[int] = None, use_orjson: Optional[bool] = None):
+        if created is None:
+            created = int(time.time())
+        envelope = json.dumps({"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model})
+        self._head = "data: " + envelope[:-1] + ', "choices": [{"index": 0, "delta": '
+        self._content_prefix = self._head + '{"content": '
+        self._reasoning_prefix = self._head + '{"reasoning_content": '
+        if use_orjson is None:
+            use_orjson = ORJSON_AVAILABLE
+        use_orjson = bool(use_orjson) and ORJSON_AVAILABLE
+        self._dumps_string = _json_string_orjson if use_orjson else _json_string_stdlib
+        self.backend = "orjson" if use_orjson else "json"
 
-    async with ARENA_AUTH_REFRESH_LOCK:
-        # Reload config within the lock to avoid concurrent writers.
-        cfg = get_config()
-        tokens = cfg.get("auth_tokens", [])
-        if not isinstance(tokens, list):
-            tokens = []
+    def content(self, text) -> str:
+        if not isinstance(text, str):
+            text = str(text)
+        return self._content_prefix + self._dumps_string(text) + self._DELTA_SUFFIX
 
-        for old in list(expired_base64):
-            if old in excluded:
-                continue
-            if old not in tokens:
-                continue
-            if not is_arena_auth_token_expired(old, skew_seconds=0):
-                continue
+    def reasoning(self, text) -> str:
+        if not isinstance(text, str):
+            text = str(text)
+        return self._reasoning_prefix + self._dumps_string(text) + self._DELTA_SUFFIX
 
-            new_token = await refresh_arena_auth_token_via_lmarena_http(old, cfg)
-            if not new_token:
-                continue
+    def finish(self, finish_reason: Optional[str]) -> str:
+        return self._head + "{}, \"finish_reason\": " + json.dumps(finish_reason) + "}]}\n\n"
 
-            # Also prefer it immediately for subsequent requests.
-            global EPHEMERAL_ARENA_AUTH_TOKEN
-            EPHEMERAL_ARENA_AUTH_TOKEN = new_token
-            return new_token
 
-    return None
+def _resolve_stream_option(
+    name: str, default: float, config: Optional[dict] = None, api_key: Optional[dict] = None, body: Optional[dict] = None
+) -> float:
+    """
+    Per-client stream option lookup: request `stream_options.<name>`, then the API key's `stream_<name>`, then the
+    global `stream_<name>` config key, then `default`. Non-numeric values are skipped.
+    """
+    cfg = config or get_config_view()
+    sources = []
+    options = body.get("stream_options") if isinstance(body, dict) else None
+    if isinstance(options, dict):
+        sources.append(options.get(name))
+    if isinstance(api_key, dict):
+        sources.append(api_key.get(f"stream_{name}"))
+    sources.append(cfg.get(f"stream_{name}"))
+    for value in sources:
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except Exception:
+            continue
+    return default
 
 
-async def maybe_refresh_expired_auth_tokens(exclude_tokens: Optional[set] = None) -> Optional[str]:
+def _get_stream_coalesce_settings(
+    config: Optional[dict] = None, api_key: Optional[dict] = None, body: Optional[dict] = None
+) -> tuple[float, int]:
     """
-    Refresh an expired `arena-auth-prod-v1` base64 session without mutating user settings.
+    Resolve `(window_seconds, max_bytes)` for delta coalescing; a window of 0 disables it.
 
-    Strategy:
-      1) Try LMArena Set-Cookie refresh (no anon key required).
-      2) Fall back to Supabase refresh_token grant (requires Supabase anon key discovered from JS bundles).
+    Precedence: request `stream_options.coalesce_ms` / `coalesce_max_bytes`, then the API key's
+    `stream_coalesce_ms` / `stream_coalesce_max_bytes`, then the global config keys of the same name.
     """
-    excluded = exclude_tokens or set()
+    window_ms = _resolve_stream_option("coalesce_ms", 0.0, config, api_key, body)
+    max_bytes = _resolve_stream_option("coalesce_max_bytes", 4096.0, config, api_key, body)
+    return max(0.0, min(window_ms, 250.0)) / 1000.0, int(max(1.0, min(max_bytes, 65536.0)))
 
-    try:
-        token = await maybe_refresh_expired_auth_tokens_via_lmarena_http(exclude_tokens=excluded)
-    except Exception:
-        token = None
-    if token:
-        return token
 
-    cfg = get_config()
-    tokens = cfg.get("auth_tokens", [])
-    if not isinstance(tokens, list):
-        tokens = []
+class SSEDeltaCoalescer:
+    """
+    Opt-in merging of consecutive same-kind deltas into one SSE event.
 
-    expired_base64: list[str] = []
-    for t in tokens:
-        t = str(t or "").strip()
-        if not t or t in excluded:
-            continue
-        if t.startswith("base64-") and is_arena_auth_token_expired(t, skew_seconds=0):
-            expired_base64.append(t)
-    if not expired_base64:
-        return None
+    Buffered text is emitted once the window since the first buffered delta elapses or the buffer reaches
+    `max_bytes` (counted in characters). A change between reasoning and content flushes first, so ordering is
+    preserved. `add()`/`flush()` return the SSE text to write ("" when nothing is due); a single return value
+    may hold two events. With a zero window every delta is encoded immediately.
+    """
 
-    async with ARENA_AUTH_REFRESH_LOCK:
-        cfg = get_config()
-        tokens = cfg.get("auth_tokens", [])
-        if not isinstance(tokens, list):
-            tokens = []
+    __slots__ = ("encoder", "window", "max_bytes", "_kind", "_parts", "_size", "_deadline")
 
-        for old in list(expired_base64):
-            if old in excluded:
-                continue
-            if old not in tokens:
-                continue
-            if not is_arena_auth_token_expired(old, skew_seconds=0):
-                continue
+    def __init__(self, encoder: SSEChunkEncoder, window_seconds: float = 0.0, max_bytes: int = 4096):
+        self.encoder = encoder
+        self.window = max(0.0, float(window_seconds))
+        self.max_bytes = max(1, int(max_bytes))
+        self._kind: Optional[str] = None
+        self._parts: list[str] = []
+        self._size = 0
+        self._deadline = 0.0
 
-            new_token = await refresh_arena_auth_token_via_supabase(old)
-            if not new_token:
-                continue
+    @property
+    def pending(self) -> bool:
+        return bool(self._parts)
+
+    def _encode(self, kind: str, text: str) -> str:
+        if kind == STREAM_EVENT_REASONING:
+            return self.encoder.reasoning(text)
+        return self.encoder.content(text)
+
+    def add(self, kind: str, text: str, now: Optional[float] = None) -> str:
+        if self.window <= 0:
+            return self._encode(kind, text)
+        out = ""
+        if self._parts and kind != self._kind:
+            out = self.flush()
+        if now is None:
+            now = time.monotonic()
+        if not self._parts:
+            self._kind = kind
+            self._deadline = now + self.window
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.max_bytes or now >= self._deadline:
+            out += self.flush()
+        return out
+
+    def flush(self) -> str:
+        if not self._parts:
+            return ""
+        text = self._parts[0] if len(self._parts) == 1 else "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return self._encode(self._kind, text)
+
+    def next_wait(self, idle_timeout: Optional[float], now: Optional[float] = None) -> Optional[float]:
+        """How long the reader may block before buffered deltas must be flushed (None: indefinitely)."""
+        if not self._parts:
+            return idle_timeout
+        if now is None:
+            now = time.monotonic()
+        remaining = max(0.0, self._deadline - now)
+        return remaining if idle_timeout is None else min(idle_timeout, remaining)
+
+
+# --- Stream keep-alive ticker ---
+# One heartbeat task per event loop serves every open SSE stream. Streams are kept in a heap keyed by when they
+# would next become idle; the ticker sleeps until the earliest of those and only wakes streams that have written
+# nothing for their interval, so an idle stream costs one heap entry instead of its own 1s timer.
+_KEEPALIVE_TICKER: Optional["KeepAliveTicker"] = None
+
+
+def _get_stream_keepalive_interval(
+    config: Optional[dict] = None, api_key: Optional[dict] = None, body: Optional[dict] = None
+) -> float:
+    """Keep-alive interval in seconds (`stream_options.keepalive_seconds` / `stream_keepalive_seconds`, default 1)."""
+    return max(0.25, min(_resolve_stream_option("keepalive_seconds", 1.0, config, api_key, body), 60.0))
+
+
+class StreamHeartbeat:
+    """
+    Idle tracking for one SSE stream.
 
-            global EPHEMERAL_ARENA_AUTH_TOKEN
-            EPHEMERAL_ARENA_AUTH_TOKEN = new_token
-            return new_token
+    `wrap_stream()` registers with the loop's ticker for the lifetime of the body and records every write. While
+    the stream waits (`wait()` on a task, or a line channel via `set_waker()`), the ticker calls the waker once the
+    stream has been idle for `interval` seconds.
+    """
 
-    return None
+    __slots__ = ("interval", "last_write", "active", "_waker")
 
+    def __init__(self, interval: float = 1.0):
+        self.interval = max(0.01, float(interval))
+        self.last_write = time.monotonic()
+        self.active = False
+        self._waker = None
 
-def get_next_auth_token(exclude_tokens: set = None, *, allow_ephemeral_fallback: bool = True):
-    """Get next auth token using round-robin selection
-     
-    Args:
-        exclude_tokens: Set of tokens to exclude from selection (e.g., already tried tokens)
-        allow_ephemeral_fallback: If True, may fall back to an in-memory `EPHEMERAL_ARENA_AUTH_TOKEN` when all
-            configured tokens are excluded.
-    """
-    global current_token_index
-    config = get_config()
-    
-    # Get all available tokens
-    auth_tokens = config.get("auth_tokens", [])
-    if not isinstance(auth_tokens, list):
-        auth_tokens = []
+    def touch(self) -> None:
+        self.last_write = time.monotonic()
 
-    # Normalize and drop empty tokens.
-    auth_tokens = [str(t or "").strip() for t in auth_tokens if str(t or "").strip()]
-
-    # Drop tokens we can confidently determine are expired, *except* base64 session cookies.
-    # Expired base64 session cookies can often be refreshed via `Set-Cookie` (see
-    # `maybe_refresh_expired_auth_tokens_via_lmarena_http`), so we keep them as a better fallback than short
-    # placeholder strings like "test-auth".
-    filtered_tokens: list[str] = []
-    for t in auth_tokens:
-        if t.startswith("base64-"):
-            filtered_tokens.append(t)
-            continue
-        try:
-            if is_arena_auth_token_expired(t):
-                continue
-        except Exception:
-            # Unknown formats: do not assume expired.
-            pass
-        filtered_tokens.append(t)
-    auth_tokens = filtered_tokens
-
-    # Token preference order:
-    #   1) plausible, non-expired tokens (base64/JWT-like)
-    #   2) base64 session cookies (even if expired, refreshable)
-    #   3) long opaque tokens
-    #   4) anything else
-    try:
-        probable = [t for t in auth_tokens if is_probably_valid_arena_auth_token(t)]
-    except Exception:
-        probable = []
-    base64_any = [t for t in auth_tokens if t.startswith("base64-")]
-    long_opaque = [t for t in auth_tokens if len(str(t)) >= 100]
-    if probable:
-        auth_tokens = probable
-    elif base64_any:
-        auth_tokens = base64_any
-    elif long_opaque:
-        auth_tokens = long_opaque
-
-    # If we have at least one *configured* token we recognize as a plausible arena-auth cookie, ignore
-    # obviously placeholder/invalid entries (e.g. short "test-token" strings). Do not let an in-memory
-    # ephemeral token cause us to drop user-configured tokens, because tests and some deployments use
-    # opaque token formats.
-    has_probably_valid_config = False
-    for t in auth_tokens:
-        try:
-            if is_probably_valid_arena_auth_token(str(t)):
-                has_probably_valid_config = True
-                break
-        except Exception:
-            continue
-    if has_probably_valid_config:
-        filtered_tokens: list[str] = []
-        for t in auth_tokens:
-            s = str(t or "").strip()
-            if not s:
-                continue
+    def idle(self, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        return (now - self.last_write) >= self.interval
+
+    def set_waker(self, waker) -> None:
+        self._waker = waker
+
+    def _fire(self) -> None:
+        waker = self._waker
+        if waker is not None:
             try:
-                if is_probably_valid_arena_auth_token(s):
-                    filtered_tokens.append(s)
-                    continue
+                waker()
             except Exception:
-                # Keep unknown formats (they may still be valid).
-                filtered_tokens.append(s)
-                continue
-            # Drop short placeholders when we have at least one plausible token.
-            if len(s) < 100:
-                continue
-            filtered_tokens.append(s)
-        auth_tokens = filtered_tokens
+                pass
 
-    # Back-compat: support single-token config without persisting/mutating user settings.
-    if not auth_tokens:
-        single_token = str(config.get("auth_token") or "").strip()
-        if single_token and not is_arena_auth_token_expired(single_token):
-            auth_tokens = [single_token]
-    if not auth_tokens and EPHEMERAL_ARENA_AUTH_TOKEN and not is_arena_auth_token_expired(EPHEMERAL_ARENA_AUTH_TOKEN):
-        # Use an in-memory token captured from the browser session as a fallback (do not override configured tokens).
-        auth_tokens = [EPHEMERAL_ARENA_AUTH_TOKEN]
-    if not auth_tokens:
-        cookie_store = config.get("browser_cookies")
-        if isinstance(cookie_store, dict) and bool(config.get("persist_arena_auth_cookie")):
-            token = str(cookie_store.get("arena-auth-prod-v1") or "").strip()
-            if token and not is_arena_auth_token_expired(token):
-                config["auth_tokens"] = [token]
-                save_config(config, preserve_auth_tokens=False)
-                auth_tokens = config.get("auth_tokens", [])
-        if not auth_tokens:
-            # Check for split cookies in browser_cookies
-            cookie_store = config.get("browser_cookies")
-            if isinstance(cookie_store, dict):
-                if cookie_store.get("arena-auth-prod-v1.0") or cookie_store.get("arena-auth-prod-v1.1"):
-                    return ""
+    def start(self) -> None:
+        if not self.active:
+            self.active = True
+            self.touch()
+            get_keepalive_ticker().add(self)
+
+    def close(self) -> None:
+        # The ticker drops inactive entries when they come due.
+        self.active = False
+        self._waker = None
+
+    async def wait(self, task: asyncio.Future) -> bool:
+        """Wait for `task` or until the stream is idle; returns True once `task` is done."""
+        if task.done():
+            return True
+        if not self.active:
+            self.start()
+        tick = asyncio.get_running_loop().create_future()
+        self._waker = lambda: tick.done() or tick.set_result(None)
+        try:
+            await asyncio.wait({task, tick}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._waker = None
+            tick.cancel()
+        return task.done()
+
+    async def wrap_stream(self, stream):
+        self.start()
+        try:
+            async for chunk in stream:
+                self.touch()
+                yield chunk
+        finally:
+            self.close()
+
+
+def _resolve_ticker_wakeup(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class KeepAliveTicker:
+    """Single per-loop heartbeat scheduler; see `StreamHeartbeat`."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self._heap: list = []
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Future] = None
+        self._sleep_until = math.inf
+        self.fires = 0
+        self.wakeups = 0
+
+    def add(self, heartbeat: StreamHeartbeat) -> None:
+        self._schedule(heartbeat, heartbeat.last_write + heartbeat.interval)
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
 
-            raise HTTPException(status_code=500, detail="No auth tokens configured")
-    
-    # Filter out excluded tokens
-    if exclude_tokens:
-        available_tokens = [t for t in auth_tokens if t not in exclude_tokens]
-        if not available_tokens:
-            if allow_ephemeral_fallback:
-                # Last resort: if we have a valid in-memory token (captured/refreshed) that isn't excluded,
-                # use it rather than failing hard.
-                try:
-                    candidate = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
-                except Exception:
-                    candidate = ""
-                if (
-                    candidate
-                    and candidate not in exclude_tokens
-                    and is_probably_valid_arena_auth_token(candidate)
-                    and not is_arena_auth_token_expired(candidate, skew_seconds=0)
-                ):
-                    return candidate
-            raise HTTPException(status_code=500, detail="No more auth tokens available to try")
-    else:
-        available_tokens = auth_tokens
-    
-    # Round-robin selection from available tokens
-    token = available_tokens[current_token_index % len(available_tokens)]
-    current_token_index = (current_token_index + 1) % len(auth_tokens)
-    # If we selected a token we can conclusively determine is expired, prefer a valid in-memory token
-    # captured from the browser session (Camoufox/Chrome) rather than hammering upstream with 401s.
+    def _schedule(self, heartbeat: StreamHeartbeat, due: float) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, heartbeat))
+        if due < self._sleep_until and self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    async def _run(self) -> None:
+        while True:
+            waiter = self.loop.create_future()
+            handle = None
+            if self._heap:
+                self._sleep_until = self._heap[0][0]
+                handle = self.loop.call_later(
+                    max(0.0, self._sleep_until - time.monotonic()), _resolve_ticker_wakeup, waiter
+                )
+            else:
+                self._sleep_until = math.inf
+            self._wakeup = waiter
+            try:
+                await waiter
+            finally:
+                self._wakeup = None
+                if handle is not None:
+                    handle.cancel()
+            self.wakeups += 1
+
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, heartbeat = heapq.heappop(self._heap)
+                if not heartbeat.active:
+                    continue
+                idle_at = heartbeat.last_write + heartbeat.interval
+                if now >= idle_at:
+                    self.fires += 1
+                    heartbeat._fire()
+                    self._schedule(heartbeat, now + heartbeat.interval)
+                else:
+                    self._schedule(heartbeat, idle_at)
+
+    def stats_snapshot(self) -> dict:
+        return {
+            "streams": sum(1 for _, _, heartbeat in self._heap if heartbeat.active),
+            "scheduled": len(self._heap),
+            "fires": self.fires,
+            "wakeups": self.wakeups,
+        }
+
+
+def get_keepalive_ticker() -> KeepAliveTicker:
+    global _KEEPALIVE_TICKER
+    loop = asyncio.get_running_loop()
+    if _KEEPALIVE_TICKER is None or _KEEPALIVE_TICKER.loop is not loop:
+        _KEEPALIVE_TICKER = KeepAliveTicker()
+    return _KEEPALIVE_TICKER
+
+
+def get_keepalive_ticker_stats() -> dict:
+    ticker = _KEEPALIVE_TICKER
+    if ticker is None:
+        return {"streams": 0, "scheduled": 0, "fires": 0, "wakeups": 0}
+    return ticker.stats_snapshot()
+
+
+# --- Upstream admission ---
+# Bounds concurrent upstream work (streams, browser fetches, proxy jobs) and shares it fairly between API keys, so a
+# burst from one key queues behind its own requests instead of starving everyone else.
+UPSTREAM_TRANSPORT_CLASSES = ("http", "browser")
+
+
+def _get_upstream_admission_settings(config: Optional[dict] = None) -> tuple[int, dict, int, float]:
+    cfg = config or get_config_view()
     try:
-        if token and is_arena_auth_token_expired(token, skew_seconds=0):
-            candidate = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
-            if (
-                candidate
-                and (not exclude_tokens or candidate not in exclude_tokens)
-                and is_probably_valid_arena_auth_token(candidate)
-                and not is_arena_auth_token_expired(candidate, skew_seconds=0)
-            ):
-                return candidate
+        max_concurrency = int(cfg.get("upstream_max_concurrency", 32))
     except Exception:
-        pass
-    return token
-
-def remove_auth_token(token: str, force: bool = False):
-    """Remove an expired/invalid auth token from the list if prune is enabled or forced"""
+        max_concurrency = 32
+    max_concurrency = max(1, min(max_concurrency, 1024))
+    defaults = {"http": max_concurrency, "browser": 4}
+    transport_limits: dict[str, int] = {}
+    for transport, default in defaults.items():
+        try:
+            limit = int(cfg.get(f"upstream_max_concurrency_{transport}", default))
+        except Exception:
+            limit = default
+        transport_limits[transport] = max(1, min(limit, max_concurrency))
     try:
-        config = get_config()
-        prune_enabled = config.get("prune_invalid_tokens", False)
-        
-        if not prune_enabled and not force:
-            debug_print(f"🔒 Token failed but pruning is disabled. Keep in config: {token[:20]}...")
+        max_queue = int(cfg.get("upstream_max_queue", 100))
+    except Exception:
+        max_queue = 100
+    try:
+        queue_timeout = float(cfg.get("upstream_queue_timeout_seconds", 60))
+    except Exception:
+        queue_timeout = 60.0
+    return max_concurrency, transport_limits, max(0, max_queue), max(0.0, min(queue_timeout, 600.0))
+
+
+class UpstreamAdmissionTicket:
+    """One admitted (or queued) request; `release()` is idempotent."""
+
+    __slots__ = (
+        "controller",
+        "api_key",
+        "transport",
+        "start_tag",
+        "finish_tag",
+        "future",
+        "enqueued_at",
+        "admitted_at",
+        "released",
+        "__weakref__",
+    )
+
+    def __init__(self, controller: "UpstreamAdmissionController", api_key: str, transport: str):
+        self.controller = controller
+        self.api_key = api_key
+        self.transport = transport
+        self.start_tag = 0.0
+        self.finish_tag = 0.0
+        self.future: Optional[asyncio.Future] = None
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+
+    def release(self) -> None:
+        if self.released or self.admitted_at is None:
             return
+        self.released = True
+        self.controller._release(self)
 
-        auth_tokens = config.get("auth_tokens", [])
-        if token in auth_tokens:
-            auth_tokens.remove(token)
-            config["auth_tokens"] = auth_tokens
-            save_config(config, preserve_auth_tokens=False)
-            debug_print(f"🗑️  Removed expired token from list: {token[:20]}...")
-    except Exception as e:
-        debug_print(f"⚠️  Error removing auth token: {e}")
+    async def wrap_stream(self, stream):
+        """Hold the admission for the lifetime of a streaming response body."""
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            self.release()
 
-# --- Dashboard Authentication ---
 
-async def get_current_session(request: Request):
-    session_id = request.cookies.get("session_id")
-    if session_id and session_id in dashboard_sessions:
-        return dashboard_sessions[session_id]
-    return None
+class UpstreamAdmissionController:
+    """
+    Global/per-transport concurrency limits with start-time fair queueing across API keys.
 
-# --- API Key Authentication & Rate Limiting ---
+    Each queued request gets a virtual start tag `max(virtual_time, key's last finish)` and a finish tag one
+    `1/weight` later; the waiting head with the smallest finish tag whose transport has capacity is admitted next.
+    """
 
-async def rate_limit_api_key(key: str = Depends(API_KEY_HEADER)):
-    config = get_config()
-    api_keys = config.get("api_keys", [])
-    
-    api_key_str = None
-    if key and key.startswith("Bearer "):
-        api_key_str = key[7:].strip()
-    
-    # Pragmatic fallback: if Authorization is missing/empty, use the first available key
-    if not api_key_str:
-        if api_keys:
-            api_key_str = api_keys[0]["key"]
-            # debug_print(f"ℹ️  No API key provided, using first available key: {api_key_str[:8]}...")
-        else:
-            raise HTTPException(
-                status_code=401, 
-                detail="Authentication required. No API keys configured and none provided in Authorization header."
-            )
-    
-    key_data = next((k for k in api_keys if k["key"] == api_key_str), None)
-    if not key_data:
-        raise HTTPException(status_code=401, detail="Invalid API Key.")
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.active = 0
+        self.active_by_transport: dict[str, int] = defaultdict(int)
+        self.queues: dict[str, deque] = {}
+        self.queued = 0
+        self.key_finish: dict[str, float] = {}
+        self.virtual_time = 0.0
+        self.hold_seconds_avg: Optional[float] = None
+        self.stats = {
+            "admitted": 0,
+            "queued_total": 0,
+            "rejected_queue_full": 0,
+            "timed_out": 0,
+            "wait_ms_avg": 0.0,
+            "wait_ms_max": 0.0,
+        }
 
-    # Rate Limiting
-    rate_limit = key_data.get("rpm", 60)
-    current_time = time.time()
-    
-    # Clean up old timestamps (older than 60 seconds)
-    api_key_usage[api_key_str] = [t for t in api_key_usage[api_key_str] if current_time - t < 60]
-
-    if len(api_key_usage[api_key_str]) >= rate_limit:
-        # Calculate seconds until oldest request expires (60 seconds window)
-        oldest_timestamp = min(api_key_usage[api_key_str])
-        retry_after = int(60 - (current_time - oldest_timestamp))
-        retry_after = max(1, retry_after)  # At least 1 second
-        
-        raise HTTPException(
+    def _has_capacity(self, transport: str, max_concurrency: int, transport_limits: dict) -> bool:
+        if self.active >= max_concurrency:
+            return False
+        return self.active_by_transport[transport] < transport_limits.get(transport, max_concurrency)
+
+    def _admit(self, ticket: UpstreamAdmissionTicket) -> None:
+        now = time.monotonic()
+        ticket.admitted_at = now
+        self.active += 1
+        self.active_by_transport[ticket.transport] += 1
+        self.stats["admitted"] += 1
+        wait_ms = (now - ticket.enqueued_at) * 1000.0
+        self.stats["wait_ms_avg"] = self.stats["wait_ms_avg"] * 0.9 + wait_ms * 0.1
+        self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], wait_ms)
+
+    def _dequeue(self, ticket: UpstreamAdmissionTicket) -> None:
+        queue = self.queues.get(ticket.api_key)
+        if queue is None:
+            return
+        try:
+            queue.remove(ticket)
+            self.queued -= 1
+        except ValueError:
+            return
+        if not queue:
+            self.queues.pop(ticket.api_key, None)
+
+    def _dispatch(self) -> None:
+        max_concurrency, transport_limits, _, _ = _get_upstream_admission_settings()
+        while self.queued and self.active < max_concurrency:
+            best = None
+            for queue in self.queues.values():
+                # Per-key FIFO; a key whose head is blocked on its transport limit doesn't block other keys.
+                for ticket in queue:
+                    if self._has_capacity(ticket.transport, max_concurrency, transport_limits):
+                        if best is None or ticket.finish_tag < best.finish_tag:
+                            best = ticket
+                        break
+            if best is None:
+                return
+            self._dequeue(best)
+            self.virtual_time = max(self.virtual_time, best.start_tag)
+            self._admit(best)
+            if best.future is not None and not best.future.done():
+                best.future.set_result(True)
+        if not self.queued:
+            # Idle: restart virtual time so stale per-key tags can't bias the next burst.
+            self.key_finish.clear()
+            self.virtual_time = 0.0
+
+    def _release(self, ticket: UpstreamAdmissionTicket) -> None:
+        self.active = max(0, self.active - 1)
+        self.active_by_transport[ticket.transport] = max(0, self.active_by_transport[ticket.transport] - 1)
+        held = time.monotonic() - float(ticket.admitted_at or time.monotonic())
+        self.hold_seconds_avg = held if self.hold_seconds_avg is None else self.hold_seconds_avg * 0.8 + held * 0.2
+        self._dispatch()
+
+    def estimate_retry_after(self, max_concurrency: int) -> int:
+        hold = self.hold_seconds_avg if self.hold_seconds_avg is not None else 10.0
+        return int(max(1, min(300, math.ceil((self.queued + 1) * hold / max(1, max_concurrency)))))
+
+    def _reject(self, reason: str, max_concurrency: int) -> HTTPException:
+        return HTTPException(
             status_code=429,
-            detail="Rate limit exceeded. Please try again later.",
-            headers={"Retry-After": str(retry_after)}
+            detail=f"Upstream capacity exhausted ({reason}). Please try again later.",
+            headers={"Retry-After": str(self.estimate_retry_after(max_concurrency))},
         )
-        
-    api_key_usage[api_key_str].append(current_time)
-    
-    return key_data
+
+    async def acquire(self, api_key: str, transport: str = "http", weight: float = 1.0) -> UpstreamAdmissionTicket:
+        max_concurrency, transport_limits, max_queue, queue_timeout = _get_upstream_admission_settings()
+        ticket = UpstreamAdmissionTicket(self, api_key, transport)
+        if not self.queued and self._has_capacity(transport, max_concurrency, transport_limits):
+            self._admit(ticket)
+            return ticket
+        if self.queued >= max_queue:
+            self.stats["rejected_queue_full"] += 1
+            raise self._reject("queue full", max_concurrency)
+
+        try:
+            weight = float(weight)
+        except Exception:
+            weight = 1.0
+        weight = max(0.01, weight)
+        ticket.start_tag = max(self.virtual_time, self.key_finish.get(api_key, 0.0))
+        ticket.finish_tag = ticket.start_tag + 1.0 / weight
+        self.key_finish[api_key] = ticket.finish_tag
+        ticket.future = self.loop.create_future()
+        self.queues.setdefault(api_key, deque()).append(ticket)
+        self.queued += 1
+        self.stats["queued_total"] += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait({ticket.future}, timeout=queue_timeout)
+        except asyncio.CancelledError:
+            if ticket.future.done():
+                ticket.release()
+            else:
+                self._dequeue(ticket)
+                self._dispatch()
+            raise
+        if ticket.future.done():
+            return ticket
+        self._dequeue(ticket)
+        self.stats["timed_out"] += 1
+        self._dispatch()
+        raise self._reject("queue wait timed out", max_concurrency)
+
+    def stats_snapshot(self) -> dict:
+        max_concurrency, transport_limits, max_queue, queue_timeout = _get_upstream_admission_settings()
+        return {
+            "active": self.active,
+            "active_by_transport": {t: self.active_by_transport.get(t, 0) for t in UPSTREAM_TRANSPORT_CLASSES},
+            "queued": self.queued,
+            "queued_by_key": {key[:8] + "...": len(queue) for key, queue in self.queues.items()},
+            "max_concurrency": max_concurrency,
+            "transport_limits": transport_limits,
+            "max_queue": max_queue,
+            "queue_timeout_seconds": queue_timeout,
+            "hold_seconds_avg": round(self.hold_seconds_avg, 3) if self.hold_seconds_avg is not None else None,
+            **{k: (round(v, 1) if isinstance(v, float) else v) for k, v in self.stats.items()},
+        }
+
+
+_UPSTREAM_ADMISSION: Optional[UpstreamAdmissionController] = None
+
+
+def get_upstream_admission() -> UpstreamAdmissionController:
+    """Return the admission controller for the running loop (a controller bound to another loop is dropped)."""
+    global _UPSTREAM_ADMISSION
+    controller = _UPSTREAM_ADMISSION
+    if controller is None or controller.loop is not asyncio.get_running_loop():
+        controller = UpstreamAdmissionController()
+        _UPSTREAM_ADMISSION = controller
+    return controller
+
+
+def get_upstream_admission_stats() -> dict:
+    controller = _UPSTREAM_ADMISSION
+    if controller is None:
+        return {"active": 0, "queued": 0}
+    return controller.stats_snapshot()
 
 # --- Core Logic ---
 
@@ -4074,6 +7260,9 @@ async def startup_event():
         return
 
     try:
+        # Load usage stats (and compact the journal) before anything rewrites config.json.
+        load_usage_stats()
+
         # Ensure config and models files exist
         config = get_config()
         if not config.get("api_keys"):
@@ -4087,8 +7276,6 @@ async def startup_event():
             ]
         save_config(config)
         save_models(get_models())
-        # Load usage stats from config
-        load_usage_stats()
         
         # 1. First, get initial data (cookies, models, etc.)
         # We await this so we have the cookie BEFORE trying reCAPTCHA
@@ -4107,8 +7294,17 @@ async def startup_event():
         # The internal Camoufox userscript-proxy mints tokens in-page for strict models, and non-strict
         # requests can refresh on-demand. Avoid launching extra browser instances at startup.
 
+        # Opt-in: warm the Chrome fetch pool now instead of on the first strict-model request.
+        if config.get("chrome_fetch_pool_prewarm"):
+            asyncio.create_task(prewarm_chrome_page_pool())
+
         # 3. Start background tasks
         asyncio.create_task(periodic_refresh_task())
+        global _USAGE_STATS_FLUSH_TASK, _RECAPTCHA_RESERVOIR_TASK, _ARENA_AUTH_REFRESH_TASK
+        _USAGE_STATS_FLUSH_TASK = asyncio.create_task(usage_stats_flush_task())
+        # Idles until requests start asking for tokens, so this does not launch a browser at startup.
+        _RECAPTCHA_RESERVOIR_TASK = asyncio.create_task(recaptcha_reservoir_task())
+        _ARENA_AUTH_REFRESH_TASK = asyncio.create_task(arena_auth_refresh_task())
         
         # Mark userscript proxy as active at startup to allow immediate delegation
         # to the internal Camoufox proxy worker.
@@ -4333,7 +7529,7 @@ async def dashboard(session: str = Depends(get_current_session)):
     cf_class = "status-good" if config.get("cf_clearance") else "status-bad"
     
     # Get recent activity count (last 24 hours)
-    recent_activity = sum(1 for timestamps in api_key_usage.values() for t in timestamps if time.time() - t < 86400)
+    recent_activity = get_api_key_recent_activity()
 
     return f"""
         <!DOCTYPE html>
@@ -5079,6 +8275,16 @@ async def userscript_push(request: Request):
     if not isinstance(job, dict):
         raise HTTPException(status_code=404, detail="Unknown job_id")
 
+    await _apply_userscript_proxy_push(job, data)
+    return {"status": "ok"}
+
+
+async def _apply_userscript_proxy_push(job: dict, data: dict) -> bool:
+    """
+    Apply one push (status/headers/lines/error/done) from an external userscript proxy to `job`.
+
+    Returns False once the job's channel refuses lines (consumer gone or overflow abort).
+    """
     status_code = data.get("status")
     if isinstance(status_code, int):
         job["status_code"] = int(status_code)
@@ -5093,12 +8299,16 @@ async def userscript_push(request: Request):
     if error:
         job["error"] = str(error)
 
+    accepted = True
     lines = data.get("lines") or []
     if isinstance(lines, list):
         for line in lines:
             if line is None:
                 continue
-            await job["lines_queue"].put(str(line))
+            # A full (paused) channel holds this push until the consumer catches up; False means it was dropped.
+            if await job["lines_queue"].put(str(line)) is False:
+                accepted = False
+                break
 
     if bool(data.get("done")):
         job["done"] = True
@@ -5110,7 +8320,271 @@ async def userscript_push(request: Request):
             status_event.set()
         await job["lines_queue"].put(None)
 
-    return {"status": "ok"}
+    return accepted
+
+
+# --- Userscript proxy WebSocket ---
+# `/api/v1/userscript/ws` replaces the poll/push round trips with one persistent connection. Messages are JSON
+# text frames:
+#   client -> server  {"type": "auth", "secret": …}         first frame, unless the handshake sent X-LMBridge-Secret
+#                     {"type": "ready", "jobs": n}         grant n more job slots (job credit)
+#                     {"type": "push", "job_id": …, …}      same fields as /api/v1/userscript/push
+#   server -> client  {"type": "job", "job_id": …, "payload": …, "credit": n}   dispatch; n = line credit
+#                     {"type": "credit", "job_id": …, "lines": n}              n more lines may be sent
+#                     {"type": "cancel", "job_id": …}                          consumer went away; stop the job
+# Jobs are only dispatched while the client has job credit, and a job may only have `credit` lines in flight; the
+# server returns line credit once the lines are in the job's channel, so a slow consumer throttles its own job
+# without stalling the other jobs multiplexed on the socket. A finished or cancelled job returns its job slot.
+# A client that pushes more lines than its credit (or floods a job with frames) gets that job failed and cancelled.
+# Frames without lines (status/headers/done) a job's inbox holds on top of its line window.
+_USERSCRIPT_WS_CONTROL_FRAMES = 16
+_USERSCRIPT_WS_STATS = {
+    "connections": 0,
+    "active": 0,
+    "jobs": 0,
+    "frames": 0,
+    "lines": 0,
+    "cancels": 0,
+    "requeued": 0,
+    "failed_on_disconnect": 0,
+    "credit_violations": 0,
+}
+
+
+def _get_userscript_ws_settings(config: Optional[dict] = None) -> tuple[int, int]:
+    cfg = config or get_config_view()
+    try:
+        line_window = int(cfg.get("userscript_proxy_ws_line_window", 256))
+    except Exception:
+        line_window = 256
+    try:
+        max_jobs = int(cfg.get("userscript_proxy_ws_max_jobs", 8))
+    except Exception:
+        max_jobs = 8
+    return max(1, min(line_window, 100_000)), max(1, min(max_jobs, 64))
+
+
+def get_userscript_ws_stats() -> dict:
+    return dict(_USERSCRIPT_WS_STATS)
+
+
+class UserscriptProxySocket:
+    """One connected userscript proxy: dispatches queued jobs and feeds pushed lines into their channels."""
+
+    __slots__ = ("websocket", "line_window", "max_jobs", "job_credit", "tick_seconds", "_jobs", "_credit", "_send_lock")
+
+    def __init__(self, websocket, config: Optional[dict] = None, tick_seconds: float = 5.0):
+        self.websocket = websocket
+        self.line_window, self.max_jobs = _get_userscript_ws_settings(config)
+        self.job_credit = 0
+        # Dispatch waits are bounded so the proxy keeps looking "active" and abandoned jobs get cancelled.
+        self.tick_seconds = float(tick_seconds)
+        # job_id -> [inbox of pushes, worker applying them in order, lines the client may still send]
+        self._jobs: dict[str, list] = {}
+        self._credit = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(message))
+
+    async def run(self) -> None:
+        _USERSCRIPT_WS_STATS["connections"] += 1
+        _USERSCRIPT_WS_STATS["active"] += 1
+        _touch_userscript_poll()
+        dispatcher = asyncio.create_task(self._dispatch_loop())
+        try:
+            receiver = asyncio.create_task(self._receive_loop())
+            done, _ = await asyncio.wait({dispatcher, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            for task in (dispatcher, receiver):
+                if task not in done:
+                    task.cancel()
+            await asyncio.gather(dispatcher, receiver, return_exceptions=True)
+        finally:
+            if not dispatcher.done():
+                dispatcher.cancel()
+            _USERSCRIPT_WS_STATS["active"] -= 1
+            for job_id in list(self._jobs):
+                job = _USERSCRIPT_PROXY_JOBS.get(job_id)
+                if isinstance(job, dict) and not job.get("done"):
+                    _USERSCRIPT_WS_STATS["failed_on_disconnect"] += 1
+                    await _apply_userscript_proxy_push(job, {"error": "userscript proxy disconnected", "done": True})
+                self._finish_job(job_id, cancel_worker=True)
+
+    def _finish_job(self, job_id: str, cancel_worker: bool = False) -> None:
+        entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            return
+        if cancel_worker and entry[1] is not asyncio.current_task():
+            entry[1].cancel()
+        self.job_credit = min(self.max_jobs, self.job_credit + 1)
+        self._credit.set()
+
+    async def _cancel_job(self, job_id: str) -> None:
+        _USERSCRIPT_WS_STATS["cancels"] += 1
+        self._finish_job(job_id, cancel_worker=True)
+        await self.send({"type": "cancel", "job_id": job_id})
+
+    async def _reject_job(self, job_id: str, reason: str) -> None:
+        """Fail and cancel a job whose client broke the flow-control contract."""
+        _USERSCRIPT_WS_STATS["credit_violations"] += 1
+        debug_print(f"⚠️ Userscript proxy job {job_id[:8]}: {reason}")
+        self._finish_job(job_id, cancel_worker=True)
+        job = _USERSCRIPT_PROXY_JOBS.get(job_id)
+        if isinstance(job, dict) and not job.get("done"):
+            # No lines, so this only records the error and closes the channel; it never waits on the consumer.
+            await _apply_userscript_proxy_push(job, {"error": f"userscript proxy {reason}", "done": True})
+        _USERSCRIPT_WS_STATS["cancels"] += 1
+        await self.send({"type": "cancel", "job_id": job_id})
+
+    async def _cancel_abandoned_jobs(self) -> None:
+        for job_id in list(self._jobs):
+            job = _USERSCRIPT_PROXY_JOBS.get(job_id)
+            if not isinstance(job, dict):
+                await self._cancel_job(job_id)
+                continue
+            channel = job.get("lines_queue")
+            if not job.get("done") and isinstance(channel, StreamLineChannel) and channel.closed:
+                await self._cancel_job(job_id)
+
+    async def _dispatch_loop(self) -> None:
+        queue = _get_userscript_proxy_queue()
+        while True:
+            _touch_userscript_poll()
+            await self._cancel_abandoned_jobs()
+            if self.job_credit <= 0:
+                self._credit.clear()
+                try:
+                    await asyncio.wait_for(self._credit.wait(), timeout=self.tick_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                job_id = await asyncio.wait_for(queue.get(), timeout=self.tick_seconds)
+            except asyncio.TimeoutError:
+                continue
+            job_id = str(job_id)
+            job = _USERSCRIPT_PROXY_JOBS.get(job_id)
+            if not isinstance(job, dict):
+                continue
+            try:
+                await self.send(
+                    {"type": "job", "job_id": job_id, "payload": job.get("payload") or {}, "credit": self.line_window}
+                )
+            except BaseException:
+                # The socket died while dispatching: leave the job for the next poller or connection.
+                _USERSCRIPT_WS_STATS["requeued"] += 1
+                queue.put_nowait(job_id)
+                raise
+            picked = job.get("picked_up_event")
+            if isinstance(picked, asyncio.Event) and not picked.is_set():
+                picked.set()
+            _USERSCRIPT_WS_STATS["jobs"] += 1
+            self.job_credit -= 1
+            inbox: asyncio.Queue = asyncio.Queue(maxsize=self.line_window + _USERSCRIPT_WS_CONTROL_FRAMES)
+            self._jobs[job_id] = [inbox, asyncio.create_task(self._job_worker(job_id, job, inbox)), self.line_window]
+
+    async def _receive_loop(self) -> None:
+        while True:
+            try:
+                text = await self.websocket.receive_text()
+            except WebSocketDisconnect:
+                return
+            _USERSCRIPT_WS_STATS["frames"] += 1
+            _touch_userscript_poll()
+            try:
+                message = json.loads(text)
+            except Exception:
+                debug_print(f"⚠️ Userscript proxy socket sent invalid JSON: {str(text)[:100]}")
+                continue
+            if not isinstance(message, dict):
+                continue
+            kind = message.get("type")
+            if kind == "ready":
+                try:
+                    grant = int(message.get("jobs", 1))
+                except Exception:
+                    grant = 1
+                self.job_credit = max(0, min(self.max_jobs, self.job_credit + grant))
+                if self.job_credit > 0:
+                    self._credit.set()
+            elif kind == "push":
+                job_id = str(message.get("job_id") or "").strip()
+                entry = self._jobs.get(job_id)
+                if entry is None:
+                    # Unknown, finished or cancelled job: tell the client to drop it.
+                    await self.send({"type": "cancel", "job_id": job_id})
+                    continue
+                lines = message.get("lines")
+                line_count = len(lines) if isinstance(lines, list) else 0
+                if line_count > entry[2]:
+                    await self._reject_job(job_id, f"sent {line_count} lines with {entry[2]} line credit left")
+                    continue
+                try:
+                    entry[0].put_nowait(message)
+                except asyncio.QueueFull:
+                    await self._reject_job(job_id, "flooded the job with frames")
+                    continue
+                entry[2] -= line_count
+
+    async def _job_worker(self, job_id: str, job: dict, inbox: asyncio.Queue) -> None:
+        while True:
+            data = await inbox.get()
+            lines = data.get("lines")
+            line_count = len(lines) if isinstance(lines, list) else 0
+            _USERSCRIPT_WS_STATS["lines"] += line_count
+            accepted = await _apply_userscript_proxy_push(job, data)
+            if bool(data.get("done")):
+                self._finish_job(job_id)
+                return
+            if not accepted:
+                await self._cancel_job(job_id)
+                return
+            if line_count:
+                entry = self._jobs.get(job_id)
+                if entry is not None:
+                    entry[2] += line_count
+                await self.send({"type": "credit", "job_id": job_id, "lines": line_count})
+
+
+# How long a socket that did not authenticate in its handshake has to send its `auth` frame.
+_USERSCRIPT_WS_AUTH_TIMEOUT_SECONDS = 10.0
+
+
+async def _userscript_ws_authenticate(websocket, config: Optional[dict] = None) -> bool:
+    """
+    Check the secret of an accepted socket: the `X-LMBridge-Secret` handshake header if present, otherwise a
+    `{"type": "auth", "secret": …}` first frame. Browsers cannot set headers on WebSocket handshakes, and a
+    `?secret=` query string would end up in the access log, so browser clients use the frame.
+    """
+    header = websocket.headers.get("X-LMBridge-Secret")
+    if header is not None or _userscript_proxy_secret_ok(None, config):
+        return _userscript_proxy_secret_ok(header, config)
+    try:
+        text = await asyncio.wait_for(websocket.receive_text(), timeout=_USERSCRIPT_WS_AUTH_TIMEOUT_SECONDS)
+        message = json.loads(text)
+    except (asyncio.TimeoutError, WebSocketDisconnect, ValueError):
+        return False
+    if not isinstance(message, dict) or message.get("type") != "auth":
+        return False
+    return _userscript_proxy_secret_ok(message.get("secret"), config)
+
+
+@app.websocket("/api/v1/userscript/ws")
+async def userscript_ws(websocket: WebSocket):
+    """Persistent job channel for external userscript proxies (see `UserscriptProxySocket` for the protocol)."""
+    cfg = get_config_view()
+    await websocket.accept()
+    if not await _userscript_ws_authenticate(websocket, cfg):
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+        return
+    try:
+        await UserscriptProxySocket(websocket, cfg).run()
+    except Exception as e:
+        debug_print(f"⚠️ Userscript proxy socket closed: {type(e).__name__}: {e}")
 
 async def push_proxy_chunk(jid, d) -> None:
     _touch_userscript_poll()
@@ -5165,7 +8639,8 @@ async def push_proxy_chunk(jid, d) -> None:
             part = str(part).strip()
             if not part:
                 continue
-            await job["lines_queue"].put(part)
+            if await job["lines_queue"].put(part) is False:
+                break
 
         if bool(d.get("done")):
             # Flush any remaining partial line.
@@ -5174,22 +8649,103 @@ async def push_proxy_chunk(jid, d) -> None:
                 await job["lines_queue"].put(remainder)
             job["_proxy_buffer"] = ""
 
-            job["done"] = True
-            done_event = job.get("done_event")
-            if isinstance(done_event, asyncio.Event):
-                done_event.set()
-            status_event = job.get("status_event")
-            if isinstance(status_event, asyncio.Event):
-                status_event.set()
-            await job["lines_queue"].put(None)
-            debug_print(f"🦊 Camoufox proxy job {job_id[:8]} done")
+            job["done"] = True
+            done_event = job.get("done_event")
+            if isinstance(done_event, asyncio.Event):
+                done_event.set()
+            status_event = job.get("status_event")
+            if isinstance(status_event, asyncio.Event):
+                status_event.set()
+            await job["lines_queue"].put(None)
+            debug_print(f"🦊 Camoufox proxy job {job_id[:8]} done")
+
+
+class CamoufoxProxyTab:
+    """One tab of the internal Camoufox proxy; runs at most one userscript-proxy job at a time."""
+
+    __slots__ = ("index", "page", "jobs", "failures", "consecutive_failures", "reopens", "broken", "busy")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.page = None
+        self.jobs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.reopens = 0
+        self.broken = False
+        self.busy = False
+
+    def is_healthy(self) -> bool:
+        if self.page is None or self.broken:
+            return False
+        if self.consecutive_failures >= _CAMOUFOX_PROXY_TAB_MAX_CONSECUTIVE_FAILURES:
+            return False
+        try:
+            closed = self.page.is_closed()
+        except Exception:
+            return False
+        return closed is not True
+
+
+_CAMOUFOX_PROXY_TABS: list[CamoufoxProxyTab] = []
+_CAMOUFOX_PROXY_TAB_MAX_CONSECUTIVE_FAILURES = 3
+
+
+def _get_camoufox_proxy_tab_count(config: Optional[dict] = None) -> int:
+    cfg = config or get_config_view()
+    try:
+        count = int(cfg.get("camoufox_proxy_tabs", 2))
+    except Exception:
+        count = 2
+    return max(1, min(count, 8))
+
+
+def get_camoufox_proxy_stats() -> dict:
+    tabs = list(_CAMOUFOX_PROXY_TABS)
+    return {
+        "tabs": len(tabs),
+        "busy": sum(1 for t in tabs if t.busy),
+        "healthy": sum(1 for t in tabs if t.is_healthy()),
+        "jobs": sum(t.jobs for t in tabs),
+        "failures": sum(t.failures for t in tabs),
+        "reopens": sum(t.reopens for t in tabs),
+    }
+
+
+async def _run_camoufox_proxy_job(
+    tab: CamoufoxProxyTab,
+    job_id: str,
+    script: str,
+    script_args: dict,
+    idle_tabs: asyncio.Queue,
+) -> None:
+    """Run one proxy job's in-page fetch on `tab`, then hand the tab back to the worker."""
+    tab.busy = True
+    try:
+        await asyncio.wait_for(tab.page.evaluate(script, script_args), timeout=200.0)
+        tab.consecutive_failures = 0
+    except asyncio.TimeoutError:
+        # The in-page fetch may still be running; reopen the tab rather than stacking jobs on it.
+        tab.failures += 1
+        tab.broken = True
+        await push_proxy_chunk(job_id, {"error": "camoufox proxy evaluate timeout", "done": True})
+    except Exception as e:
+        tab.failures += 1
+        tab.consecutive_failures += 1
+        await push_proxy_chunk(job_id, {"error": str(e), "done": True})
+    finally:
+        tab.jobs += 1
+        tab.busy = False
+        idle_tabs.put_nowait(tab)
 
 
 async def camoufox_proxy_worker():
     """
     Internal Userscript-Proxy client backed by Camoufox.
-    Maintains a SINGLE persistent browser instance to avoid crash loops and resource exhaustion.
+    Maintains a SINGLE persistent browser instance to avoid crash loops and resource exhaustion, with a
+    configurable number of tabs (`camoufox_proxy_tabs`) that each run one job concurrently.
     """
+    global _CAMOUFOX_PROXY_TABS
     # Mark the proxy as alive immediately
     _touch_userscript_poll()
     debug_print("🦊 Camoufox proxy worker started (Singleton Mode).")
@@ -5197,7 +8753,11 @@ async def camoufox_proxy_worker():
     browser_cm = None
     browser = None
     context = None
-    page = None
+    tabs: list[CamoufoxProxyTab] = []
+    idle_tabs: asyncio.Queue = asyncio.Queue()
+    running_jobs: set[asyncio.Task] = set()
+    launch_cfg: dict = {}
+    launch_headless = False
 
     proxy_recaptcha_sitekey = RECAPTCHA_SITEKEY
     proxy_recaptcha_action = RECAPTCHA_ACTION
@@ -5205,20 +8765,91 @@ async def camoufox_proxy_worker():
     
     queue = _get_userscript_proxy_queue()
 
+    async def _open_proxy_tab(tab: CamoufoxProxyTab) -> None:
+        old_page = tab.page
+        tab.page = None
+        tab.broken = False
+        tab.consecutive_failures = 0
+        if old_page is not None:
+            tab.reopens += 1
+            try:
+                await old_page.close()
+            except Exception:
+                pass
+
+        page = await context.new_page()
+        await _maybe_apply_camoufox_window_mode(
+            page,
+            launch_cfg,
+            mode_key="camoufox_proxy_window_mode",
+            marker="LMArenaBridge Camoufox Proxy",
+            headless=launch_headless,
+        )
+
+        try:
+            debug_print(f"🦊 Camoufox proxy: tab {tab.index} navigating to https://lmarena.ai/?mode=direct ...")
+            await page.goto("https://lmarena.ai/?mode=direct", wait_until="domcontentloaded", timeout=120000)
+            debug_print(f"🦊 Camoufox proxy: tab {tab.index} navigation complete.")
+        except Exception as e:
+            debug_print(f"⚠️ Navigation warning: {e}")
+
+        # Attach console listener
+        def _on_console(message) -> None:
+            try:
+                attr = getattr(message, "text", None)
+                text = attr() if callable(attr) else attr
+            except Exception:
+                return
+            if not isinstance(text, str):
+                return
+            if not text.startswith("LM_BRIDGE_PROXY|"):
+                return
+            try:
+                _, jid, payload_json = text.split("|", 2)
+            except ValueError:
+                return
+            try:
+                payload = json.loads(payload_json)
+            except Exception:
+                payload = {"error": "proxy console payload decode error", "done": True}
+            try:
+                asyncio.create_task(push_proxy_chunk(str(jid), payload))
+            except Exception:
+                return
+
+        try:
+            page.on("console", _on_console)
+        except Exception:
+            pass
+
+        # Check for "Just a moment" (Cloudflare) and click if needed
+        try:
+            title = await page.title()
+            if "Just a moment" in title:
+                debug_print("🦊 Cloudflare challenge detected.")
+                await click_turnstile(page)
+                await asyncio.sleep(2)
+        except Exception:
+            pass
+
+        # Pre-warm
+        try:
+            await page.mouse.move(100, 100)
+        except Exception:
+            pass
+        tab.page = page
+
     while True:
         try:
             _touch_userscript_poll()
             
             # --- 1. HEALTH CHECK & LAUNCH ---
             needs_launch = False
-            if browser is None or context is None or page is None:
+            if browser is None or context is None or not tabs:
                 needs_launch = True
             else:
                 try:
-                    if page.is_closed():
-                        debug_print("⚠️ Camoufox proxy page closed. Relaunching...")
-                        needs_launch = True
-                    elif not context.pages:
+                    if not context.pages:
                         debug_print("⚠️ Camoufox proxy context has no pages. Relaunching...")
                         needs_launch = True
                 except Exception:
@@ -5234,7 +8865,8 @@ async def camoufox_proxy_worker():
                 browser_cm = None
                 browser = None
                 context = None
-                page = None
+                tabs = []
+                _CAMOUFOX_PROXY_TABS = []
 
                 cfg = get_config()
                 recaptcha_sitekey, recaptcha_action = get_recaptcha_settings(cfg)
@@ -5244,6 +8876,8 @@ async def camoufox_proxy_worker():
                 
                 headless_value = cfg.get("camoufox_proxy_headless", None)
                 headless = bool(headless_value) if headless_value is not None else False
+                launch_cfg = cfg
+                launch_headless = headless
                 launch_timeout = float(cfg.get("camoufox_proxy_launch_timeout_seconds", 90))
                 launch_timeout = max(20.0, min(launch_timeout, 300.0))
 
@@ -5427,66 +9061,15 @@ async def camoufox_proxy_worker():
                 except Exception:
                     pass
 
-                page = await context.new_page()
-                await _maybe_apply_camoufox_window_mode(
-                    page,
-                    cfg,
-                    mode_key="camoufox_proxy_window_mode",
-                    marker="LMArenaBridge Camoufox Proxy",
-                    headless=headless,
-                )
-
-                try:
-                    debug_print("🦊 Camoufox proxy: navigating to https://lmarena.ai/?mode=direct ...")
-                    await page.goto("https://lmarena.ai/?mode=direct", wait_until="domcontentloaded", timeout=120000)
-                    debug_print("🦊 Camoufox proxy: navigation complete.")
-                except Exception as e:
-                    debug_print(f"⚠️ Navigation warning: {e}")
-
-                # Attach console listener
-                def _on_console(message) -> None:
-                    try:
-                        attr = getattr(message, "text", None)
-                        text = attr() if callable(attr) else attr
-                    except Exception:
-                        return
-                    if not isinstance(text, str):
-                        return
-                    if not text.startswith("LM_BRIDGE_PROXY|"):
-                        return
-                    try:
-                        _, jid, payload_json = text.split("|", 2)
-                    except ValueError:
-                        return
-                    try:
-                        payload = json.loads(payload_json)
-                    except Exception:
-                        payload = {"error": "proxy console payload decode error", "done": True}
-                    try:
-                        asyncio.create_task(push_proxy_chunk(str(jid), payload))
-                    except Exception:
-                        return
-                
-                try:
-                    page.on("console", _on_console)
-                except Exception:
-                    pass
-                
-                # Check for "Just a moment" (Cloudflare) and click if needed
-                try:
-                    title = await page.title()
-                    if "Just a moment" in title:
-                        debug_print("🦊 Cloudflare challenge detected.")
-                        await click_turnstile(page)
-                        await asyncio.sleep(2)
-                except Exception:
-                    pass
-
-                # Pre-warm
-                try:
-                    await page.mouse.move(100, 100)
-                except Exception:
-                    pass
+                # Each relaunch gets a fresh idle queue; jobs still running on the old browser hand their
+                # tabs back to the old queue, which is simply dropped.
+                tabs = [CamoufoxProxyTab(i) for i in range(_get_camoufox_proxy_tab_count(cfg))]
+                idle_tabs = asyncio.Queue()
+                for tab in tabs:
+                    idle_tabs.put_nowait(tab)
+                _CAMOUFOX_PROXY_TABS = tabs
+                # Open the first tab eagerly so the browser session (cookies, anonymous sign-up) warms up at launch.
+                await _open_proxy_tab(tabs[0])
 
             async def _get_auth_cookie_value() -> str:
                 nonlocal context
@@ -5520,8 +9103,8 @@ async def camoufox_proxy_worker():
                     return candidates[0]
                 return ""
 
-            async def _attempt_anonymous_signup(*, min_interval_seconds: float = 20.0) -> None:
-                nonlocal last_signup_attempt_at, page, context
+            async def _attempt_anonymous_signup(page, *, min_interval_seconds: float = 20.0) -> None:
+                nonlocal last_signup_attempt_at
                 if page is None or context is None:
                     return
                 now = time.time()
@@ -5841,15 +9424,35 @@ async def camoufox_proxy_worker():
                     pass
 
             # --- 2. PROCESS JOBS ---
+            # Only take a job once a tab is free, so queued jobs stay queued (and pickup timeouts stay meaningful).
+            try:
+                tab = await asyncio.wait_for(idle_tabs.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
             try:
                 job_id = await asyncio.wait_for(queue.get(), timeout=1.0)
             except asyncio.TimeoutError:
+                idle_tabs.put_nowait(tab)
                 continue
             
             job_id = str(job_id or "").strip()
             job = _USERSCRIPT_PROXY_JOBS.get(job_id)
             if not isinstance(job, dict):
+                idle_tabs.put_nowait(tab)
                 continue
+
+            if not tab.is_healthy():
+                try:
+                    if tab.page is not None:
+                        debug_print(f"⚠️ Camoufox proxy tab {tab.index} unhealthy. Reopening...")
+                    await _open_proxy_tab(tab)
+                except Exception as e:
+                    debug_print(f"⚠️ Camoufox proxy: failed to open tab {tab.index}: {e}")
+                    tab.failures += 1
+                    tab.broken = True
+                    idle_tabs.put_nowait(tab)
+                    await queue.put(job_id)
+                    raise
             
             # Signal that a proxy worker picked up this job (used to avoid long hangs when no worker is running).
             try:
@@ -6143,33 +9746,35 @@ async def camoufox_proxy_worker():
                 needs_signup = not bool(current_cookie)
             # Unit tests stub out the browser; avoid slow/interactive signup flows there.
             if needs_signup and not os.environ.get("PYTEST_CURRENT_TEST"):
-                await _attempt_anonymous_signup(min_interval_seconds=20.0)
+                await _attempt_anonymous_signup(tab.page, min_interval_seconds=20.0)
             
-            try:
-                await asyncio.wait_for(
-                    page.evaluate(
-                        fetch_script,
-                        {
-                            "jid": job_id,
-                            "payload": job.get("payload") or {},
-                            "sitekey": proxy_recaptcha_sitekey,
-                            "action": proxy_recaptcha_action,
-                            "sitekeyV2": RECAPTCHA_V2_SITEKEY,
-                            "grecaptchaTimeoutMs": 60000,
-                            "grecaptchaPollMs": 250,
-                            "timeoutMs": 180000,
-                            "debug": bool(os.environ.get("LM_BRIDGE_PROXY_DEBUG")),
-                        }
-                    ),
-                    timeout=200.0
+            # Run the in-page fetch in the background; the loop goes straight back to feeding other tabs.
+            job_task = asyncio.create_task(
+                _run_camoufox_proxy_job(
+                    tab,
+                    job_id,
+                    fetch_script,
+                    {
+                        "jid": job_id,
+                        "payload": job.get("payload") or {},
+                        "sitekey": proxy_recaptcha_sitekey,
+                        "action": proxy_recaptcha_action,
+                        "sitekeyV2": RECAPTCHA_V2_SITEKEY,
+                        "grecaptchaTimeoutMs": 60000,
+                        "grecaptchaPollMs": 250,
+                        "timeoutMs": 180000,
+                        "debug": bool(os.environ.get("LM_BRIDGE_PROXY_DEBUG")),
+                    },
+                    idle_tabs,
                 )
-            except asyncio.TimeoutError:
-                await push_proxy_chunk(job_id, {"error": "camoufox proxy evaluate timeout", "done": True})
-            except Exception as e:
-                await push_proxy_chunk(job_id, {"error": str(e), "done": True})
+            )
+            running_jobs.add(job_task)
+            job_task.add_done_callback(running_jobs.discard)
 
         except asyncio.CancelledError:
             debug_print("🦊 Camoufox proxy worker cancelled.")
+            for job_task in list(running_jobs):
+                job_task.cancel()
             if browser_cm:
                 try:
                     await browser_cm.__aexit__(None, None, None)
@@ -6181,7 +9786,7 @@ async def camoufox_proxy_worker():
             await asyncio.sleep(5.0)
             # Mark for relaunch
             browser = None
-            page = None
+            tabs = []
 
 # --- OpenAI Compatible API Endpoints ---
 
@@ -6190,7 +9795,7 @@ async def health_check():
     """Health check endpoint for monitoring"""
     try:
         models = get_models()
-        config = get_config()
+        config = get_config_view()
         
         # Basic health checks
         has_cf_clearance = bool(config.get("cf_clearance"))
@@ -6207,7 +9812,19 @@ async def health_check():
                 "models_loaded": has_models,
                 "model_count": len(models),
                 "api_keys_configured": has_api_keys
-            }
+            },
+            "upstream_http_pool": get_upstream_http_pool_stats(),
+            "chrome_page_pool": get_chrome_page_pool_stats(),
+            "camoufox_proxy": get_camoufox_proxy_stats(),
+            "recaptcha_reservoir": get_recaptcha_reservoir_stats(),
+            "single_flight": get_single_flight_stats(),
+            "auth_token_scheduler": get_auth_token_scheduler_stats(),
+            "arena_auth_refresh": get_arena_auth_refresh_stats(),
+            "upstream_admission": get_upstream_admission_stats(),
+            "upstream_backoff": get_upstream_backoff_stats(),
+            "stream_channels": get_stream_channel_stats(),
+            "stream_keepalive": get_keepalive_ticker_stats(),
+            "userscript_ws": get_userscript_ws_stats(),
         }
     except Exception as e:
         return {
@@ -6217,33 +9834,20 @@ async def health_check():
         }
 
 @app.get("/api/v1/models")
-async def list_models(api_key: dict = Depends(rate_limit_api_key)):
+async def list_models(request: Request, api_key: dict = Depends(rate_limit_api_key)):
     try:
-        models = get_models()
-        
-        # Filter for models with text OR search OR image output capability and an organization (exclude stealth models)
+        # Models with text OR search OR image output capability and an organization (stealth models excluded).
         # Always include image models - no special key needed
-        valid_models = [m for m in models 
-                       if (m.get('capabilities', {}).get('outputCapabilities', {}).get('text')
-                           or m.get('capabilities', {}).get('outputCapabilities', {}).get('search')
-                           or m.get('capabilities', {}).get('outputCapabilities', {}).get('image'))
-                       and m.get('organization')]
-        
-        return {
-            "object": "list",
-            "data": [
-                {
-                    "id": model.get("publicName"),
-                    "object": "model",
-                    "created": int(time.time()),
-                    "owned_by": model.get("organization", "lmarena")
-                } for model in valid_models if model.get("publicName")
-            ]
-        }
+        body, etag = get_models_response()
     except Exception as e:
         debug_print(f"❌ Error listing models: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to load models: {str(e)}")
 
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 @app.get("/api/v1/_debug/stream")
 async def debug_stream(api_key: dict = Depends(rate_limit_api_key)):  # noqa: ARG001
@@ -6301,8 +9905,8 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
 
         # Find model ID from public name
         try:
-            models = get_models()
-            debug_print(f"📚 Total models loaded: {len(models)}")
+            model_registry = get_model_registry()
+            debug_print(f"📚 Total models loaded: {len(model_registry)}")
         except Exception as e:
             debug_print(f"❌ Failed to load models: {e}")
             raise HTTPException(
@@ -6313,13 +9917,14 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
         model_id = None
         model_org = None
         model_capabilities = {}
+        modality = "chat"
         
-        for m in models:
-            if m.get("publicName") == model_public_name:
-                model_id = m.get("id")
-                model_org = m.get("organization")
-                model_capabilities = m.get("capabilities", {})
-                break
+        model_info = model_registry.get(model_public_name)
+        if model_info is not None:
+            model_id = model_info.id
+            model_org = model_info.organization
+            model_capabilities = model_info.capabilities
+            modality = model_info.modality
         
         if not model_id:
             debug_print(f"❌ Model '{model_public_name}' not found in model list")
@@ -6339,23 +9944,12 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
         debug_print(f"✅ Found model ID: {model_id}")
         debug_print(f"🔧 Model capabilities: {model_capabilities}")
         
-        # Determine modality based on model capabilities.
-        # Priority: image > search > chat
-        if model_capabilities.get("outputCapabilities", {}).get("image"):
-            modality = "image"
-        elif model_capabilities.get("outputCapabilities", {}).get("search"):
-            modality = "search"
-        else:
-            modality = "chat"
+        # Modality is precomputed by the registry (priority: image > search > chat).
         debug_print(f"🔍 Model modality: {modality}")
 
         # Log usage
         try:
-            model_usage_stats[model_public_name] += 1
-            # Save stats immediately after incrementing
-            config = get_config()
-            config["usage_stats"] = dict(model_usage_stats)
-            save_config(config)
+            record_model_usage(model_public_name)
         except Exception as e:
             # Don't fail the request if usage logging fails
             debug_print(f"⚠️  Failed to log usage stats: {e}")
@@ -6444,7 +10038,6 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
         # -----------------------------------------------
         
         # Generate conversation ID from context (API key + model + first user message)
-        import hashlib
         first_user_message = next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
         if isinstance(first_user_message, list):
             # Handle array content format
@@ -6559,10 +10152,13 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
         request_id = str(uuid.uuid4())
         failed_tokens = set()
         
-        # Get initial auth token using round-robin (excluding any failed ones)
-        current_token = ""
+        # Follow-ups/retries stay on the account that created the LMArena session; otherwise use the scheduler.
+        current_token = get_conversation_token(session["conversation_id"]) if session else ""
+        if current_token:
+            debug_print(f"📌 Reusing conversation token: {current_token[:20]}...")
         try:
-            current_token = get_next_auth_token(exclude_tokens=failed_tokens)
+            if not current_token:
+                current_token = get_next_auth_token(exclude_tokens=failed_tokens)
         except HTTPException:
             # For strict models we can still proceed via browser fetch transports, which may have a valid
             # arena-auth cookie already stored in the persistent profile. For non-strict models we need a token.
@@ -6576,7 +10172,7 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
         # available, switch to the first plausible token without mutating user config.
         if strict_chrome_fetch_model and current_token and not is_probably_valid_arena_auth_token(current_token):
             try:
-                cfg_now = get_config()
+                cfg_now = get_config_view()
                 tokens_now = cfg_now.get("auth_tokens", [])
                 if not isinstance(tokens_now, list):
                     tokens_now = []
@@ -6613,81 +10209,106 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
             debug_print("🔑 No auth token configured (will rely on browser session cookies).")
         
         # Retry logic wrapper
+        # Streamed httpx responses returned by `make_request_with_retry`; closed once the body has been consumed.
+        upstream_responses = AsyncExitStack()
+
         async def make_request_with_retry(url, payload, http_method, max_retries=3):
-            """Make request with automatic retry on 429/401 errors"""
+            """
+            Make request with automatic retry on 429/401 errors.
+
+            The body is streamed: error responses are read in full (they are small and needed for error details),
+            successful ones are returned unread and stay open until `upstream_responses` is closed.
+            """
             nonlocal current_token, headers, failed_tokens, recaptcha_token
             
             for attempt in range(max_retries):
+                response_cm = None
                 try:
-                    async with httpx.AsyncClient() as client:
-                        if http_method == "PUT":
-                            response = await client.put(url, json=payload, headers=headers, timeout=120)
-                        else:
-                            response = await client.post(url, json=payload, headers=headers, timeout=120)
-                        
-                        # Log status with human-readable message
-                        log_http_status(response.status_code, "LMArena API")
-                        
-                        # Check for retry-able errors
-                        if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
-                            debug_print(f"⏱️  Attempt {attempt + 1}/{max_retries} - Rate limit with token {current_token[:20]}...")
-                            retry_after = response.headers.get("Retry-After")
-                            sleep_seconds = get_rate_limit_sleep_seconds(retry_after, attempt)
-                            debug_print(f"  Retry-After header: {retry_after!r}")
-                            
-                            if attempt < max_retries - 1:
-                                try:
-                                    # Try with next token (excluding failed ones)
-                                    current_token = get_next_auth_token(exclude_tokens=failed_tokens)
-                                    headers = get_request_headers_with_token(current_token, recaptcha_token)
-                                    debug_print(f"🔄 Retrying with next token: {current_token[:20]}...")
-                                    await asyncio.sleep(sleep_seconds)
-                                    continue
-                                except HTTPException as e:
-                                    debug_print(f"❌ No more tokens available: {e.detail}")
-                                    break
+                    routed_token, backoff_wait = route_around_upstream_backoff(current_token, url, failed_tokens)
+                    if routed_token != current_token:
+                        debug_print(f"🔀 Token cooling down for this endpoint; using {routed_token[:20]}...")
+                        current_token = routed_token
+                        headers = get_request_headers_with_token(current_token, recaptcha_token)
+                    if backoff_wait > 0:
+                        debug_print(f"⏳ Waiting {backoff_wait:.1f}s for a shared upstream cooldown...")
+                        await asyncio.sleep(backoff_wait)
+                    client = get_upstream_http_client()
+                    async with AuthTokenLease(None, current_token):
+                        response_cm = client.stream(
+                            "PUT" if http_method == "PUT" else "POST", url, json=payload, headers=headers
+                        )
+                        response = await response_cm.__aenter__()
+                    if response.status_code >= 400:
+                        await response.aread()
+                    
+                    # Log status with human-readable message
+                    log_http_status(response.status_code, "LMArena API")
+                    record_auth_token_result(
+                        current_token, response.status_code, response.headers.get("Retry-After"), url
+                    )
+                    
+                    # Check for retry-able errors
+                    if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+                        debug_print(f"⏱️  Attempt {attempt + 1}/{max_retries} - Rate limit with token {current_token[:20]}...")
+                        retry_after = response.headers.get("Retry-After")
+                        sleep_seconds = get_rate_limit_sleep_seconds(retry_after, attempt)
+                        debug_print(f"  Retry-After header: {retry_after!r}")
                         
-                        elif response.status_code == HTTPStatus.FORBIDDEN:
+                        if attempt < max_retries - 1:
                             try:
-                                error_body = response.json()
-                            except Exception:
-                                error_body = None
-                            if isinstance(error_body, dict) and error_body.get("error") == "recaptcha validation failed":
-                                debug_print(
-                                    f"🤖 Attempt {attempt + 1}/{max_retries} - reCAPTCHA validation failed. Refreshing token..."
-                                )
-                                new_token = await refresh_recaptcha_token(force_new=True)
-                                if new_token and isinstance(payload, dict):
-                                    payload["recaptchaV3Token"] = new_token
-                                    recaptcha_token = new_token
-                                if attempt < max_retries - 1:
-                                    headers = get_request_headers_with_token(current_token, recaptcha_token)
-                                    await asyncio.sleep(1)
-                                    continue
-
-                        elif response.status_code == HTTPStatus.UNAUTHORIZED:
-                            debug_print(f"🔒 Attempt {attempt + 1}/{max_retries} - Auth failed with token {current_token[:20]}...")
-                            # Add current token to failed set
-                            failed_tokens.add(current_token)
-                            # (Pruning disabled)
-                            debug_print(f"📝 Failed tokens so far: {len(failed_tokens)}")
-                            
+                                # Try with next token (excluding failed ones)
+                                current_token = get_next_auth_token(exclude_tokens=failed_tokens)
+                                headers = get_request_headers_with_token(current_token, recaptcha_token)
+                                debug_print(f"🔄 Retrying with next token: {current_token[:20]}...")
+                                await asyncio.sleep(sleep_seconds)
+                                continue
+                            except HTTPException as e:
+                                debug_print(f"❌ No more tokens available: {e.detail}")
+                                break
+                    
+                    elif response.status_code == HTTPStatus.FORBIDDEN:
+                        try:
+                            error_body = response.json()
+                        except Exception:
+                            error_body = None
+                        if isinstance(error_body, dict) and error_body.get("error") == "recaptcha validation failed":
+                            debug_print(
+                                f"🤖 Attempt {attempt + 1}/{max_retries} - reCAPTCHA validation failed. Refreshing token..."
+                            )
+                            new_token = await refresh_recaptcha_token(force_new=True)
+                            if new_token and isinstance(payload, dict):
+                                payload["recaptchaV3Token"] = new_token
+                                recaptcha_token = new_token
                             if attempt < max_retries - 1:
-                                try:
-                                    # Try with next available token (excluding failed ones)
-                                    current_token = get_next_auth_token(exclude_tokens=failed_tokens)
-                                    headers = get_request_headers_with_token(current_token, recaptcha_token)
-                                    debug_print(f"🔄 Retrying with next token: {current_token[:20]}...")
-                                    await asyncio.sleep(1)  # Brief delay
-                                    continue
-                                except HTTPException as e:
-                                    debug_print(f"❌ No more tokens available: {e.detail}")
-                                    break
-                        
-                        # If we get here, return the response (success or non-retryable error)
-                        response.raise_for_status()
-                        return response
+                                headers = get_request_headers_with_token(current_token, recaptcha_token)
+                                await asyncio.sleep(1)
+                                continue
+
+                    elif response.status_code == HTTPStatus.UNAUTHORIZED:
+                        debug_print(f"🔒 Attempt {attempt + 1}/{max_retries} - Auth failed with token {current_token[:20]}...")
+                        # Add current token to failed set
+                        failed_tokens.add(current_token)
+                        # (Pruning disabled)
+                        debug_print(f"📝 Failed tokens so far: {len(failed_tokens)}")
                         
+                        if attempt < max_retries - 1:
+                            try:
+                                # Try with next available token (excluding failed ones)
+                                current_token = get_next_auth_token(exclude_tokens=failed_tokens)
+                                headers = get_request_headers_with_token(current_token, recaptcha_token)
+                                debug_print(f"🔄 Retrying with next token: {current_token[:20]}...")
+                                await asyncio.sleep(1)  # Brief delay
+                                continue
+                            except HTTPException as e:
+                                debug_print(f"❌ No more tokens available: {e.detail}")
+                                break
+                    
+                    # If we get here, return the response (success or non-retryable error)
+                    response.raise_for_status()
+                    upstream_responses.push_async_exit(response_cm)
+                    response_cm = None
+                    return response
+                    
                 except httpx.HTTPStatusError as e:
                     # Only handle 429 and 401, let other errors through
                     if e.response.status_code not in [429, 401]:
@@ -6695,18 +10316,33 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                     # If last attempt, raise the error
                     if attempt == max_retries - 1:
                         raise
+                finally:
+                    if response_cm is not None:
+                        try:
+                            await response_cm.__aexit__(None, None, None)
+                        except Exception:
+                            pass
             
             # Should not reach here, but just in case
             raise HTTPException(status_code=503, detail="Max retries exceeded")
         
+        # Wait for an upstream slot (fair across API keys); raises 429 with Retry-After when saturated.
+        admission = await get_upstream_admission().acquire(
+            api_key_str,
+            "browser" if use_chrome_fetch_for_model else "http",
+            api_key.get("weight", 1),
+        )
+
         # Handle streaming mode
         if stream:
+            stream_heartbeat = StreamHeartbeat(_get_stream_keepalive_interval(api_key=api_key, body=body))
+
             async def generate_stream():
                 nonlocal current_token, headers, failed_tokens, recaptcha_token
                 
                 # Safety: don't keep client sockets open forever on repeated upstream failures.
                 try:
-                    stream_total_timeout_seconds = float(get_config().get("stream_total_timeout_seconds", 600))
+                    stream_total_timeout_seconds = float(get_config_view().get("stream_total_timeout_seconds", 600))
                 except Exception:
                     stream_total_timeout_seconds = 600.0
                 stream_total_timeout_seconds = max(30.0, min(stream_total_timeout_seconds, 3600.0))
@@ -6717,20 +10353,21 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                 await asyncio.sleep(0)
                 
                 async def wait_for_task(task):
-                    while True:
-                        done, _ = await asyncio.wait({task}, timeout=1.0)
-                        if task in done:
-                            break
+                    # Keep-alives come from the shared ticker, only after the stream has been idle for its interval.
+                    while not await stream_heartbeat.wait(task):
                         yield ": keep-alive\n\n"
 
                 chunk_id = f"chatcmpl-{uuid.uuid4()}"
+                sse_encoder = SSEChunkEncoder(chunk_id, model_public_name)
+                coalesce_window, coalesce_max_bytes = _get_stream_coalesce_settings(api_key=api_key, body=body)
+                delta_coalescer = SSEDeltaCoalescer(sse_encoder, coalesce_window, coalesce_max_bytes)
                 
                 # Helper to keep connection alive during backoff
                 async def wait_with_keepalive(seconds: float):
                     end_time = time.time() + float(seconds)
                     while time.time() < end_time:
                         yield ": keep-alive\n\n"
-                        await asyncio.sleep(min(1.0, end_time - time.time()))
+                        await asyncio.sleep(min(stream_heartbeat.interval, end_time - time.time()))
 
                 # Only use browser transports (Chrome/Camoufox) proactively for models known to be strict with reCAPTCHA.
                 use_browser_transports = model_public_name in STRICT_CHROME_FETCH_MODELS
@@ -6793,741 +10430,901 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                         yield f"data: {json.dumps(error_chunk)}\n\n"
                         yield "data: [DONE]\n\n"
                         return
+
+                    # Respect cooldowns other requests already hit on this token/endpoint before spending an attempt.
+                    routed_token, backoff_wait = route_around_upstream_backoff(current_token, url, failed_tokens)
+                    if routed_token != current_token:
+                        debug_print(f"🔀 Token cooling down for this endpoint; using {routed_token[:20]}...")
+                        current_token = routed_token
+                        headers = get_request_headers_with_token(current_token, recaptcha_token)
+                    if backoff_wait > 0:
+                        remaining_budget = float(stream_total_timeout_seconds) - float(
+                            time.monotonic() - stream_started_at
+                        )
+                        backoff_wait = min(backoff_wait, max(0.0, remaining_budget))
+                        debug_print(f"⏳ Waiting {backoff_wait:.1f}s for a shared upstream cooldown...")
+                        async for ka in wait_with_keepalive(backoff_wait):
+                            yield ka
+
                     # Reset response data for each attempt
-                    response_text = ""
-                    reasoning_text = ""
-                    citations = []
+                    stream_parser = LMArenaStreamParser()
                     unhandled_preview: list[str] = []
 
                     try:
-                        async with AsyncExitStack() as stack:
-                            debug_print(f"📡 Sending {http_method} request for streaming (attempt {attempt})...")
-                            stream_context = None
-                            transport_used = "httpx"
-                            
-                            # Prefer the userscript proxy only when it is actually polling (or when a poller connects
-                            # shortly after the request starts). This avoids hanging strict-model requests when no
-                            # proxy is running, while still supporting "late" pollers (tests/reconnects).
-                            use_userscript = False
-                            cfg_now = None
+                        debug_print(f"📡 Sending {http_method} request for streaming (attempt {attempt})...")
+                        stream_context = None
+                        transport_used = "httpx"
+                        
+                        # Prefer the userscript proxy only when it is actually polling (or when a poller connects
+                        # shortly after the request starts). This avoids hanging strict-model requests when no
+                        # proxy is running, while still supporting "late" pollers (tests/reconnects).
+                        use_userscript = False
+                        cfg_now = None
+                        if (
+                            model_public_name in STRICT_CHROME_FETCH_MODELS
+                            and use_browser_transports
+                            and not disable_userscript_for_request
+                            and not disable_userscript_proxy_env
+                        ):
+                            try:
+                                cfg_now = get_config_view()
+                            except Exception:
+                                cfg_now = None
+
+                            try:
+                                proxy_active = _userscript_proxy_is_active(cfg_now)
+                            except Exception:
+                                proxy_active = False
+
+                            if not proxy_active:
+                                try:
+                                    grace_seconds = float((cfg_now or {}).get("userscript_proxy_grace_seconds", 0.5))
+                                except Exception:
+                                    grace_seconds = 0.5
+                                grace_seconds = max(0.0, min(grace_seconds, 2.0))
+                                if grace_seconds > 0:
+                                    deadline = time.time() + grace_seconds
+                                    while time.time() < deadline:
+                                        try:
+                                            if _userscript_proxy_is_active(cfg_now):
+                                                proxy_active = True
+                                                break
+                                        except Exception:
+                                            pass
+                                        yield ": keep-alive\n\n"
+                                        await asyncio.sleep(0.05)
+
+                            if proxy_active:
+                                use_userscript = True
+                                debug_print("🌐 Userscript Proxy is ACTIVE. Preferring Proxy over direct/Chrome fetch.")
+                            # Default behavior: mint in-page (higher success rate than side-channel cached tokens).
+                            # Optional: allow pre-filling a cached token for speed via config flag.
+                            try:
+                                prefill_cached = bool((cfg_now or {}).get("userscript_proxy_prefill_cached_recaptcha", False))
+                            except Exception:
+                                prefill_cached = False
                             if (
-                                model_public_name in STRICT_CHROME_FETCH_MODELS
-                                and use_browser_transports
-                                and not disable_userscript_for_request
-                                and not disable_userscript_proxy_env
+                                prefill_cached
+                                and isinstance(payload, dict)
+                                and not force_proxy_recaptcha_mint
+                                and not str(payload.get("recaptchaV3Token") or "").strip()
                             ):
                                 try:
-                                    cfg_now = get_config()
+                                    cached = get_cached_recaptcha_token()
+                                except Exception:
+                                    cached = ""
+                                if cached:
+                                    debug_print(f"🔐 Using cached reCAPTCHA v3 token for proxy (len={len(str(cached))})")
+                                    payload["recaptchaV3Token"] = cached
+
+                        if use_userscript:
+                            debug_print(
+                                f"📫 Delegating request to Userscript Proxy (poll active {int(time.time() - last_userscript_poll)}s ago)..."
+                            )
+                            proxy_auth_token = str(current_token or "").strip()
+                            try:
+                                # Preserve expired base64 Supabase session cookies: they can often be refreshed
+                                # in-page via their embedded refresh_token (no user interaction).
+                                if (
+                                    proxy_auth_token
+                                    and not str(proxy_auth_token).startswith("base64-")
+                                    and is_arena_auth_token_expired(proxy_auth_token, skew_seconds=0)
+                                ):
+                                    proxy_auth_token = ""
+                            except Exception:
+                                pass
+                            stream_context = await fetch_via_proxy_queue(
+                                url=url,
+                                payload=payload if isinstance(payload, dict) else {},
+                                http_method=http_method,
+                                timeout_seconds=120,
+                                streaming=True,
+                                auth_token=proxy_auth_token,
+                            )
+                            if stream_context is None:
+                                debug_print("⚠️ Userscript Proxy returned None (timeout?). Falling back...")
+                                use_userscript = False
+                            else:
+                                transport_used = "userscript"
+
+                        # Strict models: when we're about to fall back to buffered browser fetch transports (not the
+                        # streaming proxy), a side-channel token can avoid hangs while grecaptcha loads in-page.
+                        if (
+                            stream_context is None
+                            and use_browser_transports
+                            and not use_userscript
+                            and isinstance(payload, dict)
+                            and not strict_token_prefill_attempted
+                            and not str(payload.get("recaptchaV3Token") or "").strip()
+                        ):
+                            strict_token_prefill_attempted = True
+                            try:
+                                refresh_task = asyncio.create_task(refresh_recaptcha_token(force_new=True))
+                            except Exception:
+                                refresh_task = None
+                            if refresh_task is not None:
+                                async for ka in wait_for_task(refresh_task):
+                                    yield ka
+                                try:
+                                    new_token = refresh_task.result()
                                 except Exception:
-                                    cfg_now = None
+                                    new_token = None
+                                if new_token:
+                                    payload["recaptchaV3Token"] = new_token
+
+                        if stream_context is None and use_browser_transports:
+                            browser_fetch_attempts = 5
+                            try:
+                                browser_fetch_attempts = int(get_config_view().get("chrome_fetch_recaptcha_max_attempts", 5))
+                            except Exception:
+                                browser_fetch_attempts = 5
 
+                            # If we have a cached side-channel reCAPTCHA token, prefer passing it into the browser
+                            # fetch transports (they will reuse it on the first attempt and only mint in-page if
+                            # needed). This helps when in-page grecaptcha is slow/flaky.
+                            if isinstance(payload, dict) and not str(payload.get("recaptchaV3Token") or "").strip():
                                 try:
-                                    proxy_active = _userscript_proxy_is_active(cfg_now)
+                                    cached_token = get_cached_recaptcha_token()
                                 except Exception:
-                                    proxy_active = False
+                                    cached_token = ""
+                                if cached_token:
+                                    payload["recaptchaV3Token"] = cached_token
 
-                                if not proxy_active:
+                            async def _try_chrome_fetch() -> Optional[BrowserFetchStreamResponse]:
+                                debug_print("🌐 Using Chrome fetch transport for streaming...")
+                                try:
+                                    auth_for_browser = str(current_token or "").strip()
                                     try:
-                                        grace_seconds = float((cfg_now or {}).get("userscript_proxy_grace_seconds", 0.5))
+                                        cand = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
                                     except Exception:
-                                        grace_seconds = 0.5
-                                    grace_seconds = max(0.0, min(grace_seconds, 2.0))
-                                    if grace_seconds > 0:
-                                        deadline = time.time() + grace_seconds
-                                        while time.time() < deadline:
-                                            try:
-                                                if _userscript_proxy_is_active(cfg_now):
-                                                    proxy_active = True
-                                                    break
-                                            except Exception:
-                                                pass
-                                            yield ": keep-alive\n\n"
-                                            await asyncio.sleep(0.05)
-
-                                if proxy_active:
-                                    use_userscript = True
-                                    debug_print("🌐 Userscript Proxy is ACTIVE. Preferring Proxy over direct/Chrome fetch.")
-                                # Default behavior: mint in-page (higher success rate than side-channel cached tokens).
-                                # Optional: allow pre-filling a cached token for speed via config flag.
+                                        cand = ""
+                                    if cand:
+                                        try:
+                                            if (
+                                                is_probably_valid_arena_auth_token(cand)
+                                                and not is_arena_auth_token_expired(cand, skew_seconds=0)
+                                                and (
+                                                    (not auth_for_browser)
+                                                    or (not is_probably_valid_arena_auth_token(auth_for_browser))
+                                                    or is_arena_auth_token_expired(auth_for_browser, skew_seconds=0)
+                                                )
+                                            ):
+                                                auth_for_browser = cand
+                                        except Exception:
+                                            auth_for_browser = cand
+
+                                    try:
+                                        chrome_outer_timeout = float(get_config_view().get("chrome_fetch_outer_timeout_seconds", 120))
+                                    except Exception:
+                                        chrome_outer_timeout = 120.0
+                                    chrome_outer_timeout = max(20.0, min(chrome_outer_timeout, 300.0))
+
+                                    return await asyncio.wait_for(
+                                        fetch_lmarena_stream_via_chrome(
+                                            http_method=http_method,
+                                            url=url,
+                                            payload=payload if isinstance(payload, dict) else {},
+                                            auth_token=auth_for_browser,
+                                            timeout_seconds=120,
+                                            max_recaptcha_attempts=browser_fetch_attempts,
+                                        ),
+                                        timeout=chrome_outer_timeout,
+                                    )
+                                except asyncio.TimeoutError:
+                                    debug_print("⚠️ Chrome fetch transport timed out (launch/nav hang).")
+                                    return None
+                                except Exception as e:
+                                    debug_print(f"⚠️ Chrome fetch transport error: {e}")
+                                    return None
+
+                            async def _try_camoufox_fetch() -> Optional[BrowserFetchStreamResponse]:
+                                debug_print("🦊 Using Camoufox fetch transport for streaming...")
                                 try:
-                                    prefill_cached = bool((cfg_now or {}).get("userscript_proxy_prefill_cached_recaptcha", False))
-                                except Exception:
-                                    prefill_cached = False
-                                if (
-                                    prefill_cached
-                                    and isinstance(payload, dict)
-                                    and not force_proxy_recaptcha_mint
-                                    and not str(payload.get("recaptchaV3Token") or "").strip()
-                                ):
+                                    auth_for_browser = str(current_token or "").strip()
                                     try:
-                                        cached = get_cached_recaptcha_token()
+                                        cand = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
                                     except Exception:
-                                        cached = ""
-                                    if cached:
-                                        debug_print(f"🔐 Using cached reCAPTCHA v3 token for proxy (len={len(str(cached))})")
-                                        payload["recaptchaV3Token"] = cached
+                                        cand = ""
+                                    if cand:
+                                        try:
+                                            if (
+                                                is_probably_valid_arena_auth_token(cand)
+                                                and not is_arena_auth_token_expired(cand, skew_seconds=0)
+                                                and (
+                                                    (not auth_for_browser)
+                                                    or (not is_probably_valid_arena_auth_token(auth_for_browser))
+                                                    or is_arena_auth_token_expired(auth_for_browser, skew_seconds=0)
+                                                )
+                                            ):
+                                                auth_for_browser = cand
+                                        except Exception:
+                                            auth_for_browser = cand
 
-                            if use_userscript:
-                                debug_print(
-                                    f"📫 Delegating request to Userscript Proxy (poll active {int(time.time() - last_userscript_poll)}s ago)..."
-                                )
-                                proxy_auth_token = str(current_token or "").strip()
+                                    try:
+                                        camoufox_outer_timeout = float(
+                                            get_config_view().get("camoufox_fetch_outer_timeout_seconds", 180)
+                                        )
+                                    except Exception:
+                                        camoufox_outer_timeout = 180.0
+                                    camoufox_outer_timeout = max(20.0, min(camoufox_outer_timeout, 300.0))
+
+                                    return await asyncio.wait_for(
+                                        fetch_lmarena_stream_via_camoufox(
+                                            http_method=http_method,
+                                            url=url,
+                                            payload=payload if isinstance(payload, dict) else {},
+                                            auth_token=auth_for_browser,
+                                            timeout_seconds=120,
+                                            max_recaptcha_attempts=browser_fetch_attempts,
+                                        ),
+                                        timeout=camoufox_outer_timeout,
+                                    )
+                                except asyncio.TimeoutError:
+                                    debug_print("⚠️ Camoufox fetch transport timed out (launch/nav hang).")
+                                    return None
+                                except Exception as e:
+                                    debug_print(f"⚠️ Camoufox fetch transport error: {e}")
+                                    return None
+
+                            if prefer_chrome_transport:
+                                chrome_task = asyncio.create_task(_try_chrome_fetch())
+                                async for ka in wait_for_task(chrome_task):
+                                    yield ka
                                 try:
-                                    # Preserve expired base64 Supabase session cookies: they can often be refreshed
-                                    # in-page via their embedded refresh_token (no user interaction).
-                                    if (
-                                        proxy_auth_token
-                                        and not str(proxy_auth_token).startswith("base64-")
-                                        and is_arena_auth_token_expired(proxy_auth_token, skew_seconds=0)
-                                    ):
-                                        proxy_auth_token = ""
+                                    stream_context = chrome_task.result()
                                 except Exception:
-                                    pass
-                                stream_context = await fetch_via_proxy_queue(
-                                    url=url,
-                                    payload=payload if isinstance(payload, dict) else {},
-                                    http_method=http_method,
-                                    timeout_seconds=120,
-                                    streaming=True,
-                                    auth_token=proxy_auth_token,
-                                )
+                                    stream_context = None
+                                if stream_context is not None:
+                                    transport_used = "chrome"
                                 if stream_context is None:
-                                    debug_print("⚠️ Userscript Proxy returned None (timeout?). Falling back...")
-                                    use_userscript = False
-                                else:
-                                    transport_used = "userscript"
-
-                            # Strict models: when we're about to fall back to buffered browser fetch transports (not the
-                            # streaming proxy), a side-channel token can avoid hangs while grecaptcha loads in-page.
-                            if (
-                                stream_context is None
-                                and use_browser_transports
-                                and not use_userscript
-                                and isinstance(payload, dict)
-                                and not strict_token_prefill_attempted
-                                and not str(payload.get("recaptchaV3Token") or "").strip()
-                            ):
-                                strict_token_prefill_attempted = True
+                                    camoufox_task = asyncio.create_task(_try_camoufox_fetch())
+                                    async for ka in wait_for_task(camoufox_task):
+                                        yield ka
+                                    try:
+                                        stream_context = camoufox_task.result()
+                                    except Exception:
+                                        stream_context = None
+                                    if stream_context is not None:
+                                        transport_used = "camoufox"
+                            else:
+                                camoufox_task = asyncio.create_task(_try_camoufox_fetch())
+                                async for ka in wait_for_task(camoufox_task):
+                                    yield ka
                                 try:
-                                    refresh_task = asyncio.create_task(refresh_recaptcha_token(force_new=True))
+                                    stream_context = camoufox_task.result()
                                 except Exception:
-                                    refresh_task = None
-                                if refresh_task is not None:
-                                    while True:
-                                        done, _ = await asyncio.wait({refresh_task}, timeout=1.0)
-                                        if refresh_task in done:
-                                            break
-                                        yield ": keep-alive\n\n"
+                                    stream_context = None
+                                if stream_context is not None:
+                                    transport_used = "camoufox"
+                                if stream_context is None:
+                                    chrome_task = asyncio.create_task(_try_chrome_fetch())
+                                    async for ka in wait_for_task(chrome_task):
+                                        yield ka
                                     try:
-                                        new_token = refresh_task.result()
+                                        stream_context = chrome_task.result()
                                     except Exception:
-                                        new_token = None
-                                    if new_token:
-                                        payload["recaptchaV3Token"] = new_token
+                                        stream_context = None
+                                    if stream_context is not None:
+                                        transport_used = "chrome"
 
-                            if stream_context is None and use_browser_transports:
-                                browser_fetch_attempts = 5
+                        if stream_context is None:
+                            client = get_upstream_http_client()
+                            if http_method == "PUT":
+                                stream_context = client.stream('PUT', url, json=payload, headers=headers)
+                            else:
+                                stream_context = client.stream('POST', url, json=payload, headers=headers)
+                            transport_used = "httpx"
+
+                        # Userscript proxy jobs report their upstream HTTP status asynchronously.
+                        # Wait for the status (or completion) before branching on status_code, while still
+                        # keeping the client connection alive.
+                        if transport_used == "userscript":
+                            proxy_job_id = ""
+                            try:
+                                proxy_job_id = str(getattr(stream_context, "job_id", "") or "").strip()
+                            except Exception:
+                                proxy_job_id = ""
+
+                            proxy_job = _USERSCRIPT_PROXY_JOBS.get(proxy_job_id) if proxy_job_id else None
+                            status_event = None
+                            done_event = None
+                            picked_up_event = None
+                            if isinstance(proxy_job, dict):
+                                status_event = proxy_job.get("status_event")
+                                done_event = proxy_job.get("done_event")
+                                picked_up_event = proxy_job.get("picked_up_event")
+ 
+                            if isinstance(status_event, asyncio.Event) and not status_event.is_set():
                                 try:
-                                    browser_fetch_attempts = int(get_config().get("chrome_fetch_recaptcha_max_attempts", 5))
+                                    pickup_timeout_seconds = float(
+                                        get_config_view().get("userscript_proxy_pickup_timeout_seconds", 10)
+                                    )
                                 except Exception:
-                                    browser_fetch_attempts = 5
+                                    pickup_timeout_seconds = 10.0
+                                pickup_timeout_seconds = max(0.5, min(pickup_timeout_seconds, 15.0))
 
-                                # If we have a cached side-channel reCAPTCHA token, prefer passing it into the browser
-                                # fetch transports (they will reuse it on the first attempt and only mint in-page if
-                                # needed). This helps when in-page grecaptcha is slow/flaky.
-                                if isinstance(payload, dict) and not str(payload.get("recaptchaV3Token") or "").strip():
-                                    try:
-                                        cached_token = get_cached_recaptcha_token()
-                                    except Exception:
-                                        cached_token = ""
-                                    if cached_token:
-                                        payload["recaptchaV3Token"] = cached_token
-
-                                async def _try_chrome_fetch() -> Optional[BrowserFetchStreamResponse]:
-                                    debug_print("🌐 Using Chrome fetch transport for streaming...")
-                                    try:
-                                        auth_for_browser = str(current_token or "").strip()
-                                        try:
-                                            cand = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
-                                        except Exception:
-                                            cand = ""
-                                        if cand:
-                                            try:
-                                                if (
-                                                    is_probably_valid_arena_auth_token(cand)
-                                                    and not is_arena_auth_token_expired(cand, skew_seconds=0)
-                                                    and (
-                                                        (not auth_for_browser)
-                                                        or (not is_probably_valid_arena_auth_token(auth_for_browser))
-                                                        or is_arena_auth_token_expired(auth_for_browser, skew_seconds=0)
-                                                    )
-                                                ):
-                                                    auth_for_browser = cand
-                                            except Exception:
-                                                auth_for_browser = cand
+                                try:
+                                    proxy_status_timeout_seconds = float(
+                                        get_config_view().get("userscript_proxy_status_timeout_seconds", 180)
+                                    )
+                                except Exception:
+                                    proxy_status_timeout_seconds = 180.0
+                                proxy_status_timeout_seconds = max(5.0, min(proxy_status_timeout_seconds, 300.0))
+ 
+                                started = time.monotonic()
+                                proxy_status_timed_out = False
+                                while not status_event.is_set():
+                                    if isinstance(done_event, asyncio.Event) and done_event.is_set():
+                                        break
+                                    elapsed = time.monotonic() - started
+                                    picked_up = True
+                                    if isinstance(picked_up_event, asyncio.Event):
+                                        picked_up = bool(picked_up_event.is_set())
 
+                                    if (not picked_up) and elapsed >= pickup_timeout_seconds:
+                                        debug_print(
+                                            f"⚠️ Userscript proxy did not pick up job within {int(pickup_timeout_seconds)}s."
+                                        )
+                                        disable_userscript_for_request = True
                                         try:
-                                            chrome_outer_timeout = float(get_config().get("chrome_fetch_outer_timeout_seconds", 120))
+                                            await push_proxy_chunk(
+                                                proxy_job_id,
+                                                {"error": "userscript proxy pickup timeout", "done": True},
+                                            )
                                         except Exception:
-                                            chrome_outer_timeout = 120.0
-                                        chrome_outer_timeout = max(20.0, min(chrome_outer_timeout, 300.0))
-
-                                        return await asyncio.wait_for(
-                                            fetch_lmarena_stream_via_chrome(
-                                                http_method=http_method,
-                                                url=url,
-                                                payload=payload if isinstance(payload, dict) else {},
-                                                auth_token=auth_for_browser,
-                                                timeout_seconds=120,
-                                                max_recaptcha_attempts=browser_fetch_attempts,
-                                            ),
-                                            timeout=chrome_outer_timeout,
-                                        )
-                                    except asyncio.TimeoutError:
-                                        debug_print("⚠️ Chrome fetch transport timed out (launch/nav hang).")
-                                        return None
-                                    except Exception as e:
-                                        debug_print(f"⚠️ Chrome fetch transport error: {e}")
-                                        return None
-
-                                async def _try_camoufox_fetch() -> Optional[BrowserFetchStreamResponse]:
-                                    debug_print("🦊 Using Camoufox fetch transport for streaming...")
-                                    try:
-                                        auth_for_browser = str(current_token or "").strip()
+                                            pass
+                                        # Prevent the internal proxy worker from doing wasted work on a job we
+                                        # already declared dead.
                                         try:
-                                            cand = str(EPHEMERAL_ARENA_AUTH_TOKEN or "").strip()
+                                            _USERSCRIPT_PROXY_JOBS.pop(proxy_job_id, None)
                                         except Exception:
-                                            cand = ""
-                                        if cand:
-                                            try:
-                                                if (
-                                                    is_probably_valid_arena_auth_token(cand)
-                                                    and not is_arena_auth_token_expired(cand, skew_seconds=0)
-                                                    and (
-                                                        (not auth_for_browser)
-                                                        or (not is_probably_valid_arena_auth_token(auth_for_browser))
-                                                        or is_arena_auth_token_expired(auth_for_browser, skew_seconds=0)
-                                                    )
-                                                ):
-                                                    auth_for_browser = cand
-                                            except Exception:
-                                                auth_for_browser = cand
+                                            pass
+                                        proxy_status_timed_out = True
+                                        break
 
+                                    if picked_up and elapsed >= proxy_status_timeout_seconds:
+                                        debug_print(
+                                            f"⚠️ Userscript proxy did not report upstream status within {int(proxy_status_timeout_seconds)}s."
+                                        )
+                                        # Treat the proxy as unavailable for the rest of this request and fall back
+                                        # to other transports (Chrome/Camoufox/httpx). Otherwise we'd keep queuing
+                                        # jobs that will never be picked up and stall for a long time.
+                                        disable_userscript_for_request = True
                                         try:
-                                            camoufox_outer_timeout = float(
-                                                get_config().get("camoufox_fetch_outer_timeout_seconds", 180)
+                                            await push_proxy_chunk(
+                                                proxy_job_id,
+                                                {"error": "userscript proxy status timeout", "done": True},
                                             )
                                         except Exception:
-                                            camoufox_outer_timeout = 180.0
-                                        camoufox_outer_timeout = max(20.0, min(camoufox_outer_timeout, 300.0))
-
-                                        return await asyncio.wait_for(
-                                            fetch_lmarena_stream_via_camoufox(
-                                                http_method=http_method,
-                                                url=url,
-                                                payload=payload if isinstance(payload, dict) else {},
-                                                auth_token=auth_for_browser,
-                                                timeout_seconds=120,
-                                                max_recaptcha_attempts=browser_fetch_attempts,
-                                            ),
-                                            timeout=camoufox_outer_timeout,
-                                        )
-                                    except asyncio.TimeoutError:
-                                        debug_print("⚠️ Camoufox fetch transport timed out (launch/nav hang).")
-                                        return None
-                                    except Exception as e:
-                                        debug_print(f"⚠️ Camoufox fetch transport error: {e}")
-                                        return None
-
-                                if prefer_chrome_transport:
-                                    chrome_task = asyncio.create_task(_try_chrome_fetch())
-                                    while True:
-                                        done, _ = await asyncio.wait({chrome_task}, timeout=1.0)
-                                        if chrome_task in done:
-                                            try:
-                                                stream_context = chrome_task.result()
-                                            except Exception:
-                                                stream_context = None
-                                            break
-                                        yield ": keep-alive\n\n"
-                                    if stream_context is not None:
-                                        transport_used = "chrome"
-                                    if stream_context is None:
-                                        camoufox_task = asyncio.create_task(_try_camoufox_fetch())
-                                        while True:
-                                            done, _ = await asyncio.wait({camoufox_task}, timeout=1.0)
-                                            if camoufox_task in done:
-                                                try:
-                                                    stream_context = camoufox_task.result()
-                                                except Exception:
-                                                    stream_context = None
-                                                break
-                                            yield ": keep-alive\n\n"
-                                        if stream_context is not None:
-                                            transport_used = "camoufox"
-                                else:
-                                    camoufox_task = asyncio.create_task(_try_camoufox_fetch())
-                                    while True:
-                                        done, _ = await asyncio.wait({camoufox_task}, timeout=1.0)
-                                        if camoufox_task in done:
-                                            try:
-                                                stream_context = camoufox_task.result()
-                                            except Exception:
-                                                stream_context = None
-                                            break
-                                        yield ": keep-alive\n\n"
-                                    if stream_context is not None:
-                                        transport_used = "camoufox"
-                                    if stream_context is None:
-                                        chrome_task = asyncio.create_task(_try_chrome_fetch())
-                                        while True:
-                                            done, _ = await asyncio.wait({chrome_task}, timeout=1.0)
-                                            if chrome_task in done:
-                                                try:
-                                                    stream_context = chrome_task.result()
-                                                except Exception:
-                                                    stream_context = None
-                                                break
-                                            yield ": keep-alive\n\n"
-                                        if stream_context is not None:
-                                            transport_used = "chrome"
+                                            pass
+                                        proxy_status_timed_out = True
+                                        break
+ 
+                                    yield ": keep-alive\n\n"
+                                    await asyncio.sleep(1.0)
 
-                            if stream_context is None:
-                                client = await stack.enter_async_context(httpx.AsyncClient())
-                                if http_method == "PUT":
-                                    stream_context = client.stream('PUT', url, json=payload, headers=headers, timeout=120)
-                                else:
-                                    stream_context = client.stream('POST', url, json=payload, headers=headers, timeout=120)
-                                transport_used = "httpx"
+                                if proxy_status_timed_out:
+                                    async for ka in wait_with_keepalive(0.5):
+                                        yield ka
+                                    continue
+                        
+                        stream_context = AuthTokenLease(stream_context, current_token, url)
+                        async with stream_context as response:
+                            # Log status with human-readable message
+                            log_http_status(response.status_code, "LMArena API Stream")
+                            
+                            # Check for retry-able errors before processing stream
+                            if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+                                retry_429_count += 1
+                                if retry_429_count > 3:
+                                    error_chunk = {
+                                        "error": {
+                                            "message": "Too Many Requests (429) from upstream. Retries exhausted.",
+                                            "type": "rate_limit_error",
+                                            "code": HTTPStatus.TOO_MANY_REQUESTS,
+                                        }
+                                    }
+                                    yield f"data: {json.dumps(error_chunk)}\n\n"
+                                    yield "data: [DONE]\n\n"
+                                    return
 
-                            # Userscript proxy jobs report their upstream HTTP status asynchronously.
-                            # Wait for the status (or completion) before branching on status_code, while still
-                            # keeping the client connection alive.
-                            if transport_used == "userscript":
-                                proxy_job_id = ""
+                                retry_after = None
                                 try:
-                                    proxy_job_id = str(getattr(stream_context, "job_id", "") or "").strip()
+                                    retry_after = response.headers.get("Retry-After")
                                 except Exception:
-                                    proxy_job_id = ""
-
-                                proxy_job = _USERSCRIPT_PROXY_JOBS.get(proxy_job_id) if proxy_job_id else None
-                                status_event = None
-                                done_event = None
-                                picked_up_event = None
-                                if isinstance(proxy_job, dict):
-                                    status_event = proxy_job.get("status_event")
-                                    done_event = proxy_job.get("done_event")
-                                    picked_up_event = proxy_job.get("picked_up_event")
- 
-                                if isinstance(status_event, asyncio.Event) and not status_event.is_set():
+                                    retry_after = None
+                                if not retry_after:
+                                    try:
+                                        retry_after = response.headers.get("retry-after")
+                                    except Exception:
+                                        retry_after = None
+                                retry_after_value = 0.0
+                                if isinstance(retry_after, str):
+                                    try:
+                                        retry_after_value = float(retry_after.strip())
+                                    except Exception:
+                                        retry_after_value = 0.0
+                                sleep_seconds = get_rate_limit_sleep_seconds(retry_after, attempt)
+                                
+                                debug_print(
+                                    f"⏱️  Stream attempt {attempt} - Upstream rate limited. Waiting {sleep_seconds}s..."
+                                )
+                                
+                                # Rotate token on rate limit to avoid spinning on the same blocked account.
+                                old_token = current_token
+                                token_rotated = False
+                                if current_token:
                                     try:
-                                        pickup_timeout_seconds = float(
-                                            get_config().get("userscript_proxy_pickup_timeout_seconds", 10)
+                                        rotation_exclude = set(failed_tokens)
+                                        rotation_exclude.add(current_token)
+                                        current_token = get_next_auth_token(
+                                            exclude_tokens=rotation_exclude, allow_ephemeral_fallback=False
                                         )
+                                        headers = get_request_headers_with_token(current_token, recaptcha_token)
+                                        token_rotated = True
+                                        debug_print(f"🔄 Retrying stream with next token: {current_token[:20]}...")
+                                    except HTTPException:
+                                        # Only one token (or all tokens excluded). Keep the current token and retry
+                                        # after backoff instead of failing fast.
+                                        debug_print("⚠️ No alternative token available; retrying with same token after backoff.")
+
+                                # reCAPTCHA v3 tokens can be single-use and may expire while we back off.
+                                # Clear it so the next browser fetch attempt mints a fresh token.
+                                if isinstance(payload, dict):
+                                    payload["recaptchaV3Token"] = ""
+
+                                # If we rotated tokens, allow a fast retry when the backoff would exceed the remaining
+                                # stream deadline (common when one token is rate-limited but another isn't).
+                                if token_rotated and current_token and current_token != old_token:
+                                    remaining_budget = float(stream_total_timeout_seconds) - float(
+                                        time.monotonic() - stream_started_at
+                                    )
+                                    if float(sleep_seconds) > max(0.0, remaining_budget):
+                                        sleep_seconds = min(float(sleep_seconds), 1.0)
+                                
+                                async for ka in wait_with_keepalive(sleep_seconds):
+                                    yield ka
+                                continue
+                            
+                            elif response.status_code == HTTPStatus.FORBIDDEN:
+                                # Userscript proxy note:
+                                # The in-page fetch script can report an initial 403 while it mints/retries
+                                # reCAPTCHA (v3 retry + v2 fallback) and may later update the status to 200
+                                # without needing a new proxy job.
+                                if transport_used == "userscript":
+                                    proxy_job_id = ""
+                                    try:
+                                        proxy_job_id = str(getattr(stream_context, "job_id", "") or "").strip()
                                     except Exception:
-                                        pickup_timeout_seconds = 10.0
-                                    pickup_timeout_seconds = max(0.5, min(pickup_timeout_seconds, 15.0))
+                                        proxy_job_id = ""
 
+                                    proxy_job = _USERSCRIPT_PROXY_JOBS.get(proxy_job_id) if proxy_job_id else None
+                                    proxy_done_event = None
+                                    if isinstance(proxy_job, dict):
+                                        proxy_done_event = proxy_job.get("done_event")
+
+                                    # Give the proxy a chance to finish its in-page reCAPTCHA retry path before we
+                                    # abandon this response and queue a new job (which can lead to pickup timeouts).
                                     try:
-                                        proxy_status_timeout_seconds = float(
-                                            get_config().get("userscript_proxy_status_timeout_seconds", 180)
+                                        grace_seconds = float(
+                                            get_config_view().get("userscript_proxy_recaptcha_grace_seconds", 25)
                                         )
                                     except Exception:
-                                        proxy_status_timeout_seconds = 180.0
-                                    proxy_status_timeout_seconds = max(5.0, min(proxy_status_timeout_seconds, 300.0))
- 
-                                    started = time.monotonic()
-                                    proxy_status_timed_out = False
-                                    while not status_event.is_set():
-                                        if isinstance(done_event, asyncio.Event) and done_event.is_set():
-                                            break
-                                        elapsed = time.monotonic() - started
-                                        picked_up = True
-                                        if isinstance(picked_up_event, asyncio.Event):
-                                            picked_up = bool(picked_up_event.is_set())
-
-                                        if (not picked_up) and elapsed >= pickup_timeout_seconds:
-                                            debug_print(
-                                                f"⚠️ Userscript proxy did not pick up job within {int(pickup_timeout_seconds)}s."
-                                            )
-                                            disable_userscript_for_request = True
-                                            try:
-                                                await push_proxy_chunk(
-                                                    proxy_job_id,
-                                                    {"error": "userscript proxy pickup timeout", "done": True},
+                                        grace_seconds = 25.0
+                                    grace_seconds = max(0.0, min(grace_seconds, 90.0))
+
+                                    if (
+                                        grace_seconds > 0.0
+                                        and isinstance(proxy_done_event, asyncio.Event)
+                                        and not proxy_done_event.is_set()
+                                    ):
+                                        # Important: do not enqueue a new proxy job while the current one is still
+                                        # running. Its Camoufox tab stays busy until `page.evaluate()` returns, so a
+                                        # new job would race the in-page retry for the same conversation.
+                                        remaining_budget = float(stream_total_timeout_seconds) - float(
+                                            time.monotonic() - stream_started_at
+                                        )
+                                        remaining_budget = max(0.0, remaining_budget)
+                                        max_wait_seconds = min(max(float(grace_seconds), 200.0), remaining_budget)
+
+                                        debug_print(
+                                            f"⏳ Userscript proxy reported 403. Waiting up to {int(max_wait_seconds)}s for in-page retry..."
+                                        )
+                                        started = time.monotonic()
+                                        warned_extended = False
+                                        while True:
+                                            if response.status_code != HTTPStatus.FORBIDDEN:
+                                                debug_print(
+                                                    f"✅ Userscript proxy recovered from 403 (status: {response.status_code})."
                                                 )
-                                            except Exception:
-                                                pass
-                                            # Prevent the internal proxy worker from doing wasted work on a job we
-                                            # already declared dead.
+                                                break
+                                            if proxy_done_event.is_set():
+                                                break
+                                            # If the proxy job already has an error, don't wait the full window.
                                             try:
-                                                _USERSCRIPT_PROXY_JOBS.pop(proxy_job_id, None)
+                                                if isinstance(proxy_job, dict) and proxy_job.get("error"):
+                                                    break
                                             except Exception:
                                                 pass
-                                            proxy_status_timed_out = True
-                                            break
-
-                                        if picked_up and elapsed >= proxy_status_timeout_seconds:
-                                            debug_print(
-                                                f"⚠️ Userscript proxy did not report upstream status within {int(proxy_status_timeout_seconds)}s."
+                                            elapsed = time.monotonic() - started
+                                            if elapsed >= float(max_wait_seconds):
+                                                break
+                                            if (not warned_extended) and elapsed >= float(grace_seconds):
+                                                warned_extended = True
+                                                debug_print(
+                                                    "⏳ Still 403 after grace window; waiting for proxy job completion..."
+                                                )
+                                            # Sleep until the proxy pushes a status/done (or the next deadline);
+                                            # keep-alives come from the shared ticker only while the stream idles.
+                                            next_deadline = float(max_wait_seconds)
+                                            if not warned_extended:
+                                                next_deadline = min(next_deadline, float(grace_seconds))
+                                            update_task = asyncio.create_task(
+                                                wait_for_userscript_proxy_job_update(
+                                                    proxy_job, next_deadline - elapsed
+                                                )
                                             )
-                                            # Treat the proxy as unavailable for the rest of this request and fall back
-                                            # to other transports (Chrome/Camoufox/httpx). Otherwise we'd keep queuing
-                                            # jobs that will never be picked up and stall for a long time.
-                                            disable_userscript_for_request = True
                                             try:
-                                                await push_proxy_chunk(
-                                                    proxy_job_id,
-                                                    {"error": "userscript proxy status timeout", "done": True},
-                                                )
-                                            except Exception:
-                                                pass
-                                            proxy_status_timed_out = True
-                                            break
- 
-                                        yield ": keep-alive\n\n"
-                                        await asyncio.sleep(1.0)
-
-                                    if proxy_status_timed_out:
-                                        async for ka in wait_with_keepalive(0.5):
-                                            yield ka
-                                        continue
-                            
-                            async with stream_context as response:
-                                # Log status with human-readable message
-                                log_http_status(response.status_code, "LMArena API Stream")
-                                
-                                # Check for retry-able errors before processing stream
-                                if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
-                                    retry_429_count += 1
-                                    if retry_429_count > 3:
+                                                while not await stream_heartbeat.wait(update_task):
+                                                    yield ": keep-alive\n\n"
+                                            finally:
+                                                update_task.cancel()
+
+                                # If the userscript proxy recovered (status changed after in-page retries),
+                                # proceed to normal stream parsing below.
+                                if response.status_code != HTTPStatus.FORBIDDEN:
+                                    pass
+                                else:
+                                    retry_403_count += 1
+                                    if retry_403_count > 5:
                                         error_chunk = {
                                             "error": {
-                                                "message": "Too Many Requests (429) from upstream. Retries exhausted.",
-                                                "type": "rate_limit_error",
-                                                "code": HTTPStatus.TOO_MANY_REQUESTS,
+                                                "message": "Forbidden (403) from upstream. Retries exhausted.",
+                                                "type": "forbidden_error",
+                                                "code": HTTPStatus.FORBIDDEN,
                                             }
                                         }
                                         yield f"data: {json.dumps(error_chunk)}\n\n"
                                         yield "data: [DONE]\n\n"
                                         return
 
-                                    retry_after = None
+                                    body_text = ""
+                                    error_body = None
                                     try:
-                                        retry_after = response.headers.get("Retry-After")
+                                        body_bytes = await response.aread()
+                                        body_text = body_bytes.decode("utf-8", errors="replace")
+                                        error_body = json.loads(body_text)
                                     except Exception:
-                                        retry_after = None
-                                    if not retry_after:
-                                        try:
-                                            retry_after = response.headers.get("retry-after")
-                                        except Exception:
-                                            retry_after = None
-                                    retry_after_value = 0.0
-                                    if isinstance(retry_after, str):
-                                        try:
-                                            retry_after_value = float(retry_after.strip())
-                                        except Exception:
-                                            retry_after_value = 0.0
-                                    sleep_seconds = get_rate_limit_sleep_seconds(retry_after, attempt)
-                                    
-                                    debug_print(
-                                        f"⏱️  Stream attempt {attempt} - Upstream rate limited. Waiting {sleep_seconds}s..."
-                                    )
-                                    
-                                    # Rotate token on rate limit to avoid spinning on the same blocked account.
-                                    old_token = current_token
-                                    token_rotated = False
-                                    if current_token:
-                                        try:
-                                            rotation_exclude = set(failed_tokens)
-                                            rotation_exclude.add(current_token)
-                                            current_token = get_next_auth_token(
-                                                exclude_tokens=rotation_exclude, allow_ephemeral_fallback=False
-                                            )
-                                            headers = get_request_headers_with_token(current_token, recaptcha_token)
-                                            token_rotated = True
-                                            debug_print(f"🔄 Retrying stream with next token: {current_token[:20]}...")
-                                        except HTTPException:
-                                            # Only one token (or all tokens excluded). Keep the current token and retry
-                                            # after backoff instead of failing fast.
-                                            debug_print("⚠️ No alternative token available; retrying with same token after backoff.")
-
-                                    # reCAPTCHA v3 tokens can be single-use and may expire while we back off.
-                                    # Clear it so the next browser fetch attempt mints a fresh token.
-                                    if isinstance(payload, dict):
-                                        payload["recaptchaV3Token"] = ""
+                                        error_body = None
+                                        # If it's not JSON, we'll use the body_text for keyword matching.
+
+                                    is_recaptcha_failure = False
+                                    try:
+                                        if (
+                                            isinstance(error_body, dict)
+                                            and error_body.get("error") == "recaptcha validation failed"
+                                        ):
+                                            is_recaptcha_failure = True
+                                        elif "recaptcha validation failed" in str(body_text).lower():
+                                            is_recaptcha_failure = True
+                                    except Exception:
+                                        is_recaptcha_failure = False
 
-                                    # If we rotated tokens, allow a fast retry when the backoff would exceed the remaining
-                                    # stream deadline (common when one token is rate-limited but another isn't).
-                                    if token_rotated and current_token and current_token != old_token:
-                                        remaining_budget = float(stream_total_timeout_seconds) - float(
-                                            time.monotonic() - stream_started_at
-                                        )
-                                        if float(sleep_seconds) > max(0.0, remaining_budget):
-                                            sleep_seconds = min(float(sleep_seconds), 1.0)
-                                    
-                                    async for ka in wait_with_keepalive(sleep_seconds):
-                                        yield ka
-                                    continue
-                                
-                                elif response.status_code == HTTPStatus.FORBIDDEN:
-                                    # Userscript proxy note:
-                                    # The in-page fetch script can report an initial 403 while it mints/retries
-                                    # reCAPTCHA (v3 retry + v2 fallback) and may later update the status to 200
-                                    # without needing a new proxy job.
                                     if transport_used == "userscript":
-                                        proxy_job_id = ""
-                                        try:
-                                            proxy_job_id = str(getattr(stream_context, "job_id", "") or "").strip()
-                                        except Exception:
-                                            proxy_job_id = ""
+                                        # The proxy is our only truly streaming browser transport. Prefer retrying
+                                        # it with a fresh in-page token mint over switching to buffered browser
+                                        # fetch fallbacks (which can stall SSE).
+                                        force_proxy_recaptcha_mint = True
+                                        if is_recaptcha_failure:
+                                            recaptcha_403_failures += 1
+                                            if recaptcha_403_failures >= 5:
+                                                debug_print(
+                                                    "? Too many reCAPTCHA failures in userscript proxy. Failing fast."
+                                                )
+                                                error_chunk = {
+                                                    "error": {
+                                                        "message": (
+                                                            "Forbidden: reCAPTCHA validation failed repeatedly in userscript proxy."
+                                                        ),
+                                                        "type": "recaptcha_error",
+                                                        "code": HTTPStatus.FORBIDDEN,
+                                                    }
+                                                }
+                                                yield f"data: {json.dumps(error_chunk)}\n\n"
+                                                yield "data: [DONE]\n\n"
+                                                return
 
-                                        proxy_job = _USERSCRIPT_PROXY_JOBS.get(proxy_job_id) if proxy_job_id else None
-                                        proxy_done_event = None
-                                        if isinstance(proxy_job, dict):
-                                            proxy_done_event = proxy_job.get("done_event")
+                                        if isinstance(payload, dict):
+                                            payload["recaptchaV3Token"] = ""
+                                            payload.pop("recaptchaV2Token", None)
 
-                                        # Give the proxy a chance to finish its in-page reCAPTCHA retry path before we
-                                        # abandon this response and queue a new job (which can lead to pickup timeouts).
-                                        try:
-                                            grace_seconds = float(
-                                                get_config().get("userscript_proxy_recaptcha_grace_seconds", 25)
-                                            )
-                                        except Exception:
-                                            grace_seconds = 25.0
-                                        grace_seconds = max(0.0, min(grace_seconds, 90.0))
+                                        async for ka in wait_with_keepalive(1.5):
+                                            yield ka
+                                        continue
 
-                                        if (
-                                            grace_seconds > 0.0
-                                            and isinstance(proxy_done_event, asyncio.Event)
-                                            and not proxy_done_event.is_set()
-                                        ):
-                                            # Important: do not enqueue a new proxy job while the current one is still
-                                            # running. The internal Camoufox worker is single-threaded and will not pick
-                                            # up new jobs until `page.evaluate()` returns.
-                                            remaining_budget = float(stream_total_timeout_seconds) - float(
-                                                time.monotonic() - stream_started_at
-                                            )
-                                            remaining_budget = max(0.0, remaining_budget)
-                                            max_wait_seconds = min(max(float(grace_seconds), 200.0), remaining_budget)
+                                    if is_recaptcha_failure:
+                                        # Track consecutive reCAPTCHA failures so we can escalate to browser
+                                        # transports even for non-strict models.
+                                        recaptcha_403_failures += 1
+                                        if recaptcha_403_last_transport == transport_used:
+                                            recaptcha_403_consecutive += 1
+                                        else:
+                                            recaptcha_403_consecutive = 1
+                                            recaptcha_403_last_transport = transport_used
+
+                                        if transport_used in ("chrome", "camoufox"):
+                                            try:
+                                                debug_print(
+                                                    "Refreshing token/cookies (side-channel) after browser fetch 403..."
+                                                )
+                                                refresh_task = asyncio.create_task(
+                                                    refresh_recaptcha_token(force_new=True)
+                                                )
+                                                async for ka in wait_for_task(refresh_task):
+                                                    yield ka
+                                                new_token = refresh_task.result()
+                                            except Exception:
+                                                new_token = None
+                                            # Prefer reusing a fresh side-channel token on the next attempt; if we
+                                            # couldn't get one, fall back to in-page minting.
+                                            if isinstance(payload, dict):
+                                                payload["recaptchaV3Token"] = new_token or ""
+                                        else:
+                                            debug_print("Refreshing token (side-channel)...")
+                                            try:
+                                                refresh_task = asyncio.create_task(
+                                                    refresh_recaptcha_token(force_new=True)
+                                                )
+                                                async for ka in wait_for_task(refresh_task):
+                                                    yield ka
+                                                new_token = refresh_task.result()
+                                            except Exception:
+                                                new_token = None
+                                            if new_token and isinstance(payload, dict):
+                                                payload["recaptchaV3Token"] = new_token
 
+                                        if recaptcha_403_consecutive >= 2 and transport_used == "chrome":
                                             debug_print(
-                                                f"⏳ Userscript proxy reported 403. Waiting up to {int(max_wait_seconds)}s for in-page retry..."
+                                                "Switching to Camoufox-first after repeated Chrome reCAPTCHA failures."
                                             )
-                                            started = time.monotonic()
-                                            warned_extended = False
-                                            while (time.monotonic() - started) < float(max_wait_seconds):
-                                                if response.status_code != HTTPStatus.FORBIDDEN:
-                                                    debug_print(
-                                                        f"✅ Userscript proxy recovered from 403 (status: {response.status_code})."
-                                                    )
-                                                    break
-                                                if proxy_done_event.is_set():
-                                                    break
-                                                # If the proxy job already has an error, don't wait the full window.
-                                                try:
-                                                    if isinstance(proxy_job, dict) and proxy_job.get("error"):
-                                                        break
-                                                except Exception:
-                                                    pass
-                                                if (not warned_extended) and (time.monotonic() - started) >= float(
-                                                    grace_seconds
-                                                ):
-                                                    warned_extended = True
-                                                    debug_print(
-                                                        "⏳ Still 403 after grace window; waiting for proxy job completion..."
-                                                    )
-                                                yield ": keep-alive\n\n"
-                                                await asyncio.sleep(0.5)
-
-                                    # If the userscript proxy recovered (status changed after in-page retries),
-                                    # proceed to normal stream parsing below.
-                                    if response.status_code != HTTPStatus.FORBIDDEN:
-                                        pass
-                                    else:
-                                        retry_403_count += 1
-                                        if retry_403_count > 5:
-                                            error_chunk = {
-                                                "error": {
-                                                    "message": "Forbidden (403) from upstream. Retries exhausted.",
-                                                    "type": "forbidden_error",
-                                                    "code": HTTPStatus.FORBIDDEN,
-                                                }
-                                            }
-                                            yield f"data: {json.dumps(error_chunk)}\n\n"
-                                            yield "data: [DONE]\n\n"
-                                            return
+                                            use_browser_transports = True
+                                            prefer_chrome_transport = False
+                                            recaptcha_403_consecutive = 0
+                                            recaptcha_403_last_transport = None
+                                        elif recaptcha_403_consecutive >= 2 and transport_used != "chrome":
+                                            debug_print(
+                                                "🌐 Switching to Chrome fetch transport after repeated reCAPTCHA failures."
+                                            )
+                                            use_browser_transports = True
+                                            prefer_chrome_transport = True
+                                            recaptcha_403_consecutive = 0
+                                            recaptcha_403_last_transport = None
 
-                                        body_text = ""
-                                        error_body = None
-                                        try:
-                                            body_bytes = await response.aread()
-                                            body_text = body_bytes.decode("utf-8", errors="replace")
-                                            error_body = json.loads(body_text)
-                                        except Exception:
-                                            error_body = None
-                                            # If it's not JSON, we'll use the body_text for keyword matching.
+                                        async for ka in wait_with_keepalive(1.5):
+                                            yield ka
+                                        continue
 
-                                        is_recaptcha_failure = False
+                                    # If 403 but not recaptcha, might be other auth issue, but let's retry anyway
+                                    async for ka in wait_with_keepalive(2.0):
+                                        yield ka
+                                    continue
+
+                            elif response.status_code == HTTPStatus.UNAUTHORIZED:
+                                debug_print(f"🔒 Stream token expired")
+                                # Add current token to failed set
+                                failed_tokens.add(current_token)
+
+                                # Best-effort: refresh the current base64 session in-memory before rotating.
+                                refreshed_token: Optional[str] = None
+                                if current_token:
+                                    try:
+                                        cfg_now = get_config_view()
+                                    except Exception:
+                                        cfg_now = {}
+                                    if not isinstance(cfg_now, dict):
+                                        cfg_now = {}
+                                    try:
+                                        refreshed_token = await refresh_arena_auth_token_via_lmarena_http(
+                                            current_token, cfg_now
+                                        )
+                                    except Exception:
+                                        refreshed_token = None
+                                    if not refreshed_token:
                                         try:
-                                            if (
-                                                isinstance(error_body, dict)
-                                                and error_body.get("error") == "recaptcha validation failed"
-                                            ):
-                                                is_recaptcha_failure = True
-                                            elif "recaptcha validation failed" in str(body_text).lower():
-                                                is_recaptcha_failure = True
+                                            refreshed_token = await refresh_arena_auth_token_via_supabase(current_token)
                                         except Exception:
-                                            is_recaptcha_failure = False
-
-                                        if transport_used == "userscript":
-                                            # The proxy is our only truly streaming browser transport. Prefer retrying
-                                            # it with a fresh in-page token mint over switching to buffered browser
-                                            # fetch fallbacks (which can stall SSE).
-                                            force_proxy_recaptcha_mint = True
-                                            if is_recaptcha_failure:
-                                                recaptcha_403_failures += 1
-                                                if recaptcha_403_failures >= 5:
-                                                    debug_print(
-                                                        "? Too many reCAPTCHA failures in userscript proxy. Failing fast."
-                                                    )
-                                                    error_chunk = {
-                                                        "error": {
-                                                            "message": (
-                                                                "Forbidden: reCAPTCHA validation failed repeatedly in userscript proxy."
-                                                            ),
-                                                            "type": "recaptcha_error",
-                                                            "code": HTTPStatus.FORBIDDEN,
-                                                        }
-                                                    }
-                                                    yield f"data: {json.dumps(error_chunk)}\n\n"
-                                                    yield "data: [DONE]\n\n"
-                                                    return
+                                            refreshed_token = None
 
-                                            if isinstance(payload, dict):
-                                                payload["recaptchaV3Token"] = ""
-                                                payload.pop("recaptchaV2Token", None)
+                                if refreshed_token:
+                                    global EPHEMERAL_ARENA_AUTH_TOKEN
+                                    EPHEMERAL_ARENA_AUTH_TOKEN = refreshed_token
+                                    current_token = refreshed_token
+                                    headers = get_request_headers_with_token(current_token, recaptcha_token)
+                                    # Ensure the next browser attempt mints a fresh token for the refreshed session.
+                                    if isinstance(payload, dict):
+                                        payload["recaptchaV3Token"] = ""
+                                    debug_print("🔄 Refreshed arena-auth-prod-v1 session after 401. Retrying...")
+                                    async for ka in wait_with_keepalive(1.0):
+                                        yield ka
+                                    continue
+                                
+                                try:
+                                    # Try with next available token (excluding failed ones)
+                                    current_token = get_next_auth_token(exclude_tokens=failed_tokens)
+                                    headers = get_request_headers_with_token(current_token, recaptcha_token)
+                                    debug_print(f"🔄 Retrying stream with next token: {current_token[:20]}...")
+                                    async for ka in wait_with_keepalive(1.0):
+                                        yield ka
+                                    continue
+                                except HTTPException:
+                                    debug_print("No more tokens available for streaming request.")
+                                    error_chunk = {
+                                        "error": {
+                                            "message": (
+                                                "Unauthorized: Your LMArena auth token has expired or is invalid. "
+                                                "Please get a new auth token from the dashboard."
+                                            ),
+                                            "type": "authentication_error",
+                                            "code": HTTPStatus.UNAUTHORIZED,
+                                        }
+                                    }
+                                    yield f"data: {json.dumps(error_chunk)}\n\n"
+                                    yield "data: [DONE]\n\n"
+                                    return
+                            
+                            log_http_status(response.status_code, "Stream Connection")
+                            response.raise_for_status()
+                            
+                            # Yields None (keep-alive or coalescing flush) whenever upstream stays quiet; one pump task
+                            # per stream instead of a Task per line.
+                            async for maybe_line in aiter_lines_with_keepalive(
+                                response.aiter_lines(), lambda: delta_coalescer.next_wait(None), stream_heartbeat
+                            ):
+                                if maybe_line is None:
+                                    # Upstream went quiet: either a coalescing window closed or it is time
+                                    # for a keep-alive.
+                                    if delta_coalescer.pending:
+                                        yield delta_coalescer.flush()
+                                    else:
+                                        yield ": keep-alive\n\n"
+                                    continue
 
-                                            async for ka in wait_with_keepalive(1.5):
-                                                yield ka
-                                            continue
+                                for kind, value in stream_parser.feed(maybe_line):
+                                    if kind == STREAM_EVENT_REASONING or kind == STREAM_EVENT_CONTENT:
+                                        sse_text = delta_coalescer.add(kind, value)
+                                        if sse_text:
+                                            yield sse_text
+                                    elif kind == STREAM_EVENT_IMAGE:
+                                        # Images arrive as markdown content
+                                        yield delta_coalescer.flush() + sse_encoder.content(value)
+                                    elif kind == STREAM_EVENT_CITATION:
+                                        if isinstance(value, dict):
+                                            debug_print(f"  🔗 Citation added: {value.get('toolCallId')}")
+                                    elif kind == STREAM_EVENT_ERROR:
+                                        print(f"  ❌ Error in stream: {value}")
+                                    elif kind == STREAM_EVENT_FINISH:
+                                        # Send final chunk with finish_reason (after any buffered deltas)
+                                        yield delta_coalescer.flush() + sse_encoder.finish(
+                                            stream_parser.finish_reason or "stop"
+                                        )
+                                    elif kind == STREAM_EVENT_UNHANDLED:
+                                        # Capture a small preview of unhandled upstream lines for troubleshooting.
+                                        if len(unhandled_preview) < 5:
+                                            unhandled_preview.append(value)
 
-                                        if is_recaptcha_failure:
-                                            # Track consecutive reCAPTCHA failures so we can escalate to browser
-                                            # transports even for non-strict models.
-                                            recaptcha_403_failures += 1
-                                            if recaptcha_403_last_transport == transport_used:
-                                                recaptcha_403_consecutive += 1
-                                            else:
-                                                recaptcha_403_consecutive = 1
-                                                recaptcha_403_last_transport = transport_used
-
-                                            if transport_used in ("chrome", "camoufox"):
-                                                try:
-                                                    debug_print(
-                                                        "Refreshing token/cookies (side-channel) after browser fetch 403..."
-                                                    )
-                                                    refresh_task = asyncio.create_task(
-                                                        refresh_recaptcha_token(force_new=True)
-                                                    )
-                                                    async for ka in wait_for_task(refresh_task):
-                                                        yield ka
-                                                    new_token = refresh_task.result()
-                                                except Exception:
-                                                    new_token = None
-                                                # Prefer reusing a fresh side-channel token on the next attempt; if we
-                                                # couldn't get one, fall back to in-page minting.
-                                                if isinstance(payload, dict):
-                                                    payload["recaptchaV3Token"] = new_token or ""
-                                            else:
-                                                debug_print("Refreshing token (side-channel)...")
-                                                try:
-                                                    refresh_task = asyncio.create_task(
-                                                        refresh_recaptcha_token(force_new=True)
-                                                    )
-                                                    async for ka in wait_for_task(refresh_task):
-                                                        yield ka
-                                                    new_token = refresh_task.result()
-                                                except Exception:
-                                                    new_token = None
-                                                if new_token and isinstance(payload, dict):
-                                                    payload["recaptchaV3Token"] = new_token
-
-                                            if recaptcha_403_consecutive >= 2 and transport_used == "chrome":
-                                                debug_print(
-                                                    "Switching to Camoufox-first after repeated Chrome reCAPTCHA failures."
-                                                )
-                                                use_browser_transports = True
-                                                prefer_chrome_transport = False
-                                                recaptcha_403_consecutive = 0
-                                                recaptcha_403_last_transport = None
-                                            elif recaptcha_403_consecutive >= 2 and transport_used != "chrome":
-                                                debug_print(
-                                                    "🌐 Switching to Chrome fetch transport after repeated reCAPTCHA failures."
-                                                )
-                                                use_browser_transports = True
-                                                prefer_chrome_transport = True
-                                                recaptcha_403_consecutive = 0
-                                                recaptcha_403_last_transport = None
+                            pending_deltas = delta_coalescer.flush()
+                            if pending_deltas:
+                                yield pending_deltas
 
-                                            async for ka in wait_with_keepalive(1.5):
-                                                yield ka
-                                            continue
+                        response_text = stream_parser.response_text
+                        reasoning_text = stream_parser.reasoning_text
+                        citations = stream_parser.citations
+                        
+                        # If we got no usable deltas, treat it as an upstream failure and retry.
+                        if not stream_parser.has_output:
+                            upstream_hint: Optional[str] = None
+                            proxy_status: Optional[int] = None
+                            proxy_headers: Optional[dict] = None
+                            if transport_used == "userscript":
+                                try:
+                                    proxy_job_id = str(getattr(stream_context, "job_id", "") or "").strip()
+                                    proxy_job = _USERSCRIPT_PROXY_JOBS.get(proxy_job_id)
+                                    if isinstance(proxy_job, dict):
+                                        if proxy_job.get("error"):
+                                            upstream_hint = str(proxy_job.get("error") or "")
+                                        status = proxy_job.get("status_code")
+                                        headers = proxy_job.get("headers")
+                                        if isinstance(headers, dict):
+                                            proxy_headers = headers
+                                        if isinstance(status, int) and int(status) >= 400:
+                                            proxy_status = int(status)
+                                            upstream_hint = upstream_hint or f"Userscript proxy upstream HTTP {int(status)}"
+                                except Exception:
+                                    pass
 
-                                        # If 403 but not recaptcha, might be other auth issue, but let's retry anyway
-                                        async for ka in wait_with_keepalive(2.0):
-                                            yield ka
-                                        continue
+                            if not upstream_hint and unhandled_preview:
+                                # Common case: upstream returns a JSON error body (not a0:/ad: lines).
+                                try:
+                                    obj = json.loads(unhandled_preview[0])
+                                    if isinstance(obj, dict):
+                                        upstream_hint = str(obj.get("error") or obj.get("message") or "")
+                                except Exception:
+                                    pass
+                                
+                                if not upstream_hint:
+                                    upstream_hint = unhandled_preview[0][:500]
+
+                            debug_print(f"⚠️ Stream produced no content deltas (transport={transport_used}, attempt {attempt}). Retrying...")
+                            if upstream_hint:
+                                debug_print(f"   Upstream hint: {upstream_hint[:200]}")
+                                if "recaptcha" in upstream_hint.lower():
+                                    recaptcha_403_failures += 1
+                                    if recaptcha_403_failures >= 5:
+                                        debug_print("❌ Too many reCAPTCHA failures (detected in body). Failing fast.")
+                                        error_chunk = {
+                                            "error": {
+                                                "message": f"Forbidden: reCAPTCHA validation failed. Upstream hint: {upstream_hint[:200]}",
+                                                "type": "recaptcha_error",
+                                                "code": HTTPStatus.FORBIDDEN,
+                                            }
+                                        }
+                                        yield f"data: {json.dumps(error_chunk)}\n\n"
+                                        yield "data: [DONE]\n\n"
+                                        return
+                            elif unhandled_preview:
+                                debug_print(f"   Upstream preview: {unhandled_preview[0][:200]}")
+                            
+                            no_delta_failures += 1
+                            if no_delta_failures >= 10:
+                                debug_print("❌ Too many attempts with no content produced. Failing fast.")
+                                error_chunk = {
+                                    "error": {
+                                        "message": f"Upstream failure: The request produced no content after multiple retries. Last hint: {upstream_hint[:200] if upstream_hint else 'None'}",
+                                        "type": "upstream_error",
+                                        "code": HTTPStatus.BAD_GATEWAY,
+                                    }
+                                }
+                                yield f"data: {json.dumps(error_chunk)}\n\n"
+                                yield "data: [DONE]\n\n"
+                                return
 
-                                elif response.status_code == HTTPStatus.UNAUTHORIZED:
-                                    debug_print(f"🔒 Stream token expired")
-                                    # Add current token to failed set
+                            # If the userscript proxy actually returned an upstream HTTP error, don't spin forever
+                            # sending keep-alives: treat them as the equivalent upstream status and fall back.
+                            if transport_used == "userscript" and proxy_status in (
+                                HTTPStatus.UNAUTHORIZED,
+                                HTTPStatus.FORBIDDEN,
+                            ):
+                                # Mirror the regular 401/403 handling, but based on the proxy job status instead
+                                # of `response.status_code` (which can be stale for userscript jobs).
+                                if proxy_status == HTTPStatus.UNAUTHORIZED:
+                                    debug_print("🔒 Userscript proxy upstream 401. Rotating auth token...")
                                     failed_tokens.add(current_token)
+                                    # (Pruning disabled)
 
-                                    # Best-effort: refresh the current base64 session in-memory before rotating.
-                                    refreshed_token: Optional[str] = None
-                                    if current_token:
-                                        try:
-                                            cfg_now = get_config()
-                                        except Exception:
-                                            cfg_now = {}
-                                        if not isinstance(cfg_now, dict):
-                                            cfg_now = {}
-                                        try:
-                                            refreshed_token = await refresh_arena_auth_token_via_lmarena_http(
-                                                current_token, cfg_now
-                                            )
-                                        except Exception:
-                                            refreshed_token = None
-                                        if not refreshed_token:
-                                            try:
-                                                refreshed_token = await refresh_arena_auth_token_via_supabase(current_token)
-                                            except Exception:
-                                                refreshed_token = None
-
-                                    if refreshed_token:
-                                        global EPHEMERAL_ARENA_AUTH_TOKEN
-                                        EPHEMERAL_ARENA_AUTH_TOKEN = refreshed_token
-                                        current_token = refreshed_token
-                                        headers = get_request_headers_with_token(current_token, recaptcha_token)
-                                        # Ensure the next browser attempt mints a fresh token for the refreshed session.
-                                        if isinstance(payload, dict):
-                                            payload["recaptchaV3Token"] = ""
-                                        debug_print("🔄 Refreshed arena-auth-prod-v1 session after 401. Retrying...")
-                                        async for ka in wait_with_keepalive(1.0):
-                                            yield ka
-                                        continue
-                                    
                                     try:
-                                        # Try with next available token (excluding failed ones)
                                         current_token = get_next_auth_token(exclude_tokens=failed_tokens)
                                         headers = get_request_headers_with_token(current_token, recaptcha_token)
-                                        debug_print(f"🔄 Retrying stream with next token: {current_token[:20]}...")
-                                        async for ka in wait_with_keepalive(1.0):
-                                            yield ka
-                                        continue
                                     except HTTPException:
-                                        debug_print("No more tokens available for streaming request.")
                                         error_chunk = {
                                             "error": {
                                                 "message": (
@@ -7541,449 +11338,141 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                                         yield f"data: {json.dumps(error_chunk)}\n\n"
                                         yield "data: [DONE]\n\n"
                                         return
-                                
-                                log_http_status(response.status_code, "Stream Connection")
-                                response.raise_for_status()
-                                
-                                # Wrapped iterator to yield keep-alives while waiting for upstream lines.
-                                # NOTE: Avoid asyncio.wait_for() here; cancelling __anext__ can break the iterator.
-                                async def _aiter_with_keepalive(it):
-                                    pending: Optional[asyncio.Task] = asyncio.create_task(it.__anext__())
-                                    try:
-                                        while True:
-                                            done, _ = await asyncio.wait({pending}, timeout=1.0)
-                                            if pending not in done:
-                                                yield None
-                                                continue
-                                            try:
-                                                item = pending.result()
-                                            except StopAsyncIteration:
-                                                break
-                                            pending = asyncio.create_task(it.__anext__())
-                                            yield item
-                                    finally:
-                                        if pending is not None and not pending.done():
-                                            pending.cancel()
-
-                                async for maybe_line in _aiter_with_keepalive(response.aiter_lines().__aiter__()):
-                                    if maybe_line is None:
-                                        yield ": keep-alive\n\n"
-                                        continue
 
-                                    line = str(maybe_line).strip()
-                                    # Normalize possible SSE framing (e.g. `data: a0:"..."`).
-                                    if line.startswith("data:"):
-                                        line = line[5:].lstrip()
-                                    if not line:
-                                        continue
-                                    
-                                    # Parse thinking/reasoning chunks: ag:"thinking text"
-                                    if line.startswith("ag:"):
-                                        chunk_data = line[3:]
-                                        try:
-                                            reasoning_chunk = json.loads(chunk_data)
-                                            reasoning_text += reasoning_chunk
-                                            
-                                            # Send SSE-formatted chunk with reasoning_content
-                                            chunk_response = {
-                                                "id": chunk_id,
-                                                "object": "chat.completion.chunk",
-                                                "created": int(time.time()),
-                                                "model": model_public_name,
-                                                "choices": [{
-                                                    "index": 0,
-                                                    "delta": {
-                                                        "reasoning_content": reasoning_chunk
-                                                    },
-                                                    "finish_reason": None
-                                                }]
-                                            }
-                                            yield f"data: {json.dumps(chunk_response)}\n\n"
-                                            
-                                        except json.JSONDecodeError:
-                                            continue
-                                    
-                                    # Parse text chunks: a0:"Hello "
-                                    elif line.startswith("a0:"):
-                                        chunk_data = line[3:]
-                                        try:
-                                            text_chunk = json.loads(chunk_data)
-                                            response_text += text_chunk
-                                            
-                                            # Send SSE-formatted chunk
-                                            chunk_response = {
-                                                "id": chunk_id,
-                                                "object": "chat.completion.chunk",
-                                                "created": int(time.time()),
-                                                "model": model_public_name,
-                                                "choices": [{
-                                                    "index": 0,
-                                                    "delta": {
-                                                        "content": text_chunk
-                                                    },
-                                                    "finish_reason": None
-                                                }]
-                                            }
-                                            yield f"data: {json.dumps(chunk_response)}\n\n"
-                                            
-                                        except json.JSONDecodeError:
-                                            continue
-                                    
-                                    # Parse image generation: a2:[{...}] (for image models)
-                                    elif line.startswith("a2:"):
-                                        image_data = line[3:]
-                                        try:
-                                            image_list = json.loads(image_data)
-                                            # OpenAI format: return URL in content
-                                            if isinstance(image_list, list) and len(image_list) > 0:
-                                                image_obj = image_list[0]
-                                                if image_obj.get('type') == 'image':
-                                                    image_url = image_obj.get('image', '')
-                                                    # Format as markdown for streaming
-                                                    response_text = f"![Generated Image]({image_url})"
-                                                    
-                                                    # Send the markdown-formatted image in a chunk
-                                                    chunk_response = {
-                                                        "id": chunk_id,
-                                                        "object": "chat.completion.chunk",
-                                                        "created": int(time.time()),
-                                                        "model": model_public_name,
-                                                        "choices": [{
-                                                            "index": 0,
-                                                            "delta": {
-                                                                "content": response_text
-                                                            },
-                                                            "finish_reason": None
-                                                        }]
-                                                    }
-                                                    yield f"data: {json.dumps(chunk_response)}\n\n"
-                                        except json.JSONDecodeError:
-                                            pass
-                                    
-                                    # Parse citations/tool calls: ac:{...} (for search models)
-                                    elif line.startswith("ac:"):
-                                        citation_data = line[3:]
-                                        try:
-                                            citation_obj = json.loads(citation_data)
-                                            # Extract source information from argsTextDelta
-                                            if 'argsTextDelta' in citation_obj:
-                                                args_data = json.loads(citation_obj['argsTextDelta'])
-                                                if 'source' in args_data:
-                                                    source = args_data['source']
-                                                    # Can be a single source or array of sources
-                                                    if isinstance(source, list):
-                                                        citations.extend(source)
-                                                    elif isinstance(source, dict):
-                                                        citations.append(source)
-                                            debug_print(f"  🔗 Citation added: {citation_obj.get('toolCallId')}")
-                                        except json.JSONDecodeError:
-                                            pass
-                                    
-                                    # Parse error messages
-                                    elif line.startswith("a3:"):
-                                        error_data = line[3:]
-                                        try:
-                                            error_message = json.loads(error_data)
-                                            print(f"  ❌ Error in stream: {error_message}")
-                                        except json.JSONDecodeError:
-                                            pass
-                                    
-                                    # Parse metadata for finish
-                                    elif line.startswith("ad:"):
-                                        metadata_data = line[3:]
-                                        try:
-                                            metadata = json.loads(metadata_data)
-                                            finish_reason = metadata.get("finishReason", "stop")
-                                            
-                                            # Send final chunk with finish_reason
-                                            final_chunk = {
-                                                "id": chunk_id,
-                                                "object": "chat.completion.chunk",
-                                                "created": int(time.time()),
-                                                "model": model_public_name,
-                                                "choices": [{
-                                                    "index": 0,
-                                                    "delta": {},
-                                                    "finish_reason": finish_reason
-                                                }]
+                                if proxy_status == HTTPStatus.FORBIDDEN:
+                                    recaptcha_403_failures += 1
+                                    if recaptcha_403_failures >= 5:
+                                        debug_print("❌ Too many reCAPTCHA failures in userscript proxy. Failing fast.")
+                                        error_chunk = {
+                                            "error": {
+                                                "message": "Forbidden: reCAPTCHA validation failed repeatedly in userscript proxy.",
+                                                "type": "recaptcha_error",
+                                                "code": HTTPStatus.FORBIDDEN,
                                             }
-                                            yield f"data: {json.dumps(final_chunk)}\n\n"
-                                        except json.JSONDecodeError:
-                                            continue
-                                    
-                                    # Support for standard OpenAI-style JSON chunks (some proxies or new LMArena endpoints)
-                                    elif line.startswith("{"):
-                                        try:
-                                            chunk_obj = json.loads(line)
-                                            # If it looks like an OpenAI chunk, extract the delta content
-                                            if "choices" in chunk_obj and isinstance(chunk_obj["choices"], list) and len(chunk_obj["choices"]) > 0:
-                                                delta = chunk_obj["choices"][0].get("delta", {})
-                                                
-                                                # Handle thinking/reasoning
-                                                if "reasoning_content" in delta:
-                                                    r_chunk = str(delta["reasoning_content"] or "")
-                                                    reasoning_text += r_chunk
-                                                    chunk_response = {
-                                                        "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model_public_name,
-                                                        "choices": [{"index": 0, "delta": {"reasoning_content": r_chunk}, "finish_reason": None}]
-                                                    }
-                                                    yield f"data: {json.dumps(chunk_response)}\n\n"
-
-                                                # Handle text content
-                                                if "content" in delta:
-                                                    c_chunk = str(delta["content"] or "")
-                                                    response_text += c_chunk
-                                                    chunk_response = {
-                                                        "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model_public_name,
-                                                        "choices": [{"index": 0, "delta": {"content": c_chunk}, "finish_reason": None}]
-                                                    }
-                                                    yield f"data: {json.dumps(chunk_response)}\n\n"
-                                        except Exception:
-                                            pass
+                                        }
+                                        yield f"data: {json.dumps(error_chunk)}\n\n"
+                                        yield "data: [DONE]\n\n"
+                                        return
 
-                                    else:
-                                        # Capture a small preview of unhandled upstream lines for troubleshooting.
-                                        if len(unhandled_preview) < 5:
-                                            unhandled_preview.append(line)
-                                        continue
-                            
-                            # If we got no usable deltas, treat it as an upstream failure and retry.
-                            if (not response_text.strip()) and (not reasoning_text.strip()) and (not citations):
-                                upstream_hint: Optional[str] = None
-                                proxy_status: Optional[int] = None
-                                proxy_headers: Optional[dict] = None
-                                if transport_used == "userscript":
-                                    try:
-                                        proxy_job_id = str(getattr(stream_context, "job_id", "") or "").strip()
-                                        proxy_job = _USERSCRIPT_PROXY_JOBS.get(proxy_job_id)
-                                        if isinstance(proxy_job, dict):
-                                            if proxy_job.get("error"):
-                                                upstream_hint = str(proxy_job.get("error") or "")
-                                            status = proxy_job.get("status_code")
-                                            headers = proxy_job.get("headers")
-                                            if isinstance(headers, dict):
-                                                proxy_headers = headers
-                                            if isinstance(status, int) and int(status) >= 400:
-                                                proxy_status = int(status)
-                                                upstream_hint = upstream_hint or f"Userscript proxy upstream HTTP {int(status)}"
-                                    except Exception:
-                                        pass
+                                    # Common case: the proxy session gets flagged (reCAPTCHA). Retry with a fresh
+                                    # in-page token mint rather than switching to buffered browser fetch fallbacks.
+                                    force_proxy_recaptcha_mint = True
+                                    debug_print("🚫 Userscript proxy upstream 403: retrying userscript (fresh reCAPTCHA).")
+                                    if isinstance(payload, dict):
+                                        payload["recaptchaV3Token"] = ""
+                                        payload.pop("recaptchaV2Token", None)
 
-                                if not upstream_hint and unhandled_preview:
-                                    # Common case: upstream returns a JSON error body (not a0:/ad: lines).
+                                yield ": keep-alive\n\n"
+                                continue
+
+                            # If the proxy upstream is rate-limited, respect Retry-After/backoff.
+                            if transport_used == "userscript" and proxy_status == HTTPStatus.TOO_MANY_REQUESTS:
+                                retry_after = None
+                                if isinstance(proxy_headers, dict):
+                                    retry_after = proxy_headers.get("retry-after") or proxy_headers.get("Retry-After")
+                                retry_after_value = 0.0
+                                if isinstance(retry_after, str):
                                     try:
-                                        obj = json.loads(unhandled_preview[0])
-                                        if isinstance(obj, dict):
-                                            upstream_hint = str(obj.get("error") or obj.get("message") or "")
+                                        retry_after_value = float(retry_after.strip())
                                     except Exception:
-                                        pass
-                                    
-                                    if not upstream_hint:
-                                        upstream_hint = unhandled_preview[0][:500]
-
-                                debug_print(f"⚠️ Stream produced no content deltas (transport={transport_used}, attempt {attempt}). Retrying...")
-                                if upstream_hint:
-                                    debug_print(f"   Upstream hint: {upstream_hint[:200]}")
-                                    if "recaptcha" in upstream_hint.lower():
-                                        recaptcha_403_failures += 1
-                                        if recaptcha_403_failures >= 5:
-                                            debug_print("❌ Too many reCAPTCHA failures (detected in body). Failing fast.")
-                                            error_chunk = {
-                                                "error": {
-                                                    "message": f"Forbidden: reCAPTCHA validation failed. Upstream hint: {upstream_hint[:200]}",
-                                                    "type": "recaptcha_error",
-                                                    "code": HTTPStatus.FORBIDDEN,
-                                                }
-                                            }
-                                            yield f"data: {json.dumps(error_chunk)}\n\n"
-                                            yield "data: [DONE]\n\n"
-                                            return
-                                elif unhandled_preview:
-                                    debug_print(f"   Upstream preview: {unhandled_preview[0][:200]}")
+                                        retry_after_value = 0.0
+                                sleep_seconds = get_rate_limit_sleep_seconds(retry_after, attempt)
+                                debug_print(f"⏱️  Userscript proxy upstream 429. Waiting {sleep_seconds}s...")
                                 
-                                no_delta_failures += 1
-                                if no_delta_failures >= 10:
-                                    debug_print("❌ Too many attempts with no content produced. Failing fast.")
+                                # Rotate token on userscript rate limit too.
+                                old_token = current_token
+                                token_rotated = False
+                                try:
+                                    rotation_exclude = set(failed_tokens)
+                                    if current_token:
+                                        rotation_exclude.add(current_token)
+                                    current_token = get_next_auth_token(
+                                        exclude_tokens=rotation_exclude, allow_ephemeral_fallback=False
+                                    )
+                                    headers = get_request_headers_with_token(current_token, recaptcha_token)
+                                    token_rotated = True
+                                    debug_print(f"🔄 Retrying stream with next token (after proxy 429): {current_token[:20]}...")
+                                except HTTPException:
+                                    # Only one token (or all tokens excluded). Keep the current token and retry
+                                    # after backoff instead of failing fast.
+                                    debug_print(
+                                        "⚠️ No alternative token available after userscript proxy rate limit; retrying with same token after backoff."
+                                    )
+
+                                # reCAPTCHA v3 tokens can be single-use and may expire while we back off.
+                                # Clear it so the next proxy attempt mints a fresh token in-page.
+                                if isinstance(payload, dict):
+                                    payload["recaptchaV3Token"] = ""
+
+                                # If we rotated tokens, allow a fast retry when waiting would blow past the remaining
+                                # stream deadline (common when one token is rate-limited but another isn't).
+                                if token_rotated and current_token and current_token != old_token:
+                                    remaining_budget = float(stream_total_timeout_seconds) - float(
+                                        time.monotonic() - stream_started_at
+                                    )
+                                    if float(sleep_seconds) > max(0.0, remaining_budget):
+                                        sleep_seconds = min(float(sleep_seconds), 1.0)
+
+                                # If we still can't wait within the remaining deadline, fail now instead of sending
+                                # keep-alives indefinitely.
+                                if (time.monotonic() - stream_started_at + float(sleep_seconds)) > stream_total_timeout_seconds:
                                     error_chunk = {
                                         "error": {
-                                            "message": f"Upstream failure: The request produced no content after multiple retries. Last hint: {upstream_hint[:200] if upstream_hint else 'None'}",
-                                            "type": "upstream_error",
-                                            "code": HTTPStatus.BAD_GATEWAY,
+                                            "message": f"Upstream rate limit (429) would exceed stream deadline ({int(sleep_seconds)}s backoff).",
+                                            "type": "rate_limit_error",
+                                            "code": HTTPStatus.TOO_MANY_REQUESTS,
                                         }
                                     }
                                     yield f"data: {json.dumps(error_chunk)}\n\n"
                                     yield "data: [DONE]\n\n"
                                     return
 
-                                # If the userscript proxy actually returned an upstream HTTP error, don't spin forever
-                                # sending keep-alives: treat them as the equivalent upstream status and fall back.
-                                if transport_used == "userscript" and proxy_status in (
-                                    HTTPStatus.UNAUTHORIZED,
-                                    HTTPStatus.FORBIDDEN,
-                                ):
-                                    # Mirror the regular 401/403 handling, but based on the proxy job status instead
-                                    # of `response.status_code` (which can be stale for userscript jobs).
-                                    if proxy_status == HTTPStatus.UNAUTHORIZED:
-                                        debug_print("🔒 Userscript proxy upstream 401. Rotating auth token...")
-                                        failed_tokens.add(current_token)
-                                        # (Pruning disabled)
-
-                                        try:
-                                            current_token = get_next_auth_token(exclude_tokens=failed_tokens)
-                                            headers = get_request_headers_with_token(current_token, recaptcha_token)
-                                        except HTTPException:
-                                            error_chunk = {
-                                                "error": {
-                                                    "message": (
-                                                        "Unauthorized: Your LMArena auth token has expired or is invalid. "
-                                                        "Please get a new auth token from the dashboard."
-                                                    ),
-                                                    "type": "authentication_error",
-                                                    "code": HTTPStatus.UNAUTHORIZED,
-                                                }
-                                            }
-                                            yield f"data: {json.dumps(error_chunk)}\n\n"
-                                            yield "data: [DONE]\n\n"
-                                            return
-
-                                    if proxy_status == HTTPStatus.FORBIDDEN:
-                                        recaptcha_403_failures += 1
-                                        if recaptcha_403_failures >= 5:
-                                            debug_print("❌ Too many reCAPTCHA failures in userscript proxy. Failing fast.")
-                                            error_chunk = {
-                                                "error": {
-                                                    "message": "Forbidden: reCAPTCHA validation failed repeatedly in userscript proxy.",
-                                                    "type": "recaptcha_error",
-                                                    "code": HTTPStatus.FORBIDDEN,
-                                                }
-                                            }
-                                            yield f"data: {json.dumps(error_chunk)}\n\n"
-                                            yield "data: [DONE]\n\n"
-                                            return
-
-                                        # Common case: the proxy session gets flagged (reCAPTCHA). Retry with a fresh
-                                        # in-page token mint rather than switching to buffered browser fetch fallbacks.
-                                        force_proxy_recaptcha_mint = True
-                                        debug_print("🚫 Userscript proxy upstream 403: retrying userscript (fresh reCAPTCHA).")
-                                        if isinstance(payload, dict):
-                                            payload["recaptchaV3Token"] = ""
-                                            payload.pop("recaptchaV2Token", None)
-
-                                    yield ": keep-alive\n\n"
-                                    continue
-
-                                # If the proxy upstream is rate-limited, respect Retry-After/backoff.
-                                if transport_used == "userscript" and proxy_status == HTTPStatus.TOO_MANY_REQUESTS:
-                                    retry_after = None
-                                    if isinstance(proxy_headers, dict):
-                                        retry_after = proxy_headers.get("retry-after") or proxy_headers.get("Retry-After")
-                                    retry_after_value = 0.0
-                                    if isinstance(retry_after, str):
-                                        try:
-                                            retry_after_value = float(retry_after.strip())
-                                        except Exception:
-                                            retry_after_value = 0.0
-                                    sleep_seconds = get_rate_limit_sleep_seconds(retry_after, attempt)
-                                    debug_print(f"⏱️  Userscript proxy upstream 429. Waiting {sleep_seconds}s...")
-                                    
-                                    # Rotate token on userscript rate limit too.
-                                    old_token = current_token
-                                    token_rotated = False
-                                    try:
-                                        rotation_exclude = set(failed_tokens)
-                                        if current_token:
-                                            rotation_exclude.add(current_token)
-                                        current_token = get_next_auth_token(
-                                            exclude_tokens=rotation_exclude, allow_ephemeral_fallback=False
-                                        )
-                                        headers = get_request_headers_with_token(current_token, recaptcha_token)
-                                        token_rotated = True
-                                        debug_print(f"🔄 Retrying stream with next token (after proxy 429): {current_token[:20]}...")
-                                    except HTTPException:
-                                        # Only one token (or all tokens excluded). Keep the current token and retry
-                                        # after backoff instead of failing fast.
-                                        debug_print(
-                                            "⚠️ No alternative token available after userscript proxy rate limit; retrying with same token after backoff."
-                                        )
-
-                                    # reCAPTCHA v3 tokens can be single-use and may expire while we back off.
-                                    # Clear it so the next proxy attempt mints a fresh token in-page.
-                                    if isinstance(payload, dict):
-                                        payload["recaptchaV3Token"] = ""
-
-                                    # If we rotated tokens, allow a fast retry when waiting would blow past the remaining
-                                    # stream deadline (common when one token is rate-limited but another isn't).
-                                    if token_rotated and current_token and current_token != old_token:
-                                        remaining_budget = float(stream_total_timeout_seconds) - float(
-                                            time.monotonic() - stream_started_at
-                                        )
-                                        if float(sleep_seconds) > max(0.0, remaining_budget):
-                                            sleep_seconds = min(float(sleep_seconds), 1.0)
-
-                                    # If we still can't wait within the remaining deadline, fail now instead of sending
-                                    # keep-alives indefinitely.
-                                    if (time.monotonic() - stream_started_at + float(sleep_seconds)) > stream_total_timeout_seconds:
-                                        error_chunk = {
-                                            "error": {
-                                                "message": f"Upstream rate limit (429) would exceed stream deadline ({int(sleep_seconds)}s backoff).",
-                                                "type": "rate_limit_error",
-                                                "code": HTTPStatus.TOO_MANY_REQUESTS,
-                                            }
-                                        }
-                                        yield f"data: {json.dumps(error_chunk)}\n\n"
-                                        yield "data: [DONE]\n\n"
-                                        return
-
-                                    async for ka in wait_with_keepalive(sleep_seconds):
-                                        yield ka
-                                else:
-                                    async for ka in wait_with_keepalive(1.5):
-                                        yield ka
-                                continue
-
-                            # Update session - Store message history with IDs (including reasoning and citations if present)
-                            assistant_message = {
-                                "id": model_msg_id, 
-                                "role": "assistant", 
-                                "content": response_text.strip()
-                            }
-                            if reasoning_text:
-                                assistant_message["reasoning_content"] = reasoning_text.strip()
-                            if citations:
-                                # Deduplicate citations by URL
-                                unique_citations = []
-                                seen_urls = set()
-                                for citation in citations:
-                                    citation_url = citation.get('url')
-                                    if citation_url and citation_url not in seen_urls:
-                                        seen_urls.add(citation_url)
-                                        unique_citations.append(citation)
-                                assistant_message["citations"] = unique_citations
-                            
-                            if not session:
-                                chat_sessions[api_key_str][conversation_id] = {
-                                    "conversation_id": session_id,
-                                    "model": model_public_name,
-                                    "messages": [
-                                        {"id": user_msg_id, "role": "user", "content": prompt},
-                                        assistant_message
-                                    ]
-                                }
-                                debug_print(f"💾 Saved new session for conversation {conversation_id}")
+                                async for ka in wait_with_keepalive(sleep_seconds):
+                                    yield ka
                             else:
-                                # Append new messages to history
-                                chat_sessions[api_key_str][conversation_id]["messages"].append(
-                                    {"id": user_msg_id, "role": "user", "content": prompt}
-                                )
-                                chat_sessions[api_key_str][conversation_id]["messages"].append(
+                                async for ka in wait_with_keepalive(1.5):
+                                    yield ka
+                            continue
+
+                        # Update session - Store message history with IDs (including reasoning and citations if present)
+                        assistant_message = {
+                            "id": model_msg_id, 
+                            "role": "assistant", 
+                            "content": response_text.strip()
+                        }
+                        if reasoning_text:
+                            assistant_message["reasoning_content"] = reasoning_text.strip()
+                        if citations:
+                            # Already deduplicated by URL as they streamed in
+                            assistant_message["citations"] = list(citations)
+                        
+                        if not session:
+                            chat_sessions[api_key_str][conversation_id] = {
+                                "conversation_id": session_id,
+                                "model": model_public_name,
+                                "messages": [
+                                    {"id": user_msg_id, "role": "user", "content": prompt},
                                     assistant_message
-                                )
-                                debug_print(f"💾 Updated existing session for conversation {conversation_id}")
+                                ]
+                            }
+                            debug_print(f"💾 Saved new session for conversation {conversation_id}")
+                        else:
+                            # Append new messages to history
+                            chat_sessions[api_key_str][conversation_id]["messages"].append(
+                                {"id": user_msg_id, "role": "user", "content": prompt}
+                            )
+                            chat_sessions[api_key_str][conversation_id]["messages"].append(
+                                assistant_message
+                            )
+                            debug_print(f"💾 Updated existing session for conversation {conversation_id}")
+                        bind_conversation_token(
+                            chat_sessions[api_key_str][conversation_id]["conversation_id"], current_token
+                        )
+                        
+                        yield "data: [DONE]\n\n"
+                        debug_print(f"✅ Stream completed - {len(response_text)} chars sent")
+                        return  # Success, exit retry loop
                             
-                            yield "data: [DONE]\n\n"
-                            debug_print(f"✅ Stream completed - {len(response_text)} chars sent")
-                            return  # Success, exit retry loop
-                                
                     except httpx.HTTPStatusError as e:
                         # Handle retry-able errors
                         if e.response.status_code == 429:
@@ -8110,7 +11599,10 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                         yield f"data: {json.dumps(error_chunk)}\n\n"
                         yield "data: [DONE]\n\n"
                         return
-            return StreamingResponse(generate_stream(), media_type="text/event-stream")
+            body_stream = admission.wrap_stream(stream_heartbeat.wrap_stream(generate_stream()))
+            # If the body is never iterated (client gone before headers), free the slot when the stream is collected.
+            weakref.finalize(body_stream, admission.release)
+            return StreamingResponse(body_stream, media_type="text/event-stream")
         
         # Handle non-streaming mode with retry
         try:
@@ -8137,6 +11629,9 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                     # but we add an outer loop here to handle token rotation (401) and rate limits (429).
                     max_chrome_retries = 3
                     for chrome_attempt in range(max_chrome_retries):
+                        current_token, backoff_wait = route_around_upstream_backoff(current_token, url, failed_tokens)
+                        if backoff_wait > 0:
+                            await asyncio.sleep(backoff_wait)
                         response = await fetch_lmarena_stream_via_chrome(
                             http_method=http_method,
                             url=url,
@@ -8157,6 +11652,9 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                             if response is None:
                                 break # Critical error
                         
+                        record_auth_token_result(
+                            current_token, response.status_code, response.headers.get("Retry-After"), url
+                        )
                         if response.status_code == HTTPStatus.UNAUTHORIZED:
                             debug_print(f"🔒 Token {current_token[:20]}... expired in Chrome fetch (attempt {chrome_attempt+1})")
                             failed_tokens.add(current_token)
@@ -8191,137 +11689,79 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                 )
                 
             log_http_status(response.status_code, "LMArena API Response")
-            
-            # Use aread() to ensure we buffer streaming-capable responses (like BrowserFetchStreamResponse)
-            response_bytes = await response.aread()
-            response_text_body = response_bytes.decode("utf-8", errors="replace")
-            
-            debug_print(f"📏 Response length: {len(response_text_body)} characters")
             debug_print(f"📋 Response headers: {dict(response.headers)}")
             
-            debug_print(f"🔍 Processing response...")
-            debug_print(f"📄 First 500 chars of response:\n{response_text_body[:500]}")
-            
-            # Process response in lmarena format
+            # Process response in lmarena format, line by line as it arrives (the raw body is never buffered).
             # Format: ag:"thinking" for reasoning, a0:"text chunk" for content, ac:{...} for citations, ad:{...} for metadata
-            response_text = ""
-            reasoning_text = ""
-            citations = []
-            finish_reason = None
-            line_count = 0
-            text_chunks_found = 0
-            reasoning_chunks_found = 0
-            citation_chunks_found = 0
-            metadata_found = 0
+            parser = LMArenaStreamParser()
+            raw_chars = 0
+            raw_preview: list[str] = []
+            raw_preview_chars = 0
             
+            debug_print(f"🔍 Processing response...")
             debug_print(f"📊 Parsing response lines...")
             
-            error_message = None
-            for line in response_text_body.splitlines():
-                line_count += 1
-                line = line.strip()
-                if line.startswith("data: "):
-                    line = line[6:].strip()
-                if not line:
-                    continue
-                
-                # Parse thinking/reasoning chunks: ag:"thinking text"
-                if line.startswith("ag:"):
-                    chunk_data = line[3:]  # Remove "ag:" prefix
-                    reasoning_chunks_found += 1
-                    try:
-                        # Parse as JSON string (includes quotes)
-                        reasoning_chunk = json.loads(chunk_data)
-                        reasoning_text += reasoning_chunk
-                        if reasoning_chunks_found <= 3:  # Log first 3 reasoning chunks
-                            debug_print(f"  🧠 Reasoning chunk {reasoning_chunks_found}: {repr(reasoning_chunk[:50])}")
-                    except json.JSONDecodeError as e:
-                        debug_print(f"  ⚠️ Failed to parse reasoning chunk on line {line_count}: {chunk_data[:100]} - {e}")
-                        continue
-                
-                # Parse text chunks: a0:"Hello "
-                elif line.startswith("a0:"):
-                    chunk_data = line[3:]  # Remove "a0:" prefix
-                    text_chunks_found += 1
-                    try:
-                        # Parse as JSON string (includes quotes)
-                        text_chunk = json.loads(chunk_data)
-                        response_text += text_chunk
-                        if text_chunks_found <= 3:  # Log first 3 chunks
-                            debug_print(f"  ✅ Chunk {text_chunks_found}: {repr(text_chunk[:50])}")
-                    except json.JSONDecodeError as e:
-                        debug_print(f"  ⚠️ Failed to parse text chunk on line {line_count}: {chunk_data[:100]} - {e}")
-                        continue
-                
-                # Parse image generation: a2:[{...}] (for image models)
-                elif line.startswith("a2:"):
-                    image_data = line[3:]  # Remove "a2:" prefix
-                    try:
-                        image_list = json.loads(image_data)
-                        # OpenAI format expects URL in content
-                        if isinstance(image_list, list) and len(image_list) > 0:
-                            image_obj = image_list[0]
-                            if image_obj.get('type') == 'image':
-                                image_url = image_obj.get('image', '')
-                                # Format as markdown
-                                response_text = f"![Generated Image]({image_url})"
-                    except json.JSONDecodeError as e:
-                        debug_print(f"  ⚠️ Failed to parse image data on line {line_count}: {image_data[:100]} - {e}")
-                        continue
-                
-                # Parse citations/tool calls: ac:{...} (for search models)
-                elif line.startswith("ac:"):
-                    citation_data = line[3:]  # Remove "ac:" prefix
-                    citation_chunks_found += 1
-                    try:
-                        citation_obj = json.loads(citation_data)
-                        # Extract source information from argsTextDelta
-                        if 'argsTextDelta' in citation_obj:
-                            args_data = json.loads(citation_obj['argsTextDelta'])
-                            if 'source' in args_data:
-                                source = args_data['source']
-                                # Can be a single source or array of sources
-                                if isinstance(source, list):
-                                    citations.extend(source)
-                                elif isinstance(source, dict):
-                                    citations.append(source)
-                        if citation_chunks_found <= 3:  # Log first 3 citations
-                            debug_print(f"  🔗 Citation chunk {citation_chunks_found}: {citation_obj.get('toolCallId')}")
-                    except json.JSONDecodeError as e:
-                        debug_print(f"  ⚠️ Failed to parse citation chunk on line {line_count}: {citation_data[:100]} - {e}")
-                        continue
-                
-                # Parse error messages: a3:"An error occurred"
-                elif line.startswith("a3:"):
-                    error_data = line[3:]  # Remove "a3:" prefix
-                    try:
-                        error_message = json.loads(error_data)
-                        debug_print(f"  ❌ Error message received: {error_message}")
-                    except json.JSONDecodeError as e:
-                        debug_print(f"  ⚠️ Failed to parse error message on line {line_count}: {error_data[:100]} - {e}")
-                        error_message = error_data
-                
-                # Parse metadata: ad:{"finishReason":"stop"}
-                elif line.startswith("ad:"):
-                    metadata_data = line[3:]  # Remove "ad:" prefix
-                    metadata_found += 1
-                    try:
-                        metadata = json.loads(metadata_data)
-                        finish_reason = metadata.get("finishReason")
-                        debug_print(f"  📋 Metadata found: finishReason={finish_reason}")
-                    except json.JSONDecodeError as e:
-                        debug_print(f"  ⚠️ Failed to parse metadata on line {line_count}: {metadata_data[:100]} - {e}")
-                        continue
-                elif line.strip():  # Non-empty line that doesn't match expected format
-                    if line_count <= 5:  # Log first 5 unexpected lines
-                        debug_print(f"  ❓ Unexpected line format {line_count}: {line[:100]}")
+            line_count = 0
+            upstream_lines = response.aiter_lines()
+            try:
+                async for line in upstream_lines:
+                    line_count += 1
+                    raw_chars += len(line) + 1
+                    # Keep just enough raw text for the debug previews below.
+                    if raw_preview_chars < NON_STREAM_RAW_PREVIEW_CHARS:
+                        raw_preview.append(line)
+                        raw_preview_chars += len(line) + 1
+                    upstream_error = False
+                    for kind, value in parser.feed(line):
+                        if kind == STREAM_EVENT_REASONING:
+                            if parser.counts["ag"] <= 3:  # Log first 3 reasoning chunks
+                                debug_print(f"  🧠 Reasoning chunk {parser.counts['ag']}: {repr(value[:50])}")
+                        elif kind == STREAM_EVENT_CONTENT:
+                            if parser.counts["a0"] <= 3:  # Log first 3 chunks
+                                debug_print(f"  ✅ Chunk {parser.counts['a0']}: {repr(value[:50])}")
+                        elif kind == STREAM_EVENT_CITATION:
+                            if parser.counts["ac"] <= 3 and isinstance(value, dict):  # Log first 3 citations
+                                debug_print(f"  🔗 Citation chunk {parser.counts['ac']}: {value.get('toolCallId')}")
+                        elif kind == STREAM_EVENT_ERROR:
+                            debug_print(f"  ❌ Error message received: {value}")
+                            upstream_error = True
+                        elif kind == STREAM_EVENT_FINISH:
+                            debug_print(f"  📋 Metadata found: finishReason={parser.finish_reason}")
+                        elif kind == STREAM_EVENT_INVALID:
+                            tag, raw, exc = value
+                            debug_print(f"  ⚠️ Failed to parse {tag} line {line_count}: {raw[:100]} - {exc}")
+                        elif kind == STREAM_EVENT_UNHANDLED:
+                            if line_count <= 5:  # Log first 5 unexpected lines
+                                debug_print(f"  ❓ Unexpected line format {line_count}: {value[:100]}")
+                    if upstream_error:
+                        # a3: is terminal; stop reading instead of waiting for the upstream to finish the body.
+                        debug_print(f"  ⛔ Aborting read after upstream error on line {line_count}")
+                        break
+            finally:
+                close_lines = getattr(upstream_lines, "aclose", None)
+                if close_lines is not None:
+                    await close_lines()
+
+            # Proxy jobs can fail after headers were reported; surface that through the standard error handling.
+            if isinstance(response, UserscriptProxyStreamResponse):
+                response.raise_for_status()
+
+            raw_head = "\n".join(raw_preview)
+            debug_print(f"📏 Response length: {raw_chars} characters")
+            debug_print(f"📄 First 500 chars of response:\n{raw_head[:500]}")
+
+            response_text = parser.response_text
+            reasoning_text = parser.reasoning_text
+            citations = parser.citations
+            finish_reason = parser.finish_reason
+            error_message = parser.error_message
 
             debug_print(f"\n📊 Parsing Summary:")
-            debug_print(f"  - Total lines: {line_count}")
-            debug_print(f"  - Reasoning chunks found: {reasoning_chunks_found}")
-            debug_print(f"  - Text chunks found: {text_chunks_found}")
-            debug_print(f"  - Citation chunks found: {citation_chunks_found}")
-            debug_print(f"  - Metadata entries: {metadata_found}")
+            debug_print(f"  - Total lines: {parser.counts['lines']}")
+            debug_print(f"  - Reasoning chunks found: {parser.counts['ag']}")
+            debug_print(f"  - Text chunks found: {parser.counts['a0']}")
+            debug_print(f"  - Citation chunks found: {parser.counts['ac']}")
+            debug_print(f"  - Metadata entries: {parser.counts['ad']}")
             debug_print(f"  - Final response length: {len(response_text)} chars")
             debug_print(f"  - Final reasoning length: {len(reasoning_text)} chars")
             debug_print(f"  - Citations found: {len(citations)}")
@@ -8329,7 +11769,7 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
             
             if not response_text:
                 debug_print(f"\n⚠️  WARNING: Empty response text!")
-                debug_print(f"📄 Full raw response:\n{response_text_body}")
+                debug_print(f"📄 Raw response (first {len(raw_head)} of {raw_chars} chars):\n{raw_head}")
                 if error_message:
                     error_detail = f"LMArena API error: {error_message}"
                     print(f"❌ {error_detail}")
@@ -8364,15 +11804,8 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
             if reasoning_text:
                 assistant_message["reasoning_content"] = reasoning_text.strip()
             if citations:
-                # Deduplicate citations by URL
-                unique_citations = []
-                seen_urls = set()
-                for citation in citations:
-                    citation_url = citation.get('url')
-                    if citation_url and citation_url not in seen_urls:
-                        seen_urls.add(citation_url)
-                        unique_citations.append(citation)
-                assistant_message["citations"] = unique_citations
+                # Already deduplicated by URL by the parser
+                assistant_message["citations"] = list(citations)
             
             if not session:
                 chat_sessions[api_key_str][conversation_id] = {
@@ -8393,6 +11826,7 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                     assistant_message
                 )
                 debug_print(f"💾 Updated existing session for conversation {conversation_id}")
+            bind_conversation_token(chat_sessions[api_key_str][conversation_id]["conversation_id"], current_token)
 
             # Build message object with reasoning and citations if present
             message_obj = {
@@ -8402,24 +11836,15 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
             if reasoning_text:
                 message_obj["reasoning_content"] = reasoning_text.strip()
             if citations:
-                # Deduplicate citations by URL
-                unique_citations = []
-                seen_urls = set()
-                for citation in citations:
-                    citation_url = citation.get('url')
-                    if citation_url and citation_url not in seen_urls:
-                        seen_urls.add(citation_url)
-                        unique_citations.append(citation)
-                message_obj["citations"] = unique_citations
+                message_obj["citations"] = list(citations)
                 
                 # Add citations as markdown footnotes
-                if unique_citations:
-                    footnotes = "\n\n---\n\n**Sources:**\n\n"
-                    for i, citation in enumerate(unique_citations, 1):
-                        title = citation.get('title', 'Untitled')
-                        url = citation.get('url', '')
-                        footnotes += f"{i}. [{title}]({url})\n"
-                    message_obj["content"] = response_text.strip() + footnotes
+                footnotes = "\n\n---\n\n**Sources:**\n\n"
+                for i, citation in enumerate(citations, 1):
+                    title = citation.get('title', 'Untitled')
+                    url = citation.get('url', '')
+                    footnotes += f"{i}. [{title}]({url})\n"
+                message_obj["content"] = response_text.strip() + footnotes
             
             # Image models already have markdown formatting from parsing
             # No additional conversion needed
@@ -8543,6 +11968,17 @@ async def api_chat_completions(request: Request, api_key: dict = Depends(rate_li
                     "code": type(e).__name__.lower()
                 }
             }
+        finally:
+            if response is not None:
+                try:
+                    await response.aclose()
+                except Exception:
+                    pass
+            try:
+                await upstream_responses.aclose()
+            except Exception:
+                pass
+            admission.release()
                 
     except HTTPException:
         raise
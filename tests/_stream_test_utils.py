@@ -57,6 +57,10 @@ class BaseBridgeTest(unittest.IsolatedAsyncioTestCase):
 
         self.main.chat_sessions.clear()
         self.main.api_key_usage.clear()
+        self.main._AUTH_TOKEN_HEALTH.clear()
+        self.main._UPSTREAM_BACKOFF.clear()
+        self.main.conversation_tokens.clear()
+        self.main.conversation_token_expiry.clear()
 
         self._orig_config_file = self.main.CONFIG_FILE
         self._orig_token_index = getattr(self.main, "current_token_index", 0)
@@ -0,0 +1,68 @@
+"""
+Benchmark for `SSEChunkEncoder` against building and `json.dumps`-ing a full chunk dict per delta.
+
+Not collected by pytest. Run from the repo root:
+
+    python -m tests.bench_sse_encoder [--deltas N] [--repeat R]
+"""
+
+import argparse
+import json
+import time
+
+from src.main import ORJSON_AVAILABLE, SSEChunkEncoder
+
+
+def legacy_encode(chunk_id: str, model: str, deltas: list[str]) -> int:
+    size = 0
+    for text in deltas:
+        chunk = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"reasoning_content": text}, "finish_reason": None}],
+        }
+        size += len(f"data: {json.dumps(chunk)}\n\n")
+    return size
+
+
+def encoder_encode(chunk_id: str, model: str, deltas: list[str], use_orjson: bool) -> int:
+    encoder = SSEChunkEncoder(chunk_id, model, use_orjson=use_orjson)
+    size = 0
+    for text in deltas:
+        size += len(encoder.reasoning(text))
+    return size
+
+
+def best_of(repeat: int, fn, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SSE chunk encoder benchmark")
+    parser.add_argument("--deltas", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chunk_id, model = "chatcmpl-00000000-0000-0000-0000-000000000000", "example-model-thinking"
+    deltas = [f"token {i} \"quoted\" naïve " for i in range(args.deltas)]
+
+    baseline = best_of(args.repeat, legacy_encode, chunk_id, model, deltas)
+    print(f"dict + json.dumps     {baseline * 1000:9.2f} ms  {args.deltas / baseline:12.0f} chunks/s")
+    variants = [("encoder (json)", False)] + ([("encoder (orjson)", True)] if ORJSON_AVAILABLE else [])
+    for label, use_orjson in variants:
+        elapsed = best_of(args.repeat, encoder_encode, chunk_id, model, deltas, use_orjson)
+        print(
+            f"{label:<20}  {elapsed * 1000:9.2f} ms  {args.deltas / elapsed:12.0f} chunks/s  "
+            f"x{baseline / elapsed:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
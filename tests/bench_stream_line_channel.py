@@ -0,0 +1,103 @@
+"""
+Benchmark for upstream line delivery: the old Task-per-line keep-alive wrapper vs `aiter_lines_with_keepalive`.
+
+Not collected by pytest. Run from the repo root:
+
+    python -m tests.bench_stream_line_channel [--lines N] [--repeat R]
+
+Reports wall time per line and event-loop iterations per line (counted by wrapping the loop's `_run_once`).
+"""
+
+import argparse
+import asyncio
+import time
+
+from src.main import aiter_lines_with_keepalive
+
+
+async def legacy_aiter_with_keepalive(it):
+    # The wrapper previously inlined in `generate_stream`.
+    pending = asyncio.create_task(it.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=1.0)
+            if pending not in done:
+                yield None
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                break
+            pending = asyncio.create_task(it.__anext__())
+            yield item
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+async def upstream(lines: int, burst: int):
+    # Yield to the loop every `burst` lines, like a socket delivering several lines per read.
+    for i in range(lines):
+        if i % burst == 0:
+            await asyncio.sleep(0)
+        yield f'a0:"token {i}"'
+
+
+async def consume_legacy(lines: int, burst: int) -> int:
+    count = 0
+    async for item in legacy_aiter_with_keepalive(upstream(lines, burst).__aiter__()):
+        if item is not None:
+            count += 1
+    return count
+
+
+async def consume_channel(lines: int, burst: int) -> int:
+    count = 0
+    async for item in aiter_lines_with_keepalive(upstream(lines, burst), lambda: 1.0):
+        if item is not None:
+            count += 1
+    return count
+
+
+def measure(fn, lines: int, burst: int, repeat: int) -> tuple[float, float]:
+    best = float("inf")
+    iterations = 0
+    for _ in range(repeat):
+        loop = asyncio.new_event_loop()
+        counter = [0]
+        run_once = loop._run_once
+
+        def _counting_run_once():
+            counter[0] += 1
+            run_once()
+
+        loop._run_once = _counting_run_once
+        try:
+            started = time.perf_counter()
+            assert loop.run_until_complete(fn(lines, burst)) == lines
+            elapsed = time.perf_counter() - started
+        finally:
+            loop.close()
+        if elapsed < best:
+            best, iterations = elapsed, counter[0]
+    return best, iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stream line delivery benchmark")
+    parser.add_argument("--lines", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for burst in (1, 16):
+        print(f"burst={burst}")
+        for label, fn in (("task per line", consume_legacy), ("line channel", consume_channel)):
+            elapsed, iterations = measure(fn, args.lines, burst, args.repeat)
+            print(
+                f"  {label:<14} {elapsed / args.lines * 1e6:8.2f} us/line  "
+                f"{iterations / args.lines:6.2f} loop iterations/line"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Throughput benchmark for `LMArenaStreamParser`.
+
+Not collected by pytest. Run from the repo root:
+
+    python -m tests.bench_stream_parser [--deltas N] [--repeat R]
+
+Replays synthesized LMArena streams (reasoning + text deltas, search citations with repeated URLs, finish
+metadata) and reports lines/sec plus the final accumulated sizes.
+"""
+
+import argparse
+import json
+import time
+
+from src.main import LMArenaStreamParser
+
+
+def build_stream(deltas: int, citations: int = 200, unique_urls: int = 20) -> list[str]:
+    lines = [f"ag:{json.dumps(f'step {i} ')}" for i in range(deltas // 4)]
+    for i in range(citations):
+        source = {"url": f"https://example.com/{i % unique_urls}", "title": f"Source {i}"}
+        lines.append("ac:" + json.dumps({"toolCallId": f"call-{i}", "argsTextDelta": json.dumps({"source": source})}))
+    lines.extend(f"a0:{json.dumps(f'token{i} ')}" for i in range(deltas))
+    lines.append('ad:{"finishReason":"stop"}')
+    return lines
+
+
+def run(lines: list[str], repeat: int) -> None:
+    best = float("inf")
+    parser = None
+    for _ in range(repeat):
+        parser = LMArenaStreamParser()
+        started = time.perf_counter()
+        for line in lines:
+            parser.feed(line)
+        text = parser.response_text
+        best = min(best, time.perf_counter() - started)
+    print(
+        f"{len(lines):>8} lines  {best * 1000:8.2f} ms  {len(lines) / best:12.0f} lines/s  "
+        f"text={len(text)} chars  citations={len(parser.citations)}/{parser.sources_seen}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--deltas", type=int, nargs="*", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for deltas in args.deltas:
+        run(build_stream(deltas), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestApiKeyRateLimiter(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.setup_config(
+            {
+                "api_keys": [
+                    {"name": "Slow", "key": "slow-key", "rpm": 3},
+                    {"name": "Fast", "key": "fast-key", "rpm": 999},
+                ]
+            }
+        )
+        self.now = [1000.0]
+
+    async def _call(self, key: str):
+        with patch("src.main.time.time", side_effect=lambda: self.now[0]):
+            return await self.main.rate_limit_api_key(f"Bearer {key}")
+
+    async def test_window_rejects_with_exact_retry_after(self) -> None:
+        for offset in (0.0, 10.0, 20.0):
+            self.now[0] = 1000.0 + offset
+            self.assertEqual((await self._call("slow-key"))["name"], "Slow")
+
+        self.now[0] = 1030.5
+        with self.assertRaises(HTTPException) as ctx:
+            await self._call("slow-key")
+        self.assertEqual(ctx.exception.status_code, 429)
+        # The oldest admitted request (t=1000) leaves the window at t=1060.
+        self.assertEqual(ctx.exception.headers["Retry-After"], "30")
+
+        # Other keys are unaffected; the slow key is admitted once its oldest request ages out.
+        await self._call("fast-key")
+        self.now[0] = 1060.0
+        await self._call("slow-key")
+        with self.assertRaises(HTTPException) as ctx:
+            await self._call("slow-key")
+        self.assertEqual(ctx.exception.headers["Retry-After"], "10")
+
+    async def test_unknown_key_is_rejected(self) -> None:
+        with self.assertRaises(HTTPException) as ctx:
+            await self._call("nope")
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    async def test_rpm_change_keeps_recent_window(self) -> None:
+        for offset in (0.0, 1.0, 2.0):
+            self.now[0] = 1000.0 + offset
+            await self._call("slow-key")
+        self.setup_config({"api_keys": [{"name": "Slow", "key": "slow-key", "rpm": 2}]})
+        self.now[0] = 1005.0
+        with self.assertRaises(HTTPException) as ctx:
+            await self._call("slow-key")
+        # Only the two most recent timestamps are kept; the older of those (t=1001) expires at t=1061.
+        self.assertEqual(ctx.exception.headers["Retry-After"], "56")
+
+    async def test_recent_activity_uses_limiter_counters(self) -> None:
+        for offset in (0.0, 100.0, 7200.0):
+            self.now[0] = 1000.0 + offset
+            await self._call("fast-key")
+        self.now[0] = 1000.0 + 200.0
+        await self._call("slow-key")
+
+        self.assertEqual(self.main.get_api_key_recent_activity(now=9000.0), 4)
+        # A day later only the request made two hours in has not aged out of the 24 hourly buckets.
+        self.assertEqual(self.main.get_api_key_recent_activity(now=1000.0 + 86400.0 + 3600.0), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
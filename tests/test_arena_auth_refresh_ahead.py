@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import json
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+def _session_token(expires_at: int, refresh_token: str = "refresh") -> str:
+    access = "eyJhbGciOiJIUzI1NiJ9." + base64.urlsafe_b64encode(b'{"sub":"u"}').decode().rstrip("=") + ".sig"
+    session = {"access_token": access, "refresh_token": refresh_token, "expires_at": expires_at}
+    return "base64-" + base64.b64encode(json.dumps(session).encode()).decode().rstrip("=")
+
+
+class TestArenaAuthRefreshAhead(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self._reset()
+        self._orig_ephemeral = self.main.EPHEMERAL_ARENA_AUTH_TOKEN
+
+    async def asyncTearDown(self) -> None:
+        self._reset()
+        self.main.EPHEMERAL_ARENA_AUTH_TOKEN = self._orig_ephemeral
+        await super().asyncTearDown()
+
+    def _reset(self) -> None:
+        self.main._AUTH_TOKEN_POOL = None
+        self.main._ARENA_AUTH_TOKEN_SUCCESSORS.clear()
+        self.main._ARENA_AUTH_REFRESH_RETRY_AT.clear()
+        self.main._AUTH_TOKEN_HEALTH.clear()
+        self.main.current_token_index = 0
+
+    def _mark_served(self, *tokens: str) -> None:
+        for token in tokens:
+            self.main._get_auth_token_health(token).last_used_at = time.monotonic()
+
+    async def _run_task_until(self, predicate) -> None:
+        task = asyncio.create_task(self.main.arena_auth_refresh_task())
+        try:
+            for _ in range(200):
+                if predicate():
+                    return
+                await asyncio.sleep(0.01)
+            self.fail("condition not reached")
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def test_refreshes_before_expiry_and_publishes_to_pool(self) -> None:
+        expiring = _session_token(int(time.time()) + 120, "r1")
+        later = _session_token(int(time.time()) + 7200, "r2")
+        fresh = _session_token(int(time.time()) + 3600, "r3")
+        self.setup_config({"auth_tokens": [expiring, later], "arena_auth_refresh_ahead_seconds": 300})
+        self._mark_served(expiring, later)
+        pool = self.main.get_auth_token_pool()
+
+        refresh = AsyncMock(return_value=fresh)
+        with patch.object(self.main, "refresh_arena_auth_token_via_lmarena_http", refresh):
+            await self._run_task_until(lambda: self.main.get_auth_token_pool() is not pool)
+
+        refresh.assert_awaited_once_with(expiring)
+        self.assertEqual(self.main.get_auth_token_pool().candidates(), [fresh, later])
+        self.assertEqual(self.main.get_next_auth_token(), fresh)
+        self.assertEqual(self.main.get_current_arena_auth_token(expiring), fresh)
+        # The spent refresh token would leave the configured value dead after a restart, so the successor is saved.
+        self.assertEqual(self.main.get_config()["auth_tokens"], [fresh, later])
+        self.assertIsNotNone(self.main._AUTH_TOKEN_HEALTH[fresh].last_used_at)
+
+    async def test_idle_sessions_are_not_refreshed_ahead(self) -> None:
+        idle = _session_token(int(time.time()) + 60, "r1")
+        served = _session_token(int(time.time()) + 60, "r2")
+        fresh = _session_token(int(time.time()) + 3600, "r3")
+        self.setup_config({"auth_tokens": [idle, served], "arena_auth_refresh_ahead_idle_seconds": 600})
+        self._mark_served(served)
+        self.main._get_auth_token_health(idle).last_used_at = time.monotonic() - 900
+
+        refresh = AsyncMock(return_value=fresh)
+        with patch.object(self.main, "refresh_arena_auth_token_via_lmarena_http", refresh):
+            await self._run_task_until(lambda: refresh.await_count >= 1)
+            await asyncio.sleep(0.05)
+
+        refresh.assert_awaited_once_with(served)
+        self.assertEqual(self.main.get_config()["auth_tokens"], [idle, fresh])
+
+    async def test_falls_back_to_supabase_and_backs_off_on_failure(self) -> None:
+        expiring = _session_token(int(time.time()) + 60, "r1")
+        fresh = _session_token(int(time.time()) + 3600, "r2")
+        self.setup_config({"auth_tokens": [expiring]})
+
+        lmarena = AsyncMock(return_value=None)
+        supabase = AsyncMock(return_value=fresh)
+        with patch.object(self.main, "refresh_arena_auth_token_via_lmarena_http", lmarena), patch.object(
+            self.main, "refresh_arena_auth_token_via_supabase", supabase
+        ):
+            self.assertEqual(await self.main.refresh_arena_auth_token_ahead(expiring), fresh)
+        self.assertEqual(self.main.get_auth_token_pool().candidates(), [fresh])
+        self.assertEqual(self.main.get_config()["auth_tokens"], [fresh])
+
+        self._reset()
+        self.setup_config({"auth_tokens": [expiring]})
+        self._mark_served(expiring)
+        failing = AsyncMock(return_value=None)
+        with patch.object(self.main, "refresh_arena_auth_token_via_lmarena_http", failing), patch.object(
+            self.main, "refresh_arena_auth_token_via_supabase", failing
+        ):
+            await self._run_task_until(lambda: expiring in self.main._ARENA_AUTH_REFRESH_RETRY_AT)
+        self.assertEqual(failing.await_count, 2)
+        self.assertGreater(self.main._ARENA_AUTH_REFRESH_RETRY_AT[expiring], time.time())
+
+    def test_publish_updates_ephemeral_token(self) -> None:
+        self.main.EPHEMERAL_ARENA_AUTH_TOKEN = "base64-old"
+        self.main.publish_refreshed_auth_token("base64-old", "base64-new")
+        self.assertEqual(self.main.EPHEMERAL_ARENA_AUTH_TOKEN, "base64-new")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import base64
+import json
+import unittest
+from unittest.mock import patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+def _session_token(expires_at: int, refresh_token: str = "refresh") -> str:
+    access = "eyJhbGciOiJIUzI1NiJ9." + base64.urlsafe_b64encode(b'{"sub":"u"}').decode().rstrip("=") + ".sig"
+    session = {"access_token": access, "refresh_token": refresh_token, "expires_at": expires_at}
+    return "base64-" + base64.b64encode(json.dumps(session).encode()).decode().rstrip("=")
+
+
+class TestAuthTokenPool(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._AUTH_TOKEN_POOL = None
+        self.main._ARENA_AUTH_TOKEN_RECORDS.clear()
+        self.main.current_token_index = 0
+
+    def test_record_fields(self) -> None:
+        record = self.main.get_arena_auth_token_record(_session_token(2_000_000_000))
+        self.assertEqual(record.kind, "base64")
+        self.assertEqual(record.expires_at, 2_000_000_000)
+        self.assertTrue(record.well_formed)
+        self.assertTrue(record.has_refresh_token)
+
+        opaque = self.main.get_arena_auth_token_record("test-auth")
+        self.assertEqual((opaque.kind, opaque.expires_at, opaque.well_formed), ("opaque", None, False))
+
+    def test_tokens_are_decoded_once(self) -> None:
+        tokens = [_session_token(2_000_000_000, "r1"), _session_token(2_000_000_000, "r2"), "short"]
+        self.setup_config({"auth_tokens": tokens})
+        with patch.object(
+            self.main, "_decode_arena_auth_session_token", wraps=self.main._decode_arena_auth_session_token
+        ) as decode:
+            picks = [self.main.get_next_auth_token() for _ in range(6)]
+        self.assertEqual(picks, tokens[:2] * 3)
+        self.assertEqual(decode.call_count, 3)
+
+    def test_pool_rebuilds_when_tokens_change(self) -> None:
+        self.setup_config({"auth_tokens": ["token-a"]})
+        pool = self.main.get_auth_token_pool()
+        self.assertIs(self.main.get_auth_token_pool(), pool)
+
+        self.setup_config({"auth_tokens": ["token-b"]})
+        self.assertIsNot(self.main.get_auth_token_pool(), pool)
+        self.assertEqual(self.main.get_next_auth_token(), "token-b")
+
+    def test_tier_changes_when_token_expires(self) -> None:
+        valid = _session_token(1_000_100)
+        expired_later = _session_token(1_000_000)
+        self.setup_config({"auth_tokens": [expired_later, valid]})
+        pool = self.main.get_auth_token_pool()
+
+        self.assertEqual(pool.candidates(now=900_000), [expired_later, valid])
+        # `expired_later` crosses its (30s-skewed) expiry; only `valid` stays in the preferred tier.
+        self.assertEqual(pool.candidates(now=999_980), [valid])
+        # Both expired: fall back to refreshable base64 sessions.
+        self.assertEqual(pool.candidates(now=1_000_200), [expired_later, valid])
+
+
+if __name__ == "__main__":
+    unittest.main()
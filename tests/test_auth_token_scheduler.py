@@ -0,0 +1,113 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+from tests._stream_test_utils import BaseBridgeTest, FakeStreamContext, FakeStreamResponse
+
+
+class TestAuthTokenScheduler(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._AUTH_TOKEN_POOL = None
+        self.main.current_token_index = 0
+
+    def test_equal_health_keeps_round_robin(self) -> None:
+        self.setup_config({"auth_tokens": ["token-a", "token-b", "token-c"]})
+        picks = [self.main.get_next_auth_token() for _ in range(6)]
+        self.assertEqual(picks, ["token-a", "token-b", "token-c"] * 2)
+
+    def test_rate_limited_token_is_skipped_until_cooldown_ends(self) -> None:
+        self.setup_config({"auth_tokens": ["token-a", "token-b"]})
+        self.main.record_auth_token_result("token-a", 429, "30")
+
+        picks = [self.main.get_next_auth_token() for _ in range(4)]
+        self.assertEqual(picks, ["token-b"] * 4)
+
+        stats = self.main.get_auth_token_scheduler_stats()
+        self.assertEqual(stats["cooling"], 1)
+
+        # Cooldown over but the 429 is recent: still behind `token-b` until its error rate decays.
+        health = self.main._AUTH_TOKEN_HEALTH["token-a"]
+        health.cooldown_until = 0.0
+        self.assertEqual([self.main.get_next_auth_token() for _ in range(2)], ["token-b"] * 2)
+        health.error_rate_at -= 120.0
+        self.assertIn("token-a", [self.main.get_next_auth_token() for _ in range(2)])
+
+    def test_all_cooling_picks_earliest_deadline(self) -> None:
+        self.setup_config({"auth_tokens": ["token-a", "token-b"]})
+        self.main.record_auth_token_result("token-a", 429, "60")
+        self.main.record_auth_token_result("token-b", 429, "5")
+        self.assertEqual(self.main.get_next_auth_token(), "token-b")
+
+    def test_prefers_lowest_error_rate_then_least_loaded(self) -> None:
+        self.setup_config({"auth_tokens": ["token-a", "token-b", "token-c"]})
+        self.main._get_auth_token_health("token-a").in_flight = 2
+        self.main.record_auth_token_result("token-b", 401)
+        self.assertEqual(self.main.get_next_auth_token(), "token-c")
+
+        # A busy healthy token still beats an idle one that keeps failing.
+        self.main._get_auth_token_health("token-c").in_flight = 3
+        self.assertEqual(self.main.get_next_auth_token(), "token-a")
+
+    async def test_stream_lease_tracks_in_flight_and_records_status(self) -> None:
+        seen: list[int] = []
+        lease = self.main.AuthTokenLease(
+            FakeStreamContext(FakeStreamResponse(status_code=200, text="ok")), "token-a"
+        )
+        async with lease as response:
+            seen.append(self.main._AUTH_TOKEN_HEALTH["token-a"].in_flight)
+            self.assertEqual(response.status_code, 200)
+
+        health = self.main._AUTH_TOKEN_HEALTH["token-a"]
+        self.assertEqual(seen, [1])
+        self.assertEqual((health.in_flight, health.successes, health.last_status), (0, 1, 200))
+
+    async def test_stream_429_rotates_to_token_not_cooling(self) -> None:
+        self.setup_config({"auth_tokens": ["token-a", "token-b", "token-c"]})
+        # `token-b` was rate limited by an earlier request; rotation should go straight to `token-c`.
+        self.main.record_auth_token_result("token-b", 429, "120")
+        used: list[str] = []
+
+        def fake_stream(self, method, url, json=None, headers=None, timeout=None):  # noqa: ARG001
+            cookie = str((headers or {}).get("Cookie") or "")
+            used.append(next((t for t in ("token-a", "token-b", "token-c") if t in cookie), ""))
+            if len(used) == 1:
+                return FakeStreamContext(FakeStreamResponse(status_code=429, headers={"Retry-After": "1"}))
+            return FakeStreamContext(
+                FakeStreamResponse(status_code=200, text='a0:"Hello"\nad:{"finishReason":"stop"}\n')
+            )
+
+        with patch.object(self.main, "get_models") as get_models_mock, patch.object(
+            self.main, "refresh_recaptcha_token", AsyncMock(return_value="recaptcha-token")
+        ), patch.object(httpx.AsyncClient, "stream", new=fake_stream), patch(
+            "src.main.asyncio.sleep", AsyncMock()
+        ):
+            get_models_mock.return_value = [
+                {
+                    "publicName": "test-model",
+                    "id": "model-id",
+                    "organization": "test-org",
+                    "capabilities": {
+                        "inputCapabilities": {"text": True},
+                        "outputCapabilities": {"text": True},
+                    },
+                }
+            ]
+            transport = httpx.ASGITransport(app=self.main.app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/api/v1/chat/completions",
+                    headers={"Authorization": "Bearer test-key"},
+                    json={"model": "test-model", "messages": [{"role": "user", "content": "Hi"}], "stream": True},
+                    timeout=30.0,
+                )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Hello", response.text)
+        self.assertEqual(used, ["token-a", "token-c"])
+        self.assertGreater(self.main._AUTH_TOKEN_HEALTH["token-a"].cooldown_until, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestCamoufoxProxyTabs(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._USERSCRIPT_PROXY_QUEUE = None
+        self.main._USERSCRIPT_PROXY_JOBS.clear()
+        self.started: list[str] = []
+        self.gate = asyncio.Event()
+
+    async def asyncTearDown(self) -> None:
+        self.main._USERSCRIPT_PROXY_QUEUE = None
+        self.main._USERSCRIPT_PROXY_JOBS.clear()
+        self.main._CAMOUFOX_PROXY_TABS = []
+        await super().asyncTearDown()
+
+    def _make_page(self):
+        page = MagicMock()
+        page.is_closed = MagicMock(return_value=False)
+        page.goto = AsyncMock()
+        page.close = AsyncMock()
+        page.title = AsyncMock(return_value="LMArena")
+        page.mouse.move = AsyncMock()
+
+        async def _evaluate(script, arg=None):
+            if isinstance(script, str) and script.startswith("async ({ jid"):
+                self.started.append(arg["jid"])
+                await self.gate.wait()
+            return None
+
+        page.evaluate = AsyncMock(side_effect=_evaluate)
+        return page
+
+    def _make_browser(self):
+        context = MagicMock()
+        context.pages = [object()]
+        context.add_init_script = AsyncMock()
+        context.cookies = AsyncMock(return_value=[])
+        context.add_cookies = AsyncMock()
+        context.new_page = AsyncMock(side_effect=lambda: self._make_page())
+        browser = MagicMock()
+        browser.new_context = AsyncMock(return_value=context)
+        browser_cm = MagicMock()
+        browser_cm.__aenter__ = AsyncMock(return_value=browser)
+        browser_cm.__aexit__ = AsyncMock(return_value=False)
+        return browser_cm, context
+
+    async def _enqueue_job(self, job_id: str) -> asyncio.Event:
+        picked = asyncio.Event()
+        self.main._USERSCRIPT_PROXY_JOBS[job_id] = {
+            "job_id": job_id,
+            "payload": {"url": "/api", "method": "POST", "body": "{}"},
+            "picked_up_event": picked,
+            "lines_queue": asyncio.Queue(),
+            "done_event": asyncio.Event(),
+            "status_event": asyncio.Event(),
+        }
+        await self.main._get_userscript_proxy_queue().put(job_id)
+        return picked
+
+    async def _wait_for(self, predicate, timeout: float = 5.0) -> None:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not predicate():
+            if asyncio.get_running_loop().time() > deadline:
+                self.fail("condition not reached")
+            await asyncio.sleep(0.01)
+
+    async def test_jobs_run_concurrently_across_tabs(self) -> None:
+        self.setup_config({"camoufox_proxy_tabs": 2})
+        browser_cm, context = self._make_browser()
+        with patch("src.main.AsyncCamoufox", MagicMock(return_value=browser_cm)) as camoufox_cls:
+            worker = asyncio.create_task(self.main.camoufox_proxy_worker())
+            try:
+                picked_a = await self._enqueue_job("job-a")
+                picked_b = await self._enqueue_job("job-b")
+                await self._wait_for(lambda: len(self.started) == 2)
+
+                self.assertTrue(picked_a.is_set() and picked_b.is_set())
+                self.assertEqual(sorted(self.started), ["job-a", "job-b"])
+                self.assertEqual(camoufox_cls.call_count, 1)
+                self.assertEqual(context.new_page.await_count, 2)
+                self.assertEqual(self.main.get_camoufox_proxy_stats()["busy"], 2)
+
+                # A third job waits for a free tab instead of stacking on a busy one.
+                picked_c = await self._enqueue_job("job-c")
+                await asyncio.sleep(0.05)
+                self.assertFalse(picked_c.is_set())
+
+                self.gate.set()
+                await self._wait_for(lambda: "job-c" in self.started)
+                self.assertEqual(context.new_page.await_count, 2)
+            finally:
+                worker.cancel()
+                await asyncio.gather(worker, return_exceptions=True)
+
+    async def test_closed_tab_is_reopened(self) -> None:
+        self.setup_config({"camoufox_proxy_tabs": 1})
+        self.gate.set()
+        browser_cm, context = self._make_browser()
+        with patch("src.main.AsyncCamoufox", MagicMock(return_value=browser_cm)):
+            worker = asyncio.create_task(self.main.camoufox_proxy_worker())
+            try:
+                await self._enqueue_job("job-a")
+                await self._wait_for(lambda: self.started == ["job-a"])
+                await self._wait_for(lambda: self.main.get_camoufox_proxy_stats()["jobs"] == 1)
+
+                self.main._CAMOUFOX_PROXY_TABS[0].page.is_closed.return_value = True
+                await self._enqueue_job("job-b")
+                await self._wait_for(lambda: self.started == ["job-a", "job-b"])
+
+                self.assertEqual(context.new_page.await_count, 2)
+                self.assertEqual(self.main.get_camoufox_proxy_stats()["reopens"], 1)
+            finally:
+                worker.cancel()
+                await asyncio.gather(worker, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,25 @@
 import unittest
 from unittest.mock import AsyncMock, patch, MagicMock
 import asyncio
+import tempfile
 from http import HTTPStatus
+from pathlib import Path
 
 class TestChromeFetchRobustness(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        from src import main
+
+        # The fetch path persists the captured user agent; keep that write out of the repo's config.json.
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._orig_config_file = main.CONFIG_FILE
+        main.CONFIG_FILE = str(Path(self._temp_dir.name) / "config.json")
+
+    async def asyncTearDown(self):
+        from src import main
+
+        main.CONFIG_FILE = self._orig_config_file
+        self._temp_dir.cleanup()
+
     async def test_fetch_via_chrome_retries_cloudflare(self):
         from src import main
         
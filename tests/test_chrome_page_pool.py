@@ -0,0 +1,173 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+# `asyncio.sleep` is patched module-wide while the pool runs; keep a real one to let background tasks progress.
+_real_sleep = asyncio.sleep
+
+
+class TestChromePagePool(BaseBridgeTest):
+    def _mock_playwright(self):
+        mock_page = AsyncMock()
+        mock_page.is_closed = MagicMock(return_value=False)
+        mock_page.title.return_value = "LMArena"
+        mock_page.evaluate.side_effect = lambda script, arg=None: (
+            "user-agent"
+            if script == "() => navigator.userAgent"
+            else {"status": 200, "headers": {}, "text": "ok"}
+        )
+
+        mock_context = AsyncMock()
+        mock_context.new_page.return_value = mock_page
+        mock_context.cookies.return_value = []
+
+        mock_playwright = AsyncMock()
+        mock_playwright.chromium.launch_persistent_context.return_value = mock_context
+        mock_playwright.__aenter__.return_value = mock_playwright
+        return mock_playwright, mock_context, mock_page
+
+    async def _fetch(self):
+        return await self.main.fetch_lmarena_stream_via_chrome(
+            "POST",
+            "https://lmarena.ai/api",
+            {"p": 1, "recaptchaV3Token": "payload-token"},
+            "auth-token-1",
+        )
+
+    async def _run(self, calls: int):
+        mock_playwright, mock_context, mock_page = self._mock_playwright()
+        with patch("playwright.async_api.async_playwright", return_value=mock_playwright), patch(
+            "src.main.find_chrome_executable", return_value="/path/to/chrome"
+        ), patch("src.main.get_recaptcha_settings", return_value=("key", "action")), patch(
+            "src.main.click_turnstile", AsyncMock(return_value=True)
+        ), patch("src.main.asyncio.sleep", AsyncMock()):
+            try:
+                for _ in range(calls):
+                    resp = await self._fetch()
+                    self.assertIsNotNone(resp)
+                    self.assertEqual(resp.status_code, 200)
+                stats = self.main.get_chrome_page_pool_stats()
+            finally:
+                await self.main.close_chrome_page_pool()
+        return mock_playwright, mock_context, mock_page, stats
+
+    async def test_calls_reuse_warm_page(self) -> None:
+        mock_playwright, mock_context, mock_page, stats = await self._run(3)
+
+        mock_playwright.chromium.launch_persistent_context.assert_awaited_once()
+        mock_context.new_page.assert_awaited_once()
+        mock_page.goto.assert_awaited_once()
+        mock_page.expose_binding.assert_awaited_once()
+        self.assertEqual(stats["leases"], 3)
+        self.assertEqual(stats["idle"], 1)
+        mock_context.close.assert_awaited()  # closed by close_chrome_page_pool()
+
+    async def test_page_is_recycled_after_max_jobs(self) -> None:
+        self.setup_config({"chrome_fetch_pool_max_jobs": 2})
+        mock_playwright, mock_context, mock_page, stats = await self._run(5)
+
+        self.assertEqual(mock_playwright.chromium.launch_persistent_context.await_count, 3)
+        self.assertEqual(stats["recycles"], 2)
+
+    async def test_closed_page_is_relaunched(self) -> None:
+        mock_playwright, mock_context, mock_page = self._mock_playwright()
+        with patch("playwright.async_api.async_playwright", return_value=mock_playwright), patch(
+            "src.main.find_chrome_executable", return_value="/path/to/chrome"
+        ), patch("src.main.get_recaptcha_settings", return_value=("key", "action")), patch(
+            "src.main.asyncio.sleep", AsyncMock()
+        ):
+            try:
+                await self._fetch()
+                mock_page.is_closed.return_value = True
+                await self._fetch()
+            finally:
+                await self.main.close_chrome_page_pool()
+
+        self.assertEqual(mock_playwright.chromium.launch_persistent_context.await_count, 2)
+
+    async def test_chunks_from_a_previous_fetch_are_dropped(self) -> None:
+        mock_playwright, mock_context, mock_page = self._mock_playwright()
+        with patch("playwright.async_api.async_playwright", return_value=mock_playwright), patch(
+            "src.main.find_chrome_executable", return_value="/path/to/chrome"
+        ), patch("src.main.get_recaptcha_settings", return_value=("key", "action")), patch(
+            "src.main.asyncio.sleep", AsyncMock()
+        ):
+            try:
+                await self._fetch()
+                stale_id = mock_page.evaluate.call_args.args[1]["fetchId"]
+                report_chunk = mock_page.expose_binding.await_args.args[1]
+
+                pool = await self.main.get_chrome_page_pool()
+                slot = await pool.acquire()
+                channel = self.main.StreamLineChannel()
+                slot.lines_queue = channel
+                slot.fetch_id = "next-fetch"
+                await report_chunk(None, stale_id, 'a0:"stale"')
+                await report_chunk(None, "next-fetch", 'a0:"fresh"')
+                pool.release(slot)
+            finally:
+                await self.main.close_chrome_page_pool()
+
+        self.assertEqual(channel.get_nowait(), 'a0:"fresh"')
+        self.assertTrue(channel.empty())
+
+    async def test_headless_mode_change_relaunches_slot(self) -> None:
+        mock_playwright, mock_context, mock_page = self._mock_playwright()
+        with patch("playwright.async_api.async_playwright", return_value=mock_playwright), patch(
+            "src.main.find_chrome_executable", return_value="/path/to/chrome"
+        ), patch("src.main.get_recaptcha_settings", return_value=("key", "action")), patch(
+            "src.main.asyncio.sleep", AsyncMock()
+        ):
+            try:
+                await self._fetch()
+                await self.main.fetch_lmarena_stream_via_chrome(
+                    "POST", "https://lmarena.ai/api", {"p": 1, "recaptchaV3Token": "t"}, "auth-token-1", headless=True
+                )
+            finally:
+                await self.main.close_chrome_page_pool()
+
+        launches = mock_playwright.chromium.launch_persistent_context.await_args_list
+        self.assertEqual([call.kwargs["headless"] for call in launches], [False, True])
+
+    async def test_abandoned_stream_aborts_fetch_and_returns_lease(self) -> None:
+        mock_playwright, mock_context, mock_page = self._mock_playwright()
+        aborted = asyncio.Event()
+
+        async def _evaluate(script, arg=None):
+            if isinstance(arg, dict) and "fetchId" in arg:
+                report_chunk = mock_page.expose_binding.await_args.args[1]
+                await report_chunk(None, arg["fetchId"], json.dumps({"__type": "meta", "status": 200, "headers": {}}, separators=(",", ":")))
+                await report_chunk(None, arg["fetchId"], 'a0:"Hi"')
+                await aborted.wait()
+                return {"status": 502, "headers": {}, "text": "FETCH_ERROR:cancelled"}
+            if "abort('cancelled')" in str(script):
+                aborted.set()
+                return None
+            return "user-agent"
+
+        mock_page.evaluate.side_effect = _evaluate
+        with patch("playwright.async_api.async_playwright", return_value=mock_playwright), patch(
+            "src.main.find_chrome_executable", return_value="/path/to/chrome"
+        ), patch("src.main.get_recaptcha_settings", return_value=("key", "action")), patch(
+            "src.main.asyncio.sleep", AsyncMock()
+        ):
+            try:
+                resp = await self._fetch()
+                self.assertEqual(self.main.get_chrome_page_pool_stats()["idle"], 0)
+                lines = resp.aiter_lines()
+                self.assertEqual(await lines.__anext__(), 'a0:"Hi"')
+                await lines.aclose()  # Client disconnected mid-stream.
+
+                await asyncio.wait_for(aborted.wait(), timeout=1.0)
+                for _ in range(10):
+                    await _real_sleep(0)
+                self.assertEqual(self.main.get_chrome_page_pool_stats()["idle"], 1)
+            finally:
+                await self.main.close_chrome_page_pool()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestConfigStoreCache(BaseBridgeTest):
+    def _age_config_file(self) -> None:
+        # Move mtime out of the "racy" window so the cache trusts the file identity.
+        st = os.stat(self._config_path)
+        os.utime(self._config_path, ns=(st.st_atime_ns, st.st_mtime_ns - 10_000_000_000))
+
+    def test_unchanged_file_is_not_reparsed(self) -> None:
+        self._age_config_file()
+        self.main.get_config_view()
+
+        with patch.object(self.main.json, "loads", wraps=json.loads) as loads:
+            for _ in range(5):
+                self.main.get_config_view()
+                self.main.get_config()
+        loads.assert_not_called()
+
+    def test_external_rewrite_is_picked_up(self) -> None:
+        self.assertEqual(self.main.get_config_view().get("auth_tokens"), ["auth-token-1"])
+        self.setup_config({"auth_tokens": ["auth-token-2"]})
+        self.assertEqual(self.main.get_config_view().get("auth_tokens"), ["auth-token-2"])
+
+    def test_save_config_invalidates_snapshot(self) -> None:
+        self._age_config_file()
+        version = self.main.CONFIG_VERSION
+        config = self.main.get_config()
+        config["cf_clearance"] = "cf-new"
+        self.main.save_config(config)
+
+        self.assertEqual(self.main.get_config_view().get("cf_clearance"), "cf-new")
+        self.assertGreater(self.main.CONFIG_VERSION, version)
+
+    def test_view_is_read_only_and_get_config_returns_copy(self) -> None:
+        view = self.main.get_config_view()
+        self.assertIsInstance(view, dict)
+        with self.assertRaises(TypeError):
+            view["password"] = "x"
+        with self.assertRaises(TypeError):
+            view["auth_tokens"].append("x")
+
+        config = self.main.get_config()
+        config["auth_tokens"].append("auth-token-2")
+        self.assertEqual(self.main.get_config_view().get("auth_tokens"), ["auth-token-1"])
+
+    def test_defaults_are_normalized(self) -> None:
+        self.setup_config({"api_keys": [{"key": "k1"}, {"name": "missing key"}]})
+        view = self.main.get_config_view()
+        self.assertEqual(view["prune_invalid_tokens"], False)
+        self.assertEqual(view["api_keys"], [{"key": "k1", "name": "Unnamed Key", "created": 1704236400, "rpm": 60}])
+
+
+if __name__ == "__main__":
+    unittest.main()
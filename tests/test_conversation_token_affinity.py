@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+from tests._stream_test_utils import BaseBridgeTest, FakeStreamContext, FakeStreamResponse
+
+TOKENS = ("token-a", "token-b", "token-c")
+
+
+class TestConversationTokenAffinity(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._AUTH_TOKEN_POOL = None
+        self.main.current_token_index = 0
+        self.setup_config({"auth_tokens": list(TOKENS)})
+        self.calls: list[tuple[str, str]] = []
+        self.statuses: list[int] = []
+
+    async def _chat(self, messages: list[dict]) -> httpx.Response:
+        def fake_stream(client, method, url, json=None, headers=None, timeout=None):  # noqa: ARG001
+            cookie = str((headers or {}).get("Cookie") or "")
+            self.calls.append((url.rsplit("/", 2)[-2], next((t for t in TOKENS if t in cookie), "")))
+            status = self.statuses.pop(0) if self.statuses else 200
+            return FakeStreamContext(
+                FakeStreamResponse(status_code=status, text='a0:"Hello"\nad:{"finishReason":"stop"}\n')
+            )
+
+        with patch.object(self.main, "get_models") as get_models_mock, patch.object(
+            self.main, "refresh_recaptcha_token", AsyncMock(return_value="recaptcha-token")
+        ), patch.object(httpx.AsyncClient, "stream", new=fake_stream), patch("src.main.asyncio.sleep", AsyncMock()):
+            get_models_mock.return_value = [
+                {
+                    "publicName": "test-model",
+                    "id": "model-id",
+                    "organization": "test-org",
+                    "capabilities": {
+                        "inputCapabilities": {"text": True},
+                        "outputCapabilities": {"text": True},
+                    },
+                }
+            ]
+            transport = httpx.ASGITransport(app=self.main.app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post(
+                    "/api/v1/chat/completions",
+                    headers={"Authorization": "Bearer test-key"},
+                    json={"model": "test-model", "messages": messages, "stream": True},
+                    timeout=30.0,
+                )
+
+    async def test_follow_up_reuses_creating_token(self) -> None:
+        first = [{"role": "user", "content": "Hi"}]
+        await self._chat(first)
+        follow_up = first + [{"role": "assistant", "content": "Hello"}, {"role": "user", "content": "More"}]
+        await self._chat(follow_up)
+
+        self.assertEqual(
+            self.calls,
+            [("stream", "token-a"), ("post-to-evaluation", "token-a")],
+        )
+
+    async def test_failed_bound_token_falls_back_and_rebinds(self) -> None:
+        first = [{"role": "user", "content": "Hi"}]
+        await self._chat(first)
+        self.statuses = [401]
+        follow_up = first + [{"role": "assistant", "content": "Hello"}, {"role": "user", "content": "More"}]
+        await self._chat(follow_up)
+
+        used = [token for _, token in self.calls]
+        self.assertEqual(used[:2], ["token-a", "token-a"])
+        self.assertNotEqual(used[2], "token-a")
+        self.assertEqual(list(self.main.conversation_tokens.values()), [used[2]])
+
+    def test_entries_expire_after_ttl(self) -> None:
+        self.setup_config({"conversation_token_ttl_seconds": 60})
+        self.main.bind_conversation_token("session-1", "token-a")
+        self.assertEqual(self.main.get_conversation_token("session-1"), "token-a")
+        self.assertEqual(self.main.get_conversation_token("session-1", exclude_tokens={"token-a"}), "")
+
+        self.main.conversation_token_expiry["session-1"] -= 61
+        self.assertEqual(self.main.get_conversation_token("session-1"), "")
+        self.assertEqual(self.main.conversation_tokens, {})
+
+    def test_max_entries_evicts_least_recently_used(self) -> None:
+        self.setup_config({"conversation_token_max_entries": 2})
+        self.main.bind_conversation_token("session-1", "token-a")
+        self.main.bind_conversation_token("session-2", "token-b")
+        self.main.get_conversation_token("session-1")
+        self.main.bind_conversation_token("session-3", "token-c")
+        self.assertEqual(sorted(self.main.conversation_tokens), ["session-1", "session-3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+MODELS = [
+    {
+        "id": "id-chat",
+        "publicName": "chat-model",
+        "organization": "org",
+        "capabilities": {"inputCapabilities": {"text": True}, "outputCapabilities": {"text": True}},
+    },
+    {
+        "id": "id-search",
+        "publicName": "search-model",
+        "organization": "org",
+        "capabilities": {"outputCapabilities": {"text": True, "search": True}},
+    },
+    {
+        "id": "id-image",
+        "publicName": "image-model",
+        "organization": "org",
+        "capabilities": {"inputCapabilities": {"image": True}, "outputCapabilities": {"image": True, "search": True}},
+    },
+    {
+        "id": "id-stealth",
+        "publicName": "stealth-model",
+        "capabilities": {"outputCapabilities": {"text": True}},
+    },
+    {"id": "id-dup", "publicName": "chat-model", "organization": "other"},
+]
+
+
+class TestModelRegistry(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self._orig_models_file = self.main.MODELS_FILE
+        self.main.MODELS_FILE = str(Path(self._temp_dir.name) / "models.json")
+
+    async def asyncTearDown(self) -> None:
+        self.main.MODELS_FILE = self._orig_models_file
+        await super().asyncTearDown()
+
+    def test_index_and_precomputed_fields(self) -> None:
+        registry = self.main.ModelRegistry(MODELS)
+
+        chat = registry.get("chat-model")
+        self.assertEqual(chat.id, "id-chat")  # first entry wins
+        self.assertEqual(chat.modality, "chat")
+        self.assertTrue(chat.input_text)
+        self.assertEqual(registry.get("search-model").modality, "search")
+        self.assertEqual(registry.get("image-model").modality, "image")
+        self.assertTrue(registry.get("image-model").input_image)
+        self.assertTrue(registry.get("stealth-model").is_stealth)
+        self.assertIs(registry.get_by_id("id-search"), registry.get("search-model"))
+        self.assertIsNone(registry.get("missing"))
+        self.assertEqual(
+            [m.public_name for m in registry.listed],
+            ["chat-model", "search-model", "image-model"],
+        )
+
+    def test_models_file_parsed_once_and_swapped_on_save(self) -> None:
+        self.main.save_models(MODELS[:1])
+        registry = self.main.get_model_registry()
+
+        with patch.object(self.main.json, "load", wraps=json.load) as load:
+            self.assertIs(self.main.get_model_registry(), registry)
+            self.assertIs(self.main.get_models(), registry.models)
+        load.assert_not_called()
+
+        self.main.save_models(MODELS)
+        swapped = self.main.get_model_registry()
+        self.assertIsNot(swapped, registry)
+        self.assertIsNotNone(swapped.get("image-model"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import unittest
+from pathlib import Path
+
+import httpx
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+MODELS = [
+    {
+        "id": "019a98f7-afcd-779f-8dcb-856cc3b3f078",
+        "publicName": "model-a",
+        "organization": "org",
+        "capabilities": {"outputCapabilities": {"text": True}},
+    },
+    {
+        "id": "legacy-id",
+        "publicName": "model-b",
+        "organization": "org",
+        "capabilities": {"outputCapabilities": {"image": True}},
+    },
+    {"id": "stealth", "publicName": "stealth", "capabilities": {"outputCapabilities": {"text": True}}},
+]
+
+
+class TestModelsEndpointEtag(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self._orig_models_file = self.main.MODELS_FILE
+        self.main.MODELS_FILE = str(Path(self._temp_dir.name) / "models.json")
+        self.main.save_models(list(MODELS))
+
+    async def asyncTearDown(self) -> None:
+        self.main.MODELS_FILE = self._orig_models_file
+        await super().asyncTearDown()
+
+    async def _get(self, headers: dict | None = None) -> httpx.Response:
+        transport = httpx.ASGITransport(app=self.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(
+                "/api/v1/models",
+                headers={"Authorization": "Bearer test-key", **(headers or {})},
+            )
+
+    async def test_body_is_stable_and_conditional_get_returns_304(self) -> None:
+        first = await self._get()
+        self.assertEqual(first.status_code, 200)
+        payload = first.json()
+        self.assertEqual([m["id"] for m in payload["data"]], ["model-a", "model-b"])
+        # UUIDv7 ids carry their creation time.
+        self.assertEqual(payload["data"][0]["created"], 0x019A98F7AFCD // 1000)
+        etag = first.headers["ETag"]
+
+        second = await self._get()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.headers["ETag"], etag)
+
+        not_modified = await self._get({"If-None-Match": etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+    async def test_etag_changes_only_when_model_set_changes(self) -> None:
+        etag = (await self._get()).headers["ETag"]
+
+        # A refresh that rewrites the same list keeps the ETag.
+        self.main.save_models(json.loads(json.dumps(MODELS)))
+        self.assertEqual((await self._get()).headers["ETag"], etag)
+
+        self.main.save_models(MODELS[:1])
+        changed = await self._get({"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+        self.assertEqual([m["id"] for m in changed.json()["data"]], ["model-a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
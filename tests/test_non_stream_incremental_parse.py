@@ -0,0 +1,122 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+from tests._stream_test_utils import BaseBridgeTest, FakeStreamContext, FakeStreamResponse
+
+
+class _TrackingStreamResponse(FakeStreamResponse):
+    """Records how far the body was consumed and refuses to be buffered."""
+
+    def __init__(self, status_code: int, text: str) -> None:
+        super().__init__(status_code, headers={}, text=text)
+        self.lines_read = 0
+        self.closed = False
+
+    async def aiter_lines(self):
+        async for line in super().aiter_lines():
+            self.lines_read += 1
+            yield line
+
+    async def aread(self) -> bytes:
+        raise AssertionError("non-streaming responses must not be buffered")
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+class TestNonStreamIncrementalParse(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        # Earlier proxy tests leave the userscript proxy looking active; force the direct httpx transport.
+        self.main.last_userscript_poll = 0
+
+    async def _complete(self, upstream: _TrackingStreamResponse) -> httpx.Response:
+        def fake_stream(self, method, url, json=None, headers=None, timeout=None):  # noqa: ARG001
+            return FakeStreamContext(upstream)
+
+        with patch.object(self.main, "get_models") as get_models_mock, patch.object(
+            self.main,
+            "refresh_recaptcha_token",
+            AsyncMock(return_value="recaptcha-token"),
+        ), patch.object(httpx.AsyncClient, "stream", new=fake_stream):
+            get_models_mock.return_value = [
+                {
+                    "publicName": "test-model",
+                    "id": "model-id",
+                    "organization": "test-org",
+                    "capabilities": {
+                        "inputCapabilities": {"text": True},
+                        "outputCapabilities": {"text": True},
+                    },
+                }
+            ]
+
+            transport = httpx.ASGITransport(app=self.main.app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post(
+                    "/api/v1/chat/completions",
+                    headers={"Authorization": "Bearer test-key"},
+                    json={
+                        "model": "test-model",
+                        "messages": [{"role": "user", "content": "Hello"}],
+                        "stream": False,
+                    },
+                    timeout=30.0,
+                )
+
+    async def test_body_is_parsed_line_by_line(self) -> None:
+        upstream = _TrackingStreamResponse(
+            200, 'ag:"hmm"\na0:"Hello"\na0:" world"\nad:{"finishReason":"stop"}\n'
+        )
+        response = await self._complete(upstream)
+
+        self.assertEqual(response.status_code, 200)
+        message = response.json()["choices"][0]["message"]
+        self.assertEqual(message["content"], "Hello world")
+        self.assertEqual(message["reasoning_content"], "hmm")
+        self.assertEqual(upstream.lines_read, 4)
+        self.assertTrue(upstream.closed)
+
+    async def test_upstream_error_stops_reading(self) -> None:
+        upstream = _TrackingStreamResponse(200, 'a3:"model overloaded"\n' + 'a0:"late"\n' * 50)
+        response = await self._complete(upstream)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["error"]["code"], "lmarena_error")
+        self.assertIn("model overloaded", response.json()["error"]["message"])
+        self.assertEqual(upstream.lines_read, 1)
+
+    async def test_proxy_error_body_reaches_error_response(self) -> None:
+        self.main._USERSCRIPT_PROXY_JOBS.clear()
+        self.main._USERSCRIPT_PROXY_QUEUE = None
+        self.main.last_userscript_poll = time.time()
+        jobs: list[dict] = []
+
+        async def _proxy() -> None:
+            while not self.main._USERSCRIPT_PROXY_JOBS:
+                await asyncio.sleep(0.01)
+            job_id, job = next(iter(self.main._USERSCRIPT_PROXY_JOBS.items()))
+            jobs.append(job)
+            await self.main.push_proxy_chunk(
+                job_id, {"status": 400, "lines": ['{"error":"model not allowed"}'], "done": True}
+            )
+
+        proxy = asyncio.create_task(_proxy())
+        try:
+            response = await self._complete(_TrackingStreamResponse(200, 'a0:"unused"\n'))
+        finally:
+            await asyncio.wait_for(proxy, timeout=5.0)
+            self.main._USERSCRIPT_PROXY_JOBS.clear()
+            self.main._USERSCRIPT_PROXY_QUEUE = None
+
+        error = response.json()["error"]
+        self.assertEqual((error["code"], error["message"]), ("http_400", "Bad Request: model not allowed"))
+        self.assertTrue(jobs[0]["lines_queue"].closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestRecaptchaReservoir(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self._reset()
+        self._orig_token = self.main.RECAPTCHA_TOKEN
+        self._orig_expiry = self.main.RECAPTCHA_EXPIRY
+
+    async def asyncTearDown(self) -> None:
+        self._reset()
+        self.main.RECAPTCHA_TOKEN = self._orig_token
+        self.main.RECAPTCHA_EXPIRY = self._orig_expiry
+        await super().asyncTearDown()
+
+    def _reset(self) -> None:
+        self.main._RECAPTCHA_RESERVOIR.clear()
+        self.main._RECAPTCHA_RESERVOIR_DEMAND.clear()
+        self.main._RECAPTCHA_RESERVOIR_LAST_DEMAND_AT = None
+        self.main._RECAPTCHA_RESERVOIR_WAKE = None
+        for key in self.main._RECAPTCHA_RESERVOIR_STATS:
+            self.main._RECAPTCHA_RESERVOIR_STATS[key] = 0
+
+    def test_pop_skips_expired_tokens_and_is_single_use(self) -> None:
+        now = time.monotonic()
+        self.main._RECAPTCHA_RESERVOIR.append(("stale-token", now + 5))
+        self.main.add_recaptcha_token_to_reservoir("fresh-token")
+
+        token, remaining = self.main.pop_recaptcha_token()
+        self.assertEqual(token, "fresh-token")
+        self.assertGreater(remaining, 100)
+        self.assertEqual(self.main.pop_recaptcha_token(), ("", 0.0))
+
+        stats = self.main.get_recaptcha_reservoir_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["expired"]), (1, 1, 1))
+
+    def test_target_depth_follows_recent_demand(self) -> None:
+        self.setup_config({"recaptcha_reservoir_min_depth": 1, "recaptcha_reservoir_max_depth": 3})
+        self.assertEqual(self.main.get_recaptcha_reservoir_target_depth(), 0)
+
+        self.main.pop_recaptcha_token()
+        self.assertEqual(self.main.get_recaptcha_reservoir_target_depth(), 1)
+        for _ in range(9):
+            self.main.pop_recaptcha_token()
+        self.assertEqual(self.main.get_recaptcha_reservoir_target_depth(), 3)
+
+        self.setup_config({"recaptcha_reservoir_enabled": False})
+        self.assertEqual(self.main.get_recaptcha_reservoir_target_depth(), 0)
+
+    async def test_refresh_prefers_reservoir_token(self) -> None:
+        self.main.add_recaptcha_token_to_reservoir("pooled-token")
+        with patch.object(self.main, "get_recaptcha_v3_token", AsyncMock(return_value="inline-token")) as mint:
+            token = await self.main.refresh_recaptcha_token(force_new=True)
+        self.assertEqual(token, "pooled-token")
+        mint.assert_not_awaited()
+        self.assertEqual(self.main.get_cached_recaptcha_token(), "pooled-token")
+
+    async def test_background_task_refills_to_target(self) -> None:
+        self.setup_config({"recaptcha_reservoir_min_depth": 2, "recaptcha_reservoir_max_depth": 2})
+        minted = iter(f"token-{i}" for i in range(10))
+        mint = AsyncMock(side_effect=lambda remember=True: next(minted))
+        with patch.object(self.main, "get_recaptcha_v3_token", mint):
+            task = asyncio.create_task(self.main.recaptcha_reservoir_task())
+            try:
+                await asyncio.sleep(0)
+                self.assertEqual(self.main.pop_recaptcha_token(), ("", 0.0))
+                for _ in range(100):
+                    if len(self.main._RECAPTCHA_RESERVOIR) >= 2:
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        self.assertEqual([t for t, _ in self.main._RECAPTCHA_RESERVOIR], ["token-0", "token-1"])
+        self.assertTrue(all(call.kwargs == {"remember": False} for call in mint.await_args_list))
+
+
+if __name__ == "__main__":
+    unittest.main()
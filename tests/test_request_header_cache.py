@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestRequestHeaderCache(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main.invalidate_request_header_cache()
+        self.setup_config(
+            {
+                "cf_clearance": "cf",
+                "user_agent": "Mozilla/5.0 TestUA",
+                "browser_cookies": {"_cfuvid": "uv", "arena-auth-prod-v1.0": "part0"},
+            }
+        )
+
+    def test_template_is_built_once_per_config_version(self) -> None:
+        with patch.object(
+            self.main, "normalize_user_agent_value", wraps=self.main.normalize_user_agent_value
+        ) as normalize:
+            first = self.main.get_request_headers_with_token("token-a", "recaptcha-1")
+            second = self.main.get_request_headers_with_token("token-b")
+        self.assertEqual(normalize.call_count, 1)
+
+        self.assertEqual(first["Cookie"], "cf_clearance=cf; _cfuvid=uv; arena-auth-prod-v1=token-a; arena-auth-prod-v1.0=part0")
+        self.assertEqual(first["X-Recaptcha-Token"], "recaptcha-1")
+        self.assertEqual(first["X-Recaptcha-Action"], self.main.RECAPTCHA_ACTION)
+        self.assertEqual(second["Cookie"], "cf_clearance=cf; _cfuvid=uv; arena-auth-prod-v1=token-b; arena-auth-prod-v1.0=part0")
+        self.assertNotIn("X-Recaptcha-Token", second)
+        self.assertEqual(self.main.get_request_headers_with_token("")["Cookie"], "cf_clearance=cf; _cfuvid=uv; arena-auth-prod-v1.0=part0")
+
+        # Callers get their own dict.
+        first["Cookie"] = "mutated"
+        self.assertNotEqual(self.main.get_request_headers_with_token("token-a")["Cookie"], "mutated")
+
+    def test_cookie_upsert_invalidates_template(self) -> None:
+        self.main.get_request_headers_with_token("token-a")
+        config = self.main.get_config()
+        changed = self.main._upsert_browser_session_into_config(
+            config, [{"name": "cf_clearance", "value": "cf-new"}], user_agent="Mozilla/5.0 NewUA"
+        )
+        self.assertTrue(changed)
+        self.assertIsNone(self.main._REQUEST_HEADER_TEMPLATE)
+        self.main.save_config(config)
+
+        headers = self.main.get_request_headers_with_token("token-a")
+        self.assertTrue(headers["Cookie"].startswith("cf_clearance=cf-new;"))
+        self.assertEqual(headers["User-Agent"], "Mozilla/5.0 NewUA")
+
+
+if __name__ == "__main__":
+    unittest.main()
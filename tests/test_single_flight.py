@@ -0,0 +1,98 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestSingleFlight(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._SINGLE_FLIGHTS.clear()
+        self.main._SINGLE_FLIGHT_STATS.clear()
+        self.main._RECAPTCHA_RESERVOIR.clear()
+        self._orig_token = self.main.RECAPTCHA_TOKEN
+        self._orig_expiry = self.main.RECAPTCHA_EXPIRY
+
+    async def asyncTearDown(self) -> None:
+        self.main.RECAPTCHA_TOKEN = self._orig_token
+        self.main.RECAPTCHA_EXPIRY = self._orig_expiry
+        await super().asyncTearDown()
+
+    async def test_concurrent_recaptcha_refreshes_get_distinct_tokens(self) -> None:
+        minted = iter(f"minted-{i}" for i in range(10))
+        release = asyncio.Event()
+        launches = {"active": 0, "max_active": 0, "total": 0}
+
+        async def _mint(remember: bool = True):
+            launches["active"] += 1
+            launches["total"] += 1
+            launches["max_active"] = max(launches["max_active"], launches["active"])
+            try:
+                await release.wait()
+                await asyncio.sleep(0)
+                return next(minted)
+            finally:
+                launches["active"] -= 1
+
+        self.main.add_recaptcha_token_to_reservoir("pooled-0")
+        self.main.add_recaptcha_token_to_reservoir("pooled-1")
+        env = {k: v for k, v in os.environ.items() if k != "PYTEST_CURRENT_TEST"}
+        with patch.dict(os.environ, env, clear=True), patch.object(self.main, "get_recaptcha_v3_token", _mint):
+            tasks = [asyncio.create_task(self.main.refresh_recaptcha_token(force_new=True)) for _ in range(6)]
+            await asyncio.sleep(0.01)
+            release.set()
+            results = await asyncio.gather(*tasks)
+
+        # Tokens are single-use: the burst drains the reservoir first, then the rest share one mint flight that
+        # launches the browser for one token at a time.
+        self.assertEqual(
+            sorted(results), ["minted-0", "minted-1", "minted-2", "minted-3", "pooled-0", "pooled-1"]
+        )
+        self.assertEqual((launches["max_active"], launches["total"]), (1, 4))
+        mint_stats = self.main.get_single_flight_stats()["operations"]["recaptcha_v3_mint"]
+        self.assertEqual((mint_stats["flights"], mint_stats["coalesced"]), (1, 3))
+        self.assertEqual(len(self.main._RECAPTCHA_RESERVOIR), 0)
+
+    async def test_auth_refresh_is_keyed_by_token(self) -> None:
+        calls: list[str] = []
+        release = asyncio.Event()
+
+        async def _refresh(old_token, config=None):
+            calls.append(old_token)
+            await release.wait()
+            return old_token + "-new"
+
+        with patch.object(self.main, "_refresh_arena_auth_token_via_lmarena_http", _refresh):
+            tasks = [
+                asyncio.create_task(self.main.refresh_arena_auth_token_via_lmarena_http(token))
+                for token in ("base64-a", "base64-a", "base64-b", "base64-a")
+            ]
+            await asyncio.sleep(0.01)
+            release.set()
+            results = await asyncio.gather(*tasks)
+
+        self.assertEqual(results, ["base64-a-new", "base64-a-new", "base64-b-new", "base64-a-new"])
+        self.assertEqual(sorted(calls), ["base64-a", "base64-b"])
+        self.assertEqual(self.main._SINGLE_FLIGHTS, {})
+
+    async def test_cancelled_caller_does_not_cancel_flight(self) -> None:
+        release = asyncio.Event()
+
+        async def _work():
+            await release.wait()
+            return 42
+
+        first = asyncio.create_task(self.main.single_flight(("op",), _work))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(self.main.single_flight(("op",), _work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await second, 42)
+
+
+if __name__ == "__main__":
+    unittest.main()
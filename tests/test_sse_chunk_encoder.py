@@ -0,0 +1,43 @@
+import importlib.util
+import json
+import unittest
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+def _legacy(chunk_id: str, model: str, created: int, delta: dict, finish_reason=None) -> str:
+    chunk = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+class TestSSEChunkEncoder(BaseBridgeTest):
+    SAMPLES = ["Hello ", "", 'quote " backslash \\ newline \n tab \t', "héllo wörld ✨", "\ud83d"]
+
+    def test_stdlib_backend_matches_json_dumps(self) -> None:
+        encoder = self.main.SSEChunkEncoder("chatcmpl-1", 'model "x"', created=123, use_orjson=False)
+        self.assertEqual(encoder.backend, "json")
+        for text in self.SAMPLES:
+            self.assertEqual(encoder.content(text), _legacy("chatcmpl-1", 'model "x"', 123, {"content": text}))
+            self.assertEqual(
+                encoder.reasoning(text), _legacy("chatcmpl-1", 'model "x"', 123, {"reasoning_content": text})
+            )
+        self.assertEqual(encoder.finish("stop"), _legacy("chatcmpl-1", 'model "x"', 123, {}, "stop"))
+
+    @unittest.skipUnless(importlib.util.find_spec("orjson"), "orjson not installed")
+    def test_orjson_backend_is_equivalent_json(self) -> None:
+        encoder = self.main.SSEChunkEncoder("chatcmpl-1", "m", created=123, use_orjson=True)
+        self.assertEqual(encoder.backend, "orjson")
+        for text in self.SAMPLES:
+            event = encoder.content(text)
+            self.assertTrue(event.startswith("data: ") and event.endswith("\n\n"))
+            self.assertEqual(json.loads(event[6:]), json.loads(_legacy("chatcmpl-1", "m", 123, {"content": text})[6:]))
+
+
+if __name__ == "__main__":
+    unittest.main()
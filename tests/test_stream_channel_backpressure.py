@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestStreamChannelBackpressure(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        for key in self.main._STREAM_CHANNEL_STATS:
+            self.main._STREAM_CHANNEL_STATS[key] = 0
+
+    async def _drain(self, channel) -> list:
+        return [line async for line in channel]
+
+    async def test_pause_blocks_producer_until_consumer_reads(self) -> None:
+        channel = self.main.StreamLineChannel(max_lines=2, policy="pause", pause_timeout=5)
+        self.assertTrue(await channel.put("a"))
+        self.assertTrue(await channel.put("b"))
+        producer = asyncio.create_task(channel.put("c"))
+        await asyncio.sleep(0.01)
+        self.assertFalse(producer.done())
+        self.assertEqual(channel.stats_snapshot()["paused_producers"], 1)
+
+        self.assertEqual(await channel.get(), "a")
+        self.assertTrue(await producer)
+        channel.close()
+        self.assertEqual(await self._drain(channel), ["b", "c"])
+        self.assertEqual(channel.peak_bytes, 2)
+
+    async def test_pause_timeout_aborts_and_frees_buffer(self) -> None:
+        channel = self.main.StreamLineChannel(max_bytes=4, policy="pause", pause_timeout=0.02, label="job-1")
+        await channel.put("abcd")
+        self.assertFalse(await channel.put("e"))
+        self.assertEqual(channel.buffered_bytes, 0)
+        self.assertFalse(await channel.put("late"))
+        with self.assertRaises(self.main.StreamChannelOverflow):
+            await channel.get()
+        stats = self.main.get_stream_channel_stats()
+        self.assertEqual((stats["overflows"], stats["pause_timeouts"], stats["dropped_lines"]), (1, 1, 2))
+
+    async def test_abort_policy(self) -> None:
+        channel = self.main.StreamLineChannel(max_lines=1, policy="abort")
+        channel.put_nowait("a")
+        self.assertFalse(await channel.put("b"))
+        self.assertTrue(channel.closed)
+        with self.assertRaises(self.main.StreamChannelOverflow):
+            await channel.get()
+
+    async def test_spill_keeps_order_and_bounds_memory(self) -> None:
+        channel = self.main.StreamLineChannel(max_lines=2, policy="spill", spill_max_bytes=1 << 20, label="job-2")
+        lines = [f'a0:"line {i} ✨"' for i in range(10)]
+        for line in lines:
+            self.assertTrue(await channel.put(line))
+        self.assertEqual(len(channel._items), 2)
+        snapshot = [job for job in self.main.get_stream_channel_stats()["jobs"] if job["label"] == "job-2"][0]
+        self.assertEqual(snapshot["spilled_pending"], 8)
+        self.assertGreater(snapshot["spill_bytes"], 0)
+
+        self.assertEqual([await channel.get() for _ in range(3)], lines[:3])
+        await channel.put("tail")
+        channel.close()
+        self.assertEqual(await self._drain(channel), lines[3:] + ["tail"])
+        self.assertEqual(channel.spill_bytes, 0)
+
+    async def test_spill_limit_aborts(self) -> None:
+        channel = self.main.StreamLineChannel(max_lines=1, policy="spill", spill_max_bytes=16)
+        await channel.put("a")
+        self.assertTrue(await channel.put("b"))
+        self.assertFalse(await channel.put("x" * 32))
+        with self.assertRaises(self.main.StreamChannelOverflow):
+            await channel.get()
+
+    async def test_transport_channels_use_configured_budget(self) -> None:
+        self.setup_config(
+            {"stream_queue_max_lines": 3, "stream_queue_max_bytes": 2048, "stream_queue_overflow_policy": "abort"}
+        )
+        response = await self.main.fetch_lmarena_stream_via_userscript_proxy("POST", "https://lmarena.ai/x", {})
+        job = self.main._USERSCRIPT_PROXY_JOBS[response.job_id]
+        channel = job["lines_queue"]
+        self.assertEqual((channel.max_lines, channel.max_bytes, channel.policy), (3, 2048, "abort"))
+
+        await self.main.push_proxy_chunk(response.job_id, {"status": 200, "lines": [f"l{i}" for i in range(5)]})
+        self.assertTrue(channel.closed)
+        with self.assertRaises(self.main.StreamChannelOverflow):
+            [line async for line in response.aiter_lines()]
+        self.main._USERSCRIPT_PROXY_JOBS.pop(response.job_id, None)
+        self.main._USERSCRIPT_PROXY_QUEUE = None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+from tests._stream_test_utils import BaseBridgeTest, FakeStreamContext, FakeStreamResponse
+
+
+def _events(body: str) -> list[dict]:
+    events = []
+    for block in body.split("\n\n"):
+        if block.startswith("data: {"):
+            events.append(json.loads(block[6:]))
+    return events
+
+
+class TestStreamDeltaCoalescing(BaseBridgeTest):
+    def _coalescer(self, window: float = 0.05, max_bytes: int = 4096):
+        encoder = self.main.SSEChunkEncoder("chatcmpl-1", "m", created=1, use_orjson=False)
+        return self.main.SSEDeltaCoalescer(encoder, window, max_bytes)
+
+    def test_window_budget_and_kind_switch(self) -> None:
+        coalescer = self._coalescer(window=0.05, max_bytes=8)
+        self.assertEqual(coalescer.add("reasoning", "ab", now=0.0), "")
+        self.assertEqual(coalescer.add("reasoning", "cd", now=0.01), "")
+        self.assertAlmostEqual(coalescer.next_wait(1.0, now=0.01), 0.04)
+
+        # Switching kind flushes the buffered reasoning before buffering content.
+        out = coalescer.add("content", "x", now=0.02)
+        self.assertEqual([e["choices"][0]["delta"] for e in _events(out)], [{"reasoning_content": "abcd"}])
+
+        # Byte budget flushes immediately.
+        out = coalescer.add("content", "yyyyyyyy", now=0.03)
+        self.assertEqual([e["choices"][0]["delta"] for e in _events(out)], [{"content": "xyyyyyyyy"}])
+        self.assertFalse(coalescer.pending)
+
+        # Window elapsed since the first buffered delta.
+        coalescer.add("content", "1", now=1.0)
+        out = coalescer.add("content", "2", now=1.06)
+        self.assertEqual([e["choices"][0]["delta"] for e in _events(out)], [{"content": "12"}])
+
+    def test_zero_window_passes_through(self) -> None:
+        coalescer = self._coalescer(window=0.0)
+        out = coalescer.add("content", "", now=0.0)
+        self.assertEqual([e["choices"][0]["delta"] for e in _events(out)], [{"content": ""}])
+        self.assertEqual(coalescer.next_wait(1.0), 1.0)
+
+    def test_settings_precedence(self) -> None:
+        self.setup_config({"stream_coalesce_ms": 20})
+        self.assertEqual(self.main._get_stream_coalesce_settings(), (0.02, 4096))
+        key = {"key": "k", "stream_coalesce_ms": 30, "stream_coalesce_max_bytes": 512}
+        self.assertEqual(self.main._get_stream_coalesce_settings(api_key=key), (0.03, 512))
+        body = {"stream_options": {"coalesce_ms": 1000}}
+        self.assertEqual(self.main._get_stream_coalesce_settings(api_key=key, body=body), (0.25, 512))
+        body = {"stream_options": {"coalesce_ms": 0}}
+        self.assertEqual(self.main._get_stream_coalesce_settings(api_key=key, body=body)[0], 0.0)
+
+    async def _stream(self, extra_body: dict) -> str:
+        def fake_stream(self, method, url, json=None, headers=None, timeout=None):  # noqa: ARG001
+            return FakeStreamContext(
+                FakeStreamResponse(
+                    status_code=200,
+                    text='ag:"Hm"\na0:"Hello"\na0:" "\na0:"world"\nad:{"finishReason":"stop"}\n',
+                )
+            )
+
+        with patch.object(self.main, "get_models") as get_models_mock, patch.object(
+            self.main, "refresh_recaptcha_token", AsyncMock(return_value="recaptcha-token")
+        ), patch.object(httpx.AsyncClient, "stream", new=fake_stream):
+            get_models_mock.return_value = [
+                {
+                    "publicName": "test-model",
+                    "id": "model-id",
+                    "organization": "test-org",
+                    "capabilities": {"inputCapabilities": {"text": True}, "outputCapabilities": {"text": True}},
+                }
+            ]
+            transport = httpx.ASGITransport(app=self.main.app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/api/v1/chat/completions",
+                    headers={"Authorization": "Bearer test-key"},
+                    json={
+                        "model": "test-model",
+                        "messages": [{"role": "user", "content": "Hello"}],
+                        "stream": True,
+                        **extra_body,
+                    },
+                    timeout=30.0,
+                )
+        self.assertEqual(response.status_code, 200)
+        return response.text
+
+    async def test_stream_coalesces_when_requested(self) -> None:
+        plain = _events(await self._stream({}))
+        self.assertEqual(len(plain), 5)
+
+        body = await self._stream({"stream_options": {"coalesce_ms": 50}})
+        events = _events(body)
+        self.assertEqual(
+            [(e["choices"][0]["delta"], e["choices"][0]["finish_reason"]) for e in events],
+            [({"reasoning_content": "Hm"}, None), ({"content": "Hello world"}, None), ({}, "stop")],
+        )
+        self.assertTrue(body.rstrip().endswith("data: [DONE]"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestStreamKeepaliveTicker(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._KEEPALIVE_TICKER = None
+
+    async def test_only_idle_streams_are_woken(self) -> None:
+        idle = self.main.StreamHeartbeat(0.05)
+        busy = self.main.StreamHeartbeat(0.05)
+        fired = {"idle": 0, "busy": 0}
+        idle.start()
+        busy.start()
+        idle.set_waker(lambda: fired.__setitem__("idle", fired["idle"] + 1))
+        busy.set_waker(lambda: fired.__setitem__("busy", fired["busy"] + 1))
+
+        for _ in range(12):
+            busy.touch()
+            await asyncio.sleep(0.02)
+
+        self.assertGreaterEqual(fired["idle"], 3)
+        self.assertEqual(fired["busy"], 0)
+        ticker = self.main.get_keepalive_ticker()
+        self.assertEqual(self.main.get_keepalive_ticker_stats()["streams"], 2)
+
+        idle.close()
+        busy.close()
+        await asyncio.sleep(0.12)
+        self.assertEqual(self.main.get_keepalive_ticker_stats()["streams"], 0)
+        # Nothing left to schedule: the ticker parks without a timer.
+        wakeups = ticker.wakeups
+        await asyncio.sleep(0.1)
+        self.assertEqual(ticker.wakeups, wakeups)
+
+    async def test_wait_yields_ticks_until_task_done(self) -> None:
+        heartbeat = self.main.StreamHeartbeat(0.03)
+        task = asyncio.create_task(asyncio.sleep(0.1))
+        ticks = 0
+        while not await heartbeat.wait(task):
+            ticks += 1
+        self.assertTrue(1 <= ticks <= 3, ticks)
+        heartbeat.close()
+
+    def test_interval_is_per_client(self) -> None:
+        self.setup_config({"stream_keepalive_seconds": 5})
+        self.assertEqual(self.main._get_stream_keepalive_interval(), 5.0)
+        self.assertEqual(self.main._get_stream_keepalive_interval(api_key={"stream_keepalive_seconds": 15}), 15.0)
+        self.assertEqual(
+            self.main._get_stream_keepalive_interval(
+                api_key={"stream_keepalive_seconds": 15}, body={"stream_options": {"keepalive_seconds": 0}}
+            ),
+            0.25,
+        )
+
+    async def test_line_reader_ticks_from_heartbeat(self) -> None:
+        release = asyncio.Event()
+
+        async def _lines():
+            yield "a"
+            await release.wait()
+            yield "b"
+
+        heartbeat = self.main.StreamHeartbeat(0.03)
+        seen = []
+        async for item in self.main.aiter_lines_with_keepalive(_lines(), lambda: None, heartbeat):
+            seen.append(item)
+            if item is None:
+                heartbeat.touch()
+                release.set()
+        self.assertEqual(seen, ["a", None, "b"])
+        heartbeat.close()
+
+    async def test_proxy_job_update_wakes_on_new_status_not_old_one(self) -> None:
+        job = {"status_event": asyncio.Event(), "done_event": asyncio.Event(), "done": False, "status_code": 403}
+        job["status_event"].set()
+
+        # The 403 that was already reported does not count: with no new push the wait runs to its deadline.
+        started = asyncio.get_running_loop().time()
+        await self.main.wait_for_userscript_proxy_job_update(job, 0.05)
+        self.assertGreaterEqual(asyncio.get_running_loop().time() - started, 0.04)
+
+        waiter = asyncio.create_task(self.main.wait_for_userscript_proxy_job_update(job, 5.0))
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiter.done())
+        await self.main._apply_userscript_proxy_push(job, {"status": 200})
+        await asyncio.wait_for(waiter, timeout=0.5)
+        self.assertEqual(job["status_code"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestStreamLineChannel(BaseBridgeTest):
+    async def test_lines_ticks_and_eof(self) -> None:
+        channel = self.main.StreamLineChannel()
+        self.assertIsNone(await channel.get(timeout=0.01))
+
+        channel.put_nowait("a")
+        await channel.put("b")
+        channel.unget("first")
+        self.assertEqual([await channel.get() for _ in range(3)], ["first", "a", "b"])
+
+        waiter = asyncio.create_task(channel.get())
+        await asyncio.sleep(0)
+        channel.wake()
+        self.assertIsNone(await waiter)
+
+        waiter = asyncio.create_task(channel.get(timeout=5))
+        await asyncio.sleep(0)
+        channel.put_nowait("late")
+        await channel.put(None)  # Queue-style sentinel closes the channel.
+        self.assertEqual(await waiter, "late")
+        self.assertIs(await channel.get(), self.main.STREAM_CHANNEL_EOF)
+        channel.put_nowait("after-eof")
+        self.assertTrue(channel.empty())
+
+    async def test_close_with_error_drains_first(self) -> None:
+        channel = self.main.StreamLineChannel()
+        channel.put_nowait("x")
+        channel.close(ValueError("boom"))
+        self.assertEqual([line async for line in _take(channel, 1)], ["x"])
+        with self.assertRaises(ValueError):
+            await channel.get()
+
+    async def test_keepalive_iterator_ticks_and_propagates_errors(self) -> None:
+        release = asyncio.Event()
+
+        async def _lines():
+            yield "one"
+            await release.wait()
+            yield "two"
+            raise RuntimeError("upstream reset")
+
+        seen = []
+        with self.assertRaises(RuntimeError):
+            async for item in self.main.aiter_lines_with_keepalive(_lines(), lambda: 0.01):
+                seen.append(item)
+                if item is None:
+                    release.set()
+        self.assertEqual(seen[0], "one")
+        self.assertIn(None, seen)
+        self.assertEqual(seen[-1], "two")
+
+    async def test_userscript_response_reads_pushed_lines(self) -> None:
+        self.setup_config({"userscript_proxy_status_timeout_seconds": 5})
+        response = await self.main.fetch_lmarena_stream_via_userscript_proxy("POST", "https://lmarena.ai/x", {})
+        job_id = response.job_id
+
+        async def _collect():
+            return [line async for line in response.aiter_lines()]
+
+        reader = asyncio.create_task(_collect())
+        await self.main.push_proxy_chunk(job_id, {"status": 200, "lines": ['a0:"Hi"', 'ad:{"finishReason":"stop"}']})
+        await asyncio.sleep(0)
+        self.assertFalse(reader.done())
+        await self.main.push_proxy_chunk(job_id, {"done": True})
+        self.assertEqual(await asyncio.wait_for(reader, 1.0), ['a0:"Hi"', 'ad:{"finishReason":"stop"}'])
+        self.main._USERSCRIPT_PROXY_JOBS.pop(job_id, None)
+        self.main._USERSCRIPT_PROXY_QUEUE = None
+
+    async def test_userscript_response_aread_returns_error_body(self) -> None:
+        response = await self.main.fetch_lmarena_stream_via_userscript_proxy("POST", "https://lmarena.ai/x", {})
+        job_id = response.job_id
+        await self.main.push_proxy_chunk(
+            job_id, {"status": 403, "lines": ['{"error":"recaptcha validation failed"}'], "done": True}
+        )
+        self.assertEqual(await response.aread(), b'{"error":"recaptcha validation failed"}')
+        self.main._USERSCRIPT_PROXY_JOBS.pop(job_id, None)
+        self.main._USERSCRIPT_PROXY_QUEUE = None
+
+
+async def _take(channel, count: int):
+    for _ in range(count):
+        yield await channel.get()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import unittest
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+def _citation_line(*sources) -> str:
+    args = {"source": list(sources) if len(sources) > 1 else sources[0]}
+    return "ac:" + json.dumps({"toolCallId": "call-1", "argsTextDelta": json.dumps(args)})
+
+
+class TestLMArenaStreamParser(BaseBridgeTest):
+    def test_accumulates_text_reasoning_and_finish(self) -> None:
+        parser = self.main.LMArenaStreamParser()
+        events = []
+        for line in ['ag:"Think"', 'ag:"ing"', 'data: a0:"Hello "', "", 'a0:"world"', 'ad:{"finishReason":"length"}']:
+            events.extend(parser.feed(line))
+
+        self.assertEqual(
+            [kind for kind, _ in events],
+            ["reasoning", "reasoning", "content", "content", "finish"],
+        )
+        self.assertEqual(parser.reasoning_text, "Thinking")
+        self.assertEqual(parser.response_text, "Hello world")
+        self.assertEqual(parser.finish_reason, "length")
+        self.assertEqual(parser.counts["lines"], 5)
+        self.assertTrue(parser.has_output)
+
+    def test_citations_are_deduplicated_on_insert(self) -> None:
+        parser = self.main.LMArenaStreamParser()
+        a = {"url": "https://a.example", "title": "A"}
+        b = {"url": "https://b.example", "title": "B"}
+        parser.feed(_citation_line(a, b))
+        parser.feed(_citation_line(dict(a, title="A again")))
+        parser.feed(_citation_line({"title": "no url"}))
+
+        self.assertEqual(parser.citations, [a, b])
+        self.assertEqual(parser.sources_seen, 4)
+        self.assertTrue(parser.has_output)
+
+    def test_image_replaces_text_and_text_keeps_appending(self) -> None:
+        parser = self.main.LMArenaStreamParser()
+        parser.feed('a0:"placeholder"')
+        events = parser.feed('a2:[{"type":"image","image":"https://img.example/x.png"}]')
+        self.assertEqual(events, [("image", "![Generated Image](https://img.example/x.png)")])
+        self.assertEqual(parser.response_text, "![Generated Image](https://img.example/x.png)")
+        parser.feed('a0:"!"')
+        self.assertEqual(parser.response_text, "![Generated Image](https://img.example/x.png)!")
+
+    def test_errors_invalid_and_unhandled_lines(self) -> None:
+        parser = self.main.LMArenaStreamParser()
+        self.assertEqual(parser.feed('a3:"boom"'), [("error", "boom")])
+        kind, (tag, raw, _) = parser.feed("a0:not-json")[0]
+        self.assertEqual((kind, tag, raw), ("invalid", "a0", "not-json"))
+        self.assertEqual(parser.feed('{"error":"nope"}'), [])
+        self.assertEqual(parser.feed("garbage"), [("unhandled", "garbage")])
+        self.assertEqual(parser.error_message, "boom")
+        self.assertFalse(parser.has_output)
+
+    def test_openai_style_delta_lines(self) -> None:
+        parser = self.main.LMArenaStreamParser()
+        events = parser.feed(json.dumps({"choices": [{"delta": {"reasoning_content": "r", "content": "c"}}]}))
+        self.assertEqual(events, [("reasoning", "r"), ("content", "c")])
+        self.assertEqual((parser.reasoning_text, parser.response_text), ("r", "c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from fastapi import HTTPException
+
+from tests._stream_test_utils import BaseBridgeTest, FakeStreamContext, FakeStreamResponse
+
+
+class TestUpstreamAdmission(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._UPSTREAM_ADMISSION = None
+        self.setup_config({"upstream_max_concurrency": 1})
+        self.controller = self.main.get_upstream_admission()
+
+    async def test_queued_requests_are_shared_fairly_across_keys(self) -> None:
+        holder = await self.controller.acquire("key-a")
+        order: list[str] = []
+
+        async def _request(key: str, name: str) -> None:
+            ticket = await self.controller.acquire(key)
+            order.append(name)
+            await asyncio.sleep(0)
+            ticket.release()
+
+        tasks = [asyncio.create_task(_request("key-a", f"a{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(_request("key-b", "b0")))
+        await asyncio.sleep(0)
+        self.assertEqual(self.main.get_upstream_admission_stats()["queued"], 4)
+
+        holder.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["a0", "b0", "a1", "a2"])
+        stats = self.main.get_upstream_admission_stats()
+        self.assertEqual((stats["active"], stats["queued"], stats["admitted"]), (0, 0, 5))
+
+    async def test_full_queue_and_wait_timeout_reject_with_retry_after(self) -> None:
+        self.setup_config({"upstream_max_concurrency": 1, "upstream_max_queue": 1, "upstream_queue_timeout_seconds": 0.05})
+        holder = await self.controller.acquire("key-a")
+        waiter = asyncio.create_task(self.controller.acquire("key-b"))
+        await asyncio.sleep(0)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self.controller.acquire("key-c")
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertGreaterEqual(int(ctx.exception.headers["Retry-After"]), 1)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await waiter
+        self.assertIn("timed out", ctx.exception.detail)
+        stats = self.main.get_upstream_admission_stats()
+        self.assertEqual((stats["queued"], stats["rejected_queue_full"], stats["timed_out"]), (0, 1, 1))
+        holder.release()
+
+    async def test_transport_limit_does_not_block_other_transports(self) -> None:
+        self.setup_config({"upstream_max_concurrency": 4, "upstream_max_concurrency_browser": 1})
+        browser = await self.controller.acquire("key-a", "browser")
+        http = await asyncio.wait_for(self.controller.acquire("key-a", "http"), timeout=1.0)
+
+        queued = asyncio.create_task(self.controller.acquire("key-b", "browser"))
+        await asyncio.sleep(0)
+        self.assertFalse(queued.done())
+        browser.release()
+        (await asyncio.wait_for(queued, timeout=1.0)).release()
+        http.release()
+        self.assertEqual(self.main.get_upstream_admission_stats()["active"], 0)
+
+    async def test_streaming_response_holds_slot_until_body_finishes(self) -> None:
+        def fake_stream(client, method, url, json=None, headers=None, timeout=None):  # noqa: ARG001
+            self.assertEqual(self.main.get_upstream_admission_stats()["active"], 1)
+            return FakeStreamContext(
+                FakeStreamResponse(status_code=200, text='a0:"Hello"\nad:{"finishReason":"stop"}\n')
+            )
+
+        with patch.object(self.main, "get_models") as get_models_mock, patch.object(
+            self.main, "refresh_recaptcha_token", AsyncMock(return_value="recaptcha-token")
+        ), patch.object(httpx.AsyncClient, "stream", new=fake_stream):
+            get_models_mock.return_value = [
+                {
+                    "publicName": "test-model",
+                    "id": "model-id",
+                    "organization": "test-org",
+                    "capabilities": {
+                        "inputCapabilities": {"text": True},
+                        "outputCapabilities": {"text": True},
+                    },
+                }
+            ]
+            transport = httpx.ASGITransport(app=self.main.app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/api/v1/chat/completions",
+                    headers={"Authorization": "Bearer test-key"},
+                    json={"model": "test-model", "messages": [{"role": "user", "content": "Hi"}], "stream": True},
+                    timeout=30.0,
+                )
+
+        self.assertIn("Hello", response.text)
+        stats = self.main.get_upstream_admission_stats()
+        self.assertEqual((stats["active"], stats["admitted"]), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
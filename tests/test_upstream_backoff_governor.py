@@ -0,0 +1,53 @@
+import unittest
+
+from tests._stream_test_utils import BaseBridgeTest
+
+CREATE_URL = "https://lmarena.ai/nextjs-api/stream/create-evaluation"
+POST_URL = "https://lmarena.ai/nextjs-api/stream/post-to-evaluation/session-1"
+RETRY_URL = "https://lmarena.ai/nextjs-api/stream/retry-evaluation-session-message/session-1/messages/m1"
+
+
+class TestUpstreamBackoffGovernor(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._AUTH_TOKEN_POOL = None
+        self.main.current_token_index = 0
+        for key in self.main._UPSTREAM_BACKOFF_STATS:
+            self.main._UPSTREAM_BACKOFF_STATS[key] = 0
+
+    def test_endpoint_families(self) -> None:
+        family = self.main.get_upstream_endpoint_family
+        self.assertEqual(
+            [family(CREATE_URL), family(POST_URL), family(RETRY_URL), family("https://lmarena.ai/")],
+            ["create-evaluation", "post-to-evaluation", "retry", "other"],
+        )
+
+    def test_cooldown_is_scoped_to_token_and_family(self) -> None:
+        self.main.record_auth_token_result("token-a", 429, "30", CREATE_URL)
+        self.assertGreater(self.main.get_upstream_backoff_remaining("token-a", CREATE_URL), 25)
+        self.assertEqual(self.main.get_upstream_backoff_remaining("token-a", POST_URL), 0.0)
+        self.assertEqual(self.main.get_upstream_backoff_remaining("token-b", CREATE_URL), 0.0)
+        self.assertEqual(self.main.get_upstream_backoff_stats()["cooling_by_family"], {"create-evaluation": 1})
+
+    def test_routes_around_cooling_token(self) -> None:
+        self.setup_config({"auth_tokens": ["token-a", "token-b"]})
+        self.main.record_upstream_backoff("token-a", POST_URL, 30)
+        self.assertEqual(self.main.route_around_upstream_backoff("token-a", POST_URL), ("token-b", 0.0))
+        # Other endpoint families are not affected.
+        self.assertEqual(self.main.route_around_upstream_backoff("token-a", CREATE_URL), ("token-a", 0.0))
+
+    def test_waits_when_no_better_token_exists(self) -> None:
+        self.setup_config({"auth_tokens": ["token-a"]})
+        self.main.record_upstream_backoff("token-a", CREATE_URL, 30)
+        token, wait = self.main.route_around_upstream_backoff("token-a", CREATE_URL)
+        self.assertEqual(token, "token-a")
+        self.assertGreater(wait, 25)
+
+        # Token-less (browser cookie) traffic shares a cooldown too.
+        self.main.record_auth_token_result("", 429, "5", CREATE_URL)
+        self.assertGreater(self.main.route_around_upstream_backoff("", CREATE_URL)[1], 0)
+        self.assertEqual(self.main.get_upstream_backoff_stats()["waited"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
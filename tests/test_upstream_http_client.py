@@ -0,0 +1,81 @@
+import asyncio
+import base64
+import json
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestUpstreamHttpClient(BaseBridgeTest):
+    async def asyncTearDown(self) -> None:
+        await self.main.close_upstream_http_client()
+        await super().asyncTearDown()
+
+    async def test_client_is_shared_and_rebuilt_on_settings_change(self) -> None:
+        client = self.main.get_upstream_http_client()
+        self.assertIs(self.main.get_upstream_http_client(), client)
+
+        self.setup_config({"upstream_max_connections": 7})
+        rebuilt = self.main.get_upstream_http_client()
+        self.assertIsNot(rebuilt, client)
+        self.assertEqual(self.main.get_upstream_http_pool_stats()["max_connections"], 7)
+        self.assertIs(self.main.get_upstream_http_client(), rebuilt)
+
+    async def test_shared_client_never_stores_response_cookies(self) -> None:
+        client = self.main.get_upstream_http_client()
+        request = httpx.Request("GET", "https://lmarena.ai/")
+        response = httpx.Response(
+            200,
+            request=request,
+            headers=[("set-cookie", "arena-auth-prod-v1=account-a; Path=/; Domain=lmarena.ai")],
+        )
+        client.cookies.extract_cookies(response)
+        self.assertEqual(len(client.cookies.jar), 0)
+
+    async def test_pool_stats_shape(self) -> None:
+        self.main.get_upstream_http_client()
+        stats = self.main.get_upstream_http_pool_stats()
+        self.assertTrue(stats["active"])
+        for key in ("connections", "idle_connections", "busy_connections", "queued_requests", "http2"):
+            self.assertIn(key, stats)
+
+    async def test_retired_client_waits_for_in_flight_requests(self) -> None:
+        client = httpx.AsyncClient()
+        requests = client._transport._pool._requests
+        requests.append(object())  # Stands in for a stream still reading from the old pool.
+        with patch.object(self.main, "_UPSTREAM_HTTP_RETIRE_POLL_SECONDS", 0.01):
+            retire = asyncio.create_task(self.main._retire_upstream_http_client(client))
+            await asyncio.sleep(0.05)
+            self.assertFalse(client.is_closed)
+
+            requests.clear()
+            await asyncio.wait_for(retire, timeout=1.0)
+        self.assertTrue(client.is_closed)
+
+    async def test_lmarena_auth_refresh_keeps_cookies_across_redirects(self) -> None:
+        session = {"access_token": "a.b.c", "refresh_token": "r", "expires_at": 4_000_000_000}
+        new_token = "base64-" + base64.b64encode(json.dumps(session).encode()).decode()
+        seen: list[tuple[str, str]] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append((request.url.path, request.headers.get("cookie", "")))
+            if request.url.path == "/":
+                return httpx.Response(302, headers=[("location", "/welcome"), ("set-cookie", "cf_hop=1; Path=/")])
+            return httpx.Response(200, headers=[("set-cookie", f"arena-auth-prod-v1={new_token}; Path=/")])
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(self.main, "get_upstream_http_client", return_value=client):
+            refreshed = await self.main._refresh_arena_auth_token_via_lmarena_http("base64-old", {})
+        await client.aclose()
+
+        self.assertEqual(refreshed, new_token)
+        self.assertEqual([path for path, _ in seen], ["/", "/welcome"])
+        self.assertIn("arena-auth-prod-v1=base64-old", seen[1][1])
+        self.assertIn("cf_hop=1", seen[1][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
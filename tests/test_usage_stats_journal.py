@@ -0,0 +1,69 @@
+import json
+import os
+import unittest
+from collections import defaultdict
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class TestUsageStatsJournal(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self._orig_stats = self.main.model_usage_stats
+        self._orig_seq = self.main._USAGE_STATS_SEQ
+        self.main.model_usage_stats = defaultdict(int)
+        self.main._USAGE_STATS_SEQ = 0
+        self.main._USAGE_STATS_PENDING.clear()
+
+    async def asyncTearDown(self) -> None:
+        self.main.model_usage_stats = self._orig_stats
+        self.main._USAGE_STATS_SEQ = self._orig_seq
+        self.main._USAGE_STATS_PENDING.clear()
+        await super().asyncTearDown()
+
+    def _journal_path(self) -> str:
+        return self.main._usage_stats_journal_path()
+
+    def test_record_does_not_rewrite_config(self) -> None:
+        before = self._config_path.read_text(encoding="utf-8")
+        self.main.record_model_usage("model-a")
+        self.main.record_model_usage("model-a")
+        self.main.record_model_usage("model-b")
+        self.main.flush_usage_stats()
+
+        self.assertEqual(self._config_path.read_text(encoding="utf-8"), before)
+        with open(self._journal_path(), "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        self.assertEqual(lines, [{"seq": 3, "counts": {"model-a": 2, "model-b": 1}}])
+
+    def test_load_replays_and_compacts_journal(self) -> None:
+        self.setup_config({"usage_stats": {"model-a": 10}, "usage_stats_journal_seq": 4})
+        with open(self._journal_path(), "w", encoding="utf-8") as f:
+            # Already folded into config.json (seq <= 4): must be skipped.
+            f.write(json.dumps({"seq": 4, "counts": {"model-a": 3}}) + "\n")
+            f.write(json.dumps({"seq": 6, "counts": {"model-a": 1, "model-c": 1}}) + "\n")
+            f.write('{"seq": 7, "counts": {"mod')  # torn trailing write
+
+        self.main.load_usage_stats()
+
+        self.assertEqual(dict(self.main.model_usage_stats), {"model-a": 11, "model-c": 1})
+        self.assertFalse(os.path.exists(self._journal_path()))
+        saved = json.loads(self._config_path.read_text(encoding="utf-8"))
+        self.assertEqual(saved["usage_stats"], {"model-a": 11, "model-c": 1})
+        self.assertEqual(saved["usage_stats_journal_seq"], 6)
+
+    def test_save_config_drops_redundant_pending_deltas(self) -> None:
+        self.main.record_model_usage("model-a")
+        self.main.save_config(self.main.get_config())
+        self.main.flush_usage_stats()
+        self.assertFalse(os.path.exists(self._journal_path()))
+
+        self.main.record_model_usage("model-a")
+        self.main.flush_usage_stats()
+        self.main.model_usage_stats = defaultdict(int)
+        self.main.load_usage_stats()
+        self.assertEqual(dict(self.main.model_usage_stats), {"model-a": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import unittest
+
+from fastapi import WebSocketDisconnect
+
+from tests._stream_test_utils import BaseBridgeTest
+
+
+class _FakeWebSocket:
+    """In-memory stand-in for a connected `WebSocket`: the test plays the userscript side."""
+
+    def __init__(self, headers: dict = None) -> None:
+        self.headers = dict(headers or {})
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+
+    async def receive_text(self) -> str:
+        message = await self.incoming.get()
+        if message is None:
+            raise WebSocketDisconnect(1000)
+        return json.dumps(message)
+
+    async def send_text(self, text: str) -> None:
+        await self.outgoing.put(json.loads(text))
+
+    async def client_send(self, message: dict) -> None:
+        await self.incoming.put(message)
+
+    async def client_recv(self, timeout: float = 2.0) -> dict:
+        return await asyncio.wait_for(self.outgoing.get(), timeout=timeout)
+
+
+class TestUserscriptProxyWebSocket(BaseBridgeTest):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.main._USERSCRIPT_PROXY_QUEUE = None
+        self.main._USERSCRIPT_PROXY_JOBS.clear()
+        for key in self.main._USERSCRIPT_WS_STATS:
+            self.main._USERSCRIPT_WS_STATS[key] = 0
+        self.setup_config({"userscript_proxy_ws_line_window": 4})
+        self.ws = _FakeWebSocket()
+        self.session = self.main.UserscriptProxySocket(self.ws, self.main.get_config(), tick_seconds=0.05)
+        self.task = asyncio.create_task(self.session.run())
+
+    async def asyncTearDown(self) -> None:
+        await self.ws.client_send(None)
+        await asyncio.wait_for(asyncio.gather(self.task, return_exceptions=True), timeout=2.0)
+        self.main._USERSCRIPT_PROXY_QUEUE = None
+        self.main._USERSCRIPT_PROXY_JOBS.clear()
+        await super().asyncTearDown()
+
+    async def _start_job(self):
+        return await self.main.fetch_lmarena_stream_via_userscript_proxy(
+            http_method="POST", url="https://lmarena.ai/nextjs-api/stream/create-evaluation", payload={"x": 1}
+        )
+
+    async def test_jobs_dispatch_only_with_credit_and_lines_stream_through(self) -> None:
+        response = await self._start_job()
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.ws.client_recv(timeout=0.2)
+
+        await self.ws.client_send({"type": "ready", "jobs": 1})
+        job = await self.ws.client_recv()
+        self.assertEqual((job["type"], job["job_id"], job["credit"]), ("job", response.job_id, 4))
+        self.assertEqual(json.loads(job["payload"]["body"]), {"x": 1})
+
+        await self.ws.client_send(
+            {"type": "push", "job_id": job["job_id"], "status": 200, "lines": ['a0:"Hel"', 'a0:"lo"']}
+        )
+        self.assertEqual(await self.ws.client_recv(), {"type": "credit", "job_id": job["job_id"], "lines": 2})
+        await self.ws.client_send({"type": "push", "job_id": job["job_id"], "lines": ['ad:{}'], "done": True})
+
+        async with response as upstream:
+            self.assertEqual(upstream.status_code, 200)
+            lines = [line async for line in upstream.aiter_lines()]
+        self.assertEqual(lines, ['a0:"Hel"', 'a0:"lo"', "ad:{}"])
+
+        # The finished job hands its slot back, so the next job is dispatched without a new `ready`.
+        second = await self._start_job()
+        self.assertEqual((await self.ws.client_recv())["job_id"], second.job_id)
+
+    async def test_abandoned_consumer_cancels_job(self) -> None:
+        response = await self._start_job()
+        await self.ws.client_send({"type": "ready", "jobs": 1})
+        job = await self.ws.client_recv()
+
+        self.main._USERSCRIPT_PROXY_JOBS[response.job_id]["lines_queue"].abandon()
+        self.assertEqual(await self.ws.client_recv(), {"type": "cancel", "job_id": job["job_id"]})
+        self.assertEqual(self.main.get_userscript_ws_stats()["cancels"], 1)
+
+        await self.ws.client_send({"type": "push", "job_id": job["job_id"], "lines": ['a0:"late"']})
+        self.assertEqual(await self.ws.client_recv(), {"type": "cancel", "job_id": job["job_id"]})
+
+    async def test_pushing_past_line_credit_fails_job(self) -> None:
+        response = await self._start_job()
+        await self.ws.client_send({"type": "ready", "jobs": 1})
+        job = await self.ws.client_recv()
+
+        await self.ws.client_send({"type": "push", "job_id": job["job_id"], "status": 200, "lines": ["a"] * 5})
+        self.assertEqual(await self.ws.client_recv(), {"type": "cancel", "job_id": job["job_id"]})
+
+        proxy_job = self.main._USERSCRIPT_PROXY_JOBS[response.job_id]
+        self.assertTrue(proxy_job["done"])
+        self.assertIn("line credit", proxy_job["error"])
+        self.assertEqual(proxy_job["lines_queue"].qsize(), 0)
+        self.assertEqual(self.main.get_userscript_ws_stats()["credit_violations"], 1)
+        # The job slot came back: the next job is dispatched without a new `ready`.
+        second = await self._start_job()
+        self.assertEqual((await self.ws.client_recv())["job_id"], second.job_id)
+
+    async def test_flooding_job_with_frames_fails_job(self) -> None:
+        response = await self._start_job()
+        await self.ws.client_send({"type": "ready", "jobs": 1})
+        job = await self.ws.client_recv()
+
+        # Queued before the receiver wakes, so they land back to back: line window (4) + control frames.
+        for _ in range(4 + self.main._USERSCRIPT_WS_CONTROL_FRAMES + 1):
+            self.ws.incoming.put_nowait({"type": "push", "job_id": job["job_id"], "status": 200})
+        self.assertEqual(await self.ws.client_recv(), {"type": "cancel", "job_id": job["job_id"]})
+        self.assertIn("flooded", self.main._USERSCRIPT_PROXY_JOBS[response.job_id]["error"])
+
+    async def test_disconnect_fails_in_flight_job(self) -> None:
+        response = await self._start_job()
+        await self.ws.client_send({"type": "ready", "jobs": 1})
+        await self.ws.client_recv()
+
+        await self.ws.client_send(None)
+        await asyncio.wait_for(self.task, timeout=2.0)
+
+        job = self.main._USERSCRIPT_PROXY_JOBS[response.job_id]
+        self.assertTrue(job["done"])
+        self.assertEqual(job["error"], "userscript proxy disconnected")
+        self.assertEqual(self.main.get_userscript_ws_stats()["failed_on_disconnect"], 1)
+
+    async def test_secret_from_handshake_header_or_first_frame(self) -> None:
+        self.setup_config({"userscript_proxy_secret": "s3cret"})
+        authenticate = self.main._userscript_ws_authenticate
+
+        self.assertTrue(await authenticate(_FakeWebSocket({"X-LMBridge-Secret": "s3cret"})))
+        self.assertFalse(await authenticate(_FakeWebSocket({"X-LMBridge-Secret": "nope"})))
+
+        for first_frame, expected in (
+            ({"type": "auth", "secret": "s3cret"}, True),
+            ({"type": "auth", "secret": "nope"}, False),
+            ({"type": "ready", "jobs": 1}, False),
+        ):
+            ws = _FakeWebSocket()
+            await ws.client_send(first_frame)
+            self.assertEqual(await authenticate(ws), expected, first_frame)
+
+        self.setup_config({"userscript_proxy_secret": ""})
+        self.assertTrue(await authenticate(_FakeWebSocket()))
+
+
+if __name__ == "__main__":
+    unittest.main()